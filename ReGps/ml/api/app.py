@@ -4,22 +4,28 @@ Sistema de Supervisión de Empleados con GPS - ReGPS
 
 Endpoints:
 - GET  /health              - Health check
+- GET  /metrics             - Latencias y ocupación de inferencia y BD
 - POST /predict/eta         - Predecir tiempo de llegada a destino
 - POST /detect/anomaly      - Detectar comportamiento anómalo (desvíos, paradas, velocidad)
 - POST /classify/behavior   - Clasificar comportamiento del empleado en ruta
+- POST /detect/anomaly/stream - Detectar anomalía de un ping nuevo (estado por dispositivo)
+- POST /<endpoint>/batch    - Mismos modelos para muchos dispositivos por request
 - POST /verify/geofence     - Verificar si empleado está en zona permitida
+- POST /verify/geofence/batch - Geocercas para muchas ubicaciones por request
 
 Uso:
     uvicorn api.app:app --reload --port 8001
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional
 from datetime import datetime
 from contextlib import asynccontextmanager
+import asyncio
 import sys
+import time
 from pathlib import Path
 
 # ============================================================================
@@ -33,18 +39,66 @@ async def lifespan(app: FastAPI):
     """
     # Startup
     print("🚀 ReGPS ML API iniciada")
+    
+    # Pool de conexiones a la BD compartido por todos los requests.
+    # Las conexiones se abren bajo demanda: la API arranca aunque la BD no esté
+    app.state.db = AsyncDatabase()
+    print(f"🗄️ Pool de BD listo ({app.state.db.pool.size} conexiones máx.)")
+    
+    # Modelos entrenados: se cargan y calientan una sola vez. Si falta alguno,
+    # su endpoint sigue respondiendo con la heurística
     print("📊 Cargando modelos...")
-    # TODO: Cargar modelos desde archivos .joblib
+    app.state.models = ModelRegistry()
+    app.state.models.load_all()
+    
+    # Las predicciones corren en un pool aparte: el event loop nunca ejecuta sklearn
+    app.state.inference = InferenceExecutor(app.state.models)
+    app.state.inference.start()
+    print(f"⚙️ Inferencia: {app.state.inference.workers} workers ({app.state.inference.mode}), "
+          f"n_jobs={app.state.inference.n_jobs}, máx. {app.state.inference.max_pending} pendientes")
+    
+    # Estado reciente por dispositivo para /detect/anomaly/stream (memoria acotada)
+    app.state.device_state = DeviceStateStore()
+    
+    # Zonas indexadas una vez; una tarea de fondo aplica solo los cambios.
+    # Si la BD no responde al arrancar, la tarea reintenta la carga completa
+    app.state.geofence = GeofenceService(app.state.db)
+    try:
+        await app.state.geofence.load()
+    except Exception as e:
+        app.state.geofence.error = f"{type(e).__name__}: {e}"
+        print(f"⚠️ No se pudieron cargar las geocercas: {e}")
+    app.state.geofence_task = asyncio.create_task(app.state.geofence.run())
+    
+    # Requests individuales concurrentes del mismo método → una sola llamada al modelo
+    app.state.batchers = {}
+    if API_CONFIG['microbatch_enabled']:
+        app.state.batchers = {
+            method: MicroBatcher(app.state.inference.run, method) for method in INFERENCE_METHODS
+        }
+        print(f"📦 Micro-batching: hasta {API_CONFIG['microbatch_max_items']} items "
+              f"o {API_CONFIG['microbatch_max_wait_ms']:g} ms")
     print("✅ API lista para recibir requests")
     
     yield
     
     # Shutdown
+    app.state.geofence_task.cancel()
+    app.state.inference.close()
+    app.state.db.close()
     print("🛑 ReGPS ML API detenida")
 
 # Agregar el directorio raíz al path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from config import API_CONFIG
+from api.services.database import AsyncDatabase
+from api.services.model_registry import ModelRegistry
+from api.services.inference import InferenceExecutor, InferenceOverloaded, INFERENCE_METHODS
+from api.services.batching import MicroBatcher
+from api.services.device_state import DeviceStateStore, OutOfOrderPing
+from api.services.geofence import GeofenceService
+
 # Configuración de la app
 app = FastAPI(
     title="ReGPS ML API",
@@ -108,6 +162,18 @@ class AnomalyDetectionResponse(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.now)
 
 
+class StreamPingRequest(BaseModel):
+    """Request de un ping nuevo para detección de anomalías en streaming"""
+    dispositivo_id: int = Field(..., description="ID del dispositivo")
+    ubicacion: LocationPoint = Field(..., description="Ubicación recibida")
+
+
+class StreamAnomalyResponse(AnomalyDetectionResponse):
+    """Response de anomalía en streaming (incluye las features del ping)"""
+    puntos_ventana: int = Field(..., description="Puntos usados en la ventana móvil")
+    features: dict = Field(..., description="Features calculadas para el ping")
+
+
 class BehaviorClassificationRequest(BaseModel):
     """Request para clasificación de comportamiento del empleado"""
     dispositivo_id: int = Field(..., description="ID del dispositivo")
@@ -115,6 +181,30 @@ class BehaviorClassificationRequest(BaseModel):
     ubicaciones: List[LocationPoint] = Field(..., min_length=10, description="Historial de ubicaciones")
 
 
+class GeofenceRequest(BaseModel):
+    """Request para verificación de geocercas"""
+    dispositivo_id: Optional[int] = Field(None, description="ID del dispositivo")
+    ubicacion: LocationPoint = Field(..., description="Ubicación a verificar (fecha_hora para los horarios)")
+
+
+class GeofenceZone(BaseModel):
+    """Zona que contiene la ubicación"""
+    zona_id: int
+    nombre: Optional[str] = None
+    tipo_zona: str = Field(..., description="Checkpoint, Zona Permitida o Zona Restringida")
+    tipo_geometria: str = Field(..., description="Circulo o Poligono")
+
+
+class GeofenceResponse(BaseModel):
+    """Response de verificación de geocercas"""
+    dentro_de_zona: bool = Field(..., description="¿La ubicación está en alguna zona activa?")
+    en_zona_permitida: bool
+    en_zona_restringida: bool
+    zonas: List[GeofenceZone] = Field(default_factory=list, description="Zonas que contienen la ubicación")
+    alertas: List[str] = Field(default_factory=list)
+    timestamp: datetime = Field(default_factory=datetime.now)
+
+
 class BehaviorClassificationResponse(BaseModel):
     """Response de clasificación de comportamiento"""
     categoria: str = Field(..., description="Categoría (eficiente, normal, requiere_atencion)")
@@ -125,6 +215,130 @@ class BehaviorClassificationResponse(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.now)
 
 
+# ============================================================================
+# LOTES (varios dispositivos por request)
+# ============================================================================
+
+class BatchRequest(BaseModel):
+    """
+    Request de lote: cada item tiene el mismo formato que el endpoint individual
+    
+    Los items se validan uno por uno para que un item inválido se reporte
+    en su posición sin rechazar el lote completo.
+    """
+    items: List[dict] = Field(
+        ..., min_length=1, max_length=API_CONFIG['batch_max_items'],
+        description="Requests individuales a evaluar"
+    )
+
+
+class BatchItemResult(BaseModel):
+    """Resultado de un item del lote"""
+    index: int = Field(..., description="Posición del item en el request")
+    ok: bool = Field(..., description="¿Se evaluó correctamente?")
+    resultado: Optional[dict] = Field(None, description="Mismo formato que el endpoint individual")
+    error: Optional[str] = Field(None, description="Motivo si el item no se pudo evaluar")
+
+
+class BatchResponse(BaseModel):
+    """Response de lote"""
+    total: int = Field(..., description="Items recibidos")
+    exitosos: int = Field(..., description="Items evaluados")
+    errores: int = Field(..., description="Items con error")
+    duracion_ms: float = Field(..., description="Tiempo de procesamiento del lote")
+    resultados: List[BatchItemResult]
+
+
+async def infer(method, requests):
+    """
+    Ejecutar un método de PredictionService en el pool de inferencia
+    
+    Args:
+        method: 'predict_eta', 'detect_anomaly' o 'classify_behavior'
+        requests: Lista de requests validados
+    
+    Returns:
+        Lista de resultados por request
+    
+    Raises:
+        HTTPException 503: Si el pool de inferencia está saturado
+    """
+    try:
+        return await app.state.inference.run(method, requests)
+    except InferenceOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
+async def infer_one(method, request):
+    """
+    Evaluar un request individual, agrupándolo con otros concurrentes
+    
+    Args:
+        method: 'predict_eta', 'detect_anomaly' o 'classify_behavior'
+        request: Request validado
+    
+    Returns:
+        Resultado del request
+    
+    Raises:
+        HTTPException 503: Si el pool de inferencia está saturado
+    """
+    batcher = app.state.batchers.get(method)
+    if batcher is None:
+        return (await infer(method, [request]))[0]
+    
+    try:
+        return await batcher.submit(request)
+    except InferenceOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
+async def run_batch(items, request_cls, method=None, evaluate=None):
+    """
+    Validar los items de un lote y evaluarlos en una sola llamada
+    
+    Args:
+        items: Lista de dicts del request
+        request_cls: Modelo Pydantic de un item (p. ej. ETAPredictionRequest)
+        method: Método de PredictionService que recibe la lista de requests válidos
+        evaluate: Coroutine evaluate(requests) -> resultados, en lugar de method
+    
+    Returns:
+        dict con el formato de BatchResponse
+    """
+    inicio = time.perf_counter()
+    resultados = [None] * len(items)
+    validos, indices = [], []
+    
+    for i, item in enumerate(items):
+        try:
+            validos.append(request_cls.model_validate(item))
+            indices.append(i)
+        except ValidationError as e:
+            detalle = "; ".join(
+                f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors()
+            )
+            resultados[i] = {'index': i, 'ok': False, 'error': detalle}
+    
+    if validos:
+        evaluados = await evaluate(validos) if evaluate is not None else await infer(method, validos)
+        for i, resultado in zip(indices, evaluados):
+            if isinstance(resultado, Exception):
+                resultados[i] = {'index': i, 'ok': False, 'error': str(resultado)}
+            else:
+                resultados[i] = {'index': i, 'ok': True, 'resultado': resultado}
+    
+    errores = sum(1 for r in resultados if not r['ok'])
+    
+    return {
+        'total': len(items),
+        'exitosos': len(items) - errores,
+        'errores': errores,
+        'duracion_ms': round((time.perf_counter() - inicio) * 1000, 2),
+        'resultados': resultados,
+    }
+
+
 # ============================================================================
 # ENDPOINTS
 # ============================================================================
@@ -138,22 +352,55 @@ async def root():
         "status": "online",
         "endpoints": {
             "health": "/health",
+            "metrics": "/metrics",
             "docs": "/docs",
             "predict_eta": "/predict/eta",
+            "predict_eta_batch": "/predict/eta/batch",
             "detect_anomaly": "/detect/anomaly",
-            "classify_behavior": "/classify/behavior"
+            "detect_anomaly_batch": "/detect/anomaly/batch",
+            "detect_anomaly_stream": "/detect/anomaly/stream",
+            "classify_behavior": "/classify/behavior",
+            "classify_behavior_batch": "/classify/behavior/batch",
+            "verify_geofence": "/verify/geofence",
+            "verify_geofence_batch": "/verify/geofence/batch"
         }
     }
 
 
 @app.get("/health")
-async def health_check():
-    """Health check endpoint"""
+async def health_check(request: Request):
+    """Health check endpoint (hace ping real a la BD y reporta los modelos)"""
+    db = request.app.state.db
+    database = await db.ping()
+    models = request.app.state.models
+    
+    return {
+        "status": "healthy" if database["connected"] and models.all_loaded else "degraded",
+        "timestamp": datetime.now(),
+        "models_loaded": models.all_loaded,
+        "models": models.status(),
+        "database_connected": database["connected"],
+        "database": {**database, **db.stats()},
+        "inference": {
+            "mode": request.app.state.inference.mode,
+            "pendientes": request.app.state.inference.stats()["pendientes"],
+        },
+    }
+
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    """Latencias (histogramas) y ocupación del pool de inferencia y de la BD"""
     return {
-        "status": "healthy",
         "timestamp": datetime.now(),
-        "models_loaded": False,  # TODO: Actualizar cuando se carguen modelos
-        "database_connected": False  # TODO: Verificar conexión a BD
+        "inference": request.app.state.inference.stats(),
+        "microbatching": {
+            method: batcher.stats() for method, batcher in request.app.state.batchers.items()
+        },
+        "database": request.app.state.db.stats(),
+        "device_state": request.app.state.device_state.stats(),
+        "geofence": request.app.state.geofence.stats(),
+        "models": request.app.state.models.status(),
     }
 
 
@@ -162,30 +409,21 @@ async def predict_eta(request: ETAPredictionRequest):
     """
     Predice el tiempo estimado de llegada (ETA)
     
-    TODO: Implementar lógica de predicción con modelo entrenado
+    Usa ETAPredictor si está cargado; si no, distancia / velocidad promedio
     """
-    # Por ahora, retornar valores de ejemplo
-    # Calcular distancia simple (línea recta)
-    from utils.geo_utils import calculate_distance
-    
-    distancia = calculate_distance(
-        request.ubicacion_actual.latitud,
-        request.ubicacion_actual.longitud,
-        request.destino.latitud,
-        request.destino.longitud
-    )
-    
-    # Estimar velocidad promedio (simplificado)
-    velocidad_promedio = 40  # km/h promedio
-    eta_horas = distancia / velocidad_promedio
-    eta_minutos = eta_horas * 60
+    resultado = await infer_one("predict_eta", request)
+    return ETAPredictionResponse(**resultado)
+
+
+@app.post("/predict/eta/batch", response_model=BatchResponse)
+async def predict_eta_batch(request: BatchRequest):
+    """
+    ETA para muchos dispositivos en un solo request
     
-    return ETAPredictionResponse(
-        eta_minutos=eta_minutos,
-        distancia_km=distancia,
-        velocidad_promedio_esperada=velocidad_promedio,
-        confianza=0.75  # Placeholder
-    )
+    Cada item tiene el formato de /predict/eta; se hace una sola predicción
+    del modelo para todo el lote.
+    """
+    return await run_batch(request.items, ETAPredictionRequest, "predict_eta")
 
 
 @app.post("/detect/anomaly", response_model=AnomalyDetectionResponse)
@@ -198,50 +436,50 @@ async def detect_anomaly(request: AnomalyDetectionRequest):
     - Paradas no autorizadas prolongadas
     - Desvíos de ruta esperada
     
-    TODO: Implementar lógica de detección con modelo entrenado
+    Usa AnomalyDetector si está cargado (se evalúan todos los puntos y se
+    reporta el más anómalo); si no, reglas de umbral
     """
-    velocidades = [loc.velocidad for loc in request.ubicaciones if loc.velocidad is not None]
-    
-    if not velocidades:
-        raise HTTPException(status_code=400, detail="No hay datos de velocidad")
-    
-    velocidad_max = max(velocidades)
-    velocidad_promedio = sum(velocidades) / len(velocidades)
-    
-    # Detectar tipo de anomalía
-    anomalias_detectadas = []
-    tipo_anomalia = None
-    
-    # 1. Exceso de velocidad (umbral empresarial: 90 km/h)
-    if velocidad_max > 90:
-        anomalias_detectadas.append(f"Velocidad excesiva: {velocidad_max:.1f} km/h")
-        tipo_anomalia = "exceso_velocidad"
-    
-    # 2. Parada prolongada (velocidad 0 por mucho tiempo)
-    paradas = sum(1 for v in velocidades if v < 5)
-    if paradas > len(velocidades) * 0.5:  # Más del 50% detenido
-        anomalias_detectadas.append(f"Parada prolongada: {paradas}/{len(velocidades)} puntos")
-        tipo_anomalia = "parada_prolongada" if not tipo_anomalia else tipo_anomalia
-    
-    # 3. Comportamiento errático (cambios bruscos de velocidad)
-    if len(velocidades) > 1:
-        cambios_velocidad = [abs(velocidades[i] - velocidades[i-1]) for i in range(1, len(velocidades))]
-        cambios_bruscos = sum(1 for cambio in cambios_velocidad if cambio > 30)
-        if cambios_bruscos > 3:
-            anomalias_detectadas.append(f"Comportamiento errático: {cambios_bruscos} cambios bruscos")
-            tipo_anomalia = "comportamiento_erratico" if not tipo_anomalia else tipo_anomalia
-    
-    es_anomalia = len(anomalias_detectadas) > 0
-    score = velocidad_max / 150  # Normalizado para velocidades hasta 150 km/h
-    
-    detalles = " | ".join(anomalias_detectadas) if anomalias_detectadas else "Comportamiento normal detectado"
-    
-    return AnomalyDetectionResponse(
-        es_anomalia=es_anomalia,
-        tipo_anomalia=tipo_anomalia,
-        score_anomalia=score,
-        detalles=detalles
-    )
+    resultado = await infer_one("detect_anomaly", request)
+    
+    if isinstance(resultado, ValueError):
+        raise HTTPException(status_code=400, detail=str(resultado))
+    
+    return AnomalyDetectionResponse(**resultado)
+
+
+@app.post("/detect/anomaly/batch", response_model=BatchResponse)
+async def detect_anomaly_batch(request: BatchRequest):
+    """
+    Detección de anomalías para muchos dispositivos en un solo request
+    
+    Cada item tiene el formato de /detect/anomaly; los puntos de todos los
+    items se evalúan en una sola llamada al modelo.
+    """
+    return await run_batch(request.items, AnomalyDetectionRequest, "detect_anomaly")
+
+
+@app.post("/detect/anomaly/stream", response_model=StreamAnomalyResponse)
+async def detect_anomaly_stream(request: StreamPingRequest):
+    """
+    Detecta anomalías a partir de un solo ping nuevo
+    
+    El servidor guarda el estado reciente de cada dispositivo (último punto y
+    ventana de velocidades), así el cliente no reenvía el historial y las
+    features se actualizan en O(1). Los pings de un dispositivo deben llegar
+    en orden de fecha; uno anterior al último responde 409.
+    """
+    ubicacion = request.ubicacion
+    try:
+        features, puntos_ventana = app.state.device_state.update(
+            request.dispositivo_id, ubicacion.latitud, ubicacion.longitud,
+            ubicacion.velocidad, ubicacion.fecha_hora
+        )
+    except OutOfOrderPing as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    resultado = await infer_one("detect_anomaly_stream", features)
+    
+    return StreamAnomalyResponse(**resultado, puntos_ventana=puntos_ventana, features=features)
 
 
 @app.post("/classify/behavior", response_model=BehaviorClassificationResponse)
@@ -255,66 +493,65 @@ async def classify_behavior(request: BehaviorClassificationRequest):
     - Paradas apropiadas
     - Comportamiento general en ruta
     
-    TODO: Implementar lógica de clasificación con modelo entrenado
+    Usa BehaviorClassifier si está cargado; si no, reglas de umbral
     """
-    velocidades = [loc.velocidad for loc in request.ubicaciones if loc.velocidad is not None]
-    
-    if not velocidades:
-        raise HTTPException(status_code=400, detail="No hay datos de velocidad")
-    
-    velocidad_promedio = sum(velocidades) / len(velocidades)
-    velocidad_max = max(velocidades)
-    paradas = sum(1 for v in velocidades if v < 5)
-    tiempo_movimiento = len(velocidades) - paradas
-    
-    # Clasificación basada en métricas empresariales
-    alertas = []
-    recomendaciones = None
-    
-    # Evaluar velocidad
-    if velocidad_max > 90:
-        alertas.append("Exceso de velocidad detectado")
-        categoria = "requiere_atencion"
-        score = 45
-        recomendaciones = "Recordar al empleado los límites de velocidad de la empresa"
-    elif velocidad_promedio > 60:
-        categoria = "normal"
-        score = 70
-    else:
-        categoria = "eficiente"
-        score = 90
-    
-    # Evaluar paradas
-    porcentaje_paradas = (paradas / len(velocidades)) * 100
-    if porcentaje_paradas > 60:
-        alertas.append(f"Tiempo excesivo detenido: {porcentaje_paradas:.1f}%")
-        if categoria == "eficiente":
-            categoria = "normal"
-            score = 65
-    
-    # Evaluar eficiencia
-    if tiempo_movimiento > 0 and paradas / tiempo_movimiento < 0.3:
-        # Buen ratio de movimiento
-        if not alertas:
-            score = min(score + 5, 100)
-    
-    if not alertas:
-        recomendaciones = "Comportamiento dentro de parámetros normales"
-    
-    return BehaviorClassificationResponse(
-        categoria=categoria,
-        score=score,
-        alertas=alertas,
-        metricas={
-            "velocidad_promedio": round(velocidad_promedio, 2),
-            "velocidad_maxima": round(velocidad_max, 2),
-            "puntos_analizados": len(request.ubicaciones),
-            "tiempo_movimiento": tiempo_movimiento,
-            "tiempo_detenido": paradas,
-            "porcentaje_movimiento": round((tiempo_movimiento/len(velocidades))*100, 1)
-        },
-        recomendaciones=recomendaciones
-    )
+    resultado = await infer_one("classify_behavior", request)
+    
+    if isinstance(resultado, ValueError):
+        raise HTTPException(status_code=400, detail=str(resultado))
+    
+    return BehaviorClassificationResponse(**resultado)
+
+
+@app.post("/classify/behavior/batch", response_model=BatchResponse)
+async def classify_behavior_batch(request: BatchRequest):
+    """
+    Clasificación de comportamiento para muchos dispositivos en un solo request
+    
+    Cada item tiene el formato de /classify/behavior; se hace una sola
+    predicción del modelo para todo el lote.
+    """
+    return await run_batch(request.items, BehaviorClassificationRequest, "classify_behavior")
+
+
+def geofence_service():
+    """Servicio de geocercas; 503 si las zonas nunca se pudieron cargar"""
+    geofence = app.state.geofence
+    if not geofence.cargado:
+        raise HTTPException(
+            status_code=503, detail=f"Geocercas no cargadas: {geofence.error}",
+            headers={"Retry-After": str(int(geofence.refresh_seconds))}
+        )
+    return geofence
+
+
+@app.post("/verify/geofence", response_model=GeofenceResponse)
+async def verify_geofence(request: GeofenceRequest):
+    """
+    Verifica en qué zonas está una ubicación
+    
+    Mismas reglas que Zona::contienePunto de Laravel (círculo por radio,
+    polígono por sus Coordenadas), solo para zonas activas y dentro de su
+    HorarioInicio/HorarioFin. Un índice espacial evita recorrer todas las
+    zonas: la consulta toma microsegundos aunque haya miles.
+    """
+    return GeofenceResponse(**geofence_service().verify([request.ubicacion])[0])
+
+
+@app.post("/verify/geofence/batch", response_model=BatchResponse)
+async def verify_geofence_batch(request: BatchRequest):
+    """
+    Verificación de geocercas para muchas ubicaciones en un solo request
+    
+    Cada item tiene el formato de /verify/geofence; todas las ubicaciones se
+    consultan en el índice con una sola llamada vectorizada.
+    """
+    geofence = geofence_service()
+    
+    async def evaluate(requests):
+        return await asyncio.to_thread(geofence.verify, [r.ubicacion for r in requests])
+    
+    return await run_batch(request.items, GeofenceRequest, evaluate=evaluate)
 
 
 # ============================================================================
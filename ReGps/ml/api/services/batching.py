@@ -0,0 +1,182 @@
+"""
+Micro-batching de requests individuales
+
+Laravel envía muchos /detect/anomaly (y /predict/eta, /classify/behavior)
+concurrentes de un solo item. Cada uno pagaría su propia llamada al modelo,
+cuando PredictionService ya evalúa una lista completa con una sola matriz.
+
+MicroBatcher junta los requests concurrentes de un mismo método durante
+hasta `max_wait_ms` o hasta `max_items` (lo que ocurra primero), hace una
+sola llamada al ejecutor de inferencia y devuelve a cada coroutine su
+resultado. La API pública no cambia: cada cliente sigue enviando un item y
+recibiendo su respuesta; solo paga como máximo `max_wait_ms` extra.
+
+Si no hay ningún lote del método en vuelo, el request sale de inmediato:
+con poca carga no hay con quién agruparlo y esperar solo sumaría latencia.
+Mientras un lote se evalúa, los que llegan se acumulan para el siguiente.
+
+Si la llamada del lote falla, cada request se evalúa de nuevo por separado
+y el error llega solo a los que fallan: un request inválido no hace fallar
+a los que se agruparon con él. La saturación del pool (InferenceOverloaded)
+no depende de los requests y se devuelve a todo el lote.
+
+Todo ocurre en el event loop (sin locks): submit, el temporizador y el
+reparto de resultados son callbacks del mismo hilo.
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from config import API_CONFIG
+from api.services.inference import InferenceOverloaded
+from api.services.telemetry import LatencyHistogram
+
+
+def _set_exception(future, e):
+    """Excepción para un request cuyo cliente sigue esperando"""
+    if not future.done():
+        future.set_exception(e)
+
+
+class MicroBatcher:
+    """Agrupa requests concurrentes de un método en una sola llamada de inferencia"""
+    
+    def __init__(self, runner, method, max_wait_ms=None, max_items=None):
+        """
+        Args:
+            runner: Coroutine runner(method, requests) -> lista de resultados
+                    (p. ej. InferenceExecutor.run)
+            method: Método de PredictionService ('detect_anomaly', ...)
+            max_wait_ms: Espera máxima para completar un lote
+                         (default: API_CONFIG['microbatch_max_wait_ms'])
+            max_items: Tamaño máximo del lote (default: API_CONFIG['microbatch_max_items'])
+        """
+        self.runner = runner
+        self.method = method
+        self.max_wait_ms = max_wait_ms if max_wait_ms is not None else API_CONFIG['microbatch_max_wait_ms']
+        self.max_items = max_items or API_CONFIG['microbatch_max_items']
+        
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self._en_vuelo = 0
+        
+        self.lotes = 0
+        self.items = 0
+        self.lote_max = 0
+        self.por_tamano = 0
+        self.por_tiempo = 0
+        self.inmediatos = 0
+        self.separados = 0
+        self.wait = LatencyHistogram()
+    
+    async def submit(self, request):
+        """
+        Encolar un request y esperar su resultado
+        
+        Args:
+            request: Request individual ya validado
+        
+        Returns:
+            Resultado del request (mismo formato que PredictionService)
+        
+        Raises:
+            La excepción de la llamada de inferencia de este request, o
+            InferenceOverloaded si el pool rechazó el lote
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((request, future, time.perf_counter()))
+        
+        if self._en_vuelo == 0:
+            self.inmediatos += 1
+            self._flush()
+        elif len(self._pending) >= self.max_items:
+            self.por_tamano += 1
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.max_wait_ms / 1000, self._flush_by_time
+            )
+        
+        return await future
+    
+    def _flush_by_time(self):
+        """El temporizador venció antes de llenar el lote"""
+        self._timer = None
+        if self._pending:
+            self.por_tiempo += 1
+            self._flush()
+    
+    def _flush(self):
+        """Enviar los requests pendientes como un lote"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        lote, self._pending = self._pending, []
+        self._en_vuelo += 1
+        
+        task = asyncio.get_running_loop().create_task(self._run(lote))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, lote):
+        """Una llamada de inferencia para el lote y reparto de resultados"""
+        ahora = time.perf_counter()
+        for _, _, encolado in lote:
+            self.wait.observe(ahora - encolado)
+        
+        self.lotes += 1
+        self.items += len(lote)
+        self.lote_max = max(self.lote_max, len(lote))
+        
+        try:
+            resultados = await self.runner(self.method, [request for request, _, _ in lote])
+        except InferenceOverloaded as e:
+            for _, future, _ in lote:
+                _set_exception(future, e)
+            return
+        except Exception as e:
+            if len(lote) == 1:
+                _set_exception(lote[0][1], e)
+            else:
+                await self._run_each(lote)
+            return
+        finally:
+            self._en_vuelo -= 1
+        
+        for (_, future, _), resultado in zip(lote, resultados):
+            if not future.done():
+                future.set_result(resultado)
+    
+    async def _run_each(self, lote):
+        """Evaluar por separado los requests de un lote cuya llamada falló"""
+        self.separados += 1
+        for request, future, _ in lote:
+            try:
+                resultado = (await self.runner(self.method, [request]))[0]
+            except Exception as e:
+                _set_exception(future, e)
+                continue
+            if not future.done():
+                future.set_result(resultado)
+    
+    def stats(self):
+        """Tamaño de los lotes, motivo de envío (tamaño, tiempo o sin lote en vuelo) y espera"""
+        return {
+            'max_wait_ms': self.max_wait_ms,
+            'max_items': self.max_items,
+            'lotes': self.lotes,
+            'items': self.items,
+            'lote_promedio': round(self.items / self.lotes, 2) if self.lotes else 0.0,
+            'lote_max': self.lote_max,
+            'por_tamano': self.por_tamano,
+            'por_tiempo': self.por_tiempo,
+            'inmediatos': self.inmediatos,
+            'separados': self.separados,
+            'wait': self.wait.snapshot(),
+        }
@@ -0,0 +1,103 @@
+"""
+Acceso a la base de datos de Laravel desde la API
+
+Un pool acotado de conexiones (utils.db_connector.ConnectionPool) se crea
+una vez en el lifespan de FastAPI y se comparte entre requests. pymysql es
+bloqueante, así que cada consulta corre en un hilo propio del servicio
+(tantos hilos como conexiones): el event loop nunca espera a la BD y no
+se paga conectar/desconectar por request.
+"""
+
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from utils.db_connector import ConnectionPool
+from config import API_CONFIG
+from api.services.telemetry import LatencyHistogram
+
+
+class AsyncDatabase:
+    """Consultas a la BD sin bloquear el event loop, sobre un pool compartido"""
+    
+    def __init__(self, size=None, timeout=None):
+        """
+        Args:
+            size: Conexiones máximas (default: API_CONFIG['db_pool_size'])
+            timeout: Segundos máximos de espera por una conexión
+                     (default: API_CONFIG['db_pool_timeout'])
+        """
+        size = size or API_CONFIG['db_pool_size']
+        timeout = timeout if timeout is not None else API_CONFIG['db_pool_timeout']
+        
+        self.pool = ConnectionPool(size=size, timeout=timeout)
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='regps-db')
+        self.query_latency = LatencyHistogram()
+        self.errores = 0
+    
+    def _run_query(self, query, params):
+        """Ejecuta la consulta en un hilo del servicio (bloqueante)"""
+        with self.pool.connection() as db:
+            with self.query_latency.time():
+                return db.execute_query(query, params=params)
+    
+    async def query(self, query, params=None):
+        """
+        Ejecutar una consulta y devolver un DataFrame
+        
+        Args:
+            query: Consulta SQL (parámetros con el estilo %(nombre)s)
+            params: Parámetros de la consulta
+        
+        Returns:
+            DataFrame con el resultado
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, self._run_query, query, params)
+        except Exception:
+            self.errores += 1
+            raise
+    
+    async def ping(self, timeout=None):
+        """
+        Verificar que la BD responde (SELECT 1 con tiempo límite)
+        
+        Args:
+            timeout: Segundos máximos (default: API_CONFIG['db_health_timeout'])
+        
+        Returns:
+            dict: connected, latency_ms y error (si lo hubo)
+        """
+        timeout = timeout or API_CONFIG['db_health_timeout']
+        inicio = time.perf_counter()
+        
+        try:
+            await asyncio.wait_for(self.query("SELECT 1 AS ok"), timeout=timeout)
+            return {
+                'connected': True,
+                'latency_ms': round((time.perf_counter() - inicio) * 1000, 2),
+            }
+        except Exception as e:
+            return {
+                'connected': False,
+                'latency_ms': round((time.perf_counter() - inicio) * 1000, 2),
+                'error': f"{type(e).__name__}: {e}",
+            }
+    
+    def stats(self):
+        """Métricas del pool y latencia de consultas"""
+        return {
+            'pool': self.pool.stats(),
+            'query_latency': self.query_latency.snapshot(),
+            'errores': self.errores,
+        }
+    
+    def close(self):
+        """Cerrar hilos y conexiones (al apagar la API)"""
+        self._executor.shutdown(wait=True)
+        self.pool.close()
@@ -0,0 +1,369 @@
+"""
+Estado por dispositivo para features de anomalía y comportamiento en streaming
+
+/detect/anomaly recibe la ventana completa de puntos en cada llamada y
+recalcula todo. Aquí cada dispositivo guarda su estado reciente en memoria
+y cada ping nuevo actualiza las features de AnomalyDetector en O(1):
+
+- Último punto (lat, lon, velocidad, fecha) para cambio_velocidad y
+  distancia_metros.
+- Ring buffer con las últimas `window_size` velocidades y sumas corridas
+  (suma y suma de cuadrados) para la media/desviación de la ventana. Las
+  sumas se recalculan desde el buffer cada vez que da la vuelta, así el
+  error de redondeo no se acumula.
+
+El estado vive en arrays NumPy preasignados (un slot por dispositivo), de
+modo que la memoria está acotada por `max_devices` desde el arranque. Un
+OrderedDict dispositivo -> slot mantiene el orden LRU: los dispositivos sin
+pings por más de `ttl_seconds` se expiran y, si no hay slots libres, se
+desaloja el menos reciente.
+
+Igual que rolling(min_periods=1) del entrenamiento, la ventana usa los
+puntos disponibles mientras el dispositivo tiene menos de `window_size`.
+
+Además se acumulan los totales del día en curso que usa BehaviorClassifier
+(media y desviación con Welford, máximo, violaciones, movimiento, distancia
+y cambios bruscos). Se reinician con el primer ping de cada día, igual que
+el agrupamiento (dispositivo, día) de create_daily_metrics.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from config import API_CONFIG, FEATURE_CONFIG
+from utils import geo_arrays
+
+
+class OutOfOrderPing(ValueError):
+    """Ping con fecha anterior al último registrado para el dispositivo"""
+
+
+class DeviceStateStore:
+    """Estado reciente por dispositivo con memoria acotada (LRU + TTL)"""
+    
+    def __init__(self, max_devices=None, ttl_seconds=None, window_size=None):
+        """
+        Args:
+            max_devices: Dispositivos con estado (default: API_CONFIG['state_max_devices'])
+            ttl_seconds: Segundos sin pings antes de expirar un dispositivo
+                         (default: API_CONFIG['state_ttl_seconds'])
+            window_size: Puntos de la ventana móvil (default: API_CONFIG['state_window'])
+        """
+        self.max_devices = max_devices or API_CONFIG['state_max_devices']
+        self.ttl_seconds = ttl_seconds or API_CONFIG['state_ttl_seconds']
+        self.window_size = window_size or API_CONFIG['state_window']
+        
+        n = self.max_devices
+        self._slots = OrderedDict()
+        self._free = list(range(n - 1, -1, -1))
+        
+        self._buffer = np.zeros((n, self.window_size))
+        self._puntos = np.zeros(n, dtype=np.int64)
+        self._suma = np.zeros(n)
+        self._suma2 = np.zeros(n)
+        self._lat = np.zeros(n)
+        self._lon = np.zeros(n)
+        self._velocidad = np.zeros(n)
+        self._fecha = np.zeros(n, dtype='datetime64[s]')
+        self._visto = np.zeros(n)
+        
+        # Totales del día en curso (métricas de BehaviorClassifier)
+        self._dia = np.zeros(n, dtype='datetime64[D]')
+        self._dia_puntos = np.zeros(n, dtype=np.int64)
+        self._dia_media = np.zeros(n)
+        self._dia_m2 = np.zeros(n)
+        self._dia_maxima = np.zeros(n)
+        self._dia_violaciones = np.zeros(n, dtype=np.int64)
+        self._dia_movimiento = np.zeros(n, dtype=np.int64)
+        self._dia_distancia = np.zeros(n)
+        self._dia_cambios = np.zeros(n, dtype=np.int64)
+        
+        self._lock = threading.Lock()
+        self.pings = 0
+        self.desalojados = 0
+        self.expirados = 0
+        self.fuera_de_orden = 0
+    
+    def _expire(self, ahora):
+        """Liberar dispositivos sin pings por más de ttl_seconds (los más viejos van primero)"""
+        limite = ahora - self.ttl_seconds
+        while self._slots:
+            slot = next(iter(self._slots.values()))
+            if self._visto[slot] >= limite:
+                break
+            self._slots.popitem(last=False)
+            self._free.append(slot)
+            self.expirados += 1
+    
+    def _slot(self, dispositivo_id):
+        """Slot del dispositivo (nuevo si no tenía), marcado como el más reciente"""
+        slot = self._slots.get(dispositivo_id)
+        if slot is not None:
+            self._slots.move_to_end(dispositivo_id)
+            return slot, False
+        
+        if not self._free:
+            _, libre = self._slots.popitem(last=False)
+            self._free.append(libre)
+            self.desalojados += 1
+        
+        slot = self._free.pop()
+        self._slots[dispositivo_id] = slot
+        self._puntos[slot] = 0
+        self._suma[slot] = 0.0
+        self._suma2[slot] = 0.0
+        return slot, True
+    
+    def update(self, dispositivo_id, latitud, longitud, velocidad=None, fecha_hora=None):
+        """
+        Registrar un ping y devolver las features de AnomalyDetector para ese punto
+        
+        Args:
+            dispositivo_id: ID del dispositivo
+            latitud, longitud: Posición del ping
+            velocidad: km/h (None = 0, igual que fillna(0) del entrenamiento)
+            fecha_hora: datetime del ping (default: ahora)
+        
+        Returns:
+            Tuple (features, puntos_ventana): dict columna -> float y
+            número de puntos usados en la ventana móvil
+        
+        Raises:
+            OutOfOrderPing: Si fecha_hora es anterior al último ping del dispositivo
+        """
+        return self._update(dispositivo_id, latitud, longitud, velocidad, fecha_hora)
+    
+    def update_many(self, pings):
+        """
+        Registrar un lote de pings en orden
+        
+        Igual que llamar a update() por cada ping, pero las distancias al
+        punto anterior de cada dispositivo se calculan en una sola llamada
+        vectorizada (la geodésica escalar domina el costo de update()).
+        Si el punto anterior cambió entre el cálculo y la aplicación (otro
+        hilo, o un ping del lote rechazado), esa distancia se recalcula.
+        
+        Args:
+            pings: Lista de tuplas (dispositivo_id, latitud, longitud, velocidad, fecha_hora)
+        
+        Returns:
+            Lista con (features, puntos_ventana) por ping, u OutOfOrderPing en
+            la posición de un ping rechazado
+        """
+        n = len(pings)
+        prev_lat = np.full(n, np.nan)
+        prev_lon = np.full(n, np.nan)
+        
+        ultimo = {}
+        with self._lock:
+            for i, (dispositivo_id, latitud, longitud, _, _) in enumerate(pings):
+                anterior = ultimo.get(dispositivo_id)
+                if anterior is None:
+                    slot = self._slots.get(dispositivo_id)
+                    if slot is not None:
+                        anterior = (self._lat[slot], self._lon[slot])
+                if anterior is not None:
+                    prev_lat[i], prev_lon[i] = anterior
+                ultimo[dispositivo_id] = (latitud, longitud)
+        
+        lat = np.fromiter((p[1] for p in pings), dtype=float, count=n)
+        lon = np.fromiter((p[2] for p in pings), dtype=float, count=n)
+        con_anterior = ~np.isnan(prev_lat)
+        distancias = np.full(n, np.nan)
+        if con_anterior.any():
+            distancias[con_anterior] = geo_arrays.calculate_distance(
+                prev_lat[con_anterior], prev_lon[con_anterior],
+                lat[con_anterior], lon[con_anterior], method='geodesic'
+            )
+        
+        resultados = []
+        for i, (dispositivo_id, latitud, longitud, velocidad, fecha_hora) in enumerate(pings):
+            distancia = (prev_lat[i], prev_lon[i], distancias[i]) if con_anterior[i] else None
+            try:
+                resultados.append(self._update(
+                    dispositivo_id, latitud, longitud, velocidad, fecha_hora, distancia
+                ))
+            except OutOfOrderPing as e:
+                resultados.append(e)
+        
+        return resultados
+    
+    def _update(self, dispositivo_id, latitud, longitud, velocidad, fecha_hora, distancia=None):
+        """
+        update() con la distancia opcionalmente precalculada
+        
+        Args:
+            distancia: Tupla (lat_anterior, lon_anterior, km) o None; solo se usa
+                       si el punto anterior guardado sigue siendo ese
+        """
+        fecha_hora = fecha_hora or datetime.now()
+        if fecha_hora.tzinfo is not None:
+            fecha_hora = fecha_hora.replace(tzinfo=None)
+        fecha = np.datetime64(fecha_hora, 's')
+        velocidad = float(velocidad or 0.0)
+        
+        with self._lock:
+            ahora = time.monotonic()
+            self._expire(ahora)
+            slot, nuevo = self._slot(dispositivo_id)
+            
+            if not nuevo and fecha < self._fecha[slot]:
+                self.fuera_de_orden += 1
+                raise OutOfOrderPing(
+                    f"Ping de {fecha_hora} anterior al último del dispositivo {dispositivo_id} "
+                    f"({self._fecha[slot]})"
+                )
+            
+            if nuevo:
+                cambio_velocidad = 0.0
+                distancia_metros = 0.0
+            else:
+                cambio_velocidad = abs(velocidad - self._velocidad[slot])
+                if (distancia is not None and distancia[0] == self._lat[slot]
+                        and distancia[1] == self._lon[slot]):
+                    distancia_metros = float(distancia[2]) * 1000
+                else:
+                    distancia_metros = float(geo_arrays.calculate_distance(
+                        self._lat[slot], self._lon[slot], latitud, longitud, method='geodesic'
+                    )) * 1000
+            
+            # Ring buffer: la velocidad nueva reemplaza a la más vieja de la ventana
+            puntos = self._puntos[slot]
+            pos = puntos % self.window_size
+            vieja = self._buffer[slot, pos] if puntos >= self.window_size else 0.0
+            self._buffer[slot, pos] = velocidad
+            puntos += 1
+            
+            if pos == self.window_size - 1:
+                ventana = self._buffer[slot]
+                self._suma[slot] = ventana.sum()
+                self._suma2[slot] = (ventana ** 2).sum()
+            else:
+                self._suma[slot] += velocidad - vieja
+                self._suma2[slot] += velocidad ** 2 - vieja ** 2
+            
+            k = min(puntos, self.window_size)
+            media = self._suma[slot] / k
+            if k > 1:
+                varianza = max((self._suma2[slot] - k * media ** 2) / (k - 1), 0.0)
+                desviacion = float(np.sqrt(varianza))
+            else:
+                desviacion = 0.0
+            
+            self._puntos[slot] = puntos
+            self._lat[slot] = latitud
+            self._lon[slot] = longitud
+            self._velocidad[slot] = velocidad
+            self._fecha[slot] = fecha
+            self._visto[slot] = ahora
+            self._update_day(slot, nuevo, fecha, velocidad, cambio_velocidad, distancia_metros)
+            self.pings += 1
+        
+        dia_semana = fecha_hora.weekday()
+        features = {
+            'velocidad': velocidad,
+            'hora_dia': float(fecha_hora.hour),
+            'dia_semana': float(dia_semana),
+            'es_fin_semana': float(dia_semana >= 5),
+            'cambio_velocidad': cambio_velocidad,
+            'distancia_metros': distancia_metros,
+            'tiempo_detenido': float(velocidad < FEATURE_CONFIG['stop_threshold']),
+            'velocidad_media_window': float(media),
+            'velocidad_std_window': desviacion,
+        }
+        
+        return features, int(k)
+    
+    def _update_day(self, slot, nuevo, fecha, velocidad, cambio_velocidad, distancia_metros):
+        """Acumular el ping en los totales del día (se reinician al cambiar de día)"""
+        dia = fecha.astype('datetime64[D]')
+        if nuevo or dia != self._dia[slot]:
+            self._dia[slot] = dia
+            self._dia_puntos[slot] = 0
+            self._dia_media[slot] = 0.0
+            self._dia_m2[slot] = 0.0
+            self._dia_maxima[slot] = velocidad
+            self._dia_violaciones[slot] = 0
+            self._dia_movimiento[slot] = 0
+            self._dia_distancia[slot] = 0.0
+            self._dia_cambios[slot] = 0
+            # El primer punto del día no tiene anterior dentro del grupo
+            cambio_velocidad = 0.0
+            distancia_metros = 0.0
+        
+        n = self._dia_puntos[slot] + 1
+        delta = velocidad - self._dia_media[slot]
+        self._dia_media[slot] += delta / n
+        self._dia_m2[slot] += delta * (velocidad - self._dia_media[slot])
+        self._dia_puntos[slot] = n
+        self._dia_maxima[slot] = max(self._dia_maxima[slot], velocidad)
+        self._dia_violaciones[slot] += velocidad > FEATURE_CONFIG['speed_limit']
+        self._dia_movimiento[slot] += velocidad >= FEATURE_CONFIG['stop_threshold']
+        self._dia_distancia[slot] += distancia_metros / 1000
+        self._dia_cambios[slot] += cambio_velocidad > FEATURE_CONFIG['erratic_change']
+    
+    def daily_totals(self, dispositivo_id):
+        """
+        Totales del día en curso de un dispositivo
+        
+        Args:
+            dispositivo_id: ID del dispositivo
+        
+        Returns:
+            dict con fecha, puntos, velocidad_promedio, velocidad_maxima,
+            velocidad_std, violaciones_velocidad, puntos_movimiento,
+            distancia_total_km y cambios_bruscos; None si no hay estado
+        """
+        with self._lock:
+            slot = self._slots.get(dispositivo_id)
+            if slot is None:
+                return None
+            
+            puntos = int(self._dia_puntos[slot])
+            return {
+                'fecha': self._dia[slot].item(),
+                'puntos': puntos,
+                'velocidad_promedio': float(self._dia_media[slot]),
+                'velocidad_maxima': float(self._dia_maxima[slot]),
+                'velocidad_std': float(np.sqrt(self._dia_m2[slot] / (puntos - 1))) if puntos > 1 else 0.0,
+                'violaciones_velocidad': int(self._dia_violaciones[slot]),
+                'puntos_movimiento': int(self._dia_movimiento[slot]),
+                'distancia_total_km': float(self._dia_distancia[slot]),
+                'cambios_bruscos': int(self._dia_cambios[slot]),
+            }
+    
+    def forget(self, dispositivo_id):
+        """Descartar el estado de un dispositivo"""
+        with self._lock:
+            slot = self._slots.pop(dispositivo_id, None)
+            if slot is not None:
+                self._free.append(slot)
+    
+    def __len__(self):
+        return len(self._slots)
+    
+    def stats(self):
+        """Ocupación, desalojos y memoria preasignada"""
+        arrays = (self._buffer, self._puntos, self._suma, self._suma2, self._lat,
+                  self._lon, self._velocidad, self._fecha, self._visto,
+                  self._dia, self._dia_puntos, self._dia_media, self._dia_m2, self._dia_maxima,
+                  self._dia_violaciones, self._dia_movimiento, self._dia_distancia, self._dia_cambios)
+        return {
+            'dispositivos': len(self._slots),
+            'max_devices': self.max_devices,
+            'ttl_seconds': self.ttl_seconds,
+            'window_size': self.window_size,
+            'pings': self.pings,
+            'desalojados_lru': self.desalojados,
+            'expirados_ttl': self.expirados,
+            'fuera_de_orden': self.fuera_de_orden,
+            'memoria_mb': round(sum(a.nbytes for a in arrays) / 1e6, 2),
+        }
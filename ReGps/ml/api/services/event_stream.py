@@ -0,0 +1,293 @@
+"""
+Fuentes y destinos de eventos para el consumidor en línea
+
+Laravel emite el evento UbicacionActualizada (broadcastAs
+'ubicacion.actualizada', canal 'ubicaciones') por cada ubicación nueva.
+Con el broadcaster 'redis' el mensaje publicado en el canal (con el prefijo
+de la conexión) es:
+    
+    {"event": "ubicacion.actualizada", "data": {...broadcastWith()...}, "socket": null}
+
+Fuentes (todas con la misma interfaz: get(timeout) -> mensaje o None):
+- RedisSource: suscripción pub/sub al canal del broadcaster, o una lista de
+  Redis (BLPOP) como cola duradera de prueba. Requiere el paquete `redis`.
+- JsonlSource: un evento por línea desde un archivo o stdin (reproducir
+  extracciones o pruebas locales).
+- QueueSource: queue.Queue en memoria, para embeber el consumidor en otro
+  proceso o en pruebas.
+
+Destinos (emit(resultados) recibe un lote completo): RedisSink publica un
+mensaje por lote, JsonlSink escribe una línea por resultado, QueueSink los
+deja en una cola en memoria.
+"""
+
+import json
+import queue
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from config import CONSUMER_CONFIG
+
+
+def json_default(valor):
+    """Serializar datetime/numpy en los resultados"""
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    if hasattr(valor, 'item'):
+        return valor.item()
+    raise TypeError(f"{type(valor).__name__} no es serializable")
+
+
+def _parse_fecha(valor):
+    """ISO 8601 (con o sin zona) a datetime UTC sin zona; None si no viene"""
+    if valor in (None, ''):
+        return None
+    fecha = datetime.fromisoformat(str(valor).replace(' ', 'T', 1))
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha
+
+
+def parse_ubicacion_event(mensaje, event_name=None):
+    """
+    Convertir un mensaje de UbicacionActualizada en un ping
+    
+    Acepta el sobre del broadcaster ({"event", "data"}) o directamente el
+    dict de broadcastWith(). Laravel serializa Latitud/Longitud/Velocidad
+    como strings decimales; las fechas se interpretan en UTC (la zona de
+    la aplicación).
+    
+    Args:
+        mensaje: str/bytes JSON o dict
+        event_name: Nombre del evento esperado (default: CONSUMER_CONFIG['event_name'])
+    
+    Returns:
+        dict con evento_id, dispositivo_id, latitud, longitud, velocidad y
+        fecha_hora (None si el evento no trae fecha); None si el mensaje es
+        de otro evento
+    
+    Raises:
+        ValueError: Si el mensaje no es JSON válido o le faltan campos
+    """
+    event_name = event_name or CONSUMER_CONFIG['event_name']
+    
+    if isinstance(mensaje, (bytes, str)):
+        try:
+            mensaje = json.loads(mensaje)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Mensaje no es JSON válido: {e}") from e
+    
+    if not isinstance(mensaje, dict):
+        raise ValueError(f"Mensaje inesperado: {type(mensaje).__name__}")
+    
+    if 'data' in mensaje and 'event' in mensaje:
+        if mensaje['event'] != event_name:
+            return None
+        datos = mensaje['data']
+    else:
+        datos = mensaje
+    
+    try:
+        return {
+            'evento_id': datos.get('id'),
+            'dispositivo_id': int(datos['dispositivo_id']),
+            'latitud': float(datos['latitud']),
+            'longitud': float(datos['longitud']),
+            'velocidad': float(datos['velocidad']) if datos.get('velocidad') is not None else None,
+            'fecha_hora': _parse_fecha(
+                datos.get('timestamp') or datos.get('fecha_hora') or datos.get('FechaHora')
+            ),
+        }
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Evento de ubicación incompleto: {e}") from e
+
+
+# ============================================================================
+# FUENTES
+# ============================================================================
+
+class QueueSource:
+    """Eventos desde una queue.Queue en memoria"""
+    
+    _FIN = object()
+    
+    def __init__(self, cola=None):
+        """
+        Args:
+            cola: queue.Queue a consumir (default: una nueva)
+        """
+        self.cola = cola if cola is not None else queue.Queue()
+        self.agotado = False
+    
+    def put(self, mensaje):
+        """Encolar un mensaje"""
+        self.cola.put(mensaje)
+    
+    def end(self):
+        """Marcar el final del stream (el consumidor termina al vaciar la cola)"""
+        self.cola.put(self._FIN)
+    
+    def get(self, timeout):
+        """Siguiente mensaje o None si no llega ninguno en `timeout` segundos"""
+        if self.agotado:
+            return None
+        try:
+            mensaje = self.cola.get(timeout=timeout) if timeout > 0 else self.cola.get_nowait()
+        except queue.Empty:
+            return None
+        if mensaje is self._FIN:
+            self.agotado = True
+            return None
+        return mensaje
+    
+    def close(self):
+        pass
+
+
+class JsonlSource:
+    """Eventos desde un archivo JSONL (o stdin con '-'), uno por línea"""
+    
+    def __init__(self, path):
+        """
+        Args:
+            path: Ruta del archivo o '-' para stdin
+        """
+        self.path = path
+        self._file = sys.stdin if str(path) == '-' else open(path, 'r', encoding='utf-8')
+        self.agotado = False
+    
+    def get(self, timeout):
+        """Siguiente línea no vacía; None al llegar al final"""
+        while not self.agotado:
+            linea = self._file.readline()
+            if not linea:
+                self.agotado = True
+                break
+            if linea.strip():
+                return linea
+        return None
+    
+    def close(self):
+        if self._file is not sys.stdin:
+            self._file.close()
+
+
+def _redis_client(url):
+    """Cliente de Redis (dependencia opcional, solo para las fuentes/destinos Redis)"""
+    try:
+        import redis
+    except ImportError as e:
+        raise ImportError(
+            "El consumidor con Redis requiere el paquete 'redis' (pip install redis)"
+        ) from e
+    return redis.Redis.from_url(url)
+
+
+class RedisSource:
+    """
+    Eventos desde Redis
+    
+    - mode='pubsub': suscripción al canal del broadcaster de Laravel. Los
+      mensajes publicados mientras el consumidor no está conectado se pierden.
+    - mode='list': BLPOP sobre una lista (p. ej. alimentada con RPUSH por un
+      listener de Laravel) para no perder eventos entre reinicios.
+    """
+    
+    def __init__(self, channel=None, url=None, mode='pubsub'):
+        """
+        Args:
+            channel: Canal o lista (default: CONSUMER_CONFIG['channel'])
+            url: URL de Redis (default: CONSUMER_CONFIG['redis_url'])
+            mode: 'pubsub' o 'list'
+        """
+        if mode not in ('pubsub', 'list'):
+            raise ValueError(f"mode debe ser 'pubsub' o 'list', no '{mode}'")
+        
+        self.channel = channel or CONSUMER_CONFIG['channel']
+        self.mode = mode
+        self.agotado = False
+        self._client = _redis_client(url or CONSUMER_CONFIG['redis_url'])
+        
+        if mode == 'pubsub':
+            self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.subscribe(self.channel)
+    
+    def get(self, timeout):
+        """Siguiente mensaje o None si no llega ninguno en `timeout` segundos"""
+        if self.mode == 'pubsub':
+            mensaje = self._pubsub.get_message(timeout=timeout)
+            return mensaje['data'] if mensaje else None
+        
+        if timeout <= 0:
+            return self._client.lpop(self.channel)
+        # BLPOP solo acepta timeouts desde 0.01 s (0 bloquearía para siempre)
+        item = self._client.blpop([self.channel], timeout=max(timeout, 0.01))
+        return item[1] if item else None
+    
+    def close(self):
+        if self.mode == 'pubsub':
+            self._pubsub.close()
+        self._client.close()
+
+
+# ============================================================================
+# DESTINOS
+# ============================================================================
+
+class QueueSink:
+    """Resultados a una queue.Queue en memoria (un item por lote)"""
+    
+    def __init__(self, cola=None):
+        self.cola = cola if cola is not None else queue.Queue()
+    
+    def emit(self, resultados):
+        self.cola.put(resultados)
+    
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    """Resultados como JSONL a un archivo (o stdout con '-'), uno por línea"""
+    
+    def __init__(self, path):
+        """
+        Args:
+            path: Ruta del archivo (se agrega al final) o '-' para stdout
+        """
+        self._file = sys.stdout if str(path) == '-' else open(path, 'a', encoding='utf-8')
+    
+    def emit(self, resultados):
+        self._file.write(''.join(
+            json.dumps(r, default=json_default, ensure_ascii=False) + '\n' for r in resultados
+        ))
+        self._file.flush()
+    
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class RedisSink:
+    """Resultados publicados en un canal de Redis: un mensaje por lote"""
+    
+    def __init__(self, channel=None, url=None):
+        """
+        Args:
+            channel: Canal de resultados (default: CONSUMER_CONFIG['results_channel'])
+            url: URL de Redis (default: CONSUMER_CONFIG['redis_url'])
+        """
+        self.channel = channel or CONSUMER_CONFIG['results_channel']
+        self._client = _redis_client(url or CONSUMER_CONFIG['redis_url'])
+    
+    def emit(self, resultados):
+        self._client.publish(self.channel, json.dumps(
+            {'event': 'ml.resultados', 'data': {'resultados': resultados}},
+            default=json_default, ensure_ascii=False
+        ))
+    
+    def close(self):
+        self._client.close()
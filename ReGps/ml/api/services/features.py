@@ -0,0 +1,270 @@
+"""
+Features de inferencia para los endpoints de la API
+
+Reproducen con NumPy las mismas features que usan los modelos al entrenar
+(ETAPredictor.create_features, AnomalyDetector.create_features y
+BehaviorClassifier.create_daily_metrics), pero a partir de los puntos que
+llegan en el request y sin construir DataFrames.
+
+Las secuencias de ubicaciones de uno o varios requests se aplanan en arrays
+contiguos con un marcador `is_first` por request (igual que los bloques por
+dispositivo de utils.trajectory_utils), así un solo request y un lote de
+miles se calculan con el mismo código.
+"""
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from config import FEATURE_CONFIG
+from utils import geo_arrays
+from utils.trajectory_utils import (
+    group_sizes, shift_within_group, diff_within_group, rolling_within_group
+)
+from models.eta_predictor import factor_hora
+from models.behavior_classifier import BehaviorClassifier
+
+# Solo para calculate_score: la fórmula del score es la misma del entrenamiento
+_behavior_scoring = BehaviorClassifier()
+
+
+def flatten_points(secuencias, ahora=None):
+    """
+    Aplana listas de LocationPoint en arrays contiguos
+    
+    Args:
+        secuencias: Lista de listas de puntos (latitud, longitud, velocidad, fecha_hora)
+        ahora: Fecha para los puntos sin fecha_hora (default: datetime.now())
+    
+    Returns:
+        dict: Arrays 'lat', 'lon', 'velocidad', 'fecha' (datetime64[s]) e 'is_first'
+    """
+    ahora = ahora or datetime.now()
+    puntos = [p for secuencia in secuencias for p in secuencia]
+    
+    tamanos = np.array([len(s) for s in secuencias], dtype=np.int64)
+    is_first = np.zeros(len(puntos), dtype=bool)
+    is_first[(np.cumsum(tamanos) - tamanos)[tamanos > 0]] = True
+    
+    return {
+        'lat': np.fromiter((p.latitud for p in puntos), dtype=float, count=len(puntos)),
+        'lon': np.fromiter((p.longitud for p in puntos), dtype=float, count=len(puntos)),
+        'velocidad': np.fromiter(
+            (p.velocidad or 0.0 for p in puntos), dtype=float, count=len(puntos)
+        ),
+        'fecha': _as_datetime64([p.fecha_hora or ahora for p in puntos]),
+        'is_first': is_first,
+    }
+
+
+def _as_datetime64(fechas):
+    """Lista de datetime a datetime64[s] (hora local; la zona horaria se descarta)"""
+    # Por punto: los requests de un lote pueden mezclar horas con y sin zona, o zonas distintas
+    fechas = [f.replace(tzinfo=None) if f.tzinfo is not None else f for f in fechas]
+    return np.array(fechas, dtype='datetime64[s]')
+
+
+def eta_features(lat, lon, dest_lat, dest_lon, velocidad, hora, dia_semana, velocidad_historica):
+    """
+    Features de ETAPredictor para uno o varios pares origen-destino
+    
+    Args:
+        lat, lon: Ubicación actual
+        dest_lat, dest_lon: Destino
+        velocidad: Velocidad actual en km/h
+        hora: Hora del día (0-23)
+        dia_semana: Día de la semana (0=Lunes)
+        velocidad_historica: Velocidad promedio del dispositivo en km/h
+    
+    Returns:
+        dict: Una columna (array) por feature del modelo
+    """
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    dest_lat, dest_lon = np.asarray(dest_lat, dtype=float), np.asarray(dest_lon, dtype=float)
+    hora = np.asarray(hora, dtype=float)
+    dia_semana = np.asarray(dia_semana, dtype=float)
+    velocidad_historica = np.asarray(velocidad_historica, dtype=float)
+    
+    distancia = geo_arrays.calculate_distance(lat, lon, dest_lat, dest_lon, method='geodesic')
+    factor = np.asarray(factor_hora(hora), dtype=float)
+    velocidad_esperada = velocidad_historica * factor
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        eta_simple = np.where(velocidad_esperada > 0, distancia / velocidad_esperada * 60, 0.0)
+    
+    return {
+        'distancia_km': distancia,
+        'bearing': geo_arrays.calculate_bearing(lat, lon, dest_lat, dest_lon),
+        'velocidad_origen': np.asarray(velocidad, dtype=float),
+        'velocidad_promedio_historica': velocidad_historica,
+        'velocidad_esperada': velocidad_esperada,
+        'hora_inicio': hora,
+        'dia_semana': dia_semana,
+        'es_fin_semana': (dia_semana >= 5).astype(float),
+        'factor_hora': factor,
+        'eta_simple': eta_simple,
+    }
+
+
+def anomaly_features(puntos):
+    """
+    Features de AnomalyDetector por punto (una fila por ubicación)
+    
+    Args:
+        puntos: Resultado de flatten_points
+    
+    Returns:
+        dict: Una columna (array) por feature del modelo
+    """
+    is_first = puntos['is_first']
+    velocidades = puntos['velocidad']
+    fechas = puntos['fecha']
+    window_size = 5
+    
+    horas = (fechas.astype('datetime64[h]') - fechas.astype('datetime64[D]')).astype(int)
+    # 1970-01-01 fue jueves: desplazar para que 0 = lunes
+    dias = (fechas.astype('datetime64[D]').astype(np.int64) + 3) % 7
+    
+    cambios = np.abs(diff_within_group(velocidades, is_first))
+    cambios[is_first] = 0.0
+    
+    distancias = geo_arrays.calculate_distance(
+        shift_within_group(puntos['lat'], is_first), shift_within_group(puntos['lon'], is_first),
+        puntos['lat'], puntos['lon'], method='geodesic'
+    ) * 1000
+    distancias[is_first] = 0.0
+    
+    ventana = rolling_within_group(velocidades, is_first, window_size, min_periods=1)
+    pocos_puntos = group_sizes(is_first) < window_size
+    
+    return {
+        'velocidad': velocidades,
+        'hora_dia': horas.astype(float),
+        'dia_semana': dias.astype(float),
+        'es_fin_semana': (dias >= 5).astype(float),
+        'cambio_velocidad': cambios,
+        'distancia_metros': distancias,
+        'tiempo_detenido': (velocidades < FEATURE_CONFIG['stop_threshold']).astype(float),
+        'velocidad_media_window': np.where(pocos_puntos, 0.0, np.nan_to_num(ventana['mean'])),
+        'velocidad_std_window': np.where(pocos_puntos, 0.0, np.nan_to_num(ventana['std'])),
+    }
+
+
+def behavior_features(puntos):
+    """
+    Métricas de BehaviorClassifier por secuencia (una fila por request)
+    
+    Los requests no traen eventos de zona ni alertas: esas métricas van en 0.
+    
+    Args:
+        puntos: Resultado de flatten_points
+    
+    Returns:
+        dict: Una columna (array) por feature del modelo
+    """
+    is_first = puntos['is_first']
+    velocidades = puntos['velocidad']
+    inicios = np.flatnonzero(is_first)
+    n_puntos = np.diff(np.append(inicios, len(velocidades)))
+    
+    def suma_por_grupo(valores):
+        if len(inicios) == 0:
+            return np.zeros(0)
+        return np.add.reduceat(valores, inicios)
+    
+    velocidad_promedio = suma_por_grupo(velocidades) / n_puntos
+    velocidad_maxima = np.maximum.reduceat(velocidades, inicios) if len(inicios) else np.zeros(0)
+    desviaciones = (velocidades - np.repeat(velocidad_promedio, n_puntos)) ** 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        velocidad_std = np.where(n_puntos > 1, np.sqrt(suma_por_grupo(desviaciones) / (n_puntos - 1)), 0.0)
+    
+    violaciones = suma_por_grupo((velocidades > FEATURE_CONFIG['speed_limit']).astype(float))
+    movimiento = suma_por_grupo((velocidades >= FEATURE_CONFIG['stop_threshold']).astype(float))
+    pct_tiempo_movimiento = movimiento / n_puntos * 100
+    
+    distancias = geo_arrays.calculate_distance(
+        shift_within_group(puntos['lat'], is_first), shift_within_group(puntos['lon'], is_first),
+        puntos['lat'], puntos['lon'], method='geodesic'
+    )
+    distancias[is_first] = 0.0
+    
+    cambios = np.abs(diff_within_group(velocidades, is_first))
+    cambios_bruscos = suma_por_grupo((cambios > FEATURE_CONFIG['erratic_change']).astype(float))
+    
+    ceros = np.zeros(len(inicios))
+    score = _behavior_scoring.calculate_score(
+        violaciones_velocidad=violaciones,
+        eventos_zona_restringida=ceros,
+        alertas_criticas=ceros,
+        pct_tiempo_movimiento=pct_tiempo_movimiento,
+        cambios_bruscos=cambios_bruscos,
+        eventos_checkpoint=ceros
+    )
+    
+    return {
+        'velocidad_promedio': velocidad_promedio,
+        'velocidad_maxima': velocidad_maxima,
+        'velocidad_std': velocidad_std,
+        'violaciones_velocidad': violaciones,
+        'pct_violaciones_velocidad': violaciones / n_puntos * 100,
+        'pct_tiempo_movimiento': pct_tiempo_movimiento,
+        'distancia_total_km': suma_por_grupo(distancias),
+        'cambios_bruscos': cambios_bruscos,
+        'eventos_zona_restringida': ceros,
+        'eventos_checkpoint': ceros,
+        'alertas_dia': ceros,
+        'alertas_criticas': ceros,
+        'puntos_totales': n_puntos.astype(float),
+        'score': np.atleast_1d(score),
+    }
+
+
+def daily_behavior_features(totales):
+    """
+    Métricas de BehaviorClassifier a partir de los totales del día en curso
+    que acumula DeviceStateStore (una fila por dispositivo)
+    
+    Args:
+        totales: Lista de dicts de DeviceStateStore.daily_totals
+    
+    Returns:
+        dict: Una columna (array) por feature del modelo
+    """
+    def columna(clave):
+        return np.fromiter((t[clave] for t in totales), dtype=float, count=len(totales))
+    
+    n_puntos = columna('puntos')
+    violaciones = columna('violaciones_velocidad')
+    pct_tiempo_movimiento = columna('puntos_movimiento') / n_puntos * 100
+    cambios_bruscos = columna('cambios_bruscos')
+    
+    ceros = np.zeros(len(totales))
+    score = _behavior_scoring.calculate_score(
+        violaciones_velocidad=violaciones,
+        eventos_zona_restringida=ceros,
+        alertas_criticas=ceros,
+        pct_tiempo_movimiento=pct_tiempo_movimiento,
+        cambios_bruscos=cambios_bruscos,
+        eventos_checkpoint=ceros
+    )
+    
+    return {
+        'velocidad_promedio': columna('velocidad_promedio'),
+        'velocidad_maxima': columna('velocidad_maxima'),
+        'velocidad_std': columna('velocidad_std'),
+        'violaciones_velocidad': violaciones,
+        'pct_violaciones_velocidad': violaciones / n_puntos * 100,
+        'pct_tiempo_movimiento': pct_tiempo_movimiento,
+        'distancia_total_km': columna('distancia_total_km'),
+        'cambios_bruscos': cambios_bruscos,
+        'eventos_zona_restringida': ceros,
+        'eventos_checkpoint': ceros,
+        'alertas_dia': ceros,
+        'alertas_criticas': ceros,
+        'puntos_totales': n_puntos,
+        'score': np.atleast_1d(score),
+    }
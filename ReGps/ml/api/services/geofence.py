@@ -0,0 +1,198 @@
+"""
+Servicio de geocercas de la API
+
+Carga la tabla zonas una vez en un GeofenceIndex (utils.geofence) y lo
+mantiene al día sin recargarla completa: cada `geofence_refresh_seconds`
+consulta COUNT(*) y MAX(updated_at) de zonas y, solo si cambiaron, trae las
+filas modificadas desde la última marca de agua y los IDs vigentes (para
+detectar zonas borradas). El índice nuevo reemplaza al anterior con una
+sola asignación: los requests en curso terminan con el que tenían.
+"""
+
+import asyncio
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from config import API_CONFIG
+from utils.geofence import GeofenceIndex
+
+
+ZONAS_QUERY = """
+SELECT
+    ZonaID, Nombre, TipoZona, TipoGeometria, Latitud, Longitud, Radio,
+    Coordenadas, HorarioInicio, HorarioFin, Estado, updated_at
+FROM zonas
+"""
+
+
+class GeofenceService:
+    """Índice de zonas cargado desde la BD con refresco incremental"""
+    
+    def __init__(self, db, refresh_seconds=None):
+        """
+        Args:
+            db: AsyncDatabase (o cualquier objeto con `async query(sql, params)`)
+            refresh_seconds: Segundos entre revisiones de cambios
+                             (default: API_CONFIG['geofence_refresh_seconds'])
+        """
+        self.db = db
+        self.refresh_seconds = refresh_seconds or API_CONFIG['geofence_refresh_seconds']
+        self.index = GeofenceIndex()
+        self.cargado = False
+        self.error = None
+        
+        self._ids = set()
+        self._marca = None
+        self._total = None
+        self.refrescos = 0
+        self.ultima_carga_ms = None
+        self.ultimo_refresco = None
+    
+    async def load(self):
+        """Carga completa de las zonas"""
+        inicio = time.perf_counter()
+        df = await self.db.query(ZONAS_QUERY)
+        
+        self.index = GeofenceIndex.from_dataframe(df)
+        self._ids = set(int(i) for i in df['ZonaID'])
+        self._total = len(df)
+        self._marca = self._max_marca(df)
+        self.cargado = True
+        self.error = None
+        self.ultima_carga_ms = round((time.perf_counter() - inicio) * 1000, 1)
+        self.ultimo_refresco = time.time()
+        
+        print(f"🗺️ Geocercas: {len(self.index)} zonas activas indexadas ({self.ultima_carga_ms} ms)")
+        return self.index
+    
+    async def refresh(self):
+        """
+        Aplicar solo los cambios de zonas desde la última revisión
+        
+        Returns:
+            dict con zonas modificadas y eliminadas (vacío si no hubo cambios)
+        """
+        if not self.cargado:
+            await self.load()
+            return {'carga_completa': True}
+        
+        resumen = await self.db.query("SELECT COUNT(*) AS total, MAX(updated_at) AS marca FROM zonas")
+        total = int(resumen['total'].iloc[0])
+        marca = resumen['marca'].iloc[0]
+        self.ultimo_refresco = time.time()
+        
+        if total == self._total and (pd.isna(marca) or (self._marca is not None and marca <= self._marca)):
+            return {}
+        
+        # >= en vez de >: las actualizaciones del mismo segundo que la marca
+        # no se pierden (volver a parsear una zona sin cambios es inocuo)
+        if self._marca is not None:
+            cambios = await self.db.query(
+                ZONAS_QUERY + " WHERE updated_at >= %(desde)s", {'desde': self._marca}
+            )
+        else:
+            cambios = await self.db.query(ZONAS_QUERY)
+        
+        ids = await self.db.query("SELECT ZonaID FROM zonas")
+        vigentes = set(int(i) for i in ids['ZonaID'])
+        eliminadas = self._ids - vigentes
+        
+        self.index = self.index.with_changes(cambios, eliminadas)
+        self._ids = vigentes
+        self._total = total
+        marca_cambios = self._max_marca(cambios)
+        if marca_cambios is not None and (self._marca is None or marca_cambios > self._marca):
+            self._marca = marca_cambios
+        self.refrescos += 1
+        
+        print(f"🗺️ Geocercas actualizadas: {len(cambios)} modificadas, {len(eliminadas)} eliminadas")
+        return {'modificadas': len(cambios), 'eliminadas': len(eliminadas)}
+    
+    @staticmethod
+    def _max_marca(df):
+        """Mayor updated_at de las filas (None si no hay)"""
+        marca = df['updated_at'].max() if len(df) else None
+        return None if pd.isna(marca) else marca
+    
+    async def run(self):
+        """Revisar cambios periódicamente (tarea de fondo del lifespan)"""
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # La API sigue con el último índice válido
+                self.error = f"{type(e).__name__}: {e}"
+                print(f"⚠️ No se pudieron refrescar las geocercas: {e}")
+    
+    def verify(self, ubicaciones):
+        """
+        Zonas que contienen cada ubicación, respetando los horarios
+        
+        Args:
+            ubicaciones: Lista de LocationPoint (fecha_hora None = ahora)
+        
+        Returns:
+            Lista de dicts con los campos de GeofenceResponse
+        """
+        index = self.index
+        lat = np.fromiter((u.latitud for u in ubicaciones), dtype=float, count=len(ubicaciones))
+        lon = np.fromiter((u.longitud for u in ubicaciones), dtype=float, count=len(ubicaciones))
+        ahora = datetime.now()
+        # Igual que DeviceStateStore: la hora se toma tal como viene (ignorando la zona)
+        fechas = [u.fecha_hora or ahora for u in ubicaciones]
+        segundos = np.fromiter(
+            (f.hour * 3600 + f.minute * 60 + f.second for f in fechas), dtype=float, count=len(fechas)
+        )
+        
+        idx_punto, idx_zona = index.query(lat, lon, segundos)
+        limites = np.searchsorted(idx_punto, np.arange(len(ubicaciones) + 1)).tolist()
+        idx_zona = idx_zona.tolist()
+        descripciones = {z: index.describe(z) for z in set(idx_zona)}
+        hay_permitidas = bool((index.tipos == 'Zona Permitida').any())
+        
+        resultados = []
+        for i in range(len(ubicaciones)):
+            zonas = [descripciones[z] for z in idx_zona[limites[i]:limites[i + 1]]]
+            tipos = {z['tipo_zona'] for z in zonas}
+            en_permitida = 'Zona Permitida' in tipos
+            en_restringida = 'Zona Restringida' in tipos
+            
+            alertas = [f"Dentro de zona restringida: {z['nombre']}"
+                       for z in zonas if z['tipo_zona'] == 'Zona Restringida']
+            if hay_permitidas and not en_permitida:
+                alertas.append("Fuera de las zonas permitidas")
+            
+            resultados.append({
+                'dentro_de_zona': bool(zonas),
+                'en_zona_permitida': en_permitida,
+                'en_zona_restringida': en_restringida,
+                'zonas': zonas,
+                'alertas': alertas,
+                'timestamp': ahora,
+            })
+        
+        return resultados
+    
+    def stats(self):
+        """Estado del índice y de los refrescos"""
+        return {
+            'cargado': self.cargado,
+            'error': self.error,
+            'refresh_seconds': self.refresh_seconds,
+            'refrescos': self.refrescos,
+            'ultima_carga_ms': self.ultima_carga_ms,
+            'segundos_desde_refresco': (
+                round(time.time() - self.ultimo_refresco, 1) if self.ultimo_refresco else None
+            ),
+            **self.index.stats(),
+        }
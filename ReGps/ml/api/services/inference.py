@@ -0,0 +1,240 @@
+"""
+Ejecutor de inferencia de la API
+
+Las predicciones de sklearn son CPU-bound: si corren dentro de un handler
+async bloquean el event loop y serializan todos los requests. Este servicio
+las ejecuta fuera del loop, en un pool configurable:
+
+- 'thread': hilos que comparten el ModelRegistry de la API. sklearn libera
+  el GIL en el recorrido de los árboles y LoadedModel usa buffers por hilo,
+  así que los modelos se comparten sin copiarlos.
+- 'process': procesos con su propia copia de los modelos (cada worker carga
+  el registro en su inicializador). Aísla el GIL por completo a costa de
+  memoria y de serializar requests/resultados.
+
+n_jobs de cada modelo se ajusta a núcleos / workers para que los workers no
+compitan por los mismos núcleos (los modelos se entrenan con n_jobs=-1).
+
+Contrapresión: hay un máximo de llamadas pendientes (en cola o ejecutando);
+por encima se rechaza con InferenceOverloaded y la API responde 503.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from config import API_CONFIG
+from api.services.model_registry import ModelRegistry
+from api.services.prediction_service import PredictionService
+from api.services.telemetry import LatencyHistogram
+
+
+INFERENCE_MODES = ('thread', 'process')
+
+# Métodos de PredictionService que se pueden invocar
+INFERENCE_METHODS = ('predict_eta', 'detect_anomaly', 'detect_anomaly_stream', 'classify_behavior')
+
+
+class InferenceOverloaded(Exception):
+    """Demasiadas llamadas pendientes: el cliente debe reintentar más tarde"""
+
+
+def default_n_jobs(workers):
+    """Hilos por predicción para no sobresuscribir: núcleos / workers (mín. 1)"""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+# ============================================================================
+# WORKERS DE PROCESO
+# ============================================================================
+
+_worker_service = None
+
+
+def _init_process_worker(models_dir, n_jobs, model_format, tree_engine):
+    """
+    Inicializador de cada proceso: carga su propia copia de los modelos
+    (con model_format 'compact' los .mmap se comparten entre procesos)
+    """
+    global _worker_service
+    registry = ModelRegistry(models_dir, n_jobs=n_jobs, model_format=model_format, tree_engine=tree_engine)
+    registry.load_all()
+    _worker_service = PredictionService(registry)
+
+
+def _process_ping(_):
+    """
+    Tarea para arrancar los procesos al iniciar la API
+    Retiene al worker un momento para que cada ping caiga en un proceso distinto
+    y todos carguen sus modelos antes del primer request.
+    """
+    time.sleep(0.2)
+    return os.getpid()
+
+
+def _timed_call(service, method, requests, enviado):
+    """Ejecuta el método y devuelve (resultado, espera en cola, ejecución)"""
+    inicio = time.perf_counter()
+    resultado = getattr(service, method)(requests)
+    return resultado, inicio - enviado, time.perf_counter() - inicio
+
+
+def _process_call(method, requests, enviado):
+    """Llamada dentro de un proceso worker"""
+    return _timed_call(_worker_service, method, requests, enviado)
+
+
+# ============================================================================
+# EJECUTOR
+# ============================================================================
+
+class InferenceExecutor:
+    """Pool de inferencia con contrapresión y métricas de latencia"""
+    
+    def __init__(self, registry, mode=None, workers=None, n_jobs=None, max_pending=None):
+        """
+        Args:
+            registry: ModelRegistry cargado (modo 'thread' lo comparte; modo
+                      'process' solo toma su models_dir)
+            mode: 'thread' o 'process' (default: API_CONFIG['inference_mode'])
+            workers: Hilos o procesos (default: API_CONFIG['inference_workers'])
+            n_jobs: Hilos por predicción (default: API_CONFIG['inference_n_jobs'],
+                    0 = núcleos / workers)
+            max_pending: Llamadas en cola + ejecutando antes de rechazar
+                         (default: API_CONFIG['inference_max_pending'])
+        """
+        self.mode = mode or API_CONFIG['inference_mode']
+        if self.mode not in INFERENCE_MODES:
+            raise ValueError(f"mode debe ser uno de {INFERENCE_MODES}, no '{self.mode}'")
+        
+        self.workers = workers or API_CONFIG['inference_workers']
+        self.n_jobs = n_jobs or API_CONFIG['inference_n_jobs'] or default_n_jobs(self.workers)
+        self.max_pending = max_pending or API_CONFIG['inference_max_pending']
+        self.registry = registry
+        
+        if self.mode == 'thread':
+            for modelo in registry.models.values():
+                if hasattr(modelo.model, 'n_jobs'):
+                    modelo.model.n_jobs = self.n_jobs
+            self._service = PredictionService(registry)
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix='regps-inference'
+            )
+        else:
+            # spawn: no heredar hilos ni conexiones abiertas del proceso de la API
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_process_worker,
+                initargs=(str(registry.models_dir), self.n_jobs, registry.model_format, registry.tree_engine),
+            )
+        
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pendientes = 0
+        self._lock = threading.Lock()
+        self.rechazados = 0
+        self.errores = 0
+        self.queue_wait = LatencyHistogram()
+        self.latency = {method: LatencyHistogram() for method in INFERENCE_METHODS}
+        self.items = {method: 0 for method in INFERENCE_METHODS}
+    
+    def start(self):
+        """Arrancar los procesos worker (en modo 'process') antes del primer request"""
+        if self.mode == 'process':
+            pids = set(self._executor.map(_process_ping, range(self.workers), timeout=300))
+            print(f"⚙️ {len(pids)} procesos de inferencia listos")
+    
+    def _release(self, _future=None):
+        """Liberar el cupo cuando la tarea termina (aunque el cliente se haya ido)"""
+        with self._lock:
+            self._pendientes -= 1
+        self._slots.release()
+    
+    async def run(self, method, requests):
+        """
+        Ejecutar un método de PredictionService fuera del event loop
+        
+        Args:
+            method: Uno de INFERENCE_METHODS
+            requests: Lista de requests a evaluar
+        
+        Returns:
+            Resultado del método (lista de dicts por request)
+        
+        Raises:
+            InferenceOverloaded: Si ya hay max_pending llamadas pendientes
+        """
+        if method not in INFERENCE_METHODS:
+            raise ValueError(f"Método de inferencia desconocido: {method}")
+        
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rechazados += 1
+            raise InferenceOverloaded(
+                f"Inferencia saturada ({self.max_pending} llamadas pendientes)"
+            )
+        
+        with self._lock:
+            self._pendientes += 1
+        
+        loop = asyncio.get_running_loop()
+        enviado = time.perf_counter()
+        
+        try:
+            if self.mode == 'thread':
+                future = loop.run_in_executor(
+                    self._executor, _timed_call, self._service, method, requests, enviado
+                )
+            else:
+                future = loop.run_in_executor(
+                    self._executor, _process_call, method, requests, enviado
+                )
+        except Exception:
+            self._release()
+            raise
+        
+        future.add_done_callback(self._release)
+        
+        try:
+            resultado, espera, _ = await future
+        except Exception:
+            with self._lock:
+                self.errores += 1
+            raise
+        
+        self.queue_wait.observe(espera)
+        self.latency[method].observe(time.perf_counter() - enviado)
+        with self._lock:
+            self.items[method] += len(requests)
+        
+        return resultado
+    
+    def stats(self):
+        """Configuración, ocupación y latencias (espera en cola y total por método)"""
+        with self._lock:
+            pendientes = self._pendientes
+            items = dict(self.items)
+        
+        return {
+            'mode': self.mode,
+            'workers': self.workers,
+            'n_jobs': self.n_jobs,
+            'max_pending': self.max_pending,
+            'pendientes': pendientes,
+            'rechazados': self.rechazados,
+            'errores': self.errores,
+            'items': items,
+            'queue_wait': self.queue_wait.snapshot(),
+            'latency': {method: h.snapshot() for method, h in self.latency.items()},
+        }
+    
+    def close(self):
+        """Esperar las tareas en curso y cerrar el pool"""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,268 @@
+"""
+Registro de modelos entrenados servidos por la API
+
+Los artefactos .joblib de models/trained/ se cargan una sola vez en el
+lifespan de FastAPI y se calientan con una predicción de prueba (la primera
+llamada a sklearn paga validaciones e imports perezosos que no deben caer
+en un request real).
+
+Con API_CONFIG['model_format'] = 'compact' (o 'auto' si el archivo existe)
+se carga en cambio el artefacto compacto .mmap (models/compact.py): los
+árboles quedan mapeados desde el archivo, sin deserializar nada, y los
+workers de proceso comparten esas páginas en vez de tener una copia cada uno.
+
+Los wrappers (ETAPredictor, AnomalyDetector, BehaviorClassifier) predicen a
+partir de un DataFrame de una fila; aquí se evita ese costo: las features se
+copian a un buffer NumPy preasignado (uno por hilo) en el orden de
+feature_columns y el StandardScaler se aplica con sus arrays mean_/scale_.
+
+Si Numba está instalado (API_CONFIG['tree_engine']), las predicciones van
+por TreeEngine (models/tree_engine.py): recibe esas features sin escalar y
+recorre los árboles en código compilado, con salidas idénticas a sklearn y
+microsegundos por fila en vez de milisegundos.
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from config import API_CONFIG
+from models.eta_predictor import ETAPredictor
+from models.anomaly_detector import AnomalyDetector
+from models.behavior_classifier import BehaviorClassifier
+from models.compact import ARTIFACT_SUFFIX, compact_path, load_compact
+from models.tree_engine import NUMBA_AVAILABLE, TreeEngine
+
+
+MODEL_FORMATS = ('joblib', 'compact', 'auto')
+TREE_ENGINES = ('auto', 'numba', 'off')
+
+# Nombre en la API -> (clase del wrapper, archivo en models/trained/)
+MODEL_SPECS = {
+    'eta': (ETAPredictor, 'eta_predictor.joblib'),
+    'anomaly': (AnomalyDetector, 'anomaly_detector.joblib'),
+    'behavior': (BehaviorClassifier, 'behavior_classifier.joblib'),
+}
+
+
+class LoadedModel:
+    """Modelo cargado, listo para predecir desde columnas de features"""
+    
+    def __init__(self, name, wrapper, path, load_time, n_jobs=None, engine=False):
+        """
+        Args:
+            name: Nombre del modelo en MODEL_SPECS
+            wrapper: Instancia cargada (ETAPredictor, AnomalyDetector,
+                     BehaviorClassifier o CompactModel)
+            path: Ruta del artefacto
+            load_time: Segundos que tomó cargarlo
+            n_jobs: Hilos por predicción (None = el valor guardado en el
+                    artefacto, que en los modelos de entrenamiento es -1)
+            engine: Predecir con TreeEngine compilado en vez del modelo
+        """
+        self.name = name
+        self.wrapper = wrapper
+        self.model = wrapper.model
+        if n_jobs is not None and hasattr(self.model, 'n_jobs'):
+            self.model.n_jobs = n_jobs
+        self.feature_columns = list(wrapper.feature_columns)
+        self.path = Path(path)
+        self.load_time = load_time
+        self.warmup_time = None
+        
+        # Un artefacto compacto con umbrales plegados no trae scaler: el
+        # bosque recibe las features crudas
+        scaler = wrapper.scaler
+        n_features = len(self.feature_columns)
+        self.scaled = scaler is not None
+        self._mean = scaler.mean_ if self.scaled and getattr(scaler, 'with_mean', True) else np.zeros(n_features)
+        self._scale = scaler.scale_ if self.scaled and getattr(scaler, 'with_std', True) else np.ones(n_features)
+        self._local = threading.local()
+        
+        # El motor pliega el scaler en los umbrales (o usa los ya plegados)
+        self.engine = TreeEngine.from_wrapper(wrapper, compiled=True) if engine else None
+    
+    def _buffer(self, n):
+        """Matriz (n, n_features); la de una fila se reutiliza por hilo"""
+        if n != 1:
+            return np.empty((n, len(self.feature_columns)))
+        
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = np.empty((1, len(self.feature_columns)))
+        return buffer
+    
+    def matrix(self, features, scaled=True):
+        """
+        Arma la matriz escalada en el orden de feature_columns
+        
+        Args:
+            features: dict columna -> escalar o array (faltantes = 0)
+            scaled: Aplicar el StandardScaler (False = features crudas para
+                    TreeEngine; sin scaler las features siempre van crudas)
+        
+        Returns:
+            numpy.ndarray (n, n_features) lista para model.predict
+        """
+        n = max((v.size if isinstance(v, np.ndarray) else np.size(v) for v in features.values()), default=1)
+        X = self._buffer(n)
+        
+        for j, columna in enumerate(self.feature_columns):
+            X[:, j] = features.get(columna, 0.0)
+        
+        # Igual que fillna(0) del entrenamiento (también ±inf), luego StandardScaler.
+        # Con una máscara en vez de np.nan_to_num: en una fila cuesta ~1 µs, no ~10
+        X[~np.isfinite(X)] = 0.0
+        if not (scaled and self.scaled):
+            return X
+        X -= self._mean
+        X /= self._scale
+        
+        return X
+    
+    def predict(self, features):
+        """
+        Predicción del modelo (ETA en minutos o categoría de comportamiento)
+        
+        Args:
+            features: dict columna -> escalar o array
+        
+        Returns:
+            numpy.ndarray con una predicción por fila
+        """
+        if self.engine is not None:
+            return self.engine.predict(self.matrix(features, scaled=False))
+        return self.model.predict(self.matrix(features))
+    
+    def anomaly_scores(self, features):
+        """
+        Score de IsolationForest en una sola pasada por los árboles
+        
+        predict() de sklearn vuelve a calcular score_samples; aquí se usa
+        decision_function = score_samples - offset_ (< 0 = anomalía).
+        
+        Args:
+            features: dict columna -> escalar o array
+        
+        Returns:
+            numpy.ndarray: -decision_function (mayor = más anómalo, > 0 = anomalía)
+        """
+        if self.engine is not None:
+            return self.model.offset_ - self.engine.score_samples(self.matrix(features, scaled=False))
+        return self.model.offset_ - self.model.score_samples(self.matrix(features))
+    
+    def warmup(self):
+        """Predicción de prueba con features en cero"""
+        inicio = time.perf_counter()
+        features = {columna: 0.0 for columna in self.feature_columns}
+        
+        if self.name == 'anomaly':
+            self.anomaly_scores(features)
+        else:
+            self.predict(features)
+        
+        self.warmup_time = time.perf_counter() - inicio
+    
+    def info(self):
+        """Metadatos para /health"""
+        return {
+            'loaded': True,
+            'path': str(self.path),
+            'format': 'compact' if self.path.suffix == ARTIFACT_SUFFIX else 'joblib',
+            'folded': not self.scaled,
+            'n_features': len(self.feature_columns),
+            'engine': 'numba' if self.engine is not None else type(self.model).__name__,
+            'n_jobs': getattr(self.model, 'n_jobs', None),
+            'load_ms': round(self.load_time * 1000, 2),
+            'warmup_ms': round(self.warmup_time * 1000, 2) if self.warmup_time is not None else None,
+        }
+
+
+class ModelRegistry:
+    """Modelos entrenados cargados una vez al iniciar la API"""
+    
+    def __init__(self, models_dir=None, n_jobs=None, model_format=None, tree_engine=None):
+        """
+        Args:
+            models_dir: Carpeta con los .joblib (default: API_CONFIG['models_dir'])
+            n_jobs: Hilos por predicción de cada modelo (ver LoadedModel)
+            model_format: 'joblib', 'compact' o 'auto' (default: API_CONFIG['model_format'])
+            tree_engine: 'auto', 'numba' u 'off' (default: API_CONFIG['tree_engine'])
+        """
+        self.models_dir = Path(models_dir or API_CONFIG['models_dir'])
+        self.n_jobs = n_jobs
+        self.model_format = model_format or API_CONFIG['model_format']
+        if self.model_format not in MODEL_FORMATS:
+            raise ValueError(f"model_format debe ser uno de {MODEL_FORMATS}, no '{self.model_format}'")
+        self.tree_engine = tree_engine or API_CONFIG['tree_engine']
+        if self.tree_engine not in TREE_ENGINES:
+            raise ValueError(f"tree_engine debe ser uno de {TREE_ENGINES}, no '{self.tree_engine}'")
+        if self.tree_engine == 'numba' and not NUMBA_AVAILABLE:
+            raise ImportError("tree_engine='numba' requiere el paquete 'numba' (pip install numba)")
+        self.models = {}
+        self.errors = {}
+    
+    def load_all(self):
+        """
+        Cargar y calentar todos los modelos de MODEL_SPECS
+        
+        Un artefacto faltante o inválido no detiene la API: queda en errors
+        y el endpoint correspondiente sigue con su heurística.
+        
+        Returns:
+            dict: Estado por modelo (ver status)
+        """
+        engine = self.tree_engine != 'off' and NUMBA_AVAILABLE
+        for name, (cls, filename) in MODEL_SPECS.items():
+            path = self.models_dir / filename
+            compacto = compact_path(path)
+            if self.model_format == 'compact' or (self.model_format == 'auto' and compacto.exists()):
+                path, cls = compacto, None
+            
+            if not path.exists():
+                self.errors[name] = f"No existe {path}"
+                print(f"⚠️ Modelo '{name}' no encontrado: {path}")
+                continue
+            
+            try:
+                inicio = time.perf_counter()
+                wrapper = cls.load(path) if cls is not None else load_compact(path)
+                modelo = LoadedModel(
+                    name, wrapper, path, time.perf_counter() - inicio, n_jobs=self.n_jobs, engine=engine
+                )
+                modelo.warmup()
+            except Exception as e:
+                self.errors[name] = f"{type(e).__name__}: {e}"
+                print(f"❌ Error cargando modelo '{name}': {e}")
+                continue
+            
+            self.models[name] = modelo
+            self.errors.pop(name, None)
+            print(f"   • {name}: {modelo.load_time * 1000:.0f} ms carga, "
+                  f"{modelo.warmup_time * 1000:.0f} ms calentamiento")
+        
+        return self.status()
+    
+    def get(self, name):
+        """Modelo cargado o None si no está disponible"""
+        return self.models.get(name)
+    
+    @property
+    def all_loaded(self):
+        """True si todos los modelos de MODEL_SPECS están cargados"""
+        return all(name in self.models for name in MODEL_SPECS)
+    
+    def status(self):
+        """Estado por modelo: metadatos si cargó, error si no"""
+        estado = {}
+        for name in MODEL_SPECS:
+            if name in self.models:
+                estado[name] = self.models[name].info()
+            else:
+                estado[name] = {'loaded': False, 'error': self.errors.get(name, 'No cargado')}
+        return estado
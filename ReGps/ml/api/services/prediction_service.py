@@ -0,0 +1,501 @@
+"""
+Servicio de predicción de la API
+
+Calcula ETA, anomalías y comportamiento para una lista de requests a la
+vez: las features de todos los items se arman en una sola matriz y cada
+modelo hace una única llamada a predict/score_samples. Los endpoints
+individuales pasan una lista de un elemento; los de lote, la lista completa.
+
+Si un modelo no está cargado en el registro se usan las reglas de umbral
+(heurísticas) que la API tenía antes de servir modelos.
+
+Un request que no se puede evaluar no hace fallar al resto de la lista: su
+posición devuelve el ValueError y los demás su resultado.
+"""
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from config import API_CONFIG, FEATURE_CONFIG
+from api.services.features import (
+    flatten_points, eta_features, anomaly_features, behavior_features,
+    daily_behavior_features, _behavior_scoring
+)
+
+
+def describe_anomaly(features, i):
+    """
+    Tipo y detalle de la anomalía del punto i según sus features
+    
+    Args:
+        features: Resultado de anomaly_features
+        i: Índice del punto más anómalo
+    
+    Returns:
+        Tuple (tipo_anomalia, detalle)
+    """
+    velocidad = features['velocidad'][i]
+    cambio = features['cambio_velocidad'][i]
+    
+    if velocidad > FEATURE_CONFIG['speed_limit']:
+        return "exceso_velocidad", f"Velocidad excesiva: {velocidad:.1f} km/h"
+    if cambio > FEATURE_CONFIG['erratic_change']:
+        return "comportamiento_erratico", f"Cambio brusco de velocidad: {cambio:.1f} km/h"
+    if features['tiempo_detenido'][i]:
+        return "parada_prolongada", f"Detenido a las {features['hora_dia'][i]:.0f}h"
+    return "patron_atipico", f"Patrón atípico a {velocidad:.1f} km/h"
+
+
+def behavior_alerts(metricas):
+    """
+    Alertas y recomendación a partir de las métricas de comportamiento
+    
+    Args:
+        metricas: dict de escalares (una fila de behavior_features)
+    
+    Returns:
+        Tuple (alertas, recomendaciones)
+    """
+    alertas = []
+    recomendaciones = "Comportamiento dentro de parámetros normales"
+    
+    if metricas['violaciones_velocidad'] > 0:
+        alertas.append(f"Exceso de velocidad detectado: {metricas['violaciones_velocidad']:.0f} puntos")
+        recomendaciones = "Recordar al empleado los límites de velocidad de la empresa"
+    if metricas['pct_tiempo_movimiento'] < 40:
+        alertas.append(f"Tiempo excesivo detenido: {100 - metricas['pct_tiempo_movimiento']:.1f}%")
+    if metricas['cambios_bruscos'] > 5:
+        alertas.append(f"Comportamiento errático: {metricas['cambios_bruscos']:.0f} cambios bruscos")
+    
+    if alertas and metricas['violaciones_velocidad'] == 0:
+        recomendaciones = "Revisar paradas y conducción del empleado"
+    
+    return alertas, recomendaciones
+
+
+def anomaly_heuristic(ubicaciones):
+    """
+    Detección por reglas de umbral (sin modelo)
+    
+    Args:
+        ubicaciones: Lista de LocationPoint
+    
+    Returns:
+        dict con los campos de AnomalyDetectionResponse
+    
+    Raises:
+        ValueError: Si ningún punto trae velocidad
+    """
+    velocidades = [loc.velocidad for loc in ubicaciones if loc.velocidad is not None]
+    
+    if not velocidades:
+        raise ValueError("No hay datos de velocidad")
+    
+    velocidad_max = max(velocidades)
+    
+    # Detectar tipo de anomalía
+    anomalias_detectadas = []
+    tipo_anomalia = None
+    
+    # 1. Exceso de velocidad (umbral empresarial: 90 km/h)
+    if velocidad_max > 90:
+        anomalias_detectadas.append(f"Velocidad excesiva: {velocidad_max:.1f} km/h")
+        tipo_anomalia = "exceso_velocidad"
+    
+    # 2. Parada prolongada (velocidad 0 por mucho tiempo)
+    paradas = sum(1 for v in velocidades if v < 5)
+    if paradas > len(velocidades) * 0.5:  # Más del 50% detenido
+        anomalias_detectadas.append(f"Parada prolongada: {paradas}/{len(velocidades)} puntos")
+        tipo_anomalia = "parada_prolongada" if not tipo_anomalia else tipo_anomalia
+    
+    # 3. Comportamiento errático (cambios bruscos de velocidad)
+    if len(velocidades) > 1:
+        cambios_velocidad = [abs(velocidades[i] - velocidades[i-1]) for i in range(1, len(velocidades))]
+        cambios_bruscos = sum(1 for cambio in cambios_velocidad if cambio > 30)
+        if cambios_bruscos > 3:
+            anomalias_detectadas.append(f"Comportamiento errático: {cambios_bruscos} cambios bruscos")
+            tipo_anomalia = "comportamiento_erratico" if not tipo_anomalia else tipo_anomalia
+    
+    es_anomalia = len(anomalias_detectadas) > 0
+    score = velocidad_max / 150  # Normalizado para velocidades hasta 150 km/h
+    
+    detalles = " | ".join(anomalias_detectadas) if anomalias_detectadas else "Comportamiento normal detectado"
+    
+    return {
+        'es_anomalia': es_anomalia,
+        'tipo_anomalia': tipo_anomalia,
+        'score_anomalia': score,
+        'detalles': detalles,
+    }
+
+
+def behavior_heuristic(ubicaciones):
+    """
+    Clasificación por reglas de umbral (sin modelo)
+    
+    Args:
+        ubicaciones: Lista de LocationPoint
+    
+    Returns:
+        dict con los campos de BehaviorClassificationResponse
+    
+    Raises:
+        ValueError: Si ningún punto trae velocidad
+    """
+    velocidades = [loc.velocidad for loc in ubicaciones if loc.velocidad is not None]
+    
+    if not velocidades:
+        raise ValueError("No hay datos de velocidad")
+    
+    velocidad_promedio = sum(velocidades) / len(velocidades)
+    velocidad_max = max(velocidades)
+    paradas = sum(1 for v in velocidades if v < 5)
+    tiempo_movimiento = len(velocidades) - paradas
+    
+    # Clasificación basada en métricas empresariales
+    alertas = []
+    recomendaciones = None
+    
+    # Evaluar velocidad
+    if velocidad_max > 90:
+        alertas.append("Exceso de velocidad detectado")
+        categoria = "requiere_atencion"
+        score = 45
+        recomendaciones = "Recordar al empleado los límites de velocidad de la empresa"
+    elif velocidad_promedio > 60:
+        categoria = "normal"
+        score = 70
+    else:
+        categoria = "eficiente"
+        score = 90
+    
+    # Evaluar paradas
+    porcentaje_paradas = (paradas / len(velocidades)) * 100
+    if porcentaje_paradas > 60:
+        alertas.append(f"Tiempo excesivo detenido: {porcentaje_paradas:.1f}%")
+        if categoria == "eficiente":
+            categoria = "normal"
+            score = 65
+    
+    # Evaluar eficiencia
+    if tiempo_movimiento > 0 and paradas / tiempo_movimiento < 0.3:
+        # Buen ratio de movimiento
+        if not alertas:
+            score = min(score + 5, 100)
+    
+    if not alertas:
+        recomendaciones = "Comportamiento dentro de parámetros normales"
+    
+    return {
+        'categoria': categoria,
+        'score': score,
+        'alertas': alertas,
+        'metricas': {
+            "velocidad_promedio": round(velocidad_promedio, 2),
+            "velocidad_maxima": round(velocidad_max, 2),
+            "puntos_analizados": len(ubicaciones),
+            "tiempo_movimiento": tiempo_movimiento,
+            "tiempo_detenido": paradas,
+            "porcentaje_movimiento": round((tiempo_movimiento/len(velocidades))*100, 1)
+        },
+        'recomendaciones': recomendaciones,
+    }
+
+
+def behavior_result(features, k, categoria, puntos, ahora):
+    """
+    Respuesta de comportamiento para la fila k de las métricas
+    
+    Args:
+        features: Columnas de behavior_features / daily_behavior_features
+        k: Fila a describir
+        categoria: Categoría predicha para la fila
+        puntos: Puntos evaluados
+        ahora: Timestamp de la respuesta
+    
+    Returns:
+        dict con los campos de BehaviorClassificationResponse
+    """
+    metricas = {columna: float(valores[k]) for columna, valores in features.items()}
+    alertas, recomendaciones = behavior_alerts(metricas)
+    paradas = round(puntos * (100 - metricas['pct_tiempo_movimiento']) / 100)
+    
+    return {
+        'categoria': str(categoria),
+        'score': metricas['score'],
+        'alertas': alertas,
+        'metricas': {
+            "velocidad_promedio": round(metricas['velocidad_promedio'], 2),
+            "velocidad_maxima": round(metricas['velocidad_maxima'], 2),
+            "puntos_analizados": puntos,
+            "tiempo_movimiento": puntos - paradas,
+            "tiempo_detenido": paradas,
+            "porcentaje_movimiento": round(metricas['pct_tiempo_movimiento'], 1),
+            "distancia_total_km": round(metricas['distancia_total_km'], 3),
+            "cambios_bruscos": int(metricas['cambios_bruscos']),
+        },
+        'recomendaciones': recomendaciones,
+        'timestamp': ahora,
+    }
+
+
+def evaluate_each_on_error(evaluar, requests):
+    """
+    Evaluar la lista en una llamada y, si falla, cada request por separado
+    
+    Así el error queda solo en la posición de los requests que lo causan.
+    
+    Args:
+        evaluar: Función evaluar(requests) -> lista de resultados
+        requests: Lista de requests
+    
+    Returns:
+        Lista de resultados o ValueError en la posición de cada request que
+        no se pudo evaluar
+    """
+    try:
+        return evaluar(requests)
+    except ValueError as e:
+        if len(requests) == 1:
+            return [e]
+    
+    resultados = []
+    for request in requests:
+        try:
+            resultados.extend(evaluar([request]))
+        except ValueError as e:
+            resultados.append(e)
+    return resultados
+
+
+class PredictionService:
+    """Predicciones vectorizadas sobre los modelos del registro"""
+    
+    def __init__(self, registry):
+        """
+        Args:
+            registry: ModelRegistry con los modelos cargados
+        """
+        self.registry = registry
+    
+    def predict_eta(self, requests):
+        """
+        ETA para una lista de ETAPredictionRequest
+        
+        Args:
+            requests: Lista de requests (uno o miles)
+        
+        Returns:
+            Lista de dicts con los campos de ETAPredictionResponse
+        """
+        ahora = datetime.now()
+        n = len(requests)
+        
+        def columna(valor):
+            return np.fromiter((valor(r) for r in requests), dtype=float, count=n)
+        
+        features = eta_features(
+            columna(lambda r: r.ubicacion_actual.latitud),
+            columna(lambda r: r.ubicacion_actual.longitud),
+            columna(lambda r: r.destino.latitud),
+            columna(lambda r: r.destino.longitud),
+            velocidad=columna(lambda r: r.ubicacion_actual.velocidad or 0.0),
+            hora=columna(lambda r: r.hora_actual if r.hora_actual is not None else ahora.hour),
+            dia_semana=columna(lambda r: r.dia_semana if r.dia_semana is not None else ahora.weekday()),
+            velocidad_historica=np.full(n, API_CONFIG['eta_default_speed'])
+        )
+        distancia = features['distancia_km']
+        
+        modelo = self.registry.get('eta')
+        if modelo is not None:
+            eta_minutos = np.maximum(modelo.predict(features), 0.0)
+            velocidad_promedio = features['velocidad_esperada']
+        else:
+            # Estimar velocidad promedio (simplificado)
+            velocidad_promedio = np.full(n, API_CONFIG['eta_default_speed'])
+            eta_minutos = distancia / velocidad_promedio * 60
+        
+        return [
+            {
+                'eta_minutos': float(eta_minutos[i]),
+                'distancia_km': float(distancia[i]),
+                'velocidad_promedio_esperada': float(velocidad_promedio[i]),
+                'confianza': 0.75,  # Placeholder
+                'timestamp': ahora,
+            }
+            for i in range(n)
+        ]
+    
+    def detect_anomaly(self, requests):
+        """
+        Anomalías para una lista de AnomalyDetectionRequest
+        
+        Con modelo se evalúan todos los puntos de todos los requests en una
+        sola llamada y se reporta el punto más anómalo de cada request.
+        
+        Args:
+            requests: Lista de requests (uno o miles)
+        
+        Returns:
+            Lista de dicts (campos de AnomalyDetectionResponse) o ValueError
+            en la posición de un request que no se pudo evaluar
+        """
+        ahora = datetime.now()
+        modelo = self.registry.get('anomaly')
+        
+        if modelo is None:
+            resultados = []
+            for r in requests:
+                try:
+                    resultados.append({**anomaly_heuristic(r.ubicaciones), 'timestamp': ahora})
+                except ValueError as e:
+                    resultados.append(e)
+            return resultados
+        
+        return evaluate_each_on_error(
+            lambda lote: self._detect_anomaly_model(modelo, lote, ahora), requests
+        )
+    
+    def _detect_anomaly_model(self, modelo, requests, ahora):
+        """Anomalías con AnomalyDetector: el punto de mayor score de cada request"""
+        puntos = flatten_points([r.ubicaciones for r in requests], ahora=ahora)
+        features = anomaly_features(puntos)
+        scores = modelo.anomaly_scores(features)
+        
+        # Punto de mayor score de cada request: ordenar por (request, -score)
+        grupo = np.cumsum(puntos['is_first']) - 1
+        orden = np.lexsort((-scores, grupo))
+        peores = orden[np.searchsorted(grupo[orden], np.arange(len(requests)))]
+        inicios = np.flatnonzero(puntos['is_first'])
+        
+        resultados = []
+        for k, peor in enumerate(peores):
+            es_anomalia = bool(scores[peor] > 0)
+            if es_anomalia:
+                tipo_anomalia, detalle = describe_anomaly(features, peor)
+                detalles = f"Punto {peor - inicios[k] + 1}/{len(requests[k].ubicaciones)}: {detalle}"
+            else:
+                tipo_anomalia, detalles = None, "Comportamiento normal detectado"
+            
+            resultados.append({
+                'es_anomalia': es_anomalia,
+                'tipo_anomalia': tipo_anomalia,
+                'score_anomalia': float(scores[peor]),
+                'detalles': detalles,
+                'timestamp': ahora,
+            })
+        
+        return resultados
+    
+    def detect_anomaly_stream(self, features):
+        """
+        Anomalía de pings individuales cuyas features ya calculó DeviceStateStore
+        
+        Args:
+            features: Lista de dicts (una fila de features de AnomalyDetector por ping)
+        
+        Returns:
+            Lista de dicts con los campos de AnomalyDetectionResponse
+        """
+        ahora = datetime.now()
+        columnas = {
+            columna: np.fromiter((f[columna] for f in features), dtype=float, count=len(features))
+            for columna in features[0]
+        }
+        
+        modelo = self.registry.get('anomaly')
+        if modelo is not None:
+            scores = modelo.anomaly_scores(columnas)
+            es_anomalia = scores > 0
+        else:
+            # Sin modelo: mismas reglas de umbral que anomaly_heuristic, por punto
+            es_anomalia = (
+                (columnas['velocidad'] > FEATURE_CONFIG['speed_limit'])
+                | (columnas['cambio_velocidad'] > FEATURE_CONFIG['erratic_change'])
+            )
+            scores = columnas['velocidad'] / 150
+        
+        resultados = []
+        for i in range(len(features)):
+            if es_anomalia[i]:
+                tipo_anomalia, detalles = describe_anomaly(columnas, i)
+            else:
+                tipo_anomalia, detalles = None, "Comportamiento normal detectado"
+            
+            resultados.append({
+                'es_anomalia': bool(es_anomalia[i]),
+                'tipo_anomalia': tipo_anomalia,
+                'score_anomalia': float(scores[i]),
+                'detalles': detalles,
+                'timestamp': ahora,
+            })
+        
+        return resultados
+    
+    def classify_behavior(self, requests):
+        """
+        Comportamiento para una lista de BehaviorClassificationRequest
+        
+        Args:
+            requests: Lista de requests (uno o miles)
+        
+        Returns:
+            Lista de dicts (campos de BehaviorClassificationResponse) o
+            ValueError en la posición de un request que no se pudo evaluar
+        """
+        ahora = datetime.now()
+        modelo = self.registry.get('behavior')
+        
+        if modelo is None:
+            resultados = []
+            for r in requests:
+                try:
+                    resultados.append({**behavior_heuristic(r.ubicaciones), 'timestamp': ahora})
+                except ValueError as e:
+                    resultados.append(e)
+            return resultados
+        
+        return evaluate_each_on_error(
+            lambda lote: self._classify_behavior_model(modelo, lote, ahora), requests
+        )
+    
+    def _classify_behavior_model(self, modelo, requests, ahora):
+        """Comportamiento con BehaviorClassifier: una fila de métricas por request"""
+        features = behavior_features(flatten_points([r.ubicaciones for r in requests], ahora=ahora))
+        categorias = modelo.predict(features)
+        
+        return [
+            behavior_result(features, k, categorias[k], len(r.ubicaciones), ahora)
+            for k, r in enumerate(requests)
+        ]
+    
+    def classify_behavior_stream(self, totales):
+        """
+        Comportamiento del día en curso de dispositivos cuyos totales ya
+        acumuló DeviceStateStore
+        
+        Args:
+            totales: Lista de dicts de DeviceStateStore.daily_totals
+        
+        Returns:
+            Lista de dicts con los campos de BehaviorClassificationResponse
+        """
+        ahora = datetime.now()
+        features = daily_behavior_features(totales)
+        
+        modelo = self.registry.get('behavior')
+        if modelo is not None:
+            categorias = modelo.predict(features)
+        else:
+            # Sin modelo: la misma regla score -> categoría que etiqueta el entrenamiento
+            categorias = _behavior_scoring.score_to_category(features['score'])
+        
+        return [
+            behavior_result(features, k, categorias[k], t['puntos'], ahora)
+            for k, t in enumerate(totales)
+        ]
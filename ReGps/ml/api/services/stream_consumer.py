@@ -0,0 +1,262 @@
+"""
+Consumidor en línea de eventos UbicacionActualizada
+
+Hasta ahora el módulo ML solo veía datos por las extracciones nocturnas o
+por llamadas HTTP puntuales. StreamConsumer lee los pings a medida que
+Laravel los emite y los evalúa casi en tiempo real:
+
+1. Junta mensajes de la fuente en lotes de hasta `batch_max_items` o
+   `batch_max_wait_ms` (lo que ocurra primero).
+2. Cada ping actualiza en O(1) el estado del dispositivo en DeviceStateStore:
+   ventana móvil de AnomalyDetector y totales del día de BehaviorClassifier.
+3. Evalúa el lote completo con una llamada por modelo: anomalía por ping y
+   comportamiento del día para cada dispositivo del lote (una vez, con su
+   último ping, desde que el día tiene 2 puntos, igual que el entrenamiento).
+4. Emite los resultados del lote al destino en una sola escritura.
+
+Métricas: eventos/s (total y de los últimos segundos), lag de evento (ahora
+menos la fecha del ping) y tiempo de procesamiento de cada lote.
+"""
+
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from config import CONSUMER_CONFIG
+from api.services.device_state import DeviceStateStore, OutOfOrderPing
+from api.services.event_stream import parse_ubicacion_event
+from api.services.telemetry import LatencyHistogram
+
+
+# El lag de evento puede ser de minutos si la fuente se atrasa
+LAG_BUCKETS_MS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000, 900000)
+
+# Segundos de la ventana para eventos_por_segundo_recientes
+RATE_WINDOW_SECONDS = 10
+
+
+def _utcnow():
+    """Ahora en UTC sin zona (igual que las fechas de parse_ubicacion_event)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class StreamConsumer:
+    """Evalúa pings de una fuente de eventos en lotes y emite los resultados"""
+    
+    def __init__(self, source, sink, service, state=None, batch_max_items=None, batch_max_wait_ms=None):
+        """
+        Args:
+            source: Fuente de event_stream (get(timeout) -> mensaje o None)
+            sink: Destino de event_stream (emit(resultados))
+            service: PredictionService con los modelos cargados
+            state: DeviceStateStore (default: uno nuevo con API_CONFIG)
+            batch_max_items: Pings por lote (default: CONSUMER_CONFIG['batch_max_items'])
+            batch_max_wait_ms: Espera máxima para llenar un lote
+                               (default: CONSUMER_CONFIG['batch_max_wait_ms'])
+        """
+        self.source = source
+        self.sink = sink
+        self.service = service
+        self.state = state if state is not None else DeviceStateStore()
+        self.batch_max_items = batch_max_items or CONSUMER_CONFIG['batch_max_items']
+        self.batch_max_wait_ms = (
+            batch_max_wait_ms if batch_max_wait_ms is not None else CONSUMER_CONFIG['batch_max_wait_ms']
+        )
+        
+        self._stop = threading.Event()
+        self._inicio = None
+        self._recientes = deque()
+        self._lock = threading.Lock()
+        
+        self.eventos = 0
+        self.evaluados = 0
+        self.anomalias = 0
+        self.comportamientos = 0
+        self.invalidos = 0
+        self.ignorados = 0
+        self.fuera_de_orden = 0
+        self.lotes = 0
+        self.errores = 0
+        self.lag = LatencyHistogram(LAG_BUCKETS_MS)
+        self.procesamiento = LatencyHistogram()
+        self.ultimo_lag_ms = None
+    
+    def _read_batch(self, poll_timeout):
+        """Esperar el primer mensaje y completar el lote hasta llenarlo o vencer la espera"""
+        primero = self.source.get(poll_timeout)
+        if primero is None:
+            return []
+        
+        lote = [primero]
+        limite = time.monotonic() + self.batch_max_wait_ms / 1000
+        while len(lote) < self.batch_max_items:
+            restante = limite - time.monotonic()
+            mensaje = self.source.get(max(restante, 0.0))
+            if mensaje is None:
+                break
+            lote.append(mensaje)
+        
+        return lote
+    
+    def process(self, mensajes):
+        """
+        Evaluar un lote de mensajes y emitir sus resultados
+        
+        Args:
+            mensajes: Mensajes crudos de la fuente
+        
+        Returns:
+            Lista de resultados emitidos (uno por ping evaluado)
+        """
+        inicio = time.perf_counter()
+        recibido = _utcnow()
+        
+        validos = []
+        for mensaje in mensajes:
+            try:
+                ping = parse_ubicacion_event(mensaje)
+            except ValueError:
+                self.invalidos += 1
+                continue
+            if ping is None:
+                self.ignorados += 1
+                continue
+            ping['fecha_hora'] = ping['fecha_hora'] or recibido
+            validos.append(ping)
+        
+        actualizados = self.state.update_many([
+            (p['dispositivo_id'], p['latitud'], p['longitud'], p['velocidad'], p['fecha_hora'])
+            for p in validos
+        ])
+        
+        pings = []
+        features = []
+        ventanas = []
+        for ping, actualizado in zip(validos, actualizados):
+            if isinstance(actualizado, OutOfOrderPing):
+                self.fuera_de_orden += 1
+                continue
+            fila, k = actualizado
+            pings.append(ping)
+            features.append(fila)
+            ventanas.append(k)
+        
+        resultados = []
+        if pings:
+            anomalias = self.service.detect_anomaly_stream(features)
+            
+            # Comportamiento del día: una vez por dispositivo, en su último ping del lote
+            ultimo = {p['dispositivo_id']: i for i, p in enumerate(pings)}
+            totales = {}
+            for dispositivo_id, i in ultimo.items():
+                dia = self.state.daily_totals(dispositivo_id)
+                if dia is not None and dia['puntos'] >= 2:
+                    totales[i] = dia
+            
+            comportamientos = {}
+            if totales:
+                evaluados = self.service.classify_behavior_stream(list(totales.values()))
+                comportamientos = dict(zip(totales.keys(), evaluados))
+            
+            for i, (ping, anomalia) in enumerate(zip(pings, anomalias)):
+                resultados.append({
+                    'evento_id': ping['evento_id'],
+                    'dispositivo_id': ping['dispositivo_id'],
+                    'fecha_hora': ping['fecha_hora'],
+                    'puntos_ventana': ventanas[i],
+                    'anomalia': anomalia,
+                    'comportamiento': comportamientos.get(i),
+                })
+            
+            self.sink.emit(resultados)
+            
+            self.anomalias += sum(a['es_anomalia'] for a in anomalias)
+            self.comportamientos += len(comportamientos)
+        
+        # Lag de evento: desde la fecha del ping hasta que su resultado se emitió
+        emitido = _utcnow()
+        for ping in pings:
+            self.lag.observe(max((emitido - ping['fecha_hora']).total_seconds(), 0.0))
+        if pings:
+            self.ultimo_lag_ms = round((emitido - pings[-1]['fecha_hora']).total_seconds() * 1000, 1)
+        
+        self.procesamiento.observe(time.perf_counter() - inicio)
+        with self._lock:
+            self.lotes += 1
+            self.eventos += len(mensajes)
+            self.evaluados += len(pings)
+            self._recientes.append((time.monotonic(), len(mensajes)))
+        
+        return resultados
+    
+    def run(self, max_eventos=None, poll_timeout=1.0, report_seconds=None, on_report=None):
+        """
+        Consumir la fuente hasta que se agote, se llame a stop() o se alcance max_eventos
+        
+        Args:
+            max_eventos: Terminar después de esta cantidad de mensajes (None = sin límite)
+            poll_timeout: Segundos de espera por el primer mensaje de cada lote
+            report_seconds: Cada cuánto llamar a on_report (default: CONSUMER_CONFIG['report_seconds'])
+            on_report: Callback on_report(stats) para el reporte periódico
+        """
+        report_seconds = report_seconds or CONSUMER_CONFIG['report_seconds']
+        self._inicio = time.monotonic()
+        proximo_reporte = self._inicio + report_seconds
+        
+        while not self._stop.is_set():
+            if max_eventos is not None and self.eventos >= max_eventos:
+                break
+            
+            lote = self._read_batch(poll_timeout)
+            if lote:
+                try:
+                    self.process(lote)
+                except Exception as e:
+                    # Un lote con error no detiene el consumidor
+                    self.errores += 1
+                    print(f"❌ Error procesando lote de {len(lote)} eventos: {e}")
+            elif self.source.agotado:
+                break
+            
+            if on_report is not None and time.monotonic() >= proximo_reporte:
+                on_report(self.stats())
+                proximo_reporte = time.monotonic() + report_seconds
+    
+    def stop(self):
+        """Pedir que run() termine después del lote en curso"""
+        self._stop.set()
+    
+    def stats(self):
+        """Throughput, lag, conteos por resultado y estado de los dispositivos"""
+        ahora = time.monotonic()
+        with self._lock:
+            while self._recientes and self._recientes[0][0] < ahora - RATE_WINDOW_SECONDS:
+                self._recientes.popleft()
+            recientes = sum(n for _, n in self._recientes)
+            eventos = self.eventos
+        
+        duracion = ahora - self._inicio if self._inicio is not None else 0.0
+        return {
+            'duracion_s': round(duracion, 1),
+            'eventos': eventos,
+            'evaluados': self.evaluados,
+            'eventos_por_segundo': round(eventos / duracion, 1) if duracion > 0 else 0.0,
+            'eventos_por_segundo_recientes': round(recientes / min(duracion or 1, RATE_WINDOW_SECONDS), 1),
+            'lotes': self.lotes,
+            'lote_promedio': round(eventos / self.lotes, 2) if self.lotes else 0.0,
+            'anomalias': self.anomalias,
+            'comportamientos': self.comportamientos,
+            'invalidos': self.invalidos,
+            'ignorados': self.ignorados,
+            'fuera_de_orden': self.fuera_de_orden,
+            'errores': self.errores,
+            'ultimo_lag_ms': self.ultimo_lag_ms,
+            'lag': self.lag.snapshot(),
+            'procesamiento': self.procesamiento.snapshot(),
+            'device_state': self.state.stats(),
+        }
@@ -0,0 +1,94 @@
+"""
+Métricas de latencia para los servicios de la API
+
+Histogramas con buckets fijos (en milisegundos), seguros entre hilos y
+baratos de actualizar: se usan para consultas a BD, inferencia, colas,
+etc. y se exponen en /health y /metrics.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+# Límites superiores de los buckets (ms); el último bucket es +inf
+DEFAULT_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """
+    Histograma de latencias con buckets fijos
+    
+    Los percentiles se estiman con el límite superior del bucket donde
+    caen (igual que un histograma de Prometheus), así que su resolución
+    es la de los buckets.
+    """
+    
+    def __init__(self, buckets_ms=DEFAULT_BUCKETS_MS):
+        """
+        Args:
+            buckets_ms: Límites superiores de los buckets en milisegundos
+        """
+        self.buckets_ms = np.asarray(buckets_ms, dtype=float)
+        self._counts = np.zeros(len(self.buckets_ms) + 1, dtype=np.int64)
+        self._sum_ms = 0.0
+        self._max_ms = 0.0
+        self._lock = threading.Lock()
+    
+    def observe(self, seconds):
+        """Registrar una latencia (en segundos)"""
+        ms = seconds * 1000
+        idx = int(np.searchsorted(self.buckets_ms, ms, side='left'))
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum_ms += ms
+            self._max_ms = max(self._max_ms, ms)
+    
+    @contextmanager
+    def time(self):
+        """Medir la duración de un bloque with"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio)
+    
+    def percentile(self, q):
+        """Percentil estimado en ms (q entre 0 y 100)"""
+        with self._lock:
+            counts = self._counts.copy()
+            max_ms = self._max_ms
+        
+        total = counts.sum()
+        if total == 0:
+            return 0.0
+        
+        idx = int(np.searchsorted(np.cumsum(counts), np.ceil(total * q / 100), side='left'))
+        return float(self.buckets_ms[idx]) if idx < len(self.buckets_ms) else max_ms
+    
+    def snapshot(self):
+        """
+        Resumen del histograma
+        
+        Returns:
+            dict: count, mean_ms, max_ms, p50/p95/p99 y conteo por bucket
+        """
+        with self._lock:
+            counts = self._counts.copy()
+            sum_ms = self._sum_ms
+            max_ms = self._max_ms
+        
+        total = int(counts.sum())
+        etiquetas = [f"<={b:g}ms" for b in self.buckets_ms] + [f">{self.buckets_ms[-1]:g}ms"]
+        
+        return {
+            'count': total,
+            'mean_ms': round(sum_ms / total, 3) if total else 0.0,
+            'max_ms': round(max_ms, 3),
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'buckets': {e: int(c) for e, c in zip(etiquetas, counts) if c},
+        }
@@ -62,6 +62,34 @@ MODEL_PARAMS = {
     }
 }
 
+# Búsqueda de hiperparámetros (train_* --tune, utils/model_search.py): cada
+# candidato parte de MODEL_PARAMS y cambia los valores de estos rangos
+MODEL_SEARCH_SPACE = {
+    "eta": {
+        "n_estimators": [100, 200],
+        "max_depth": [12, 20, None],
+        "min_samples_leaf": [1, 2, 5],
+        "max_features": [1.0, 0.5],
+    },
+    "anomaly": {
+        "n_estimators": [100, 200],
+        "max_samples": ['auto', 512, 2048],
+        "max_features": [1.0, 0.75],
+    },
+    "behavior": {
+        "n_estimators": [100, 200],
+        "max_depth": [8, 15, None],
+        "min_samples_leaf": [1, 2, 5],
+        "max_features": ['sqrt', 0.5],
+    }
+}
+
+TUNING_CONFIG = {
+    "workers": int(os.getenv("ML_TUNING_WORKERS", os.cpu_count() or 1)),  # Procesos (cada ajuste con n_jobs=1)
+    "max_candidates": int(os.getenv("ML_TUNING_MAX_CANDIDATES", 24)),  # Muestra de la grilla (0 = completa)
+    "min_fold_rows": 20,  # Folds con menos filas de train o validación se omiten
+}
+
 # Umbrales de comportamiento y scoring
 BEHAVIOR_SCORE_THRESHOLDS = {
     "speed_violation": -20,  # Penalización por exceso de velocidad
@@ -87,6 +115,84 @@ FEATURE_CONFIG = {
     "erratic_change": 30,  # km/h - Cambio brusco de velocidad
 }
 
+# Configuración del pipeline en modo streaming (datos que no caben en RAM)
+STREAMING_CONFIG = {
+    "chunk_size": int(os.getenv("ML_CHUNK_SIZE", 500_000)),  # Filas por bloque
+}
+
+# Extracción incremental desde MySQL
+EXTRACTION_CONFIG = {
+    # Margen hacia atrás desde la marca de agua para ubicaciones que llegan
+    # tarde (dispositivos que suben datos acumulados al recuperar señal)
+    "late_tolerance_hours": int(os.getenv("ML_LATE_TOLERANCE_HOURS", 48)),
+    # UbicacionID bajo la marca de agua que se releen en cada carga incremental:
+    # una transacción con un ID menor puede confirmar después de una con uno mayor
+    "late_id_margin": int(os.getenv("ML_LATE_ID_MARGIN", 10_000)),
+    "batch_size": 50_000,  # Filas por bloque leídas del cursor del servidor
+    "page_size": 500_000,  # Filas por página en la paginación por clave
+    "workers": int(os.getenv("ML_EXTRACT_WORKERS", 4)),  # Conexiones/shards en paralelo
+    "max_retries": 3,  # Reintentos por shard antes de darlo por fallido
+    "retry_backoff": 2.0,  # Segundos de espera base entre reintentos (exponencial)
+}
+
+# Almacenamiento columnar (Parquet particionado por fecha y bucket de dispositivo)
+DATASET_CONFIG = {
+    "device_buckets": int(os.getenv("ML_DEVICE_BUCKETS", 16)),  # Particiones por dispositivo
+    "compression": "zstd",
+    "row_group_size": 256_000,  # Filas por row group (granularidad del filtrado)
+}
+
+# Caché de features calculadas (utils/feature_cache.py, data/cache/features)
+FEATURE_CACHE_CONFIG = {
+    "enabled": os.getenv("ML_FEATURE_CACHE", "1") != "0",  # ML_FEATURE_CACHE=0 la desactiva
+    "max_mb": int(os.getenv("ML_FEATURE_CACHE_MB", 2048)),  # Tamaño máximo (desalojo LRU)
+}
+
+# Generación de historial_zonas desde las ubicaciones (scripts/generate_zone_events.py)
+ZONE_EVENTS_CONFIG = {
+    "workers": int(os.getenv("ML_ZONE_EVENTS_WORKERS", os.cpu_count() or 1)),  # Buckets de dispositivos en paralelo
+}
+
+# Configuración de la API de predicciones
+API_CONFIG = {
+    "db_pool_size": int(os.getenv("ML_API_DB_POOL_SIZE", 5)),  # Conexiones a la BD compartidas
+    "db_pool_timeout": float(os.getenv("ML_API_DB_POOL_TIMEOUT", 5)),  # Segundos de espera por una conexión
+    "db_health_timeout": 2.0,  # Segundos máximos del ping de /health
+    "models_dir": Path(os.getenv("ML_API_MODELS_DIR", MODELS_DIR / "trained")),  # Artefactos .joblib a servir
+    "model_format": os.getenv("ML_API_MODEL_FORMAT", "joblib"),  # 'joblib', 'compact' (.mmap) o 'auto' (.mmap si existe)
+    "tree_engine": os.getenv("ML_API_TREE_ENGINE", "auto"),  # 'auto' (Numba si está instalado), 'numba' u 'off'
+    "eta_default_speed": 40.0,  # km/h cuando no hay historial de velocidad del dispositivo
+    "batch_max_items": int(os.getenv("ML_API_BATCH_MAX_ITEMS", 5000)),  # Items por request en /batch
+    "inference_mode": os.getenv("ML_API_INFERENCE_MODE", "thread"),  # 'thread' o 'process'
+    "inference_workers": int(os.getenv("ML_API_INFERENCE_WORKERS", min(4, os.cpu_count() or 1))),
+    "inference_n_jobs": int(os.getenv("ML_API_INFERENCE_N_JOBS", 0)),  # Hilos por predicción (0 = núcleos / workers)
+    "inference_max_pending": int(os.getenv("ML_API_INFERENCE_MAX_PENDING", 64)),  # Más en cola → 503
+    "microbatch_enabled": os.getenv("ML_API_MICROBATCH", "1") != "0",  # Agrupar requests individuales concurrentes
+    "microbatch_max_wait_ms": float(os.getenv("ML_API_MICROBATCH_MAX_WAIT_MS", 5)),  # Espera máx. para llenar un lote
+    "microbatch_max_items": int(os.getenv("ML_API_MICROBATCH_MAX_ITEMS", 64)),  # Tamaño máx. de un lote
+    "state_max_devices": int(os.getenv("ML_API_STATE_MAX_DEVICES", 100_000)),  # Dispositivos con estado en memoria
+    "state_ttl_seconds": int(os.getenv("ML_API_STATE_TTL_SECONDS", 6 * 3600)),  # Sin pings por más tiempo → se expira
+    "state_window": 5,  # Puntos de la ventana móvil (igual que AnomalyDetector)
+    "geofence_refresh_seconds": float(os.getenv("ML_API_GEOFENCE_REFRESH_SECONDS", 30)),  # Revisión de cambios en zonas
+}
+
+# Consumidor en línea de eventos UbicacionActualizada (scripts/consume_events.py)
+CONSUMER_CONFIG = {
+    "source": os.getenv("ML_STREAM_SOURCE", "redis"),  # 'redis', 'redis-list' o 'jsonl'
+    "redis_url": os.getenv(
+        "ML_STREAM_REDIS_URL",
+        f"redis://{os.getenv('REDIS_HOST', '127.0.0.1')}:{os.getenv('REDIS_PORT', '6379')}/{os.getenv('REDIS_DB', '0')}"
+    ),
+    # Canal del broadcaster 'redis' de Laravel: prefijo de la conexión + canal del evento
+    "channel": os.getenv("ML_STREAM_CHANNEL", os.getenv("REDIS_PREFIX", "laravel-database-") + "ubicaciones"),
+    "event_name": "ubicacion.actualizada",  # broadcastAs() del evento
+    "results_channel": os.getenv("ML_STREAM_RESULTS_CHANNEL", "ml-resultados"),  # Resultados en lote
+    "batch_max_items": int(os.getenv("ML_STREAM_BATCH_MAX_ITEMS", 500)),  # Pings por lote evaluado
+    "batch_max_wait_ms": float(os.getenv("ML_STREAM_BATCH_MAX_WAIT_MS", 50)),  # Espera máx. para llenar un lote
+    "metrics_port": int(os.getenv("ML_STREAM_METRICS_PORT", 8010)),  # GET /metrics del consumidor (0 = sin servidor)
+    "report_seconds": 30,  # Cada cuánto imprimir throughput y lag
+}
+
 print(f"✅ Configuración cargada desde: {BASE_DIR}")
 print(f"📊 Directorio de datos: {DATA_DIR}")
 print(f"🤖 Directorio de modelos: {MODELS_DIR}")
@@ -15,7 +15,11 @@ from datetime import datetime
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from utils.geo_utils import calculate_distance
+from utils import geo_arrays
+from utils.trajectory_utils import (
+    group_starts, group_sizes, shift_within_group, diff_within_group, rolling_within_group
+)
+from models import compact, tree_engine
 
 
 class AnomalyDetector:
@@ -66,51 +70,41 @@ class AnomalyDetector:
         features_df['dia_semana'] = df_ubicaciones['FechaHora'].dt.dayofweek
         features_df['es_fin_semana'] = features_df['dia_semana'].isin([5, 6]).astype(int)
         
-        features_df['cambio_velocidad'] = 0.0
-        features_df['distancia_metros'] = 0.0
-        features_df['tiempo_detenido'] = (features_df['velocidad'] < 5).astype(int)
+        # Un solo ordenamiento: cada dispositivo queda en un bloque contiguo
+        is_first = group_starts(df_ubicaciones['DispositivoID'].to_numpy())
         
         print("  • Calculando cambios de velocidad y distancias...")
-        for dispositivo_id in df_ubicaciones['DispositivoID'].unique():
-            mask = df_ubicaciones['DispositivoID'] == dispositivo_id
-            idx = df_ubicaciones[mask].index
-            
-            if len(idx) < 2:
-                continue
-            
-            velocidades = df_ubicaciones.loc[idx, 'Velocidad'].values
-            cambios = np.abs(np.diff(velocidades, prepend=velocidades[0]))
-            features_df.loc[idx, 'cambio_velocidad'] = cambios
-            
-            lats = df_ubicaciones.loc[idx, 'Latitud'].values
-            lons = df_ubicaciones.loc[idx, 'Longitud'].values
-            
-            distancias = [0]
-            for i in range(1, len(lats)):
-                dist = calculate_distance(lats[i-1], lons[i-1], lats[i], lons[i])
-                distancias.append(dist * 1000)
-            
-            features_df.loc[idx, 'distancia_metros'] = distancias
+        velocidades = df_ubicaciones['Velocidad'].to_numpy(dtype=float)
+        cambios = np.abs(diff_within_group(velocidades, is_first))
+        cambios[is_first] = 0.0
+        features_df['cambio_velocidad'] = cambios
+        
+        lats = df_ubicaciones['Latitud'].to_numpy(dtype=float)
+        lons = df_ubicaciones['Longitud'].to_numpy(dtype=float)
+        distancias = geo_arrays.calculate_distance(
+            shift_within_group(lats, is_first), shift_within_group(lons, is_first),
+            lats, lons, method='geodesic'
+        ) * 1000
+        distancias[is_first] = 0.0
+        features_df['distancia_metros'] = distancias
+        
+        features_df['tiempo_detenido'] = (features_df['velocidad'] < 5).astype(int)
         
         print("  • Calculando estadísticos por ventana móvil...")
         window_size = 5
         
-        for dispositivo_id in df_ubicaciones['DispositivoID'].unique():
-            mask = df_ubicaciones['DispositivoID'] == dispositivo_id
-            idx = df_ubicaciones[mask].index
-            
-            if len(idx) < window_size:
-                continue
-            
-            velocidad_window = features_df.loc[idx, 'velocidad'].rolling(window_size, min_periods=1).mean()
-            features_df.loc[idx, 'velocidad_media_window'] = velocidad_window
-            
-            velocidad_std = features_df.loc[idx, 'velocidad'].rolling(window_size, min_periods=1).std().fillna(0)
-            features_df.loc[idx, 'velocidad_std_window'] = velocidad_std
+        ventana = rolling_within_group(features_df['velocidad'], is_first, window_size, min_periods=1)
+        
+        # Dispositivos con menos puntos que la ventana quedan en 0
+        pocos_puntos = group_sizes(is_first) < window_size
+        features_df['velocidad_media_window'] = np.where(pocos_puntos, 0.0, ventana['mean'])
+        features_df['velocidad_std_window'] = np.where(pocos_puntos, 0.0, ventana['std'])
         
         features_df = features_df.fillna(0)
         
         self.feature_columns = list(features_df.columns)
+        # Dispositivo y fecha de cada fila (validación cruzada agrupada, utils/model_search.py)
+        self.row_keys = df_ubicaciones[['DispositivoID', 'FechaHora']]
         
         print(f"✅ Features creados: {features_df.shape[1]} columnas")
         
@@ -131,6 +125,8 @@ class AnomalyDetector:
         print(f"   • Contamination: {self.contamination}")
         
         X_train, X_test = train_test_split(X, test_size=test_size, random_state=42)
+        # Filas de test: save_compact verifica con ellas el artefacto plegado
+        self.X_holdout = X_test
         
         print(f"   • Train: {len(X_train):,} filas")
         print(f"   • Test: {len(X_test):,} filas")
@@ -187,6 +183,11 @@ class AnomalyDetector:
             raise ValueError("Modelo no entrenado. Ejecutar train() primero.")
         
         if isinstance(features, dict):
+            # Una fila completa va por el motor compilado (mismo resultado, sin pandas)
+            fila = tree_engine.dict_row(features, self.feature_columns)
+            if fila is not None:
+                score = tree_engine.engine_for(self).score_samples(fila)
+                return score[0] - self.model.offset_ < 0, score[0]
             features = pd.DataFrame([features])
         
         features_scaled = self.scaler.transform(features[self.feature_columns])
@@ -218,6 +219,29 @@ class AnomalyDetector:
         joblib.dump(model_data, path)
         print(f"💾 Modelo guardado en: {path}")
     
+    def save_compact(self, path, fold=True):
+        """
+        Guarda el modelo como artefacto compacto (arrays planos que la API
+        carga con mmap, ver models/compact.py)
+        
+        Con fold=True el StandardScaler se pliega en los umbrales (el
+        artefacto predice desde features crudas) y, antes de escribirlo, se
+        verifica que dé lo mismo que sklearn en las filas de test del último
+        train().
+        
+        Args:
+            path: Ruta del archivo .mmap
+            fold: Plegar el scaler en los umbrales
+        """
+        if not self.is_trained:
+            raise ValueError("Modelo no entrenado. Ejecutar train() primero.")
+        
+        info = compact.save_compact(self, path, fold=fold, X_check=getattr(self, 'X_holdout', None))
+        print(f"💾 Artefacto compacto guardado en: {path}")
+        if info['folded']:
+            print(f"   • Scaler plegado en {info['nodos']:,} nodos; "
+                  f"{info['filas_verificadas']:,} filas de test idénticas a sklearn")
+    
     @classmethod
     def load(cls, path):
         """
@@ -16,7 +16,9 @@ from datetime import datetime
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from utils.geo_utils import calculate_distance
+from utils import geo_arrays
+from utils.trajectory_utils import group_starts, shift_within_group, diff_within_group
+from models import compact, tree_engine
 
 
 class BehaviorClassifier:
@@ -63,109 +65,123 @@ class BehaviorClassifier:
         print("📊 Creando métricas diarias por empleado...")
         
         df_ubicaciones['FechaHora'] = pd.to_datetime(df_ubicaciones['FechaHora'])
-        df_ubicaciones['Fecha'] = df_ubicaciones['FechaHora'].dt.date
-        
-        daily_metrics = []
-        
-        for (dispositivo_id, fecha), group in df_ubicaciones.groupby(['DispositivoID', 'Fecha']):
-            if len(group) < 2:
-                continue
-            
-            # Métricas de velocidad
-            velocidades = group['Velocidad'].fillna(0)
-            violaciones_velocidad = (velocidades > 90).sum()
-            pct_violaciones_velocidad = (violaciones_velocidad / len(velocidades)) * 100
-            
-            # Métricas de movimiento
-            tiempo_detenido = (velocidades < 5).sum()
-            tiempo_movimiento = (velocidades >= 5).sum()
-            pct_tiempo_movimiento = (tiempo_movimiento / len(velocidades)) * 100
-            
-            # Distancia total
-            distancia_total = 0
-            for i in range(1, len(group)):
-                prev = group.iloc[i-1]
-                curr = group.iloc[i]
-                dist = calculate_distance(
-                    prev['Latitud'], prev['Longitud'],
-                    curr['Latitud'], curr['Longitud']
-                )
-                distancia_total += dist
-            
-            # Cambios bruscos
-            cambios_velocidad = np.abs(np.diff(velocidades.values))
-            cambios_bruscos = (cambios_velocidad > 30).sum()
-            
-            # Métricas de zonas
-            eventos_zona_restringida = 0
-            eventos_checkpoint = 0
-            
-            if df_historial is not None and len(df_historial) > 0:
-                df_historial['FechaHoraEvento'] = pd.to_datetime(df_historial['FechaHoraEvento'])
-                df_historial['Fecha'] = df_historial['FechaHoraEvento'].dt.date
-                
-                historial_day = df_historial[
-                    (df_historial['DispositivoID'] == dispositivo_id) & 
-                    (df_historial['Fecha'] == fecha)
-                ]
-                
-                if len(historial_day) > 0:
-                    eventos_zona_restringida = (historial_day['TipoZona'] == 'Zona Restringida').sum()
-                    eventos_checkpoint = (historial_day['TipoZona'] == 'Checkpoint').sum()
-            
-            # Métricas de alertas
-            alertas_dia = 0
-            alertas_criticas = 0
-            
-            if df_alertas is not None and len(df_alertas) > 0:
-                df_alertas['FechaHora'] = pd.to_datetime(df_alertas['FechaHora'])
-                df_alertas['Fecha'] = df_alertas['FechaHora'].dt.date
-                
-                alertas_day = df_alertas[
-                    (df_alertas['DispositivoID'] == dispositivo_id) & 
-                    (df_alertas['Fecha'] == fecha)
-                ]
-                
-                if len(alertas_day) > 0:
-                    alertas_dia = len(alertas_day)
-                    alertas_criticas = (alertas_day['Prioridad'] == 'Crítica').sum()
-            
-            # Calcular score
-            score = self.calculate_score(
-                violaciones_velocidad=violaciones_velocidad,
-                eventos_zona_restringida=eventos_zona_restringida,
-                alertas_criticas=alertas_criticas,
-                pct_tiempo_movimiento=pct_tiempo_movimiento,
-                cambios_bruscos=cambios_bruscos,
-                eventos_checkpoint=eventos_checkpoint
-            )
-            
-            # Clasificar
-            categoria = self.score_to_category(score)
-            
-            metrics = {
-                'DispositivoID': dispositivo_id,
-                'Fecha': fecha,
-                'velocidad_promedio': velocidades.mean(),
-                'velocidad_maxima': velocidades.max(),
-                'velocidad_std': velocidades.std(),
-                'violaciones_velocidad': violaciones_velocidad,
-                'pct_violaciones_velocidad': pct_violaciones_velocidad,
-                'pct_tiempo_movimiento': pct_tiempo_movimiento,
-                'distancia_total_km': distancia_total,
-                'cambios_bruscos': cambios_bruscos,
-                'eventos_zona_restringida': eventos_zona_restringida,
-                'eventos_checkpoint': eventos_checkpoint,
-                'alertas_dia': alertas_dia,
-                'alertas_criticas': alertas_criticas,
-                'puntos_totales': len(velocidades),
-                'score': score,
-                'categoria': categoria,
-            }
-            
-            daily_metrics.append(metrics)
-        
-        df_metrics = pd.DataFrame(daily_metrics)
+        
+        # Ordenar una sola vez por (DispositivoID, día). lexsort es estable, así
+        # que dentro de cada día se conserva el orden original (igual que groupby)
+        dias = df_ubicaciones['FechaHora'].dt.normalize().to_numpy()
+        dispositivos = df_ubicaciones['DispositivoID'].to_numpy()
+        orden = np.lexsort((dias, dispositivos))
+        orden = orden[~np.isnat(dias[orden])]
+        
+        dias = dias[orden]
+        dispositivos = dispositivos[orden]
+        velocidades = df_ubicaciones['Velocidad'].fillna(0).to_numpy(dtype=float)[orden]
+        lats = df_ubicaciones['Latitud'].to_numpy(dtype=float)[orden]
+        lons = df_ubicaciones['Longitud'].to_numpy(dtype=float)[orden]
+        
+        is_first = group_starts(dispositivos, dias)
+        inicios = np.flatnonzero(is_first)
+        puntos = np.diff(np.append(inicios, len(orden)))
+        
+        def suma_por_grupo(valores):
+            if len(inicios) == 0:
+                return np.zeros(0)
+            return np.add.reduceat(valores, inicios)
+        
+        # Métricas de velocidad
+        velocidad_promedio = suma_por_grupo(velocidades) / puntos
+        velocidad_maxima = np.maximum.reduceat(velocidades, inicios) if len(inicios) else np.zeros(0)
+        desviaciones = (velocidades - np.repeat(velocidad_promedio, puntos)) ** 2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            velocidad_std = np.where(puntos > 1, np.sqrt(suma_por_grupo(desviaciones) / (puntos - 1)), np.nan)
+        
+        violaciones_velocidad = suma_por_grupo((velocidades > 90).astype(np.int64))
+        pct_violaciones_velocidad = (violaciones_velocidad / puntos) * 100
+        
+        # Métricas de movimiento
+        tiempo_movimiento = suma_por_grupo((velocidades >= 5).astype(np.int64))
+        pct_tiempo_movimiento = (tiempo_movimiento / puntos) * 100
+        
+        # Distancia total
+        distancias = geo_arrays.calculate_distance(
+            shift_within_group(lats, is_first), shift_within_group(lons, is_first), lats, lons,
+            method='geodesic'
+        )
+        distancias[is_first] = 0.0
+        distancia_total = suma_por_grupo(distancias)
+        
+        # Cambios bruscos
+        cambios_velocidad = np.abs(diff_within_group(velocidades, is_first))
+        cambios_bruscos = suma_por_grupo((cambios_velocidad > 30).astype(np.int64))
+        
+        claves = pd.MultiIndex.from_arrays(
+            [dispositivos[inicios], dias[inicios]], names=['DispositivoID', 'Dia']
+        )
+        
+        # Métricas de zonas: un conteo por (dispositivo, día), luego join
+        eventos_zona_restringida = np.zeros(len(inicios), dtype=np.int64)
+        eventos_checkpoint = np.zeros(len(inicios), dtype=np.int64)
+        
+        if df_historial is not None and len(df_historial) > 0:
+            eventos = pd.DataFrame({
+                'DispositivoID': df_historial['DispositivoID'].to_numpy(),
+                'Dia': pd.to_datetime(df_historial['FechaHoraEvento']).dt.normalize().to_numpy(),
+                'restringida': (df_historial['TipoZona'] == 'Zona Restringida').to_numpy(dtype=np.int64),
+                'checkpoint': (df_historial['TipoZona'] == 'Checkpoint').to_numpy(dtype=np.int64),
+            })
+            eventos = eventos.groupby(['DispositivoID', 'Dia']).sum().reindex(claves, fill_value=0)
+            eventos_zona_restringida = eventos['restringida'].to_numpy()
+            eventos_checkpoint = eventos['checkpoint'].to_numpy()
+        
+        # Métricas de alertas
+        alertas_dia = np.zeros(len(inicios), dtype=np.int64)
+        alertas_criticas = np.zeros(len(inicios), dtype=np.int64)
+        
+        if df_alertas is not None and len(df_alertas) > 0:
+            alertas = pd.DataFrame({
+                'DispositivoID': df_alertas['DispositivoID'].to_numpy(),
+                'Dia': pd.to_datetime(df_alertas['FechaHora']).dt.normalize().to_numpy(),
+                'total': 1,
+                'criticas': (df_alertas['Prioridad'] == 'Crítica').to_numpy(dtype=np.int64),
+            })
+            alertas = alertas.groupby(['DispositivoID', 'Dia']).sum().reindex(claves, fill_value=0)
+            alertas_dia = alertas['total'].to_numpy()
+            alertas_criticas = alertas['criticas'].to_numpy()
+        
+        # Calcular score y clasificar (vectorizado)
+        score = self.calculate_score(
+            violaciones_velocidad=violaciones_velocidad,
+            eventos_zona_restringida=eventos_zona_restringida,
+            alertas_criticas=alertas_criticas,
+            pct_tiempo_movimiento=pct_tiempo_movimiento,
+            cambios_bruscos=cambios_bruscos,
+            eventos_checkpoint=eventos_checkpoint
+        )
+        categoria = self.score_to_category(score)
+        
+        df_metrics = pd.DataFrame({
+            'DispositivoID': dispositivos[inicios],
+            'Fecha': pd.DatetimeIndex(dias[inicios]).date,
+            'velocidad_promedio': velocidad_promedio,
+            'velocidad_maxima': velocidad_maxima,
+            'velocidad_std': velocidad_std,
+            'violaciones_velocidad': violaciones_velocidad,
+            'pct_violaciones_velocidad': pct_violaciones_velocidad,
+            'pct_tiempo_movimiento': pct_tiempo_movimiento,
+            'distancia_total_km': distancia_total,
+            'cambios_bruscos': cambios_bruscos,
+            'eventos_zona_restringida': eventos_zona_restringida,
+            'eventos_checkpoint': eventos_checkpoint,
+            'alertas_dia': alertas_dia,
+            'alertas_criticas': alertas_criticas,
+            'puntos_totales': puntos,
+            'score': score,
+            'categoria': categoria,
+        })
+        
+        # Días con menos de 2 puntos no se evalúan
+        df_metrics = df_metrics[puntos >= 2].reset_index(drop=True)
+        
         print(f"✅ Creadas {len(df_metrics):,} observaciones diarias")
         
         print(f"\n📊 Distribución de categorías:")
@@ -181,40 +197,31 @@ class BehaviorClassifier:
                        eventos_checkpoint):
         """
         Calcula score de comportamiento
+        Acepta escalares o arrays (un valor por observación)
         
         Returns:
             Score entre 0 y 100
         """
-        score = 100
-        
-        if violaciones_velocidad > 0:
-            score -= 20 * min(violaciones_velocidad / 10, 1)
-        
-        if eventos_zona_restringida > 0:
-            score -= 30 * min(eventos_zona_restringida / 3, 1)
-        
-        if alertas_criticas > 0:
-            score -= 15 * min(alertas_criticas / 2, 1)
-        
-        if pct_tiempo_movimiento < 30:
-            score -= 10
+        score = 100 - 20 * np.minimum(np.asarray(violaciones_velocidad) / 10, 1)
+        score = score - 30 * np.minimum(np.asarray(eventos_zona_restringida) / 3, 1)
+        score = score - 15 * np.minimum(np.asarray(alertas_criticas) / 2, 1)
+        score = score - 10 * (np.asarray(pct_tiempo_movimiento) < 30)
+        score = score - 10 * (np.asarray(cambios_bruscos) > 5)
+        score = score + 5 * np.minimum(np.asarray(eventos_checkpoint) / 2, 1)
         
-        if cambios_bruscos > 5:
-            score -= 10
+        score = np.clip(score, 0, 100)
         
-        if eventos_checkpoint > 0:
-            score += 5 * min(eventos_checkpoint / 2, 1)
-        
-        return max(0, min(100, score))
+        return float(score) if np.ndim(score) == 0 else score
     
     def score_to_category(self, score):
-        """Convierte score a categoría"""
-        if score >= 90:
-            return 'eficiente'
-        elif score >= 60:
-            return 'normal'
-        else:
-            return 'requiere_atencion'
+        """Convierte score a categoría (escalar o array)"""
+        categorias = np.select(
+            [np.asarray(score) >= 90, np.asarray(score) >= 60],
+            ['eficiente', 'normal'],
+            default='requiere_atencion'
+        )
+        
+        return str(categorias) if np.ndim(categorias) == 0 else categorias.astype(object)
     
     def create_features(self, df_metrics):
         """
@@ -269,6 +276,8 @@ class BehaviorClassifier:
         X_train, X_test, y_train, y_test = train_test_split(
             X, y, test_size=test_size, random_state=42, stratify=y
         )
+        # Filas de test: save_compact verifica con ellas el artefacto plegado
+        self.X_holdout = X_test
         
         print(f"   • Train: {len(X_train):,} filas")
         print(f"   • Test: {len(X_test):,} filas")
@@ -333,6 +342,10 @@ class BehaviorClassifier:
             raise ValueError("Modelo no entrenado. Ejecutar train() primero.")
         
         if isinstance(features, dict):
+            # Una fila completa va por el motor compilado (mismo resultado, sin pandas)
+            fila = tree_engine.dict_row(features, self.feature_columns)
+            if fila is not None:
+                return tree_engine.engine_for(self).predict(fila)[0]
             features = pd.DataFrame([features])
         
         features_scaled = self.scaler.transform(features[self.feature_columns])
@@ -356,6 +369,29 @@ class BehaviorClassifier:
         joblib.dump(model_data, path)
         print(f"💾 Modelo guardado en: {path}")
     
+    def save_compact(self, path, fold=True):
+        """
+        Guarda el modelo como artefacto compacto (arrays planos que la API
+        carga con mmap, ver models/compact.py)
+        
+        Con fold=True el StandardScaler se pliega en los umbrales (el
+        artefacto predice desde features crudas) y, antes de escribirlo, se
+        verifica que dé lo mismo que sklearn en las filas de test del último
+        train().
+        
+        Args:
+            path: Ruta del archivo .mmap
+            fold: Plegar el scaler en los umbrales
+        """
+        if not self.is_trained:
+            raise ValueError("Modelo no entrenado. Ejecutar train() primero.")
+        
+        info = compact.save_compact(self, path, fold=fold, X_check=getattr(self, 'X_holdout', None))
+        print(f"💾 Artefacto compacto guardado en: {path}")
+        if info['folded']:
+            print(f"   • Scaler plegado en {info['nodos']:,} nodos; "
+                  f"{info['filas_verificadas']:,} filas de test idénticas a sklearn")
+    
     @classmethod
     def load(cls, path):
         """Carga un modelo entrenado"""
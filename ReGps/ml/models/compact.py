@@ -0,0 +1,654 @@
+"""
+Artefactos compactos de los modelos (arrays planos, cargables con mmap)
+
+Un .joblib guarda los objetos de sklearn serializados con pickle: cargarlo
+reconstruye cada árbol (y copia todos sus nodos) en la memoria privada del
+proceso, así que cada worker de la API paga el tiempo de carga y su propia
+copia del bosque.
+
+Este formato guarda lo que hace falta para predecir como arrays NumPy
+contiguos en un solo archivo:
+    
+    REGPSMDL | largo del encabezado (uint64) | encabezado JSON | arrays
+
+- Nodos de todos los árboles concatenados: feature, threshold, hijos
+  (izquierdo y derecho intercalados, con índices globales; una hoja apunta
+  a sí misma) y el valor de cada hoja ya listo para sumar (predicción del
+  árbol, probabilidades o profundidad de aislamiento).
+- Orden de feature_columns y metadatos del wrapper (categorías,
+  contamination, fecha) en el JSON.
+- El StandardScaler va plegado en los umbrales (fold_thresholds): cada
+  umbral se reescribe en el espacio de las features crudas, así que el
+  artefacto no guarda el scaler y predecir no necesita escalar. Con
+  fold=False se guardan mean/scale y los umbrales originales.
+
+Cada array empieza alineado a 64 bytes, así que load_compact los expone
+como vistas de un np.memmap de solo lectura: la carga no copia nada y los
+procesos que abren el mismo archivo comparten las páginas en el page cache.
+
+CompactForest reproduce exactamente las operaciones de sklearn (mismo orden
+de sumas, X en float32 al comparar contra los umbrales), así que sus
+predicciones son idénticas a las del modelo original con n_jobs=1. Con los
+umbrales plegados la comparación es en float64 contra el umbral crudo
+equivalente, que save_compact verifica nodo por nodo y contra las filas de
+test antes de escribir el archivo.
+"""
+
+import json
+import os
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import IsolationForest, RandomForestClassifier, RandomForestRegressor
+from sklearn.ensemble._iforest import _average_path_length
+
+
+ARTIFACT_MAGIC = b'REGPSMDL'
+ARTIFACT_VERSION = 1
+ARTIFACT_SUFFIX = '.mmap'
+ALIGNMENT = 64
+
+FOREST_KINDS = ('regressor', 'classifier', 'isolation')
+
+# Desde sklearn 1.4 tree_.value de los clasificadores ya son fracciones
+# (predict_proba no vuelve a normalizarlas)
+_NORMALIZE_LEAF_PROBA = tuple(int(p) for p in sklearn.__version__.split('.')[:2]) < (1, 4)
+
+
+def compact_path(path):
+    """Ruta del artefacto compacto equivalente a un .joblib"""
+    return Path(path).with_suffix(ARTIFACT_SUFFIX)
+
+
+# ============================================================================
+# FORMATO DE ARCHIVO
+# ============================================================================
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_arrays(path, arrays, meta=None):
+    """
+    Guarda arrays y metadatos en un archivo (escritura atómica)
+    
+    Args:
+        path: Ruta del archivo
+        arrays: dict nombre -> numpy.ndarray (numérico)
+        meta: dict serializable a JSON
+    
+    Returns:
+        Path del archivo
+    """
+    path = Path(path)
+    arrays = {nombre: np.ascontiguousarray(valor) for nombre, valor in arrays.items()}
+    
+    # Los offsets dependen del largo del encabezado, que a su vez los
+    # contiene: se calculan relativos al inicio de la zona de datos
+    indice, offset = {}, 0
+    for nombre, valor in arrays.items():
+        offset = _aligned(offset)
+        indice[nombre] = {'dtype': valor.dtype.str, 'shape': list(valor.shape), 'offset': offset}
+        offset += valor.nbytes
+    
+    encabezado = json.dumps({
+        'version': ARTIFACT_VERSION,
+        'meta': meta or {},
+        'arrays': indice,
+    }).encode('utf-8')
+    inicio_datos = _aligned(len(ARTIFACT_MAGIC) + 8 + len(encabezado))
+    
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp, 'wb') as f:
+        f.write(ARTIFACT_MAGIC)
+        f.write(np.uint64(len(encabezado)).tobytes())
+        f.write(encabezado)
+        for nombre, valor in arrays.items():
+            f.seek(inicio_datos + indice[nombre]['offset'])
+            f.write(valor.tobytes())
+        f.truncate(inicio_datos + offset)
+    os.replace(tmp, path)
+    
+    return path
+
+
+def load_arrays(path, mmap=True):
+    """
+    Abre un archivo de save_arrays
+    
+    Args:
+        path: Ruta del archivo
+        mmap: True = vistas de solo lectura sobre el archivo mapeado;
+              False = leerlo completo a memoria
+    
+    Returns:
+        Tuple (arrays, meta)
+    
+    Raises:
+        ValueError: Si el archivo no es un artefacto compacto válido
+    """
+    if mmap:
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    else:
+        buffer = np.fromfile(path, dtype=np.uint8)
+    
+    n_magic = len(ARTIFACT_MAGIC)
+    if buffer[:n_magic].tobytes() != ARTIFACT_MAGIC:
+        raise ValueError(f"{path} no es un artefacto compacto de ReGPS")
+    largo = int(buffer[n_magic:n_magic + 8].view(np.uint64)[0])
+    encabezado = json.loads(buffer[n_magic + 8:n_magic + 8 + largo].tobytes())
+    if encabezado['version'] != ARTIFACT_VERSION:
+        raise ValueError(f"Versión de artefacto no soportada: {encabezado['version']}")
+    
+    inicio_datos = _aligned(n_magic + 8 + largo)
+    arrays = {}
+    for nombre, info in encabezado['arrays'].items():
+        dtype = np.dtype(info['dtype'])
+        n = int(np.prod(info['shape'], dtype=np.int64))
+        inicio = inicio_datos + info['offset']
+        # ndarray base (no np.memmap): mismas páginas, sin el costo de la subclase al despachar a Numba
+        arrays[nombre] = np.asarray(buffer[inicio:inicio + n * dtype.itemsize]).view(dtype).reshape(info['shape'])
+    
+    return arrays, encabezado['meta']
+
+
+# ============================================================================
+# BOSQUE COMPACTO
+# ============================================================================
+
+def _node_depths(left, right):
+    """Largo del camino (raíz = 1) de cada nodo de un árbol"""
+    profundidad = np.zeros(len(left))
+    profundidad[0] = 1.0
+    # sklearn numera cada hijo después de su padre
+    for nodo in range(len(left)):
+        if left[nodo] != -1:
+            profundidad[left[nodo]] = profundidad[right[nodo]] = profundidad[nodo] + 1.0
+    return profundidad
+
+
+class CompactForest:
+    """
+    Bosque de árboles como arrays planos, con la misma API de predicción
+    que el estimador de sklearn que lo originó
+    """
+    
+    def __init__(self, arrays, meta):
+        """
+        Args:
+            arrays: dict con feature, threshold, children, value, roots
+            meta: dict con kind, max_depth y los parámetros del tipo de bosque
+        """
+        self.kind = meta['kind']
+        if self.kind not in FOREST_KINDS:
+            raise ValueError(f"Tipo de bosque desconocido: {self.kind}")
+        
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.children = arrays['children']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.max_depth = int(meta['max_depth'])
+        self.n_features_in_ = int(meta['n_features'])
+        self.classes_ = np.array(meta['classes'], dtype=object) if meta.get('classes') is not None else None
+        self.offset_ = meta.get('offset')
+        self.denominator = meta.get('denominator')
+        # Umbrales en el espacio de las features crudas (ver fold_thresholds)
+        self.folded = bool(meta.get('folded', False))
+    
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+    
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+    
+    @classmethod
+    def from_estimator(cls, model):
+        """
+        Aplanar un RandomForestRegressor, RandomForestClassifier o IsolationForest
+        
+        Args:
+            model: Estimador de sklearn entrenado
+        
+        Returns:
+            Tuple (arrays, meta) para CompactForest(arrays, meta) o save_arrays
+        """
+        if isinstance(model, RandomForestRegressor):
+            kind = 'regressor'
+        elif isinstance(model, RandomForestClassifier):
+            kind = 'classifier'
+        elif isinstance(model, IsolationForest):
+            kind = 'isolation'
+        else:
+            raise TypeError(f"Modelo no soportado: {type(model).__name__}")
+        
+        if getattr(model, 'n_outputs_', 1) != 1:
+            raise ValueError("Solo se soportan modelos de una salida")
+        
+        subconjuntos = None
+        if kind == 'isolation' and model._max_features != model.n_features_in_:
+            subconjuntos = model.estimators_features_
+        
+        features, thresholds, children, values, roots = [], [], [], [], []
+        base, max_depth = 0, 0
+        for t, estimator in enumerate(model.estimators_):
+            tree = estimator.tree_
+            left = tree.children_left.astype(np.int64)
+            right = tree.children_right.astype(np.int64)
+            hoja = left == -1
+            nodos = np.arange(tree.node_count, dtype=np.int64)
+            
+            feature = tree.feature.astype(np.int64)
+            if subconjuntos is not None:
+                feature = np.where(hoja, 0, np.asarray(subconjuntos[t])[np.maximum(feature, 0)])
+            feature[hoja] = 0
+            
+            # Las hojas apuntan a sí mismas: recorrer de más no las mueve
+            features.append(feature.astype(np.int32))
+            thresholds.append(np.where(hoja, 0.0, tree.threshold))
+            children.append(np.stack([
+                np.where(hoja, nodos, left), np.where(hoja, nodos, right)
+            ], axis=1).ravel() + base)
+            
+            if kind == 'regressor':
+                values.append(tree.value[:, 0, 0].astype(np.float64))
+            elif kind == 'classifier':
+                proba = tree.value[:, 0, :model.n_classes_].astype(np.float64)
+                if _NORMALIZE_LEAF_PROBA:
+                    normalizador = proba.sum(axis=1)[:, np.newaxis]
+                    normalizador[normalizador == 0.0] = 1.0
+                    proba = proba / normalizador
+                values.append(proba)
+            else:
+                # Mismo orden de operaciones que _parallel_compute_tree_depths
+                values.append(
+                    _node_depths(left, right)
+                    + _average_path_length(tree.n_node_samples)
+                    - 1.0
+                )
+            
+            roots.append(base)
+            base += tree.node_count
+            max_depth = max(max_depth, int(tree.max_depth))
+        
+        indice = np.int32 if base < 2**31 else np.int64
+        arrays = {
+            'feature': np.concatenate(features),
+            'threshold': np.concatenate(thresholds).astype(np.float64),
+            'children': np.concatenate(children).astype(indice),
+            'value': np.concatenate(values),
+            'roots': np.array(roots, dtype=np.int64),
+        }
+        meta = {
+            'kind': kind,
+            'max_depth': max_depth,
+            'n_features': int(model.n_features_in_),
+        }
+        if kind == 'classifier':
+            meta['classes'] = model.classes_.tolist()
+        if kind == 'isolation':
+            meta['offset'] = float(model.offset_)
+            meta['denominator'] = float(
+                len(model.estimators_) * _average_path_length([model._max_samples])[0]
+            )
+        
+        return arrays, meta
+    
+    def apply(self, X):
+        """
+        Hoja de cada fila en cada árbol
+        
+        Args:
+            X: Matriz (n, n_features) ya escalada (cruda si folded)
+        
+        Returns:
+            numpy.ndarray (n, n_estimators) de índices globales de nodo
+        """
+        # sklearn compara X en float32 contra umbrales float64; los
+        # umbrales plegados ya incluyen ese paso y se comparan en float64
+        X = np.ascontiguousarray(X, dtype=np.float64 if self.folded else np.float32)
+        n, n_features = X.shape
+        valores = X.ravel()
+        
+        # Un elemento por (fila, árbol); solo se siguen los que no llegaron a una hoja
+        nodo = np.tile(self.roots, n)
+        activos = np.arange(len(nodo))
+        base = activos // len(self.roots) * n_features
+        actual = nodo
+        
+        for _ in range(self.max_depth):
+            derecha = valores[base + self.feature[actual]] > self.threshold[actual]
+            actual = self.children[2 * actual + derecha]
+            nodo[activos] = actual
+            
+            sigue = self.children[2 * actual] != actual
+            if not sigue.any():
+                break
+            activos, base, actual = activos[sigue], base[sigue], actual[sigue]
+        
+        return nodo.reshape(n, len(self.roots))
+    
+    def _sum_leaves(self, X):
+        """Suma de los valores de hoja en el orden de los árboles"""
+        hojas = self.apply(X)
+        total = np.zeros((len(hojas),) + self.value.shape[1:])
+        for t in range(hojas.shape[1]):
+            total += self.value[hojas[:, t]]
+        return total
+    
+    def predict_proba(self, X):
+        """Probabilidad de cada clase (clasificador)"""
+        if self.kind != 'classifier':
+            raise AttributeError("predict_proba solo existe para clasificadores")
+        proba = self._sum_leaves(X)
+        proba /= self.n_estimators
+        return proba
+    
+    def score_samples(self, X):
+        """Score de IsolationForest (menor = más anómalo)"""
+        if self.kind != 'isolation':
+            raise AttributeError("score_samples solo existe para IsolationForest")
+        profundidad = self._sum_leaves(X)
+        return -(2 ** (-np.divide(
+            profundidad, self.denominator, out=np.ones_like(profundidad), where=self.denominator != 0
+        )))
+    
+    def decision_function(self, X):
+        """score_samples - offset_ (< 0 = anomalía)"""
+        return self.score_samples(X) - self.offset_
+    
+    def predict(self, X):
+        """
+        Predicción con la misma salida que el estimador original
+        
+        Returns:
+            Regresión: valor; clasificación: clase; IsolationForest: 1 / -1
+        """
+        if self.kind == 'regressor':
+            y = self._sum_leaves(X)
+            y /= self.n_estimators
+            return y
+        if self.kind == 'classifier':
+            return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+        
+        es_normal = np.ones(len(X), dtype=int)
+        es_normal[self.decision_function(X) < 0] = -1
+        return es_normal
+
+
+# ============================================================================
+# ESCALADO PLEGADO EN LOS UMBRALES
+# ============================================================================
+
+_SIGNO = np.int64(-2**63)
+_MAGNITUD = np.int64(2**63 - 1)
+
+
+def _float_keys(x):
+    """Enteros con el mismo orden que los float64 (±0 comparten clave)"""
+    bits = np.asarray(x, dtype=np.float64).view(np.int64)
+    return np.where(bits < 0, -(bits & _MAGNITUD), bits)
+
+
+def _keys_to_float(claves):
+    """Inverso de _float_keys"""
+    bits = np.where(claves < 0, (-claves) | _SIGNO, claves)
+    return bits.view(np.float64)
+
+
+def _scaled32(x, mean, scale):
+    """Feature como la ve un árbol de sklearn: float32((x - mean) / scale)"""
+    with np.errstate(over='ignore', invalid='ignore'):
+        return ((x - mean) / scale).astype(np.float32)
+
+
+def fold_thresholds(threshold, feature, es_hoja, mean, scale):
+    """
+    Reescribe los umbrales de un bosque entrenado sobre features escaladas
+    al espacio de las features crudas
+    
+    Un árbol de sklearn va a la izquierda si float32((x - mean) / scale) <= t.
+    Esa expresión no decrece con x (resta, división por scale > 0 y
+    redondeo a float32 son monótonas), así que el conjunto de x que van a la
+    izquierda es x <= T, con T el mayor float64 que cumple la condición.
+    T se busca en binario sobre el orden de los float64 (64 pasos,
+    vectorizado sobre todos los nodos), y se comprueba para cada nodo que T
+    va a la izquierda y el float siguiente a la derecha: con eso
+    `x <= T` decide igual que sklearn para cualquier x finito.
+    
+    Args:
+        threshold: Umbrales (espacio escalado) por nodo
+        feature: Índice de feature por nodo
+        es_hoja: Máscara de hojas (su umbral queda en 0)
+        mean: mean_ del StandardScaler (ceros si no centra)
+        scale: scale_ del StandardScaler (unos si no escala)
+    
+    Returns:
+        numpy.ndarray float64 de umbrales crudos
+    
+    Raises:
+        ValueError: Si algún nodo no queda equivalente
+    """
+    internos = np.flatnonzero(~es_hoja)
+    t = np.asarray(threshold, dtype=np.float64)[internos]
+    m = np.asarray(mean, dtype=np.float64)[feature[internos]]
+    s = np.asarray(scale, dtype=np.float64)[feature[internos]]
+    
+    maximo = np.finfo(np.float64).max
+    lo = np.full(len(t), _float_keys(-maximo))
+    hi = np.full(len(t), _float_keys(maximo))
+    # Sin ningún x finito a la izquierda el umbral es -inf
+    hay_izquierda = _scaled32(-maximo, m, s) <= t
+    
+    while True:
+        pendiente = lo < hi
+        if not pendiente.any():
+            break
+        # lo + ceil((hi - lo) / 2): la diferencia puede pasar de 2**63, se
+        # calcula en uint64 (aritmética módulo 2**64)
+        distancia = hi.astype(np.uint64) - lo.astype(np.uint64)
+        medio = (lo.astype(np.uint64) + (distancia >> np.uint64(1)) + (distancia & np.uint64(1))).astype(np.int64)
+        izquierda = _scaled32(_keys_to_float(medio), m, s) <= t
+        lo = np.where(pendiente & izquierda, medio, lo)
+        hi = np.where(pendiente & ~izquierda, medio - 1, hi)
+    
+    crudos = np.where(hay_izquierda, _keys_to_float(lo), -np.inf)
+    
+    siguiente = np.nextafter(crudos, np.inf)
+    ok = np.where(hay_izquierda, _scaled32(crudos, m, s) <= t, True)
+    ok &= (crudos == maximo) | (_scaled32(siguiente, m, s) > t)
+    if not ok.all():
+        raise ValueError(f"{int((~ok).sum())} umbrales no quedaron equivalentes al plegar el scaler")
+    
+    resultado = np.zeros(len(threshold))
+    resultado[internos] = crudos
+    return resultado
+
+
+def fold_forest(arrays, meta, mean, scale):
+    """
+    Pliega el scaler en los arrays de CompactForest.from_estimator (en el lugar)
+    
+    Returns:
+        Tuple (arrays, meta) con threshold en espacio crudo y meta['folded']
+    """
+    es_hoja = arrays['children'][0::2] == np.arange(len(arrays['feature']))
+    arrays['threshold'] = fold_thresholds(arrays['threshold'], arrays['feature'], es_hoja, mean, scale)
+    meta['folded'] = True
+    return arrays, meta
+
+
+def _forest_outputs(model, X, kind):
+    """Salida a comparar: proba (clasificador), score (IsolationForest) o predicción"""
+    if kind == 'classifier':
+        return model.predict_proba(X)
+    if kind == 'isolation':
+        return model.score_samples(X)
+    return model.predict(X)
+
+
+def verify_folded(wrapper, forest, X_check):
+    """
+    Compara un bosque plegado contra el modelo de sklearn con su scaler
+    
+    Args:
+        wrapper: Modelo entrenado (model, scaler, feature_columns)
+        forest: CompactForest con folded=True
+        X_check: DataFrame con feature_columns (p. ej. las filas de test)
+    
+    Returns:
+        int: Filas comparadas (las que tienen NaN/inf se omiten: la API y el
+        entrenamiento las reemplazan por 0 antes de predecir)
+    
+    Raises:
+        ValueError: Si alguna salida no es idéntica
+    """
+    crudas = np.asarray(X_check[wrapper.feature_columns], dtype=np.float64)
+    crudas = crudas[np.isfinite(crudas).all(axis=1)]
+    if not len(crudas):
+        return 0
+    
+    escaladas = wrapper.scaler.transform(pd.DataFrame(crudas, columns=wrapper.feature_columns))
+    
+    # Con n_jobs > 1 sklearn suma los árboles en el orden en que terminan
+    modelo = wrapper.model
+    n_jobs = getattr(modelo, 'n_jobs', None)
+    try:
+        if n_jobs is not None:
+            modelo.n_jobs = 1
+        esperado = _forest_outputs(modelo, escaladas, forest.kind)
+    finally:
+        if n_jobs is not None:
+            modelo.n_jobs = n_jobs
+    
+    obtenido = _forest_outputs(forest, crudas, forest.kind)
+    distintas = ~(esperado == obtenido)
+    if distintas.ndim > 1:
+        distintas = distintas.any(axis=1)
+    if distintas.any():
+        raise ValueError(
+            f"El bosque plegado difiere de sklearn en {int(distintas.sum())} de {len(crudas)} filas"
+        )
+    
+    return len(crudas)
+
+
+class CompactScaler:
+    """Parámetros de un StandardScaler entrenado"""
+    
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+        self.with_mean = True
+        self.with_std = True
+    
+    def transform(self, X):
+        X = np.array(X, dtype=np.float64)
+        X -= self.mean_
+        X /= self.scale_
+        return X
+
+
+class CompactModel:
+    """
+    Modelo cargado desde un artefacto compacto
+    
+    Expone model, scaler y feature_columns igual que ETAPredictor,
+    AnomalyDetector y BehaviorClassifier, así que ModelRegistry lo usa sin
+    distinguirlo de un wrapper cargado desde joblib. Con los umbrales
+    plegados scaler es None y model recibe las features crudas.
+    """
+    
+    def __init__(self, model, scaler, feature_columns, meta, path=None):
+        self.model = model
+        self.scaler = scaler
+        self.feature_columns = feature_columns
+        self.meta = meta
+        self.path = path
+        self.is_trained = True
+        for clave in ('categories', 'contamination', 'trained_date'):
+            if clave in meta:
+                setattr(self, clave, meta[clave])
+
+
+def save_compact(wrapper, path, fold=True, X_check=None):
+    """
+    Guarda un wrapper entrenado (ETAPredictor, AnomalyDetector o
+    BehaviorClassifier) como artefacto compacto
+    
+    Args:
+        wrapper: Modelo entrenado con model, scaler y feature_columns
+        path: Ruta del archivo (por convención, el .joblib con sufijo .mmap)
+        fold: Plegar el StandardScaler en los umbrales (ver fold_thresholds)
+        X_check: DataFrame de filas (p. ej. de test) con las que verificar
+                 que el bosque plegado predice idéntico a sklearn
+    
+    Returns:
+        dict con path, folded, nodos y filas verificadas
+    
+    Raises:
+        ValueError: Si el bosque plegado no es idéntico (no se escribe nada)
+    """
+    arrays, meta = CompactForest.from_estimator(wrapper.model)
+    
+    scaler = wrapper.scaler
+    n_features = len(wrapper.feature_columns)
+    mean = (
+        np.asarray(scaler.mean_, dtype=np.float64) if getattr(scaler, 'with_mean', True)
+        else np.zeros(n_features)
+    )
+    scale = (
+        np.asarray(scaler.scale_, dtype=np.float64) if getattr(scaler, 'with_std', True)
+        else np.ones(n_features)
+    )
+    
+    filas = 0
+    if fold:
+        fold_forest(arrays, meta, mean, scale)
+        if X_check is not None:
+            filas = verify_folded(wrapper, CompactForest(arrays, meta), X_check)
+    else:
+        arrays['scaler_mean'] = mean
+        arrays['scaler_scale'] = scale
+    
+    meta['feature_columns'] = list(wrapper.feature_columns)
+    meta['wrapper'] = type(wrapper).__name__
+    for clave in ('categories', 'contamination', 'trained_date'):
+        valor = getattr(wrapper, clave, None)
+        if valor is not None:
+            meta[clave] = valor
+    
+    return {
+        'path': save_arrays(path, arrays, meta),
+        'folded': fold,
+        'nodos': int(len(arrays['feature'])),
+        'filas_verificadas': filas,
+    }
+
+
+def load_compact(path, mmap=True):
+    """
+    Carga un artefacto compacto
+    
+    Args:
+        path: Ruta del archivo
+        mmap: Mapear el archivo en vez de leerlo (ver load_arrays)
+    
+    Returns:
+        CompactModel
+    """
+    arrays, meta = load_arrays(path, mmap=mmap)
+    # Con los umbrales plegados no hay scaler: el bosque recibe features crudas
+    scaler = CompactScaler(arrays['scaler_mean'], arrays['scaler_scale']) if 'scaler_mean' in arrays else None
+    return CompactModel(
+        CompactForest(arrays, meta),
+        scaler,
+        list(meta['feature_columns']),
+        meta,
+        path=Path(path),
+    )
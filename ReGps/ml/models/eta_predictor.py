@@ -15,8 +15,30 @@ from datetime import datetime
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from utils.geo_utils import calculate_distance, calculate_bearing
+from utils import geo_arrays
+from utils.trajectory_utils import group_starts
 from utils.metrics import mae, rmse
+from models import compact, tree_engine
+
+
+def factor_hora(hora):
+    """
+    Factor de velocidad según la hora del día
+    Hora pico (7-9, 17-19): 0.7 | Madrugada (0-5): 1.2 | Resto: 1.0
+    
+    Args:
+        hora: Hora (0-23), escalar o array
+    
+    Returns:
+        float o numpy.ndarray con el factor
+    """
+    hora = np.asarray(hora)
+    factor = np.select(
+        [((hora >= 7) & (hora <= 9)) | ((hora >= 17) & (hora <= 19)), (hora >= 0) & (hora <= 5)],
+        [0.7, 1.2],
+        default=1.0
+    )
+    return float(factor) if factor.ndim == 0 else factor
 
 
 class ETAPredictor:
@@ -45,7 +67,7 @@ class ETAPredictor:
         self.scaler = StandardScaler()
         self.feature_columns = None
         self.is_trained = False
-        
+    
     def create_route_segments(self, df_ubicaciones):
         """
         Crea segmentos de ruta con origen-destino y tiempo real de viaje
@@ -59,52 +81,54 @@ class ETAPredictor:
         print("🛣️ Creando segmentos de ruta...")
         
         df_ubicaciones['FechaHora'] = pd.to_datetime(df_ubicaciones['FechaHora'])
-        segments = []
-        
-        for dispositivo_id in df_ubicaciones['DispositivoID'].unique():
-            device_locs = df_ubicaciones[df_ubicaciones['DispositivoID'] == dispositivo_id].copy()
-            device_locs = device_locs.sort_values('FechaHora').reset_index(drop=True)
-            
-            for i in range(len(device_locs) - 1):
-                origen = device_locs.iloc[i]
-                destino = device_locs.iloc[i + 1]
-                
-                tiempo_viaje = (destino['FechaHora'] - origen['FechaHora']).total_seconds() / 60
-                
-                if tiempo_viaje < 0.5 or tiempo_viaje > 120:
-                    continue
-                
-                distancia = calculate_distance(
-                    origen['Latitud'], origen['Longitud'],
-                    destino['Latitud'], destino['Longitud']
-                )
-                
-                if distancia < 0.01:
-                    continue
-                
-                bearing = calculate_bearing(
-                    origen['Latitud'], origen['Longitud'],
-                    destino['Latitud'], destino['Longitud']
-                )
-                
-                segment = {
-                    'DispositivoID': dispositivo_id,
-                    'lat_origen': origen['Latitud'],
-                    'lon_origen': origen['Longitud'],
-                    'lat_destino': destino['Latitud'],
-                    'lon_destino': destino['Longitud'],
-                    'velocidad_origen': origen['Velocidad'],
-                    'hora_inicio': origen['FechaHora'].hour,
-                    'dia_semana': origen['FechaHora'].dayofweek,
-                    'es_fin_semana': 1 if origen['FechaHora'].dayofweek >= 5 else 0,
-                    'distancia_km': distancia,
-                    'bearing': bearing,
-                    'tiempo_viaje_min': tiempo_viaje,
-                }
-                
-                segments.append(segment)
-        
-        df_segments = pd.DataFrame(segments)
+        
+        # Dispositivos en orden de aparición y puntos ordenados por tiempo:
+        # cada par (origen, destino) son dos filas consecutivas del mismo bloque
+        codigo_dispositivo = pd.factorize(df_ubicaciones['DispositivoID'])[0]
+        orden = np.lexsort((df_ubicaciones['FechaHora'].to_numpy(), codigo_dispositivo))
+        df_sorted = df_ubicaciones.iloc[orden]
+        
+        dispositivos = df_sorted['DispositivoID'].to_numpy()
+        fechas = df_sorted['FechaHora'].to_numpy(dtype='datetime64[ns]')
+        lats = df_sorted['Latitud'].to_numpy(dtype=float)
+        lons = df_sorted['Longitud'].to_numpy(dtype=float)
+        velocidades = df_sorted['Velocidad'].to_numpy(dtype=float)
+        
+        # Origen = fila i, destino = fila i + 1 del mismo dispositivo
+        mismo_dispositivo = ~group_starts(codigo_dispositivo[orden])[1:]
+        tiempo_viaje = (fechas[1:] - fechas[:-1]) / np.timedelta64(1, 'm')
+        
+        mask = mismo_dispositivo & (tiempo_viaje >= 0.5) & (tiempo_viaje <= 120)
+        origen = np.flatnonzero(mask)
+        destino = origen + 1
+        
+        distancia = geo_arrays.calculate_distance(
+            lats[origen], lons[origen], lats[destino], lons[destino], method='geodesic'
+        )
+        
+        # Descartar segmentos de menos de 10 metros
+        validos = ~(distancia < 0.01)
+        origen, destino, distancia = origen[validos], destino[validos], distancia[validos]
+        
+        bearing = geo_arrays.calculate_bearing(lats[origen], lons[origen], lats[destino], lons[destino])
+        fecha_origen = pd.DatetimeIndex(fechas[origen])
+        
+        df_segments = pd.DataFrame({
+            'DispositivoID': dispositivos[origen],
+            'FechaHora': fecha_origen,
+            'lat_origen': lats[origen],
+            'lon_origen': lons[origen],
+            'lat_destino': lats[destino],
+            'lon_destino': lons[destino],
+            'velocidad_origen': velocidades[origen],
+            'hora_inicio': fecha_origen.hour,
+            'dia_semana': fecha_origen.dayofweek,
+            'es_fin_semana': (fecha_origen.dayofweek >= 5).astype(int),
+            'distancia_km': distancia,
+            'bearing': bearing,
+            'tiempo_viaje_min': tiempo_viaje[origen],
+        })
+        
         print(f"✅ Creados {len(df_segments):,} segmentos de ruta")
         
         return df_segments
@@ -125,15 +149,7 @@ class ETAPredictor:
         device_avg_speed = df_ubicaciones.groupby('DispositivoID')['Velocidad'].mean().to_dict()
         df_segments['velocidad_promedio_historica'] = df_segments['DispositivoID'].map(device_avg_speed)
         
-        def get_hour_factor(hour):
-            if 7 <= hour <= 9 or 17 <= hour <= 19:
-                return 0.7
-            elif 0 <= hour <= 5:
-                return 1.2
-            else:
-                return 1.0
-        
-        df_segments['factor_hora'] = df_segments['hora_inicio'].apply(get_hour_factor)
+        df_segments['factor_hora'] = factor_hora(df_segments['hora_inicio'].to_numpy())
         df_segments['velocidad_esperada'] = (
             df_segments['velocidad_promedio_historica'] * df_segments['factor_hora']
         )
@@ -176,6 +192,8 @@ class ETAPredictor:
         X_train, X_test, y_train, y_test = train_test_split(
             X, y, test_size=test_size, random_state=42
         )
+        # Filas de test: save_compact verifica con ellas el artefacto plegado
+        self.X_holdout = X_test
         
         print(f"   • Train: {len(X_train):,} filas")
         print(f"   • Test: {len(X_test):,} filas")
@@ -248,6 +266,10 @@ class ETAPredictor:
             raise ValueError("Modelo no entrenado. Ejecutar train() primero.")
         
         if isinstance(features, dict):
+            # Una fila completa va por el motor compilado (mismo resultado, sin pandas)
+            fila = tree_engine.dict_row(features, self.feature_columns)
+            if fila is not None:
+                return tree_engine.engine_for(self).predict(fila)[0]
             features = pd.DataFrame([features])
         
         features_scaled = self.scaler.transform(features[self.feature_columns])
@@ -275,6 +297,29 @@ class ETAPredictor:
         joblib.dump(model_data, path)
         print(f"💾 Modelo guardado en: {path}")
     
+    def save_compact(self, path, fold=True):
+        """
+        Guarda el modelo como artefacto compacto (arrays planos que la API
+        carga con mmap, ver models/compact.py)
+        
+        Con fold=True el StandardScaler se pliega en los umbrales (el
+        artefacto predice desde features crudas) y, antes de escribirlo, se
+        verifica que dé lo mismo que sklearn en las filas de test del último
+        train().
+        
+        Args:
+            path: Ruta del archivo .mmap
+            fold: Plegar el scaler en los umbrales
+        """
+        if not self.is_trained:
+            raise ValueError("Modelo no entrenado. Ejecutar train() primero.")
+        
+        info = compact.save_compact(self, path, fold=fold, X_check=getattr(self, 'X_holdout', None))
+        print(f"💾 Artefacto compacto guardado en: {path}")
+        if info['folded']:
+            print(f"   • Scaler plegado en {info['nodos']:,} nodos; "
+                  f"{info['filas_verificadas']:,} filas de test idénticas a sklearn")
+    
     @classmethod
     def load(cls, path):
         """
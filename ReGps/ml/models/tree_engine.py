@@ -0,0 +1,250 @@
+"""
+Motor de inferencia compilado para los bosques (ETA, anomalías, comportamiento)
+
+Predecir una fila con los wrappers cuesta cientos de microsegundos que no
+son del modelo: DataFrame de una fila, selección de columnas, validaciones
+de StandardScaler.transform y de sklearn. TreeEngine recibe las features
+crudas como array float y recorre los arrays planos de CompactForest
+(models/compact.py) en una función compilada con Numba:
+
+- Con umbrales plegados (compact.fold_thresholds) la fila cruda se compara
+  directo en float64: no hay paso de escalado.
+- Si no, el escalado va dentro del kernel: (x - mean) / scale se calcula
+  una vez por feature de la fila (no por nodo) con las mismas operaciones
+  que StandardScaler.transform, y se pasa a float32 igual que sklearn antes
+  de comparar contra los umbrales.
+- Las hojas se suman en el orden de los árboles y el resultado se divide
+  igual que sklearn, así que las salidas son idénticas a las del modelo con
+  n_jobs=1 (no solo cercanas).
+
+Numba es opcional (pip install numba): sin él, TreeEngine usa el recorrido
+vectorizado con NumPy de CompactForest, con los mismos resultados pero sin
+la ganancia en filas sueltas. Las features deben venir sin NaN (la API y el
+entrenamiento los reemplazan por 0 antes).
+"""
+
+import numpy as np
+
+from models.compact import CompactForest, fold_forest
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+# Árboles que se recorren a la vez: sus caminos son independientes, así
+# que las lecturas de nodos de un árbol se solapan con las de los otros
+GRUPO_ARBOLES = 8
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, nogil=True)
+    def _sum_row(fila, feature, threshold, children, roots, value, max_depth, divisor, hojas, salida):
+        """Suma de los valores de hoja de una fila, dividida por divisor, en salida (k,)"""
+        n_arboles = roots.shape[0]
+        for inicio in range(0, n_arboles, GRUPO_ARBOLES):
+            m = min(GRUPO_ARBOLES, n_arboles - inicio)
+            for g in range(m):
+                hojas[g] = roots[inicio + g]
+            # Sin ramas: las hojas apuntan a sí mismas, así que max_depth
+            # pasos dejan a todos los árboles del grupo en su hoja
+            for _ in range(max_depth):
+                for g in range(m):
+                    nodo = hojas[g]
+                    hojas[g] = children[2 * nodo + (fila[feature[nodo]] > threshold[nodo])]
+            # Suma en el orden de los árboles, como sklearn
+            for g in range(m):
+                for k in range(value.shape[1]):
+                    salida[k] += value[hojas[g], k]
+        for k in range(value.shape[1]):
+            salida[k] /= divisor
+    
+    @njit(cache=True, nogil=True)
+    def _forest_kernel(X, escalado, feature, threshold, children, roots, value, max_depth, divisor):
+        """
+        Filas crudas de X con el scaler aplicado en el kernel, (n, k)
+        (divisor: n_estimators o el denominador de IsolationForest)
+        """
+        n, n_features = X.shape
+        total = np.zeros((n, value.shape[1]))
+        fila = np.empty(n_features, dtype=np.float32)
+        hojas = np.empty(GRUPO_ARBOLES, dtype=np.int64)
+        for i in range(n):
+            for j in range(n_features):
+                fila[j] = np.float32((X[i, j] - escalado[0, j]) / escalado[1, j])
+            _sum_row(fila, feature, threshold, children, roots, value, max_depth, divisor, hojas, total[i])
+        return total
+    
+    @njit(cache=True, nogil=True)
+    def _folded_kernel(X, feature, threshold, children, roots, value, max_depth, divisor):
+        """Filas crudas de X contra umbrales plegados (float64, sin escalar), (n, k)"""
+        n = X.shape[0]
+        total = np.zeros((n, value.shape[1]))
+        hojas = np.empty(GRUPO_ARBOLES, dtype=np.int64)
+        for i in range(n):
+            _sum_row(X[i], feature, threshold, children, roots, value, max_depth, divisor, hojas, total[i])
+        return total
+
+
+class TreeEngine:
+    """
+    Predicción de un bosque (regresor, clasificador o IsolationForest) a
+    partir de features crudas, sin pandas ni validaciones de sklearn
+    """
+    
+    def __init__(self, forest, mean=None, scale=None, compiled=None):
+        """
+        Args:
+            forest: CompactForest
+            mean: mean_ del StandardScaler (ceros si no centra; None si
+                  forest tiene los umbrales plegados)
+            scale: scale_ del StandardScaler (unos si no escala; idem)
+            compiled: Usar el kernel de Numba (default: si está instalado)
+        """
+        self.forest = forest
+        self.kind = forest.kind
+        self.folded = forest.folded
+        if not self.folded and (mean is None or scale is None):
+            raise ValueError("Un bosque sin umbrales plegados necesita mean y scale del scaler")
+        self.mean = None if self.folded else np.ascontiguousarray(mean, dtype=np.float64)
+        self.scale = None if self.folded else np.ascontiguousarray(scale, dtype=np.float64)
+        self.n_features = forest.n_features_in_
+        self._escalado = None if self.folded else np.stack([self.mean, self.scale])
+        self.compiled = NUMBA_AVAILABLE if compiled is None else compiled
+        if self.compiled and not NUMBA_AVAILABLE:
+            raise ImportError("El motor compilado requiere el paquete 'numba' (pip install numba)")
+        
+        value = forest.value
+        self._value = value.reshape(len(value), -1)
+        self._k = self._value.shape[1]
+        # sklearn divide la suma por el número de árboles; IsolationForest
+        # divide las profundidades por n_estimators * c(max_samples)
+        self._divisor = float(forest.denominator if self.kind == 'isolation' else forest.n_estimators)
+    
+    @classmethod
+    def from_wrapper(cls, wrapper, compiled=None, fold=True):
+        """
+        Motor para un ETAPredictor, AnomalyDetector, BehaviorClassifier
+        (o un CompactModel ya cargado)
+        
+        Args:
+            wrapper: Modelo entrenado con model, scaler y feature_columns
+            compiled: Ver __init__
+            fold: Plegar el scaler en los umbrales de un modelo de sklearn
+                  (un CompactModel se usa tal como se guardó)
+        
+        Returns:
+            TreeEngine
+        """
+        forest = wrapper.model
+        if isinstance(forest, CompactForest) and forest.folded:
+            return cls(forest, compiled=compiled)
+        
+        scaler = wrapper.scaler
+        n_features = len(wrapper.feature_columns)
+        mean = scaler.mean_ if getattr(scaler, 'with_mean', True) else np.zeros(n_features)
+        scale = scaler.scale_ if getattr(scaler, 'with_std', True) else np.ones(n_features)
+        
+        if not isinstance(forest, CompactForest):
+            arrays, meta = CompactForest.from_estimator(forest)
+            if fold:
+                return cls(CompactForest(*fold_forest(arrays, meta, mean, scale)), compiled=compiled)
+            forest = CompactForest(arrays, meta)
+        
+        return cls(forest, mean, scale, compiled=compiled)
+    
+    def _matrix(self, X):
+        """Features crudas como matriz (n, n_features) float64 contigua"""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"Se esperaban {self.n_features} features, llegaron {X.shape[1]}")
+        return np.ascontiguousarray(X)
+    
+    def _mean_leaves(self, X):
+        """Suma de hojas en el orden de los árboles dividida por _divisor, (n, k)"""
+        X = self._matrix(X)
+        if not self.compiled:
+            if not self.folded:
+                X = (X - self.mean) / self.scale
+            total = self.forest._sum_leaves(X).reshape(len(X), self._k)
+            total /= self._divisor
+            return total
+        
+        forest = self.forest
+        if self.folded:
+            return _folded_kernel(
+                X, forest.feature, forest.threshold, forest.children,
+                forest.roots, self._value, forest.max_depth, self._divisor
+            )
+        return _forest_kernel(
+            X, self._escalado, forest.feature, forest.threshold, forest.children,
+            forest.roots, self._value, forest.max_depth, self._divisor
+        )
+    
+    def predict_proba(self, X):
+        """Probabilidad de cada clase (clasificador)"""
+        if self.kind != 'classifier':
+            raise AttributeError("predict_proba solo existe para clasificadores")
+        return self._mean_leaves(X)
+    
+    def score_samples(self, X):
+        """Score de IsolationForest (menor = más anómalo)"""
+        if self.kind != 'isolation':
+            raise AttributeError("score_samples solo existe para IsolationForest")
+        if self.forest.denominator == 0:
+            return -np.ones(len(self._matrix(X)))
+        return -(2 ** -self._mean_leaves(X)[:, 0])
+    
+    def decision_function(self, X):
+        """score_samples - offset_ (< 0 = anomalía)"""
+        return self.score_samples(X) - self.forest.offset_
+    
+    def predict(self, X):
+        """
+        Misma salida que model.predict(scaler.transform(X))
+        
+        Args:
+            X: Features crudas (n, n_features) o una fila (n_features,)
+        
+        Returns:
+            numpy.ndarray: minutos (ETA), clase (comportamiento) o 1 / -1 (anomalía)
+        """
+        if self.kind == 'regressor':
+            return self._mean_leaves(X)[:, 0]
+        if self.kind == 'classifier':
+            return self.forest.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+        
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+
+def engine_for(wrapper):
+    """
+    TreeEngine del wrapper, construido la primera vez y guardado en él
+    (se reconstruye si el modelo o el scaler cambiaron, p. ej. tras train())
+    """
+    cache = getattr(wrapper, '_tree_engine', None)
+    if cache is None or cache[0] is not wrapper.model or cache[1] is not wrapper.scaler:
+        cache = (wrapper.model, wrapper.scaler, TreeEngine.from_wrapper(wrapper))
+        wrapper._tree_engine = cache
+    return cache[2]
+
+
+def dict_row(features, feature_columns):
+    """
+    Fila cruda para el motor compilado a partir de un dict de features
+    
+    Returns:
+        numpy.ndarray (n_features,), o None si no conviene el motor (sin
+        Numba, columnas faltantes o valores no finitos): el caller sigue por
+        el camino de pandas/sklearn, con sus mismos errores
+    """
+    if not NUMBA_AVAILABLE:
+        return None
+    try:
+        fila = np.array([features[c] for c in feature_columns], dtype=np.float64)
+    except (KeyError, TypeError, ValueError):
+        return None
+    return fila if np.isfinite(fila).all() else None
@@ -0,0 +1,452 @@
+"""
+Benchmark y verificación de paridad de la construcción de features vectorizada
+
+Compara la implementación vectorizada de los modelos contra la versión
+anterior (bucle por dispositivo con geopy por fila) sobre datos sintéticos,
+verifica que ambas produzcan los mismos valores y reporta filas/segundo.
+
+Con --check solo verifica la paridad sobre un conjunto chico y fijo
+(semilla y tamaño constantes, unos segundos) y termina con código 1 si
+algo difiere: es el chequeo a correr después de tocar la construcción de
+features de los modelos.
+
+Uso:
+    python scripts/benchmark_features.py --check
+    python scripts/benchmark_features.py
+    python scripts/benchmark_features.py --devices 200 --points 500
+"""
+
+import sys
+import time
+from pathlib import Path
+import pandas as pd
+import numpy as np
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from models.anomaly_detector import AnomalyDetector
+from models.eta_predictor import ETAPredictor
+from models.behavior_classifier import BehaviorClassifier
+from utils.geo_utils import calculate_distance, calculate_bearing
+
+
+def generate_synthetic_ubicaciones(n_devices=50, points_per_device=200, seed=42):
+    """
+    Genera ubicaciones sintéticas con trayectorias tipo random-walk
+    
+    Args:
+        n_devices: Número de dispositivos
+        points_per_device: Puntos promedio por dispositivo
+        seed: Semilla para reproducibilidad
+    
+    Returns:
+        DataFrame con el esquema de ubicaciones_raw_*.csv (desordenado)
+    """
+    rng = np.random.default_rng(seed)
+    
+    frames = []
+    for dispositivo_id in range(1, n_devices + 1):
+        n = max(1, int(rng.poisson(points_per_device)))
+        inicio = pd.Timestamp('2025-11-01') + pd.Timedelta(minutes=int(rng.integers(0, 60 * 24 * 30)))
+        intervalos = rng.exponential(90, n).round() + 1  # segundos, sin empates
+        
+        velocidades = np.clip(rng.normal(40, 25, n), 0, 160).round(1)
+        velocidades[rng.random(n) < 0.02] = np.nan
+        
+        frames.append(pd.DataFrame({
+            'DispositivoID': dispositivo_id,
+            'Latitud': -16.40 + np.cumsum(rng.normal(0, 0.002, n)),
+            'Longitud': -71.53 + np.cumsum(rng.normal(0, 0.002, n)),
+            'Velocidad': velocidades,
+            'Direccion': rng.uniform(0, 360, n).round(),
+            'FechaHora': inicio + pd.to_timedelta(np.cumsum(intervalos), unit='s'),
+        }))
+    
+    df = pd.concat(frames, ignore_index=True)
+    df = df.sample(frac=1, random_state=seed).reset_index(drop=True)
+    df.insert(0, 'UbicacionID', np.arange(1, len(df) + 1))
+    df['FechaHora'] = df['FechaHora'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    
+    return df
+
+
+def generate_synthetic_eventos(df_ubicaciones, fraction=0.05, seed=42):
+    """
+    Genera historial de zonas y alertas sintéticos a partir de ubicaciones
+    
+    Args:
+        df_ubicaciones: DataFrame generado por generate_synthetic_ubicaciones
+        fraction: Fracción de ubicaciones que generan un evento
+        seed: Semilla para reproducibilidad
+    
+    Returns:
+        Tuple (df_historial, df_alertas)
+    """
+    rng = np.random.default_rng(seed)
+    
+    muestra = df_ubicaciones.sample(frac=fraction, random_state=seed)
+    df_historial = pd.DataFrame({
+        'DispositivoID': muestra['DispositivoID'].to_numpy(),
+        'FechaHoraEvento': muestra['FechaHora'].to_numpy(),
+        'TipoZona': rng.choice(['Zona Restringida', 'Checkpoint', 'Zona Segura'], len(muestra)),
+    })
+    
+    muestra = df_ubicaciones.sample(frac=fraction, random_state=seed + 1)
+    df_alertas = pd.DataFrame({
+        'DispositivoID': muestra['DispositivoID'].to_numpy(),
+        'FechaHora': muestra['FechaHora'].to_numpy(),
+        'Prioridad': rng.choice(['Crítica', 'Alta', 'Media', 'Baja'], len(muestra)),
+    })
+    
+    return df_historial, df_alertas
+
+
+# ============================================================================
+# IMPLEMENTACIONES DE REFERENCIA (versión por fila, previa a la vectorización)
+# ============================================================================
+
+def legacy_anomaly_features(df_ubicaciones):
+    """Referencia: AnomalyDetector.create_features con bucle por dispositivo"""
+    df_ubicaciones['FechaHora'] = pd.to_datetime(df_ubicaciones['FechaHora'])
+    df_ubicaciones = df_ubicaciones.sort_values(['DispositivoID', 'FechaHora']).reset_index(drop=True)
+    
+    features_df = pd.DataFrame()
+    features_df['velocidad'] = df_ubicaciones['Velocidad'].fillna(0)
+    features_df['hora_dia'] = df_ubicaciones['FechaHora'].dt.hour
+    features_df['dia_semana'] = df_ubicaciones['FechaHora'].dt.dayofweek
+    features_df['es_fin_semana'] = features_df['dia_semana'].isin([5, 6]).astype(int)
+    
+    features_df['cambio_velocidad'] = 0.0
+    features_df['distancia_metros'] = 0.0
+    features_df['tiempo_detenido'] = (features_df['velocidad'] < 5).astype(int)
+    
+    for dispositivo_id in df_ubicaciones['DispositivoID'].unique():
+        mask = df_ubicaciones['DispositivoID'] == dispositivo_id
+        idx = df_ubicaciones[mask].index
+        
+        if len(idx) < 2:
+            continue
+        
+        velocidades = df_ubicaciones.loc[idx, 'Velocidad'].values
+        cambios = np.abs(np.diff(velocidades, prepend=velocidades[0]))
+        features_df.loc[idx, 'cambio_velocidad'] = cambios
+        
+        lats = df_ubicaciones.loc[idx, 'Latitud'].values
+        lons = df_ubicaciones.loc[idx, 'Longitud'].values
+        
+        distancias = [0]
+        for i in range(1, len(lats)):
+            dist = calculate_distance(lats[i-1], lons[i-1], lats[i], lons[i])
+            distancias.append(dist * 1000)
+        
+        features_df.loc[idx, 'distancia_metros'] = distancias
+    
+    window_size = 5
+    
+    for dispositivo_id in df_ubicaciones['DispositivoID'].unique():
+        mask = df_ubicaciones['DispositivoID'] == dispositivo_id
+        idx = df_ubicaciones[mask].index
+        
+        if len(idx) < window_size:
+            continue
+        
+        velocidad_window = features_df.loc[idx, 'velocidad'].rolling(window_size, min_periods=1).mean()
+        features_df.loc[idx, 'velocidad_media_window'] = velocidad_window
+        
+        velocidad_std = features_df.loc[idx, 'velocidad'].rolling(window_size, min_periods=1).std().fillna(0)
+        features_df.loc[idx, 'velocidad_std_window'] = velocidad_std
+    
+    return features_df.fillna(0)
+
+
+def legacy_route_segments(df_ubicaciones):
+    """Referencia: ETAPredictor.create_route_segments con .iloc por fila"""
+    df_ubicaciones['FechaHora'] = pd.to_datetime(df_ubicaciones['FechaHora'])
+    segments = []
+    
+    for dispositivo_id in df_ubicaciones['DispositivoID'].unique():
+        device_locs = df_ubicaciones[df_ubicaciones['DispositivoID'] == dispositivo_id].copy()
+        device_locs = device_locs.sort_values('FechaHora').reset_index(drop=True)
+        
+        for i in range(len(device_locs) - 1):
+            origen = device_locs.iloc[i]
+            destino = device_locs.iloc[i + 1]
+            
+            tiempo_viaje = (destino['FechaHora'] - origen['FechaHora']).total_seconds() / 60
+            
+            if tiempo_viaje < 0.5 or tiempo_viaje > 120:
+                continue
+            
+            distancia = calculate_distance(
+                origen['Latitud'], origen['Longitud'],
+                destino['Latitud'], destino['Longitud']
+            )
+            
+            if distancia < 0.01:
+                continue
+            
+            bearing = calculate_bearing(
+                origen['Latitud'], origen['Longitud'],
+                destino['Latitud'], destino['Longitud']
+            )
+            
+            segments.append({
+                'DispositivoID': dispositivo_id,
+                'FechaHora': origen['FechaHora'],
+                'lat_origen': origen['Latitud'],
+                'lon_origen': origen['Longitud'],
+                'lat_destino': destino['Latitud'],
+                'lon_destino': destino['Longitud'],
+                'velocidad_origen': origen['Velocidad'],
+                'hora_inicio': origen['FechaHora'].hour,
+                'dia_semana': origen['FechaHora'].dayofweek,
+                'es_fin_semana': 1 if origen['FechaHora'].dayofweek >= 5 else 0,
+                'distancia_km': distancia,
+                'bearing': bearing,
+                'tiempo_viaje_min': tiempo_viaje,
+            })
+    
+    return pd.DataFrame(segments)
+
+
+def legacy_daily_metrics(df_ubicaciones, df_historial=None, df_alertas=None):
+    """Referencia: BehaviorClassifier.create_daily_metrics con bucle por (dispositivo, día)"""
+    classifier = BehaviorClassifier()
+    
+    df_ubicaciones['FechaHora'] = pd.to_datetime(df_ubicaciones['FechaHora'])
+    df_ubicaciones['Fecha'] = df_ubicaciones['FechaHora'].dt.date
+    
+    daily_metrics = []
+    
+    for (dispositivo_id, fecha), group in df_ubicaciones.groupby(['DispositivoID', 'Fecha']):
+        if len(group) < 2:
+            continue
+        
+        velocidades = group['Velocidad'].fillna(0)
+        violaciones_velocidad = (velocidades > 90).sum()
+        pct_violaciones_velocidad = (violaciones_velocidad / len(velocidades)) * 100
+        
+        tiempo_movimiento = (velocidades >= 5).sum()
+        pct_tiempo_movimiento = (tiempo_movimiento / len(velocidades)) * 100
+        
+        distancia_total = 0
+        for i in range(1, len(group)):
+            prev = group.iloc[i-1]
+            curr = group.iloc[i]
+            distancia_total += calculate_distance(
+                prev['Latitud'], prev['Longitud'],
+                curr['Latitud'], curr['Longitud']
+            )
+        
+        cambios_velocidad = np.abs(np.diff(velocidades.values))
+        cambios_bruscos = (cambios_velocidad > 30).sum()
+        
+        eventos_zona_restringida = 0
+        eventos_checkpoint = 0
+        
+        if df_historial is not None and len(df_historial) > 0:
+            df_historial['FechaHoraEvento'] = pd.to_datetime(df_historial['FechaHoraEvento'])
+            df_historial['Fecha'] = df_historial['FechaHoraEvento'].dt.date
+            
+            historial_day = df_historial[
+                (df_historial['DispositivoID'] == dispositivo_id) & 
+                (df_historial['Fecha'] == fecha)
+            ]
+            
+            if len(historial_day) > 0:
+                eventos_zona_restringida = (historial_day['TipoZona'] == 'Zona Restringida').sum()
+                eventos_checkpoint = (historial_day['TipoZona'] == 'Checkpoint').sum()
+        
+        alertas_dia = 0
+        alertas_criticas = 0
+        
+        if df_alertas is not None and len(df_alertas) > 0:
+            df_alertas['FechaHora'] = pd.to_datetime(df_alertas['FechaHora'])
+            df_alertas['Fecha'] = df_alertas['FechaHora'].dt.date
+            
+            alertas_day = df_alertas[
+                (df_alertas['DispositivoID'] == dispositivo_id) & 
+                (df_alertas['Fecha'] == fecha)
+            ]
+            
+            if len(alertas_day) > 0:
+                alertas_dia = len(alertas_day)
+                alertas_criticas = (alertas_day['Prioridad'] == 'Crítica').sum()
+        
+        score = 100
+        if violaciones_velocidad > 0:
+            score -= 20 * min(violaciones_velocidad / 10, 1)
+        if eventos_zona_restringida > 0:
+            score -= 30 * min(eventos_zona_restringida / 3, 1)
+        if alertas_criticas > 0:
+            score -= 15 * min(alertas_criticas / 2, 1)
+        if pct_tiempo_movimiento < 30:
+            score -= 10
+        if cambios_bruscos > 5:
+            score -= 10
+        if eventos_checkpoint > 0:
+            score += 5 * min(eventos_checkpoint / 2, 1)
+        score = max(0, min(100, score))
+        
+        daily_metrics.append({
+            'DispositivoID': dispositivo_id,
+            'Fecha': fecha,
+            'velocidad_promedio': velocidades.mean(),
+            'velocidad_maxima': velocidades.max(),
+            'velocidad_std': velocidades.std(),
+            'violaciones_velocidad': violaciones_velocidad,
+            'pct_violaciones_velocidad': pct_violaciones_velocidad,
+            'pct_tiempo_movimiento': pct_tiempo_movimiento,
+            'distancia_total_km': distancia_total,
+            'cambios_bruscos': cambios_bruscos,
+            'eventos_zona_restringida': eventos_zona_restringida,
+            'eventos_checkpoint': eventos_checkpoint,
+            'alertas_dia': alertas_dia,
+            'alertas_criticas': alertas_criticas,
+            'puntos_totales': len(velocidades),
+            'score': score,
+            'categoria': classifier.score_to_category(score),
+        })
+    
+    return pd.DataFrame(daily_metrics)
+
+
+# ============================================================================
+# UTILIDADES DE COMPARACIÓN
+# ============================================================================
+
+def assert_frames_match(expected, actual, name, rtol=1e-9, atol=1e-6):
+    """
+    Verifica que dos DataFrames tengan las mismas columnas y valores
+    
+    Raises:
+        AssertionError: Si alguna columna difiere fuera de tolerancia
+    """
+    assert list(expected.columns) == list(actual.columns), (
+        f"{name}: columnas distintas\n  esperado: {list(expected.columns)}\n  obtenido: {list(actual.columns)}"
+    )
+    assert len(expected) == len(actual), f"{name}: {len(expected)} filas esperadas, {len(actual)} obtenidas"
+    
+    for col in expected.columns:
+        esperado = expected[col].to_numpy()
+        obtenido = actual[col].to_numpy()
+        
+        if np.issubdtype(esperado.dtype, np.number) and np.issubdtype(obtenido.dtype, np.number):
+            ok = np.allclose(esperado.astype(float), obtenido.astype(float), rtol=rtol, atol=atol, equal_nan=True)
+        elif np.issubdtype(esperado.dtype, np.datetime64) and np.issubdtype(obtenido.dtype, np.datetime64):
+            # La resolución (ns/us) puede diferir según cómo se armó la columna
+            ok = np.array_equal(esperado.astype('datetime64[ns]'), obtenido.astype('datetime64[ns]'))
+        else:
+            ok = np.array_equal(esperado.astype(str), obtenido.astype(str))
+        
+        assert ok, f"{name}: la columna '{col}' no coincide"
+
+
+def timed(func, *args, **kwargs):
+    """Ejecuta una función y devuelve (resultado, segundos)"""
+    inicio = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - inicio
+
+
+def report(name, n_rows, t_legacy, t_vectorized):
+    """Imprime filas/segundo antes y después"""
+    print(f"\n📊 {name}")
+    print(f"   • Filas: {n_rows:,}")
+    print(f"   • Antes:   {t_legacy:8.3f} s  ({n_rows / t_legacy:>12,.0f} filas/s)")
+    print(f"   • Después: {t_vectorized:8.3f} s  ({n_rows / t_vectorized:>12,.0f} filas/s)")
+    print(f"   • Aceleración: {t_legacy / t_vectorized:,.1f}x")
+
+
+# Datos de --check: chicos para que corra en segundos, con semilla fija
+CHECK_DEVICES = 12
+CHECK_POINTS = 80
+CHECK_SEED = 7
+
+
+# ============================================================================
+# BENCHMARKS
+# ============================================================================
+
+def benchmark_anomaly_features(df, check=False):
+    """Paridad y rendimiento de AnomalyDetector.create_features"""
+    expected, t_legacy = timed(legacy_anomaly_features, df.copy())
+    actual, t_vectorized = timed(AnomalyDetector().create_features, df.copy())
+    
+    assert_frames_match(expected, actual, 'AnomalyDetector.create_features')
+    print("✅ Paridad verificada: AnomalyDetector.create_features")
+    
+    if not check:
+        report('AnomalyDetector.create_features', len(df), t_legacy, t_vectorized)
+
+
+def benchmark_route_segments(df, check=False):
+    """Paridad y rendimiento de ETAPredictor.create_route_segments"""
+    expected, t_legacy = timed(legacy_route_segments, df.copy())
+    actual, t_vectorized = timed(ETAPredictor().create_route_segments, df.copy())
+    
+    assert_frames_match(expected, actual, 'ETAPredictor.create_route_segments')
+    print("✅ Paridad verificada: ETAPredictor.create_route_segments")
+    
+    if not check:
+        report('ETAPredictor.create_route_segments', len(df), t_legacy, t_vectorized)
+
+
+def benchmark_daily_metrics(df, check=False):
+    """Paridad y rendimiento de BehaviorClassifier.create_daily_metrics"""
+    df_historial, df_alertas = generate_synthetic_eventos(df)
+    
+    expected, t_legacy = timed(legacy_daily_metrics, df.copy(), df_historial.copy(), df_alertas.copy())
+    actual, t_vectorized = timed(
+        BehaviorClassifier().create_daily_metrics, df.copy(), df_historial.copy(), df_alertas.copy()
+    )
+    
+    assert_frames_match(expected, actual, 'BehaviorClassifier.create_daily_metrics')
+    print("✅ Paridad verificada: BehaviorClassifier.create_daily_metrics")
+    
+    if not check:
+        report('BehaviorClassifier.create_daily_metrics', len(df), t_legacy, t_vectorized)
+
+
+def main():
+    """Función principal"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Benchmark de features vectorizadas')
+    parser.add_argument('--devices', type=int, default=50, help='Número de dispositivos (default: 50)')
+    parser.add_argument('--points', type=int, default=200, help='Puntos por dispositivo (default: 200)')
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help='Solo paridad, con datos chicos y semilla fijos; código de salida 1 si algo difiere'
+    )
+    args = parser.parse_args()
+    
+    if args.check:
+        print("=" * 70)
+        print("🔍 VERIFICACIÓN DE PARIDAD DE FEATURES")
+        print("=" * 70)
+        df = generate_synthetic_ubicaciones(CHECK_DEVICES, CHECK_POINTS, seed=CHECK_SEED)
+    else:
+        print("=" * 70)
+        print("🚀 BENCHMARK DE FEATURES VECTORIZADAS")
+        print("=" * 70)
+        df = generate_synthetic_ubicaciones(args.devices, args.points)
+    print(f"\n📍 Datos sintéticos: {len(df):,} ubicaciones, {df['DispositivoID'].nunique()} dispositivos")
+    
+    try:
+        benchmark_anomaly_features(df, check=args.check)
+        benchmark_route_segments(df, check=args.check)
+        benchmark_daily_metrics(df, check=args.check)
+    except AssertionError as e:
+        print(f"\n❌ PARIDAD ROTA: {e}")
+        sys.exit(1)
+    
+    print("\n" + "=" * 70)
+    print("✅ PARIDAD VERIFICADA" if args.check else "✅ BENCHMARK COMPLETADO")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Benchmark de artefactos de modelo: joblib contra el formato compacto (.mmap)
+
+Para cada modelo entrenado en models/trained/:
+- Carga en frío en un proceso nuevo (como un worker de la API que arranca):
+  tiempo de carga y memoria del proceso (RssAnon = privada, RssFile =
+  páginas del archivo mapeado, compartidas entre procesos).
+- Paridad: las predicciones del artefacto compacto deben ser idénticas a
+  las de sklearn (n_jobs=1) sobre filas sintéticas; si tiene el scaler
+  plegado en los umbrales recibe las features crudas.
+- Latencia de una fila y de un lote; con Numba instalado también la del
+  motor compilado (models/tree_engine.py), que recibe las features crudas.
+
+Si el .mmap no existe (o es más viejo que el .joblib) se exporta a una
+carpeta temporal; con --export se guarda junto al .joblib.
+
+Uso:
+    python scripts/benchmark_models.py
+    python scripts/benchmark_models.py --models-dir models/trained --rows 5000 --export
+"""
+
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import API_CONFIG
+from api.services.model_registry import MODEL_SPECS
+from models.compact import compact_path, load_compact, save_compact
+from models.tree_engine import NUMBA_AVAILABLE, TreeEngine
+
+
+def memory_kb():
+    """RssAnon y RssFile del proceso actual en kB (Linux, /proc/self/status)"""
+    memoria = {'RssAnon': None, 'RssFile': None}
+    try:
+        with open('/proc/self/status') as f:
+            for linea in f:
+                clave, _, valor = linea.partition(':')
+                if clave in memoria:
+                    memoria[clave] = int(valor.split()[0])
+    except OSError:
+        pass
+    return memoria
+
+
+def child_load(fmt, cls_name, path):
+    """
+    Carga un artefacto en este proceso y reporta tiempo y memoria (JSON a stdout)
+    
+    Se ejecuta en un proceso nuevo por medición, así que los imports ya
+    hechos por otras cargas no alteran el resultado.
+    """
+    antes = memory_kb()
+    
+    inicio = time.perf_counter()
+    if fmt == 'joblib':
+        cls = {c.__name__: c for c, _ in MODEL_SPECS.values()}[cls_name]
+        with contextlib.redirect_stdout(io.StringIO()):
+            wrapper = cls.load(path)
+    else:
+        wrapper = load_compact(path)
+    t_carga = time.perf_counter() - inicio
+    
+    # Primera predicción: incluye las páginas del .mmap que se tocan
+    X = np.zeros((1, len(wrapper.feature_columns)))
+    inicio = time.perf_counter()
+    wrapper.model.predict(X)
+    t_primera = time.perf_counter() - inicio
+    despues = memory_kb()
+    
+    print(json.dumps({
+        'load_ms': t_carga * 1000,
+        'first_predict_ms': t_primera * 1000,
+        'rss_anon_kb': despues['RssAnon'] - antes['RssAnon'] if antes['RssAnon'] is not None else None,
+        'rss_file_kb': despues['RssFile'] - antes['RssFile'] if antes['RssFile'] is not None else None,
+    }))
+
+
+def cold_load(fmt, cls_name, path, repeats=3):
+    """
+    Mediana de `repeats` cargas en frío, cada una en un proceso nuevo
+    
+    Returns:
+        dict con load_ms, first_predict_ms, rss_anon_kb, rss_file_kb
+    """
+    mediciones = []
+    for _ in range(repeats):
+        salida = subprocess.run(
+            [sys.executable, __file__, '--child', fmt, cls_name, str(path)],
+            capture_output=True, text=True, check=True
+        )
+        mediciones.append(json.loads(salida.stdout.strip().splitlines()[-1]))
+    
+    return {
+        clave: (float(np.median([m[clave] for m in mediciones])) if mediciones[0][clave] is not None else None)
+        for clave in mediciones[0]
+    }
+
+
+def synthetic_rows(n_features, n, seed=42):
+    """Filas en la escala del StandardScaler, alrededor de la distribución de entrenamiento"""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0, 1.5, size=(n, n_features))
+    # Algunas filas exactamente en cero (features faltantes -> media del scaler)
+    X[rng.random(n) < 0.05] = 0.0
+    return X
+
+
+def outputs(name, model, X):
+    """Salida comparable del modelo: score de anomalía o predicción"""
+    if name == 'anomaly':
+        return model.score_samples(X)
+    return model.predict(X)
+
+
+def latency(func, X, repeats):
+    """Mediana de segundos por llamada"""
+    tiempos = []
+    for _ in range(repeats):
+        inicio = time.perf_counter()
+        func(X)
+        tiempos.append(time.perf_counter() - inicio)
+    return float(np.median(tiempos))
+
+
+def benchmark_model(name, cls, joblib_path, mmap_path, rows, repeats):
+    """Carga en frío, paridad y latencia de un modelo"""
+    print(f"\n📊 {name} ({joblib_path.name})")
+    print(f"   • Tamaño: joblib {joblib_path.stat().st_size / 1e6:,.1f} MB | "
+          f"compacto {mmap_path.stat().st_size / 1e6:,.1f} MB")
+    
+    frio = {fmt: cold_load(fmt, cls.__name__, path) for fmt, path in (('joblib', joblib_path), ('compact', mmap_path))}
+    for fmt, m in frio.items():
+        memoria = (f"RssAnon +{m['rss_anon_kb'] / 1024:,.1f} MB, RssFile +{m['rss_file_kb'] / 1024:,.1f} MB"
+                   if m['rss_anon_kb'] is not None else "memoria no disponible")
+        print(f"   • Carga en frío {fmt:<7}: {m['load_ms']:8.1f} ms + primera predicción "
+              f"{m['first_predict_ms']:6.1f} ms | {memoria}")
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        wrapper = cls.load(joblib_path)
+    if hasattr(wrapper.model, 'n_jobs'):
+        wrapper.model.n_jobs = 1
+    compacto = load_compact(mmap_path)
+    
+    # Features crudas y su versión escalada (lo que recibe el modelo de sklearn)
+    mean, scale = wrapper.scaler.mean_, wrapper.scaler.scale_
+    crudas = synthetic_rows(len(wrapper.feature_columns), rows) * scale + mean
+    X = (crudas - mean) / scale
+    
+    # Con los umbrales plegados el artefacto compacto recibe las crudas
+    plegado = compacto.scaler is None
+    X_compacto = crudas if plegado else X
+    esperado = outputs(name, wrapper.model, X)
+    iguales = np.array_equal(esperado, outputs(name, compacto.model, X_compacto))
+    print(f"   • Paridad en {rows:,} filas{' (scaler plegado)' if plegado else ''}: "
+          f"{'✅ idéntica' if iguales else '❌ DIFERENTE'}")
+    
+    engine = None
+    if NUMBA_AVAILABLE:
+        # El motor siempre recibe features crudas
+        engine = TreeEngine.from_wrapper(compacto)
+        iguales_motor = np.array_equal(esperado, outputs(name, engine, crudas))
+        print(f"   • Paridad del motor compilado: {'✅ idéntica' if iguales_motor else '❌ DIFERENTE'}")
+        iguales = iguales and iguales_motor
+    
+    for etiqueta, n, reps in (('1 fila', 1, repeats * 10), (f'{rows:,} filas', rows, repeats)):
+        t_sk = latency(lambda d: outputs(name, wrapper.model, d), X[:n].copy(), reps)
+        t_cp = latency(lambda d: outputs(name, compacto.model, d), X_compacto[:n].copy(), reps)
+        linea = (f"   • Latencia {etiqueta:>12}: sklearn {t_sk * 1000:8.2f} ms | compacto {t_cp * 1000:8.2f} ms "
+                 f"({t_sk / t_cp:,.1f}x)")
+        if engine is not None:
+            t_motor = latency(lambda d: outputs(name, engine, d), crudas[:n].copy(), reps * 100 if n == 1 else reps)
+            linea += f" | motor {t_motor * 1000:8.3f} ms ({t_sk / t_motor:,.0f}x)"
+        print(linea)
+    
+    return iguales
+
+
+def main():
+    """Función principal"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Benchmark de artefactos joblib contra compactos (.mmap)')
+    parser.add_argument('--child', nargs=3, default=None, help=argparse.SUPPRESS)
+    parser.add_argument(
+        '--models-dir',
+        type=Path,
+        default=None,
+        help='Directorio de artefactos .joblib (default: API_CONFIG["models_dir"])'
+    )
+    parser.add_argument('--rows', type=int, default=5000, help='Filas del lote de paridad/latencia (default: 5000)')
+    parser.add_argument('--repeats', type=int, default=5, help='Repeticiones por medición de latencia (default: 5)')
+    parser.add_argument('--export', action='store_true', help='Guardar los .mmap exportados junto a los .joblib')
+    args = parser.parse_args()
+    
+    if args.child:
+        child_load(*args.child)
+        return
+    
+    models_dir = Path(args.models_dir or API_CONFIG['models_dir'])
+    
+    print("=" * 70)
+    print("🚀 BENCHMARK DE ARTEFACTOS DE MODELO")
+    print("=" * 70)
+    print(f"📁 Modelos: {models_dir}")
+    
+    resultados = {}
+    with tempfile.TemporaryDirectory(prefix='regps-mmap-') as tmp:
+        for name, (cls, filename) in MODEL_SPECS.items():
+            joblib_path = models_dir / filename
+            if not joblib_path.exists():
+                print(f"\n⚠️ {name}: no existe {joblib_path}")
+                continue
+            
+            mmap_path = compact_path(joblib_path)
+            if not mmap_path.exists() or mmap_path.stat().st_mtime < joblib_path.stat().st_mtime:
+                destino = mmap_path if args.export else compact_path(Path(tmp) / filename)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    save_compact(cls.load(joblib_path), destino)
+                print(f"\n💾 {name}: artefacto compacto exportado a {destino}")
+                mmap_path = destino
+            
+            resultados[name] = benchmark_model(name, cls, joblib_path, mmap_path, args.rows, args.repeats)
+    
+    print("\n" + "=" * 70)
+    if resultados and all(resultados.values()):
+        print("✅ BENCHMARK COMPLETADO")
+    else:
+        print("❌ BENCHMARK CON DIFERENCIAS O SIN MODELOS")
+    print("=" * 70)
+    
+    return resultados
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Consumidor en línea de eventos UbicacionActualizada
+Evalúa anomalía y comportamiento de cada ping casi en tiempo real y publica
+los resultados en lotes. Las métricas (throughput y lag) se sirven en
+GET /metrics del puerto --metrics-port y se imprimen periódicamente.
+
+Ejemplos:
+    python scripts/consume_events.py                          # Redis pub/sub del broadcaster
+    python scripts/consume_events.py --source jsonl --input eventos.jsonl --output -
+"""
+
+import json
+import signal
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import CONSUMER_CONFIG
+from api.services.model_registry import ModelRegistry
+from api.services.prediction_service import PredictionService
+from api.services.stream_consumer import StreamConsumer
+from api.services.event_stream import (
+    RedisSource, JsonlSource, RedisSink, JsonlSink, json_default
+)
+
+
+def start_metrics_server(consumer, port):
+    """
+    Servir GET /metrics (JSON de StreamConsumer.stats) en un hilo aparte
+    
+    Args:
+        consumer: StreamConsumer a reportar
+        port: Puerto HTTP
+    
+    Returns:
+        ThreadingHTTPServer en ejecución
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') not in ('', '/metrics'):
+                self.send_error(404)
+                return
+            cuerpo = json.dumps(consumer.stats(), default=json_default).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='regps-consumer-metrics', daemon=True).start()
+    print(f"📈 Métricas en http://0.0.0.0:{port}/metrics")
+    return server
+
+
+def print_report(stats):
+    """Línea de reporte periódico"""
+    print(
+        f"📊 {stats['eventos']:,} eventos | {stats['eventos_por_segundo_recientes']:,.1f} ev/s | "
+        f"lag p95 {stats['lag']['p95_ms']:,.0f} ms | lote {stats['lote_promedio']:.1f} | "
+        f"anomalías {stats['anomalias']:,} | dispositivos {stats['device_state']['dispositivos']:,}"
+    )
+
+
+def main(args):
+    """Función principal"""
+    print("=" * 70)
+    print("🚀 CONSUMIDOR EN LÍNEA DE UBICACIONES")
+    print("=" * 70)
+    
+    registry = ModelRegistry(args.models_dir)
+    registry.load_all()
+    service = PredictionService(registry)
+    
+    if args.source == 'jsonl':
+        source = JsonlSource(args.input)
+        print(f"📥 Fuente: {args.input}")
+    else:
+        mode = 'list' if args.source == 'redis-list' else 'pubsub'
+        source = RedisSource(args.channel, mode=mode)
+        print(f"📥 Fuente: Redis {mode} '{source.channel}'")
+    
+    if args.output:
+        sink = JsonlSink(args.output)
+        print(f"📤 Resultados: {args.output}")
+    else:
+        sink = RedisSink()
+        print(f"📤 Resultados: Redis canal '{sink.channel}'")
+    
+    consumer = StreamConsumer(
+        source, sink, service,
+        batch_max_items=args.batch_max_items, batch_max_wait_ms=args.batch_max_wait_ms
+    )
+    
+    server = start_metrics_server(consumer, args.metrics_port) if args.metrics_port else None
+    
+    # SIGTERM/Ctrl+C: terminar después del lote en curso
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: consumer.stop())
+    
+    try:
+        consumer.run(max_eventos=args.max_events, on_report=print_report)
+    finally:
+        source.close()
+        sink.close()
+        if server is not None:
+            server.shutdown()
+    
+    stats = consumer.stats()
+    print("\n" + "=" * 70)
+    print("✅ CONSUMIDOR DETENIDO")
+    print("=" * 70)
+    print(f"   • Eventos: {stats['eventos']:,} ({stats['eventos_por_segundo']:,.1f} ev/s)")
+    print(f"   • Evaluados: {stats['evaluados']:,} | inválidos: {stats['invalidos']:,} | "
+          f"fuera de orden: {stats['fuera_de_orden']:,}")
+    print(f"   • Anomalías: {stats['anomalias']:,} | comportamientos: {stats['comportamientos']:,}")
+    print(f"   • Lag p50/p95: {stats['lag']['p50_ms']:,.0f} / {stats['lag']['p95_ms']:,.0f} ms")
+    
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Consumidor en línea de eventos UbicacionActualizada')
+    parser.add_argument(
+        '--source',
+        choices=['redis', 'redis-list', 'jsonl'],
+        default=CONSUMER_CONFIG['source'],
+        help="Fuente de eventos (default: CONSUMER_CONFIG['source'])"
+    )
+    parser.add_argument(
+        '--channel',
+        default=None,
+        help="Canal pub/sub o lista de Redis (default: CONSUMER_CONFIG['channel'])"
+    )
+    parser.add_argument(
+        '--input',
+        default='-',
+        help="Archivo JSONL de eventos para --source jsonl ('-' = stdin)"
+    )
+    parser.add_argument(
+        '--output',
+        default=None,
+        help="Escribir resultados como JSONL ('-' = stdout) en vez de publicarlos en Redis"
+    )
+    parser.add_argument(
+        '--models-dir',
+        default=None,
+        help='Directorio de artefactos .joblib (default: API_CONFIG["models_dir"])'
+    )
+    parser.add_argument('--batch-max-items', type=int, default=None, help='Pings por lote evaluado')
+    parser.add_argument('--batch-max-wait-ms', type=float, default=None, help='Espera máx. para llenar un lote')
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=CONSUMER_CONFIG['metrics_port'],
+        help='Puerto de GET /metrics (0 = sin servidor de métricas)'
+    )
+    parser.add_argument('--max-events', type=int, default=None, help='Terminar después de N eventos')
+    
+    main(parser.parse_args())
@@ -24,38 +24,47 @@ from config import MODELS_DIR, RAW_DATA_DIR
 
 def load_model(model_name):
     """
-    Carga un modelo entrenado
+    Busca un modelo entrenado y carga su metadata
+    
+    La evaluación solo usa la metadata: el modelo no se deserializa.
     
     Args:
         model_name: Nombre del modelo (sin extensión)
     
     Returns:
-        Modelo, metadata, o None si no existe
+        Tupla (ruta del modelo, metadata), o (None, None) si no existe
     """
-    model_path = MODELS_DIR / f"{model_name}.joblib"
+    model_path = MODELS_DIR / "trained" / f"{model_name}.joblib"
     metadata_path = MODELS_DIR / "metadata" / f"{model_name}_metadata.joblib"
     
     if not model_path.exists():
         return None, None
     
-    model_data = joblib.load(model_path)
     metadata = None
     
     if metadata_path.exists():
         metadata = joblib.load(metadata_path)
     
-    return model_data, metadata
+    return model_path, metadata
 
 
-def evaluate_eta_predictor():
-    """Evalúa el modelo de predicción de ETA"""
+def evaluate_eta_predictor(metadata=None):
+    """
+    Evalúa el modelo de predicción de ETA
+    
+    Args:
+        metadata: Metadata ya en memoria (p. ej. la que devuelve el
+                  entrenamiento en scripts/train_pipeline.py); si no se
+                  pasa, se carga de models/metadata
+    """
     print("\n" + "=" * 70)
     print("📊 EVALUANDO: ETA PREDICTOR")
     print("=" * 70)
     
-    model_data, metadata = load_model("eta_predictor")
+    if metadata is None:
+        model_path, metadata = load_model("eta_predictor")
     
-    if model_data is None:
+    if metadata is None:
         print("❌ Modelo no encontrado. Ejecutar train_eta_model.py primero.")
         return None
     
@@ -90,15 +99,23 @@ def evaluate_eta_predictor():
     return metadata
 
 
-def evaluate_anomaly_detector():
-    """Evalúa el modelo de detección de anomalías"""
+def evaluate_anomaly_detector(metadata=None):
+    """
+    Evalúa el modelo de detección de anomalías
+    
+    Args:
+        metadata: Metadata ya en memoria (p. ej. la que devuelve el
+                  entrenamiento en scripts/train_pipeline.py); si no se
+                  pasa, se carga de models/metadata
+    """
     print("\n" + "=" * 70)
     print("🚨 EVALUANDO: ANOMALY DETECTOR")
     print("=" * 70)
     
-    model_data, metadata = load_model("anomaly_detector")
+    if metadata is None:
+        model_path, metadata = load_model("anomaly_detector")
     
-    if model_data is None:
+    if metadata is None:
         print("❌ Modelo no encontrado. Ejecutar train_anomaly_model.py primero.")
         return None
     
@@ -130,15 +147,23 @@ def evaluate_anomaly_detector():
     return metadata
 
 
-def evaluate_behavior_classifier():
-    """Evalúa el modelo de clasificación de comportamiento"""
+def evaluate_behavior_classifier(metadata=None):
+    """
+    Evalúa el modelo de clasificación de comportamiento
+    
+    Args:
+        metadata: Metadata ya en memoria (p. ej. la que devuelve el
+                  entrenamiento en scripts/train_pipeline.py); si no se
+                  pasa, se carga de models/metadata
+    """
     print("\n" + "=" * 70)
     print("👤 EVALUANDO: BEHAVIOR CLASSIFIER")
     print("=" * 70)
     
-    model_data, metadata = load_model("behavior_classifier")
+    if metadata is None:
+        model_path, metadata = load_model("behavior_classifier")
     
-    if model_data is None:
+    if metadata is None:
         print("❌ Modelo no encontrado. Ejecutar train_behavior_classifier.py primero.")
         return None
     
@@ -1,13 +1,19 @@
 """
 Script para extraer datos de la base de datos MySQL de Laravel
-y exportarlos a archivos CSV para entrenamiento de modelos.
+y guardarlos en el almacenamiento Parquet (data/raw/<tabla>/) para
+entrenamiento de modelos.
 
 Uso:
-    python scripts/extract_data.py
+    python scripts/extract_data.py                      # incremental (solo filas nuevas)
+    python scripts/extract_data.py --full --days 90     # extracción completa
+    python scripts/extract_data.py --backfill 2025-01-01 2025-01-31
+    python scripts/extract_data.py --full --workers 8   # en paralelo por shards
 """
 
 import sys
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime, timedelta
 import pandas as pd
@@ -15,26 +21,15 @@ import pandas as pd
 # Agregar el directorio raíz al path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from utils.db_connector import DatabaseConnector
-from config import DB_CONFIG, DATA_DIR
+from utils.db_connector import DatabaseConnector, ConnectionPool
+from utils.dataset_store import (
+    write_dataset, write_partition, read_dataset, read_watermark, write_watermark, compact_dataset,
+    delete_partitions, device_bucket
+)
+from config import DB_CONFIG, RAW_DATA_DIR, EXTRACTION_CONFIG
 
-def extract_ubicaciones(connector, days_back=90, output_path=None):
-    """
-    Extrae ubicaciones de los últimos N días
-    
-    Args:
-        connector: Instancia de DatabaseConnector
-        days_back: Número de días hacia atrás para extraer
-        output_path: Ruta del archivo CSV de salida
-    
-    Returns:
-        DataFrame con las ubicaciones
-    """
-    print(f"\n📍 Extrayendo ubicaciones de los últimos {days_back} días...")
-    
-    fecha_limite = (datetime.now() - timedelta(days=days_back)).strftime('%Y-%m-%d')
-    
-    query = f"""
+# Consulta base de ubicaciones; cada modo de extracción agrega su WHERE
+UBICACIONES_QUERY = """
     SELECT 
         u.UbicacionID,
         u.DispositivoID,
@@ -49,32 +44,435 @@ def extract_ubicaciones(connector, days_back=90, output_path=None):
     FROM ubicaciones u
     LEFT JOIN dispositivos d ON u.DispositivoID = d.DispositivoID
     LEFT JOIN empleados e ON d.EmpleadoID = e.EmpleadoID
-    WHERE u.FechaHora >= '{fecha_limite}'
-    ORDER BY u.FechaHora ASC
+"""
+
+
+# Orden de la paginación por clave: el del índice idx_dispositivo_fecha
+# (InnoDB agrega UbicacionID, la clave primaria, al final del índice)
+UBICACIONES_KEYS = {
+    'u.DispositivoID': 'DispositivoID',
+    'u.FechaHora': 'FechaHora',
+    'u.UbicacionID': 'UbicacionID',
+}
+
+
+def update_ubicaciones_watermark(ultimo_id, ultima_fecha):
     """
+    Avanza la marca de agua de ubicaciones (nunca la retrocede)
     
-    df = connector.execute_query(query)
+    Args:
+        ultimo_id: Mayor UbicacionID guardado
+        ultima_fecha: Mayor FechaHora guardada
+    """
+    if ultimo_id is None:
+        return
     
-    if df is not None and len(df) > 0:
-        print(f"✅ Extraídas {len(df):,} ubicaciones")
-        print(f"📅 Rango: {df['FechaHora'].min()} a {df['FechaHora'].max()}")
+    watermark = read_watermark('ubicaciones') or {}
+    ultima_fecha = pd.Timestamp(ultima_fecha)
+    
+    if ultimo_id > watermark.get('UbicacionID', -1):
+        watermark['UbicacionID'] = int(ultimo_id)
+    if 'FechaHora' not in watermark or ultima_fecha > pd.Timestamp(watermark['FechaHora']):
+        watermark['FechaHora'] = ultima_fecha.isoformat()
+    watermark['actualizado'] = datetime.now().isoformat(timespec='seconds')
+    
+    write_watermark('ubicaciones', watermark)
+
+
+def stored_ubicacion_ids(desde, desde_id):
+    """
+    UbicacionID ya guardados que la consulta incremental puede volver a traer
+    
+    Args:
+        desde: FechaHora mínima de la consulta
+        desde_id: UbicacionID de la consulta (se traen los mayores)
+    
+    Returns:
+        Array de UbicacionID
+    """
+    df = read_dataset('ubicaciones', columns=['UbicacionID'], start=desde)
+    if df is None:
+        return []
+    return df.loc[df['UbicacionID'] > desde_id, 'UbicacionID'].to_numpy()
+
+
+def save_ubicaciones_batches(batches, update_watermark=False):
+    """
+    Agrega bloques de ubicaciones al almacenamiento a medida que llegan
+    
+    Args:
+        batches: Iterable de DataFrames (p. ej. DatabaseConnector.iter_keyset)
+        update_watermark: Avanzar la marca de agua con cada bloque (solo
+                          si los bloques llegan en orden de UbicacionID)
+    
+    Returns:
+        dict: filas, fecha_min, fecha_max y ultimo_id de lo guardado
+    """
+    resumen = {'filas': 0, 'fecha_min': None, 'fecha_max': None, 'ultimo_id': None}
+    
+    for df in batches:
+        if len(df) == 0:
+            continue
+        
+        write_dataset(df, 'ubicaciones', mode='append')
+        
+        fecha_min, fecha_max = df['FechaHora'].min(), df['FechaHora'].max()
+        ultimo_id = int(df['UbicacionID'].max())
+        if resumen['filas'] == 0:
+            resumen.update(fecha_min=fecha_min, fecha_max=fecha_max, ultimo_id=ultimo_id)
+        else:
+            resumen['fecha_min'] = min(resumen['fecha_min'], fecha_min)
+            resumen['fecha_max'] = max(resumen['fecha_max'], fecha_max)
+            resumen['ultimo_id'] = max(resumen['ultimo_id'], ultimo_id)
+        resumen['filas'] += len(df)
+        
+        if update_watermark:
+            update_ubicaciones_watermark(resumen['ultimo_id'], resumen['fecha_max'])
         
-        if output_path:
-            df.to_csv(output_path, index=False, encoding='utf-8')
-            print(f"💾 Guardado en: {output_path}")
+        print(f"  • {resumen['filas']:,} filas guardadas")
+    
+    return resumen
+
+
+def extract_ubicaciones(connector, days_back=90):
+    """
+    Extrae ubicaciones de los últimos N días (extracción completa)
+    
+    Se lee por páginas con paginación por clave y cada página se guarda
+    en cuanto llega, así que la memoria no depende del tamaño de la ventana.
+    Las particiones de la ventana se borran antes de empezar.
+    
+    Args:
+        connector: Instancia de DatabaseConnector
+        days_back: Número de días hacia atrás para extraer
+    
+    Returns:
+        int: Número de ubicaciones extraídas
+    """
+    print(f"\n📍 Extrayendo ubicaciones de los últimos {days_back} días...")
+    
+    desde = pd.Timestamp(datetime.now() - timedelta(days=days_back)).normalize()
+    delete_partitions('ubicaciones', start=desde)
+    
+    batches = connector.iter_keyset(
+        UBICACIONES_QUERY, UBICACIONES_KEYS,
+        where='u.FechaHora >= %(desde)s', params={'desde': desde.to_pydatetime()},
+        dataset='ubicaciones'
+    )
+    resumen = save_ubicaciones_batches(batches)
+    
+    # El orden es por dispositivo: la marca de agua solo se fija al terminar
+    update_ubicaciones_watermark(resumen['ultimo_id'], resumen['fecha_max'])
+    
+    if resumen['filas'] > 0:
+        print(f"✅ Extraídas {resumen['filas']:,} ubicaciones")
+        print(f"📅 Rango: {resumen['fecha_min']} a {resumen['fecha_max']}")
     else:
         print("⚠️ No se encontraron ubicaciones")
     
-    return df
+    return resumen['filas']
+
+
+def extract_ubicaciones_incremental(connector, days_back=90):
+    """
+    Extrae solo las ubicaciones nuevas desde la última ejecución
+    
+    La marca de agua guarda el último UbicacionID y FechaHora extraídos.
+    La consulta filtra por dispositivo y FechaHora (rango sobre el índice
+    idx_dispositivo_fecha) desde la marca menos una tolerancia para
+    registros que llegan tarde, y por UbicacionID desde la marca menos
+    late_id_margin: un ID menor que confirma después de uno mayor (otra
+    transacción) no queda atrás. Lo que ya estaba guardado se descarta por
+    UbicacionID.
+    Las filas se leen en orden de UbicacionID con un cursor del servidor y
+    la marca avanza con cada bloque guardado: si la extracción se corta,
+    la siguiente continúa desde el último bloque sin duplicar filas.
+    Sin marca de agua (primera ejecución) hace la extracción completa.
+    
+    Las filas nuevas con FechaHora anterior a la tolerancia no se extraen
+    (y la marca las deja atrás): se cuentan, se avisa con su rango de días
+    y se recuperan con --backfill INICIO FIN.
+    
+    Args:
+        connector: Instancia de DatabaseConnector
+        days_back: Días a extraer si no hay marca de agua
+    
+    Returns:
+        int: Número de ubicaciones nuevas
+    """
+    watermark = read_watermark('ubicaciones')
+    if watermark is None:
+        print("\n📍 Sin marca de agua: se hace la extracción completa inicial")
+        return extract_ubicaciones(connector, days_back)
+    
+    tolerancia = timedelta(hours=EXTRACTION_CONFIG['late_tolerance_hours'])
+    desde = pd.Timestamp(watermark['FechaHora']) - tolerancia
+    print(f"\n📍 Extrayendo ubicaciones nuevas (UbicacionID > {watermark['UbicacionID']:,} "
+          f"menos {EXTRACTION_CONFIG['late_id_margin']:,} de margen, FechaHora >= {desde})...")
+    
+    dispositivos = connector.execute_query("SELECT DispositivoID FROM dispositivos")
+    if dispositivos is None or len(dispositivos) == 0:
+        print("⚠️ No hay dispositivos registrados")
+        return 0
+    
+    params = {
+        'dispositivos': tuple(int(d) for d in dispositivos['DispositivoID']),
+        'desde': desde.to_pydatetime(),
+        'ultimo_id': int(watermark['UbicacionID']),
+        'desde_id': max(int(watermark['UbicacionID']) - EXTRACTION_CONFIG['late_id_margin'], 0),
+    }
+    
+    # Antes del cursor del servidor: mientras se lee no admite otras consultas
+    atrasadas = connector.execute_query("""
+    SELECT COUNT(*) AS filas, MIN(FechaHora) AS fecha_min, MAX(FechaHora) AS fecha_max
+    FROM ubicaciones
+    WHERE DispositivoID IN %(dispositivos)s
+      AND FechaHora < %(desde)s
+      AND UbicacionID > %(ultimo_id)s
+    """, params=params)
+    if atrasadas is not None and len(atrasadas) > 0 and int(atrasadas['filas'].iloc[0]) > 0:
+        fila = atrasadas.iloc[0]
+        print(f"⚠️ {int(fila['filas']):,} ubicaciones nuevas llegaron con más de "
+              f"{EXTRACTION_CONFIG['late_tolerance_hours']}h de atraso y no se extraen")
+        print(f"   Recuperarlas con: python scripts/extract_data.py --backfill "
+              f"{pd.Timestamp(fila['fecha_min']).date()} {pd.Timestamp(fila['fecha_max']).date()}")
+    
+    query = UBICACIONES_QUERY + """
+    WHERE u.DispositivoID IN %(dispositivos)s
+      AND u.FechaHora >= %(desde)s
+      AND u.UbicacionID > %(desde_id)s
+    ORDER BY u.UbicacionID ASC
+    """
+    
+    ya_guardadas = stored_ubicacion_ids(desde, params['desde_id'])
+    batches = connector.iter_query(query, params=params, dataset='ubicaciones')
+    batches = (df[~df['UbicacionID'].isin(ya_guardadas)] for df in batches)
+    resumen = save_ubicaciones_batches(batches, update_watermark=True)
+    
+    if resumen['filas'] > 0:
+        print(f"✅ Extraídas {resumen['filas']:,} ubicaciones nuevas")
+        print(f"📅 Rango: {resumen['fecha_min']} a {resumen['fecha_max']}")
+    else:
+        print("✅ No hay ubicaciones nuevas")
+    
+    return resumen['filas']
+
+
+def extract_ubicaciones_range(connector, start, end):
+    """
+    Backfill: extrae de nuevo las ubicaciones de un rango de días
+    
+    El rango se amplía a días completos y las particiones de esos días se
+    reemplazan. La marca de agua no se modifica, así que se puede usar para
+    reparar días pasados sin afectar la carga incremental.
+    
+    Args:
+        connector: Instancia de DatabaseConnector
+        start: Fecha inicial (incluida)
+        end: Fecha final (incluida)
+    
+    Returns:
+        int: Número de ubicaciones extraídas
+    """
+    desde = pd.Timestamp(start).normalize()
+    hasta = pd.Timestamp(end).normalize() + timedelta(days=1)
+    print(f"\n📍 Backfill de ubicaciones: {desde.date()} a {(hasta - timedelta(days=1)).date()}...")
+    
+    delete_partitions('ubicaciones', start=desde, end=hasta - timedelta(days=1))
+    
+    batches = connector.iter_keyset(
+        UBICACIONES_QUERY, UBICACIONES_KEYS,
+        where='u.FechaHora >= %(desde)s AND u.FechaHora < %(hasta)s',
+        params={'desde': desde.to_pydatetime(), 'hasta': hasta.to_pydatetime()},
+        dataset='ubicaciones'
+    )
+    resumen = save_ubicaciones_batches(batches)
+    
+    if resumen['filas'] > 0:
+        print(f"✅ Extraídas {resumen['filas']:,} ubicaciones")
+    else:
+        print("⚠️ No se encontraron ubicaciones en el rango")
+    
+    return resumen['filas']
 
 
-def extract_dispositivos(connector, output_path=None):
+def extract_shard(pool, fecha, bucket, dispositivos):
+    """
+    Extrae un shard (un día × un bucket de dispositivos) y lo escribe
+    directamente como archivo de su partición
+    
+    Reintenta con espera exponencial si falla la consulta o la conexión;
+    cada intento usa una conexión nueva del pool.
+    
+    Args:
+        pool: ConnectionPool compartido
+        fecha: Día del shard (Timestamp normalizado)
+        bucket: Bucket de dispositivo
+        dispositivos: DispositivoID del bucket
+    
+    Returns:
+        dict con filas, tiempos (db, escritura), intentos y rango de IDs
+    """
+    query = UBICACIONES_QUERY + """
+    WHERE u.DispositivoID IN %(dispositivos)s
+      AND u.FechaHora >= %(desde)s
+      AND u.FechaHora < %(hasta)s
+    """
+    params = {
+        'dispositivos': tuple(dispositivos),
+        'desde': fecha.to_pydatetime(),
+        'hasta': (fecha + timedelta(days=1)).to_pydatetime(),
+    }
+    
+    for intento in range(EXTRACTION_CONFIG['max_retries'] + 1):
+        try:
+            inicio = time.perf_counter()
+            with pool.connection() as connector:
+                df = connector.execute_query(query, params=params)
+            t_db = time.perf_counter() - inicio
+            
+            inicio = time.perf_counter()
+            write_partition(df, 'ubicaciones', fecha, bucket)
+            t_escritura = time.perf_counter() - inicio
+            
+            return {
+                'fecha': fecha.date(),
+                'bucket': bucket,
+                'filas': len(df),
+                't_db': t_db,
+                't_escritura': t_escritura,
+                'intentos': intento + 1,
+                'ultimo_id': int(df['UbicacionID'].max()) if len(df) else None,
+                'fecha_max': df['FechaHora'].max() if len(df) else None,
+            }
+        
+        except Exception as e:
+            if intento == EXTRACTION_CONFIG['max_retries']:
+                raise
+            espera = EXTRACTION_CONFIG['retry_backoff'] * 2 ** intento
+            print(f"  ⚠️ Shard {fecha.date()}/{bucket} falló ({e}); reintento en {espera:.0f}s")
+            time.sleep(espera)
+
+
+def print_extraction_report(resultados, fallidos, segundos, workers):
+    """
+    Resumen de throughput de la extracción en paralelo
+    
+    - filas/s total: crece con los workers mientras la BD no esté saturada
+    - eficiencia: tiempo sumado de los shards / (workers × tiempo total);
+      cerca de 100% = los workers siempre ocupados
+    - latencia BD por 1.000 filas: si sube al agregar workers, la BD (y no
+      el cliente) es el cuello de botella
+    """
+    filas = sum(r['filas'] for r in resultados)
+    t_db = sum(r['t_db'] for r in resultados)
+    t_escritura = sum(r['t_escritura'] for r in resultados)
+    reintentos = sum(r['intentos'] - 1 for r in resultados)
+    
+    print("\n" + "-" * 60)
+    print("📈 REPORTE DE EXTRACCIÓN EN PARALELO")
+    print("-" * 60)
+    print(f"  • Workers: {workers}")
+    print(f"  • Shards: {len(resultados):,} completados, {len(fallidos):,} fallidos, {reintentos:,} reintentos")
+    print(f"  • Filas: {filas:,} en {segundos:.1f}s ({filas / max(segundos, 1e-9):,.0f} filas/s)")
+    print(f"  • Tiempo en BD: {t_db:.1f}s | escritura: {t_escritura:.1f}s (sumados entre workers)")
+    print(f"  • Eficiencia del paralelismo: {(t_db + t_escritura) / max(workers * segundos, 1e-9) * 100:.0f}%")
+    if filas:
+        print(f"  • Latencia BD por 1.000 filas: {t_db / filas * 1000:.3f}s")
+    for fecha, bucket, error in fallidos[:10]:
+        print(f"  ❌ Shard {fecha}/{bucket}: {error}")
+
+
+def extract_ubicaciones_parallel(start, end, workers=None):
+    """
+    Extrae ubicaciones de un rango de días en paralelo, por shards
+    (día × bucket de dispositivos)
+    
+    Cada shard es una consulta independiente sobre idx_dispositivo_fecha
+    (DispositivoID IN bucket, FechaHora en el día) que se escribe como el
+    archivo de su partición, así que los shards no comparten estado y un
+    shard fallido se puede reintentar o repetir sin tocar el resto.
+    
+    Args:
+        start: Fecha inicial (incluida)
+        end: Fecha final (incluida)
+        workers: Shards en paralelo = conexiones del pool
+                 (default: EXTRACTION_CONFIG['workers'])
+    
+    Returns:
+        int: Número de ubicaciones extraídas (None si algún shard falló)
+    """
+    workers = workers or EXTRACTION_CONFIG['workers']
+    desde = pd.Timestamp(start).normalize()
+    hasta = pd.Timestamp(end).normalize()
+    dias = pd.date_range(desde, hasta, freq='D')
+    
+    print(f"\n📍 Extrayendo ubicaciones en paralelo: {desde.date()} a {hasta.date()} ({workers} workers)...")
+    
+    with ConnectionPool(size=workers) as pool:
+        with pool.connection() as connector:
+            df_dispositivos = connector.execute_query("SELECT DispositivoID FROM dispositivos")
+        
+        if df_dispositivos is None or len(df_dispositivos) == 0:
+            print("⚠️ No hay dispositivos registrados")
+            return 0
+        
+        ids = df_dispositivos['DispositivoID'].astype(int).to_numpy()
+        buckets = device_bucket(ids)
+        por_bucket = {int(b): ids[buckets == b].tolist() for b in sorted(set(buckets.tolist()))}
+        shards = [(dia, b, por_bucket[b]) for dia in dias for b in por_bucket]
+        print(f"  • {len(shards):,} shards ({len(dias)} días × {len(por_bucket)} buckets)")
+        
+        resultados, fallidos = [], []
+        inicio = time.perf_counter()
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(extract_shard, pool, dia, b, dispositivos): (dia.date(), b)
+                for dia, b, dispositivos in shards
+            }
+            for future in as_completed(futures):
+                try:
+                    resultados.append(future.result())
+                except Exception as e:
+                    fallidos.append((*futures[future], e))
+                
+                hechos = len(resultados) + len(fallidos)
+                if hechos % max(1, len(shards) // 20) == 0 or hechos == len(shards):
+                    filas = sum(r['filas'] for r in resultados)
+                    segundos = time.perf_counter() - inicio
+                    print(f"  • {hechos:,}/{len(shards):,} shards | {filas:,} filas | "
+                          f"{filas / max(segundos, 1e-9):,.0f} filas/s")
+        
+        segundos = time.perf_counter() - inicio
+    
+    print_extraction_report(resultados, fallidos, segundos, workers)
+    
+    if fallidos:
+        print("❌ Hubo shards fallidos: vuelve a ejecutar el rango (los completados se reescriben igual)")
+        return None
+    
+    # Solo con todos los shards completos la marca de agua es válida
+    con_datos = [r for r in resultados if r['filas']]
+    if con_datos:
+        update_ubicaciones_watermark(
+            max(r['ultimo_id'] for r in con_datos),
+            max(r['fecha_max'] for r in con_datos)
+        )
+    
+    total = sum(r['filas'] for r in resultados)
+    print(f"✅ Extraídas {total:,} ubicaciones")
+    
+    return total
+
+
+def extract_dispositivos(connector, save=False):
     """
     Extrae información de dispositivos
     
     Args:
         connector: Instancia de DatabaseConnector
-        output_path: Ruta del archivo CSV de salida
+        save: Guardar en el almacenamiento Parquet
     
     Returns:
         DataFrame con los dispositivos
@@ -100,22 +498,22 @@ def extract_dispositivos(connector, output_path=None):
     if df is not None and len(df) > 0:
         print(f"✅ Extraídos {len(df):,} dispositivos")
         
-        if output_path:
-            df.to_csv(output_path, index=False, encoding='utf-8')
-            print(f"💾 Guardado en: {output_path}")
+        if save:
+            path = write_dataset(df, 'dispositivos', mode='overwrite')
+            print(f"💾 Guardado en: {path}")
     else:
         print("⚠️ No se encontraron dispositivos")
     
     return df
 
 
-def extract_zonas(connector, output_path=None):
+def extract_zonas(connector, save=False):
     """
     Extrae información de zonas/geocercas
     
     Args:
         connector: Instancia de DatabaseConnector
-        output_path: Ruta del archivo CSV de salida
+        save: Guardar en el almacenamiento Parquet
     
     Returns:
         DataFrame con las zonas
@@ -126,10 +524,15 @@ def extract_zonas(connector, output_path=None):
     SELECT 
         ZonaID,
         Nombre,
+        TipoZona,
+        TipoGeometria,
         Latitud,
         Longitud,
         Radio,
-        TipoAlerta
+        Coordenadas,
+        HorarioInicio,
+        HorarioFin,
+        Estado
     FROM zonas
     """
     
@@ -138,30 +541,123 @@ def extract_zonas(connector, output_path=None):
     if df is not None and len(df) > 0:
         print(f"✅ Extraídas {len(df):,} zonas")
         
-        if output_path:
-            df.to_csv(output_path, index=False, encoding='utf-8')
-            print(f"💾 Guardado en: {output_path}")
+        if save:
+            path = write_dataset(df, 'zonas', mode='overwrite')
+            print(f"💾 Guardado en: {path}")
     else:
         print("⚠️ No se encontraron zonas")
     
     return df
 
 
-def extract_all_data(days_back=90):
+def extract_historial_zonas(connector, days_back=90, save=False):
+    """
+    Extrae eventos de entrada/salida de zonas de los últimos N días
+    
+    Args:
+        connector: Instancia de DatabaseConnector
+        days_back: Número de días hacia atrás para extraer
+        save: Guardar en el almacenamiento Parquet
+    
+    Returns:
+        DataFrame con el historial de zonas (incluye TipoZona)
+    """
+    print(f"\n🚧 Extrayendo historial de zonas de los últimos {days_back} días...")
+    
+    fecha_limite = (datetime.now() - timedelta(days=days_back)).strftime('%Y-%m-%d')
+    
+    query = f"""
+    SELECT 
+        h.HistorialID,
+        h.ZonaID,
+        h.EmpleadoID,
+        h.DispositivoID,
+        h.TipoEvento,
+        h.FechaHoraEvento,
+        h.Latitud,
+        h.Longitud,
+        h.TiempoPermanencia,
+        h.AlertaGenerada,
+        z.TipoZona
+    FROM historial_zonas h
+    LEFT JOIN zonas z ON h.ZonaID = z.ZonaID
+    WHERE h.FechaHoraEvento >= '{fecha_limite}'
+    ORDER BY h.FechaHoraEvento ASC
+    """
+    
+    df = connector.execute_query(query)
+    
+    if df is not None and len(df) > 0:
+        print(f"✅ Extraídos {len(df):,} eventos de zonas")
+        
+        if save:
+            path = write_dataset(df, 'historial_zonas', mode='replace_partitions')
+            print(f"💾 Guardado en: {path}")
+    else:
+        print("⚠️ No se encontró historial de zonas")
+    
+    return df
+
+
+def extract_alertas(connector, days_back=90, save=False):
+    """
+    Extrae alertas de los últimos N días
+    
+    Args:
+        connector: Instancia de DatabaseConnector
+        days_back: Número de días hacia atrás para extraer
+        save: Guardar en el almacenamiento Parquet
+    
+    Returns:
+        DataFrame con las alertas
+    """
+    print(f"\n🚨 Extrayendo alertas de los últimos {days_back} días...")
+    
+    fecha_limite = (datetime.now() - timedelta(days=days_back)).strftime('%Y-%m-%d')
+    
+    query = f"""
+    SELECT 
+        AlertaID,
+        DispositivoID,
+        TipoAlerta,
+        Prioridad,
+        Descripcion,
+        FechaHora,
+        Estado
+    FROM alertas
+    WHERE FechaHora >= '{fecha_limite}'
+    ORDER BY FechaHora ASC
+    """
+    
+    df = connector.execute_query(query)
+    
+    if df is not None and len(df) > 0:
+        print(f"✅ Extraídas {len(df):,} alertas")
+        
+        if save:
+            path = write_dataset(df, 'alertas', mode='replace_partitions')
+            print(f"💾 Guardado en: {path}")
+    else:
+        print("⚠️ No se encontraron alertas")
+    
+    return df
+
+
+def extract_all_data(days_back=90, incremental=True, backfill=None, workers=None):
     """
     Extrae todos los datos necesarios para ML
     
     Args:
         days_back: Número de días de historial a extraer
+        incremental: Extraer solo ubicaciones nuevas (según la marca de agua)
+        backfill: Tupla (inicio, fin) para volver a extraer ese rango de días
+        workers: Si se indica, las extracciones completas y los backfill de
+                 ubicaciones se hacen en paralelo por shards
     """
     print("=" * 60)
     print("🚀 EXTRACCIÓN DE DATOS PARA MACHINE LEARNING")
     print("=" * 60)
     
-    # Crear directorio de salida si no existe
-    raw_dir = Path(DATA_DIR) / 'raw'
-    raw_dir.mkdir(parents=True, exist_ok=True)
-    
     # Conectar a la base de datos
     connector = DatabaseConnector()
     
@@ -170,29 +666,39 @@ def extract_all_data(days_back=90):
             print("❌ Error al conectar a la base de datos")
             return False
         
-        # Extraer ubicaciones
-        ubicaciones_path = raw_dir / f'ubicaciones_raw_{datetime.now().strftime("%Y%m%d")}.csv'
-        df_ubicaciones = extract_ubicaciones(connector, days_back, ubicaciones_path)
+        if workers and (backfill or not incremental):
+            rango = backfill or (datetime.now() - timedelta(days=days_back), datetime.now())
+            n_ubicaciones = extract_ubicaciones_parallel(*rango, workers=workers) or 0
+        elif backfill:
+            n_ubicaciones = extract_ubicaciones_range(connector, *backfill)
+        elif incremental:
+            n_ubicaciones = extract_ubicaciones_incremental(connector, days_back)
+        else:
+            n_ubicaciones = extract_ubicaciones(connector, days_back)
         
-        # Extraer dispositivos
-        dispositivos_path = raw_dir / f'dispositivos_raw_{datetime.now().strftime("%Y%m%d")}.csv'
-        df_dispositivos = extract_dispositivos(connector, dispositivos_path)
+        # Unir los archivos pequeños de las cargas incrementales (días cerrados)
+        compactadas = compact_dataset('ubicaciones', until=datetime.now())
+        if compactadas:
+            print(f"\n🗜️ Particiones compactadas: {compactadas}")
         
-        # Extraer zonas
-        zonas_path = raw_dir / f'zonas_raw_{datetime.now().strftime("%Y%m%d")}.csv'
-        df_zonas = extract_zonas(connector, zonas_path)
+        df_dispositivos = extract_dispositivos(connector, save=True)
+        df_zonas = extract_zonas(connector, save=True)
+        df_historial = extract_historial_zonas(connector, days_back, save=True)
+        df_alertas = extract_alertas(connector, days_back, save=True)
         
         print("\n" + "=" * 60)
         print("✅ EXTRACCIÓN COMPLETADA")
         print("=" * 60)
         print(f"\n📊 Resumen:")
-        print(f"  • Ubicaciones: {len(df_ubicaciones) if df_ubicaciones is not None else 0:,}")
+        print(f"  • Ubicaciones: {n_ubicaciones:,}")
         print(f"  • Dispositivos: {len(df_dispositivos) if df_dispositivos is not None else 0:,}")
         print(f"  • Zonas: {len(df_zonas) if df_zonas is not None else 0:,}")
-        print(f"\n📂 Archivos guardados en: {raw_dir}")
+        print(f"  • Historial zonas: {len(df_historial) if df_historial is not None else 0:,}")
+        print(f"  • Alertas: {len(df_alertas) if df_alertas is not None else 0:,}")
+        print(f"\n📂 Datasets guardados en: {RAW_DATA_DIR}")
         
         return True
-        
+    
     except Exception as e:
         print(f"❌ Error durante la extracción: {str(e)}")
         return False
@@ -204,14 +710,43 @@ def extract_all_data(days_back=90):
 if __name__ == "__main__":
     import argparse
     
-    parser = argparse.ArgumentParser(description='Extraer datos de ReGPS para ML')
+    parser = argparse.ArgumentParser(
+        description='Extraer datos de ReGPS para ML',
+        epilog=(
+            'Sin --full ni --backfill la extracción es incremental desde la marca de agua: '
+            'las ubicaciones que llegan con más de ML_LATE_TOLERANCE_HOURS (default: 48) de atraso '
+            'no se extraen; se avisa cuántas son y de qué días, y se recuperan con '
+            '--backfill INICIO FIN sobre esos días.'
+        )
+    )
     parser.add_argument(
         '--days', 
         type=int, 
         default=90,
         help='Número de días de historial a extraer (default: 90)'
     )
+    parser.add_argument(
+        '--full',
+        action='store_true',
+        help='Extraer de nuevo toda la ventana de días (ignora la marca de agua)'
+    )
+    parser.add_argument(
+        '--backfill',
+        nargs=2,
+        metavar=('INICIO', 'FIN'),
+        help='Volver a extraer las ubicaciones entre dos fechas (YYYY-MM-DD, incluidas); '
+             'recupera las que llegaron tarde a la extracción incremental'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='Extraer --full/--backfill en paralelo por shards (día × bucket) con N conexiones'
+    )
     
     args = parser.parse_args()
     
-    extract_all_data(days_back=args.days)
+    extract_all_data(
+        days_back=args.days, incremental=not args.full, backfill=args.backfill, workers=args.workers
+    )
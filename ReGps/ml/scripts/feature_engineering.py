@@ -12,43 +12,48 @@ Features que se crean:
 
 Uso:
     python scripts/feature_engineering.py
+    python scripts/feature_engineering.py --stream --chunk-size 500000
 """
 
 import sys
+import io
+import contextlib
 from pathlib import Path
 import pandas as pd
 import numpy as np
-from datetime import datetime
 
 # Agregar el directorio raíz al path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from utils.geo_utils import calculate_distance, calculate_bearing, calculate_speed, calculate_acceleration
-from config import DATA_DIR
+from utils import geo_arrays
+from utils.trajectory_utils import (
+    group_starts, shift_within_group, diff_within_group, cumsum_within_group, rolling_within_group
+)
+from utils.dataset_store import load_dataset, write_dataset, dataset_fingerprint
+from utils.feature_cache import cached_features, code_version
+from config import PROCESSED_DATA_DIR, STREAMING_CONFIG
+from scripts.preprocess import iter_raw_data, clean_ubicaciones, add_basic_features
+
+
+# Ventanas móviles (en puntos) de calculate_statistical_features
+STAT_WINDOWS = [5, 10]
 
 
 def load_processed_data():
     """
-    Carga el archivo procesado más reciente
+    Carga las ubicaciones procesadas del almacenamiento Parquet
+    (o del CSV procesado más reciente)
     
     Returns:
         DataFrame con ubicaciones procesadas
     """
-    processed_dir = Path(DATA_DIR) / 'processed'
-    
-    # Buscar archivos procesados
-    processed_files = list(processed_dir.glob('ubicaciones_processed_*.csv'))
+    df = load_dataset('ubicaciones', PROCESSED_DATA_DIR, csv_pattern='ubicaciones_processed_*.csv')
     
-    if not processed_files:
-        print("❌ No se encontraron archivos procesados en data/processed/")
+    if df is None:
+        print("❌ No se encontraron datos procesados en data/processed/")
         print("   Ejecuta primero: python scripts/preprocess.py")
         return None
     
-    # Tomar el más reciente
-    latest_file = max(processed_files, key=lambda x: x.stat().st_mtime)
-    print(f"📂 Cargando: {latest_file.name}")
-    
-    df = pd.read_csv(latest_file, parse_dates=['FechaHora'])
     print(f"✅ Cargadas {len(df):,} filas")
     
     return df
@@ -66,76 +71,68 @@ def calculate_trip_features(df):
     """
     print("\n🛣️ Calculando features de trayectorias...")
     
-    df_features = df.copy()
+    # Agrupar por dispositivo y ordenar por tiempo (sort_values ya devuelve una copia)
+    df_features = df.sort_values(['DispositivoID', 'FechaHora'])
     
-    # Agrupar por dispositivo y ordenar por tiempo
-    df_features = df_features.sort_values(['DispositivoID', 'FechaHora'])
+    # Cada dispositivo queda en un bloque contiguo: las operaciones por
+    # dispositivo son desplazamientos sobre arrays, sin groupby.apply
+    is_first = group_starts(df_features['DispositivoID'].to_numpy())
     
-    # Calcular diferencias entre puntos consecutivos del mismo dispositivo
-    grouped = df_features.groupby('DispositivoID')
+    lats = df_features['Latitud'].to_numpy(dtype=float)
+    lons = df_features['Longitud'].to_numpy(dtype=float)
+    velocidades = df_features['Velocidad'].to_numpy(dtype=float)
+    direcciones = df_features['Direccion'].to_numpy(dtype=float)
     
     # Tiempo desde el punto anterior (en segundos)
-    df_features['TiempoDesdeAnterior'] = grouped['FechaHora'].diff().dt.total_seconds()
+    tiempo = diff_within_group(df_features['FechaHora'].to_numpy(dtype='datetime64[ns]'), is_first)
+    df_features['TiempoDesdeAnterior'] = tiempo
     
     # Coordenadas anteriores
-    df_features['LatitudAnterior'] = grouped['Latitud'].shift(1)
-    df_features['LongitudAnterior'] = grouped['Longitud'].shift(1)
+    lats_prev = shift_within_group(lats, is_first)
+    lons_prev = shift_within_group(lons, is_first)
+    df_features['LatitudAnterior'] = lats_prev
+    df_features['LongitudAnterior'] = lons_prev
     
     # Velocidad y dirección anteriores
-    df_features['VelocidadAnterior'] = grouped['Velocidad'].shift(1)
-    df_features['DireccionAnterior'] = grouped['Direccion'].shift(1)
+    velocidades_prev = shift_within_group(velocidades, is_first)
+    df_features['VelocidadAnterior'] = velocidades_prev
+    df_features['DireccionAnterior'] = shift_within_group(direcciones, is_first)
     
     # Calcular distancia al punto anterior
     print("  • Calculando distancias...")
-    df_features['DistanciaRecorrida'] = df_features.apply(
-        lambda row: calculate_distance(
-            row['LatitudAnterior'], row['LongitudAnterior'],
-            row['Latitud'], row['Longitud']
-        ) if pd.notna(row['LatitudAnterior']) else 0,
-        axis=1
-    )
+    distancia = geo_arrays.calculate_distance(lats_prev, lons_prev, lats, lons, method='geodesic')
+    distancia[is_first] = 0.0
+    df_features['DistanciaRecorrida'] = distancia
     
     # Calcular velocidad real (basada en distancia/tiempo)
     print("  • Calculando velocidades reales...")
-    df_features['VelocidadCalculada'] = df_features.apply(
-        lambda row: calculate_speed(
-            row['DistanciaRecorrida'], 
-            row['TiempoDesdeAnterior']
-        ) if pd.notna(row['TiempoDesdeAnterior']) and row['TiempoDesdeAnterior'] > 0 else 0,
-        axis=1
-    )
+    tiempo_valido = tiempo > 0  # False para NaN (primer punto)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        velocidad_calculada = distancia / (tiempo / 3600)
+    df_features['VelocidadCalculada'] = np.where(tiempo_valido, velocidad_calculada, 0.0)
     
     # Calcular aceleración
     print("  • Calculando aceleraciones...")
-    df_features['Aceleracion'] = df_features.apply(
-        lambda row: calculate_acceleration(
-            row['VelocidadAnterior'], 
-            row['Velocidad'],
-            row['TiempoDesdeAnterior']
-        ) if pd.notna(row['VelocidadAnterior']) and pd.notna(row['TiempoDesdeAnterior']) and row['TiempoDesdeAnterior'] > 0 else 0,
-        axis=1
+    aceleracion = geo_arrays.calculate_acceleration(velocidades_prev, velocidades, tiempo)
+    df_features['Aceleracion'] = np.where(
+        tiempo_valido & ~np.isnan(velocidades_prev), aceleracion, 0.0
     )
     
     # Calcular cambio de dirección
     print("  • Calculando cambios de dirección...")
-    df_features['CambioDireccion'] = (
-        (df_features['Direccion'] - df_features['DireccionAnterior']).abs()
-    )
+    cambio_direccion = np.abs(diff_within_group(direcciones, is_first))
     # Ajustar para el caso 359° -> 1° (debe ser 2° no 358°)
-    df_features.loc[df_features['CambioDireccion'] > 180, 'CambioDireccion'] = (
-        360 - df_features['CambioDireccion']
-    )
+    df_features['CambioDireccion'] = np.where(cambio_direccion > 180, 360 - cambio_direccion, cambio_direccion)
     
     # Es una parada? (velocidad < 5 km/h)
-    df_features['EsParada'] = (df_features['Velocidad'] < 5).astype(int)
+    es_parada = (velocidades < 5).astype(int)
+    df_features['EsParada'] = es_parada
     
     # Tiempo acumulado en movimiento por dispositivo
-    df_features['TiempoMovimientoAcum'] = grouped.apply(
-        lambda g: (g['TiempoDesdeAnterior'] * (1 - g['EsParada'])).cumsum()
-    ).reset_index(level=0, drop=True)
+    df_features['TiempoMovimientoAcum'] = cumsum_within_group(tiempo * (1 - es_parada), is_first)
     
     # Distancia acumulada por dispositivo
-    df_features['DistanciaAcumulada'] = grouped['DistanciaRecorrida'].cumsum()
+    df_features['DistanciaAcumulada'] = cumsum_within_group(distancia, is_first)
     
     print(f"✅ Features de trayectoria calculadas")
     
@@ -154,36 +151,43 @@ def calculate_statistical_features(df):
     """
     print("\n📈 Calculando features estadísticas (ventanas móviles)...")
     
-    df_features = df.copy()
+    # Copia superficial: solo se agregan columnas, no se duplican los datos
+    df_features = df.copy(deep=False)
+    
+    # Ordenar (por posición) por dispositivo y tiempo para calcular las
+    # ventanas sobre bloques contiguos; los resultados vuelven al orden original
+    orden = np.lexsort((
+        df_features['FechaHora'].to_numpy(dtype='datetime64[ns]'),
+        df_features['DispositivoID'].to_numpy()
+    ))
+    is_first = group_starts(df_features['DispositivoID'].to_numpy()[orden])
+    velocidades = df_features['Velocidad'].to_numpy(dtype=float)[orden]
     
-    # Ventanas: últimos 5 y 10 puntos
-    windows = [5, 10]
+    def al_orden_original(valores):
+        resultado = np.empty_like(valores)
+        resultado[orden] = valores
+        return resultado
     
-    for window in windows:
+    for window in STAT_WINDOWS:
         print(f"  • Ventana de {window} puntos...")
         
-        grouped = df_features.groupby('DispositivoID')
+        velocidad = rolling_within_group(velocidades, is_first, window, min_periods=1)
         
         # Velocidad promedio en ventana
-        df_features[f'VelocidadMedia_{window}p'] = grouped['Velocidad'].transform(
-            lambda x: x.rolling(window=window, min_periods=1).mean()
-        )
+        df_features[f'VelocidadMedia_{window}p'] = al_orden_original(velocidad['mean'])
         
         # Velocidad máxima en ventana
-        df_features[f'VelocidadMax_{window}p'] = grouped['Velocidad'].transform(
-            lambda x: x.rolling(window=window, min_periods=1).max()
-        )
+        df_features[f'VelocidadMax_{window}p'] = al_orden_original(velocidad['max'])
         
-        # Desviación estándar de velocidad (variabilidad)
-        df_features[f'VelocidadStd_{window}p'] = grouped['Velocidad'].transform(
-            lambda x: x.rolling(window=window, min_periods=2).std().fillna(0)
-        )
+        # Desviación estándar de velocidad (variabilidad, mínimo 2 puntos)
+        velocidad_std = np.nan_to_num(velocidad['std'], nan=0.0)
+        df_features[f'VelocidadStd_{window}p'] = al_orden_original(velocidad_std)
         
         # Aceleración promedio en ventana
         if 'Aceleracion' in df_features.columns:
-            df_features[f'AceleracionMedia_{window}p'] = grouped['Aceleracion'].transform(
-                lambda x: x.rolling(window=window, min_periods=1).mean()
-            )
+            aceleraciones = df_features['Aceleracion'].to_numpy(dtype=float)[orden]
+            aceleracion = rolling_within_group(aceleraciones, is_first, window, min_periods=1)
+            df_features[f'AceleracionMedia_{window}p'] = al_orden_original(aceleracion['mean'])
     
     print(f"✅ Features estadísticas calculadas")
     
@@ -202,7 +206,8 @@ def calculate_behavioral_features(df):
     """
     print("\n🚗 Calculando features de comportamiento...")
     
-    df_features = df.copy()
+    # Copia superficial: solo se agregan columnas, no se duplican los datos
+    df_features = df.copy(deep=False)
     
     # Frenado brusco (aceleración negativa fuerte)
     if 'Aceleracion' in df_features.columns:
@@ -238,22 +243,50 @@ def calculate_behavioral_features(df):
     return df_features
 
 
-def save_engineered_features(df, filename='features_engineered.csv'):
+def compute_features(df, fingerprints=None):
     """
-    Guarda datos con features engineeradas
+    Features de trayectoria, estadísticas y de comportamiento, de la caché
+    de features si ya se calcularon con los mismos datos y el mismo código
     
     Args:
-        df: DataFrame con features
-        filename: Nombre del archivo de salida
+        df: DataFrame con ubicaciones procesadas
+        fingerprints: Huella de los datos procesados (dataset_fingerprint); None = sin caché
+    
+    Returns:
+        DataFrame con features
     """
-    processed_dir = Path(DATA_DIR) / 'processed'
-    processed_dir.mkdir(parents=True, exist_ok=True)
+    def calcular():
+        df_features = calculate_trip_features(df)
+        df_features = calculate_statistical_features(df_features)
+        return calculate_behavioral_features(df_features), {}
+    
+    df_features, _ = cached_features(
+        'trajectory_features', fingerprints, code_version(sys.modules[__name__]),
+        calcular, params={'stat_windows': STAT_WINDOWS}
+    )
     
-    # Agregar timestamp al nombre
-    timestamp = datetime.now().strftime("%Y%m%d")
-    output_path = processed_dir / f"{filename.replace('.csv', '')}_{timestamp}.csv"
+    return df_features
+
+
+def processed_fingerprints():
+    """Huella de las ubicaciones procesadas (clave de la caché de features)"""
+    return {
+        'ubicaciones_procesadas': dataset_fingerprint(
+            'ubicaciones', PROCESSED_DATA_DIR, csv_pattern='ubicaciones_processed_*.csv'
+        )
+    }
+
+
+def save_engineered_features(df, name='features', mode='overwrite'):
+    """
+    Guarda datos con features engineeradas en el almacenamiento Parquet
     
-    df.to_csv(output_path, index=False, encoding='utf-8')
+    Args:
+        df: DataFrame con features
+        name: Nombre del dataset en data/processed/
+        mode: Modo de escritura de write_dataset
+    """
+    output_path = write_dataset(df, name, PROCESSED_DATA_DIR, mode=mode)
     print(f"\n💾 Features guardadas en: {output_path}")
     print(f"   Total de columnas: {len(df.columns)}")
     
@@ -269,20 +302,15 @@ def feature_engineering_pipeline():
     print("=" * 60)
     
     # 1. Cargar datos procesados
+    fingerprints = processed_fingerprints()
     df = load_processed_data()
     if df is None:
         return False
     
     print(f"\n📊 Columnas iniciales: {len(df.columns)}")
     
-    # 2. Features de trayectoria
-    df = calculate_trip_features(df)
-    
-    # 3. Features estadísticas
-    df = calculate_statistical_features(df)
-    
-    # 4. Features de comportamiento
-    df = calculate_behavioral_features(df)
+    # 2-4. Features de trayectoria, estadísticas y de comportamiento
+    df = compute_features(df, fingerprints)
     
     # 5. Guardar dataset con features
     save_engineered_features(df)
@@ -304,5 +332,196 @@ def feature_engineering_pipeline():
     return True
 
 
+# ============================================================================
+# MODO STREAMING (por bloques, memoria acotada)
+# ============================================================================
+
+# Columnas acumuladas por dispositivo y el incremento por fila que suman.
+# En modo streaming se recalculan sobre cada bloque partiendo del total
+# arrastrado del bloque anterior.
+CUMULATIVE_COLUMNS = {
+    'TiempoMovimientoAcum': lambda df: df['TiempoDesdeAnterior'] * (1 - df['EsParada']),
+    'DistanciaAcumulada': lambda df: df['DistanciaRecorrida'],
+    'TotalFrenadosBruscos': lambda df: df['FrenadoBrusco'],
+    'TotalAceleracionesBruscas': lambda df: df['AceleracionBrusca'],
+    'TotalExcesosVelocidad': lambda df: df['ExcesoVelocidad'],
+}
+
+
+class DeviceStreamState:
+    """
+    Estado por dispositivo que se arrastra entre bloques en modo streaming
+    
+    - contexto: últimas filas (ya limpias) de cada dispositivo, suficientes
+      para los shift y la ventana móvil más grande
+    - acumulados: total por dispositivo de cada columna de CUMULATIVE_COLUMNS
+    
+    La memoria del estado depende del número de dispositivos, no de filas.
+    """
+    
+    def __init__(self, context_size=None):
+        """
+        Args:
+            context_size: Filas de contexto por dispositivo (default: ventana más grande)
+        """
+        self.context_size = context_size or max(STAT_WINDOWS)
+        self.contexto = None
+        self.acumulados = pd.DataFrame(columns=list(CUMULATIVE_COLUMNS), dtype=float)
+    
+    def context_for(self, dispositivos):
+        """Filas de contexto de los dispositivos indicados"""
+        if self.contexto is None:
+            return None
+        return self.contexto[self.contexto['DispositivoID'].isin(dispositivos)]
+    
+    def update_context(self, df_bloque):
+        """Guarda las últimas context_size filas por dispositivo (contexto previo + bloque)"""
+        df = pd.concat([self.contexto, df_bloque]) if self.contexto is not None else df_bloque
+        df = df.sort_values(['DispositivoID', 'FechaHora'], kind='stable')
+        self.contexto = df.groupby('DispositivoID').tail(self.context_size).reset_index(drop=True)
+    
+    def apply_cumulative(self, df_nuevos):
+        """
+        Recalcula las columnas acumuladas de las filas nuevas sumando el total
+        arrastrado por dispositivo, y actualiza ese total
+        
+        Args:
+            df_nuevos: Filas nuevas ordenadas por (DispositivoID, FechaHora)
+        """
+        dispositivos = df_nuevos['DispositivoID'].to_numpy()
+        is_first = group_starts(dispositivos)
+        previos = self.acumulados.reindex(dispositivos).fillna(0)
+        
+        totales = {}
+        for col, incremento in CUMULATIVE_COLUMNS.items():
+            valores = incremento(df_nuevos)
+            acumulado = previos[col].to_numpy() + cumsum_within_group(valores, is_first)
+            
+            if pd.api.types.is_integer_dtype(valores):
+                acumulado = acumulado.astype(np.int64)
+            df_nuevos[col] = acumulado
+            
+            totales[col] = pd.Series(valores.to_numpy(dtype=float)).groupby(dispositivos).sum()
+        
+        self.acumulados = self.acumulados.add(pd.DataFrame(totales), fill_value=0)
+        
+        return df_nuevos
+
+
+def process_stream_chunk(df_bloque, state):
+    """
+    Calcula todas las features de un bloque usando el estado por dispositivo
+    
+    Las filas de contexto se anteponen al bloque para que shift, diff y
+    ventanas móviles vean los puntos anteriores; luego se descartan y las
+    columnas acumuladas se corrigen con los totales arrastrados. El
+    resultado coincide fila a fila con la ejecución completa en memoria.
+    
+    Args:
+        df_bloque: DataFrame limpio y con features básicas (un bloque)
+        state: DeviceStreamState compartido entre bloques
+    
+    Returns:
+        DataFrame con las features de las filas del bloque
+    """
+    contexto = state.context_for(df_bloque['DispositivoID'].unique())
+    
+    partes = [df_bloque.assign(_contexto=False)]
+    if contexto is not None and len(contexto) > 0:
+        partes.insert(0, contexto.assign(_contexto=True))
+    df = pd.concat(partes, ignore_index=True)
+    
+    df = calculate_trip_features(df)
+    df = calculate_statistical_features(df)
+    df = calculate_behavioral_features(df)
+    
+    df_nuevos = df[~df['_contexto']].drop(columns='_contexto').reset_index(drop=True)
+    df_nuevos = state.apply_cumulative(df_nuevos)
+    
+    state.update_context(df_bloque)
+    
+    return df_nuevos
+
+
+def streaming_feature_pipeline(chunk_size=None, name='features'):
+    """
+    Pipeline completo (limpieza → features básicas → trayectorias →
+    ventanas móviles → comportamiento) procesando los datos crudos por bloques
+    
+    Los bloques llegan en orden cronológico (el dataset Parquet se recorre
+    día a día; un CSV heredado debe estar ordenado por FechaHora, como lo
+    exportaba extract_data.py). La memoria máxima depende de chunk_size y
+    del número de dispositivos, no del tamaño total de los datos. Cada
+    bloque se agrega al dataset de features en cuanto se calcula.
+    Los duplicados exactos solo se detectan dentro de un mismo bloque.
+    
+    Args:
+        chunk_size: Filas por bloque (default: STREAMING_CONFIG['chunk_size'])
+        name: Nombre del dataset de salida en data/processed/
+    
+    Returns:
+        Ruta del dataset generado, o None si no hay datos
+    """
+    chunk_size = chunk_size or STREAMING_CONFIG['chunk_size']
+    
+    print("=" * 60)
+    print("🚀 FEATURE ENGINEERING (MODO STREAMING)")
+    print("=" * 60)
+    
+    output_path = None
+    state = DeviceStreamState()
+    total_filas = 0
+    n_bloques = 0
+    
+    for df_raw in iter_raw_data(chunk_size):
+        # Los mensajes por etapa se silencian: se reporta un resumen por bloque
+        with contextlib.redirect_stdout(io.StringIO()):
+            df_bloque = add_basic_features(clean_ubicaciones(df_raw))
+            if len(df_bloque) == 0:
+                continue
+            df_features = process_stream_chunk(df_bloque, state)
+        
+        output_path = write_dataset(
+            df_features, name, PROCESSED_DATA_DIR,
+            mode='overwrite' if n_bloques == 0 else 'append'
+        )
+        
+        n_bloques += 1
+        total_filas += len(df_features)
+        print(f"  • Bloque {n_bloques}: {len(df_features):,} filas "
+              f"({total_filas:,} acumuladas, {len(state.acumulados):,} dispositivos)")
+    
+    if n_bloques == 0:
+        print("❌ No hay datos para procesar")
+        return None
+    
+    print(f"\n💾 Features guardadas en: {output_path}")
+    print("\n" + "=" * 60)
+    print("✅ FEATURE ENGINEERING COMPLETADO")
+    print("=" * 60)
+    
+    return output_path
+
+
 if __name__ == "__main__":
-    feature_engineering_pipeline()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Feature engineering para ML')
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Procesar los datos crudos por bloques (para datos que no caben en memoria)'
+    )
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=None,
+        help=f"Filas por bloque en modo streaming (default: {STREAMING_CONFIG['chunk_size']:,})"
+    )
+    
+    args = parser.parse_args()
+    
+    if args.stream:
+        streaming_feature_pipeline(chunk_size=args.chunk_size)
+    else:
+        feature_engineering_pipeline()
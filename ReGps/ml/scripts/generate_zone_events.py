@@ -0,0 +1,238 @@
+"""
+Script para generar los eventos de zona (historial_zonas) desde las ubicaciones
+Recalcula las Entradas/Salidas que Laravel registra en línea
+(UbicacionController::verificarGeofencing) sobre el almacenamiento Parquet,
+para backfills o para evaluar definiciones de zonas nuevas.
+
+- Las zonas se indexan una vez en un GeofenceIndex (STRtree + pruebas
+  vectorizadas de círculo/polígono).
+- Cada bucket de dispositivos se procesa en un proceso aparte: los
+  dispositivos de un bucket no comparten estado con los de otro.
+- Dentro del bucket las ubicaciones se leen día a día (iter_dataset) y
+  ZoneEventTracker continúa las estadías abiertas entre bloques, así que la
+  memoria depende del tamaño de bloque, no del total.
+
+El resultado se guarda como dataset 'historial_zonas' en data/processed
+(no reemplaza el extraído de Laravel en data/raw).
+
+Uso:
+    python scripts/generate_zone_events.py                          # todo el historial
+    python scripts/generate_zone_events.py --start 2025-01-01 --end 2025-01-31 --workers 8
+    python scripts/generate_zone_events.py --horarios               # aplicar HorarioInicio/HorarioFin
+"""
+
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from pathlib import Path
+
+import pandas as pd
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.dataset_store import load_dataset, iter_dataset, write_dataset, delete_partitions
+from utils.geofence import GeofenceIndex, ZoneEventTracker
+from config import RAW_DATA_DIR, PROCESSED_DATA_DIR, DATASET_CONFIG, STREAMING_CONFIG, ZONE_EVENTS_CONFIG
+
+
+UBICACIONES_COLUMNS = ['DispositivoID', 'Latitud', 'Longitud', 'FechaHora']
+
+
+def load_zone_inputs(raw_dir=None):
+    """
+    Carga zonas y el empleado de cada dispositivo
+    
+    Args:
+        raw_dir: Directorio de los datos extraídos (default: data/raw)
+    
+    Returns:
+        Tuple (df_zonas, empleados): empleados es una Series
+        DispositivoID -> EmpleadoID, o None si no hay dataset de dispositivos
+    """
+    raw_dir = raw_dir or RAW_DATA_DIR
+    
+    df_zonas = load_dataset('zonas', raw_dir, csv_pattern="zonas_raw_*.csv")
+    if df_zonas is None:
+        raise FileNotFoundError("No se encontraron datos de zonas")
+    
+    df_dispositivos = load_dataset(
+        'dispositivos', raw_dir, columns=['DispositivoID', 'EmpleadoID'],
+        csv_pattern="dispositivos_raw_*.csv"
+    )
+    empleados = None
+    if df_dispositivos is not None:
+        df_dispositivos = df_dispositivos.dropna(subset=['EmpleadoID'])
+        empleados = df_dispositivos.set_index('DispositivoID')['EmpleadoID'].astype('int64')
+    
+    return df_zonas, empleados
+
+
+def generate_bucket_events(bucket, df_zonas, empleados, start=None, end=None, horarios=False,
+                           chunk_size=None, raw_dir=None, output_dir=None):
+    """
+    Genera y guarda los eventos de zona de un bucket de dispositivos
+    
+    Args:
+        bucket: Bucket de dispositivo a procesar
+        df_zonas: Tabla zonas
+        empleados: Series DispositivoID -> EmpleadoID (None = sin filtrar).
+                   Igual que Laravel, los dispositivos sin empleado no
+                   generan eventos.
+        start: Primer día (incluido)
+        end: Fin del rango (excluido)
+        horarios: Aplicar HorarioInicio/HorarioFin de las zonas
+        chunk_size: Filas máximas por bloque leído
+        raw_dir: Directorio de ubicaciones (default: data/raw)
+        output_dir: Directorio del historial generado (default: data/processed)
+    
+    Returns:
+        dict con puntos, eventos, entradas, salidas, estadías abiertas y tiempos
+    """
+    inicio = time.perf_counter()
+    index = GeofenceIndex.from_dataframe(df_zonas)
+    tracker = ZoneEventTracker(index, horarios=horarios)
+    
+    for chunk in iter_dataset(
+        'ubicaciones', chunk_size or STREAMING_CONFIG['chunk_size'], raw_dir or RAW_DATA_DIR,
+        columns=UBICACIONES_COLUMNS, start=start, end=end, buckets=[bucket]
+    ):
+        chunk = chunk.dropna(subset=['Latitud', 'Longitud', 'FechaHora'])
+        if empleados is not None:
+            chunk = chunk[chunk['DispositivoID'].isin(empleados.index)]
+        tracker.process(chunk['DispositivoID'], chunk['Latitud'], chunk['Longitud'], chunk['FechaHora'])
+    
+    eventos = tracker.events()
+    eventos.insert(1, 'EmpleadoID', eventos['DispositivoID'].map(empleados) if empleados is not None else pd.NA)
+    t_calculo = time.perf_counter() - inicio
+    
+    inicio = time.perf_counter()
+    if len(eventos):
+        write_dataset(eventos, 'historial_zonas', output_dir or PROCESSED_DATA_DIR, mode='append')
+    t_escritura = time.perf_counter() - inicio
+    
+    return {
+        'bucket': bucket,
+        'puntos': tracker.puntos,
+        'eventos': len(eventos),
+        'entradas': int((eventos['TipoEvento'] == 'Entrada').sum()),
+        'salidas': int((eventos['TipoEvento'] == 'Salida').sum()),
+        'abiertas': tracker.open_stays(),
+        't_calculo': t_calculo,
+        't_escritura': t_escritura,
+    }
+
+
+def generate_zone_events(start=None, end=None, workers=None, horarios=False, chunk_size=None,
+                         raw_dir=None, output_dir=None):
+    """
+    Genera el historial de zonas de un rango de días en paralelo por bucket
+    
+    Las estadías abiertas antes de `start` no se conocen: en un rango
+    parcial, el primer ping dentro de una zona genera su Entrada.
+    
+    Args:
+        start: Fecha inicial (incluida, None = desde el principio)
+        end: Fecha final (incluida, None = hasta el final)
+        workers: Buckets en paralelo (default: ZONE_EVENTS_CONFIG['workers'])
+        horarios: Aplicar HorarioInicio/HorarioFin de las zonas
+        chunk_size: Filas máximas por bloque leído
+        raw_dir: Directorio de ubicaciones, zonas y dispositivos (default: data/raw)
+        output_dir: Directorio del historial generado (default: data/processed)
+    
+    Returns:
+        int: Número de eventos generados (None si algún bucket falló)
+    """
+    workers = workers or ZONE_EVENTS_CONFIG['workers']
+    output_dir = output_dir or PROCESSED_DATA_DIR
+    desde = pd.Timestamp(start).normalize() if start is not None else None
+    hasta = pd.Timestamp(end).normalize() + timedelta(days=1) if end is not None else None
+    
+    print("\n📍 Generando eventos de zona desde las ubicaciones...")
+    df_zonas, empleados = load_zone_inputs(raw_dir)
+    print(f"  • Zonas activas: {len(GeofenceIndex.from_dataframe(df_zonas)):,} de {len(df_zonas):,}")
+    if empleados is None:
+        print("  ⚠️ Sin dataset de dispositivos: se procesan todos y EmpleadoID queda vacío")
+    
+    # Reemplazar el rango completo: un día sin eventos no debe conservar los de una corrida anterior
+    borrados = delete_partitions('historial_zonas', desde, hasta - timedelta(days=1) if hasta else None, output_dir)
+    if borrados:
+        print(f"  • Días reemplazados: {borrados:,}")
+    
+    buckets = list(range(DATASET_CONFIG['device_buckets']))
+    resultados, fallidos = [], []
+    inicio = time.perf_counter()
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                generate_bucket_events, b, df_zonas, empleados, desde, hasta, horarios,
+                chunk_size, raw_dir, output_dir
+            ): b
+            for b in buckets
+        }
+        for future in as_completed(futures):
+            try:
+                r = future.result()
+                resultados.append(r)
+                print(f"  • Bucket {r['bucket']:>3}: {r['puntos']:,} puntos → {r['eventos']:,} eventos "
+                      f"({r['t_calculo']:.1f}s)")
+            except Exception as e:
+                fallidos.append((futures[future], e))
+                print(f"  ❌ Bucket {futures[future]}: {e}")
+    
+    segundos = time.perf_counter() - inicio
+    puntos = sum(r['puntos'] for r in resultados)
+    eventos = sum(r['eventos'] for r in resultados)
+    t_calculo = sum(r['t_calculo'] for r in resultados)
+    
+    print("\n" + "-" * 60)
+    print("📈 REPORTE DE EVENTOS DE ZONA")
+    print("-" * 60)
+    print(f"  • Workers: {workers} | buckets: {len(resultados)} completados, {len(fallidos)} fallidos")
+    print(f"  • Puntos: {puntos:,} en {segundos:.1f}s ({puntos / max(segundos, 1e-9):,.0f} puntos/s)")
+    print(f"  • Eventos: {eventos:,} (entradas {sum(r['entradas'] for r in resultados):,}, "
+          f"salidas {sum(r['salidas'] for r in resultados):,}, "
+          f"estadías abiertas {sum(r['abiertas'] for r in resultados):,})")
+    print(f"  • Eficiencia del paralelismo: {t_calculo / max(workers * segundos, 1e-9) * 100:.0f}%")
+    
+    if fallidos:
+        print("❌ Hubo buckets fallidos: vuelve a ejecutar el rango")
+        return None
+    
+    print(f"✅ Historial de zonas guardado en: {output_dir / 'historial_zonas'}")
+    return eventos
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Generar historial_zonas (Entrada/Salida) desde las ubicaciones')
+    parser.add_argument('--start', default=None, help='Fecha inicial (YYYY-MM-DD, incluida)')
+    parser.add_argument('--end', default=None, help='Fecha final (YYYY-MM-DD, incluida)')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help="Buckets de dispositivos en paralelo (default: ZONE_EVENTS_CONFIG['workers'])"
+    )
+    parser.add_argument(
+        '--horarios',
+        action='store_true',
+        help='Aplicar HorarioInicio/HorarioFin de las zonas (Laravel no los aplica)'
+    )
+    parser.add_argument('--chunk-size', type=int, default=None, help='Filas máximas por bloque leído')
+    parser.add_argument(
+        '--output-dir',
+        type=Path,
+        default=None,
+        help='Directorio base del historial generado (default: data/processed)'
+    )
+    
+    args = parser.parse_args()
+    
+    generate_zone_events(
+        start=args.start, end=args.end, workers=args.workers, horarios=args.horarios,
+        chunk_size=args.chunk_size, output_dir=args.output_dir
+    )
@@ -16,34 +16,36 @@ import sys
 from pathlib import Path
 import pandas as pd
 import numpy as np
-from datetime import datetime
 
 # Agregar el directorio raíz al path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from config import DATA_DIR
+from config import RAW_DATA_DIR, PROCESSED_DATA_DIR
+from utils.dataset_store import load_dataset, write_dataset, dataset_exists, iter_dataset
 
-def load_latest_raw_data():
+def load_raw_data(start=None, end=None, dispositivos=None):
     """
-    Carga el archivo de ubicaciones más reciente
+    Carga las ubicaciones crudas del almacenamiento Parquet
+    (o del CSV más reciente si aún no se migró)
+    
+    Args:
+        start: Fecha inicial (incluida), opcional
+        end: Fecha final (excluida), opcional
+        dispositivos: Lista de DispositivoID, opcional
     
     Returns:
         DataFrame con ubicaciones crudas
     """
-    raw_dir = Path(DATA_DIR) / 'raw'
-    
-    # Buscar archivos de ubicaciones
-    ubicaciones_files = list(raw_dir.glob('ubicaciones_raw_*.csv'))
+    df = load_dataset(
+        'ubicaciones', RAW_DATA_DIR, csv_pattern='ubicaciones_raw_*.csv',
+        start=start, end=end, dispositivos=dispositivos
+    )
     
-    if not ubicaciones_files:
-        print("❌ No se encontraron archivos de ubicaciones en data/raw/")
+    if df is None:
+        print("❌ No se encontraron ubicaciones en data/raw/")
+        print("   Ejecuta primero: python scripts/extract_data.py")
         return None
     
-    # Tomar el más reciente
-    latest_file = max(ubicaciones_files, key=lambda x: x.stat().st_mtime)
-    print(f"📂 Cargando: {latest_file.name}")
-    
-    df = pd.read_csv(latest_file)
     print(f"✅ Cargadas {len(df):,} filas")
     
     return df
@@ -61,11 +63,10 @@ def clean_ubicaciones(df):
     """
     print("\n🧹 Limpiando datos...")
     
-    df_clean = df.copy()
-    initial_count = len(df_clean)
+    initial_count = len(df)
     
-    # 1. Eliminar duplicados exactos
-    df_clean = df_clean.drop_duplicates()
+    # 1. Eliminar duplicados exactos (drop_duplicates ya devuelve una copia)
+    df_clean = df.drop_duplicates()
     print(f"  • Duplicados eliminados: {initial_count - len(df_clean)}")
     
     # 2. Convertir FechaHora a datetime
@@ -96,8 +97,8 @@ def clean_ubicaciones(df):
     # 6. Rellenar velocidades faltantes con 0
     df_clean['Velocidad'] = df_clean['Velocidad'].fillna(0)
     
-    # 7. Rellenar dirección faltante con 0
-    df_clean['Direccion'] = df_clean['Direccion'].fillna(0)
+    # 7. Rellenar dirección faltante con 0 (rumbo en grados)
+    df_clean['Direccion'] = pd.to_numeric(df_clean['Direccion'], errors='coerce').fillna(0)
     
     # 8. Ordenar por dispositivo y tiempo
     df_clean = df_clean.sort_values(['DispositivoID', 'FechaHora'])
@@ -123,7 +124,8 @@ def add_basic_features(df):
     """
     print("\n🔧 Agregando features básicas...")
     
-    df_features = df.copy()
+    # Copia superficial: solo se agregan columnas, no se duplican los datos
+    df_features = df.copy(deep=False)
     
     # Features temporales
     df_features['Hora'] = df_features['FechaHora'].dt.hour
@@ -155,22 +157,45 @@ def add_basic_features(df):
     return df_features
 
 
-def save_processed_data(df, filename='ubicaciones_processed.csv'):
+def iter_raw_data(chunk_size):
     """
-    Guarda datos procesados
+    Lee las ubicaciones crudas por bloques, en orden cronológico por dispositivo
+    
+    Con el almacenamiento Parquet se recorre día a día; si solo hay CSV
+    heredados se lee el más reciente por bloques.
     
     Args:
-        df: DataFrame procesado
-        filename: Nombre del archivo de salida
+        chunk_size: Filas por bloque
+    
+    Yields:
+        DataFrame con un bloque de ubicaciones crudas
     """
-    processed_dir = Path(DATA_DIR) / 'processed'
-    processed_dir.mkdir(parents=True, exist_ok=True)
+    if dataset_exists('ubicaciones', RAW_DATA_DIR):
+        print(f"📂 Leyendo por bloques de {chunk_size:,} filas: dataset ubicaciones (Parquet)")
+        yield from iter_dataset('ubicaciones', chunk_size, RAW_DATA_DIR)
+        return
     
-    # Agregar timestamp al nombre
-    timestamp = datetime.now().strftime("%Y%m%d")
-    output_path = processed_dir / f"{filename.replace('.csv', '')}_{timestamp}.csv"
+    ubicaciones_files = list(Path(RAW_DATA_DIR).glob('ubicaciones_raw_*.csv'))
     
-    df.to_csv(output_path, index=False, encoding='utf-8')
+    if not ubicaciones_files:
+        print("❌ No se encontraron ubicaciones en data/raw/")
+        return
+    
+    latest_file = max(ubicaciones_files, key=lambda x: x.stat().st_mtime)
+    print(f"📂 Leyendo por bloques de {chunk_size:,} filas: {latest_file.name}")
+    
+    yield from pd.read_csv(latest_file, chunksize=chunk_size)
+
+
+def save_processed_data(df, name='ubicaciones'):
+    """
+    Guarda datos procesados en el almacenamiento Parquet
+    
+    Args:
+        df: DataFrame procesado
+        name: Nombre del dataset en data/processed/
+    """
+    output_path = write_dataset(df, name, PROCESSED_DATA_DIR)
     print(f"\n💾 Datos guardados en: {output_path}")
     
     return output_path
@@ -217,7 +242,7 @@ def preprocess_pipeline():
     print("=" * 60)
     
     # 1. Cargar datos crudos
-    df_raw = load_latest_raw_data()
+    df_raw = load_raw_data()
     if df_raw is None:
         return False
     
@@ -11,36 +11,94 @@ from datetime import datetime
 # Agregar el directorio raíz al path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from models import anomaly_detector
 from models.anomaly_detector import AnomalyDetector
-from config import RAW_DATA_DIR, MODELS_DIR
+from models.compact import compact_path
+from utils.dataset_store import load_dataset, dataset_fingerprint
+from utils.feature_cache import cached_features, code_version
+from utils.model_search import search_model, NotEnoughFolds
+from config import RAW_DATA_DIR, MODELS_DIR, MODEL_PARAMS
 import joblib
 
 
+# Columnas leídas del almacenamiento (proyección: el resto no se carga)
+UBICACIONES_COLUMNS = ['DispositivoID', 'Latitud', 'Longitud', 'Velocidad', 'FechaHora']
+
+
 def load_latest_data():
-    """Carga los archivos CSV más recientes"""
+    """Carga las ubicaciones (solo las columnas que usa el modelo)"""
     print("\n📂 Cargando datos de entrenamiento...")
     
-    ubicaciones_files = list(RAW_DATA_DIR.glob("ubicaciones_raw_*.csv"))
-    if not ubicaciones_files:
-        raise FileNotFoundError("No se encontraron archivos de ubicaciones")
-    
-    latest_ubicaciones = max(ubicaciones_files, key=lambda p: p.stat().st_mtime)
-    print(f"📄 Cargando: {latest_ubicaciones.name}")
-    df_ubicaciones = pd.read_csv(latest_ubicaciones)
+    df_ubicaciones = load_dataset(
+        'ubicaciones', RAW_DATA_DIR, columns=UBICACIONES_COLUMNS,
+        csv_pattern="ubicaciones_raw_*.csv"
+    )
+    if df_ubicaciones is None:
+        raise FileNotFoundError("No se encontraron datos de ubicaciones")
     
     print(f"✅ Cargadas {len(df_ubicaciones):,} ubicaciones")
     
     return df_ubicaciones
 
 
-def main():
-    """Función principal"""
+def input_fingerprints():
+    """Huella de los datos que lee load_latest_data (clave de la caché de features)"""
+    return {'ubicaciones': dataset_fingerprint('ubicaciones', RAW_DATA_DIR, csv_pattern="ubicaciones_raw_*.csv")}
+
+
+def build_features(detector, df_ubicaciones, fingerprints=None):
+    """
+    Features por ubicación, de la caché de features si ya se calcularon con
+    los mismos datos y el mismo código
+    
+    Args:
+        detector: AnomalyDetector (queda con feature_columns y row_keys)
+        df_ubicaciones: DataFrame con ubicaciones
+        fingerprints: Huellas de los datos (input_fingerprints); None = sin caché
+    
+    Returns:
+        DataFrame con features
+    """
+    def calcular():
+        features_df = detector.create_features(df_ubicaciones)
+        bloque = pd.concat([detector.row_keys, features_df], axis=1)
+        return bloque, {'feature_columns': detector.feature_columns}
+    
+    bloque, meta = cached_features(
+        'anomaly_features', fingerprints, code_version(anomaly_detector),
+        calcular, params={'columns': UBICACIONES_COLUMNS}
+    )
+    detector.feature_columns = meta['feature_columns']
+    detector.row_keys = bloque[['DispositivoID', 'FechaHora']]
+    
+    return bloque[detector.feature_columns]
+
+
+def main(tune=False, workers=None, n_jobs=None, df_ubicaciones=None, fingerprints=None):
+    """
+    Función principal
+    
+    Args:
+        tune: Elegir los hiperparámetros con validación cruzada (utils/model_search.py)
+        workers: Procesos de la búsqueda (default: TUNING_CONFIG['workers'])
+        n_jobs: Hilos del ajuste final (default: -1, todos los núcleos).
+                scripts/train_pipeline.py reparte los núcleos entre los
+                modelos que entrena a la vez
+        df_ubicaciones: Ubicaciones ya cargadas (default: se leen de data/raw)
+        fingerprints: Huellas de df_ubicaciones (input_fingerprints) para usar
+                      la caché de features con datos ya cargados
+    
+    Returns:
+        dict con la metadata del modelo
+    """
     print("=" * 70)
     print("🚀 ENTRENAMIENTO DE MODELO DE DETECCIÓN DE ANOMALÍAS")
     print("=" * 70)
     
     # 1. Cargar datos
-    df_ubicaciones = load_latest_data()
+    if df_ubicaciones is None:
+        fingerprints = input_fingerprints()
+        df_ubicaciones = load_latest_data()
     
     # 2. Crear instancia del modelo
     detector = AnomalyDetector(
@@ -50,26 +108,54 @@ def main():
     )
     
     # 3. Crear features
-    X = detector.create_features(df_ubicaciones)
+    X = build_features(detector, df_ubicaciones, fingerprints)
+    
+    # 4. Parámetros: MODEL_PARAMS o los mejores de la búsqueda
+    params = dict(MODEL_PARAMS['anomaly'])
+    busqueda = None
+    if tune:
+        try:
+            busqueda = search_model(
+                'anomaly', X, None, detector.row_keys['DispositivoID'], detector.row_keys['FechaHora'],
+                workers=workers, report_path=MODELS_DIR / "metadata" / "anomaly_detector_search.json"
+            )
+            params = busqueda['best_params']
+        except NotEnoughFolds as e:
+            # Pocos datos para validar: se entrena igual, sin búsqueda
+            print(f"⚠️ Búsqueda omitida: {e}")
+            print("   Se entrena con MODEL_PARAMS")
+    detector.model.set_params(**params)
+    detector.contamination = detector.model.contamination
+    if n_jobs is not None:
+        detector.model.set_params(n_jobs=n_jobs)
     
-    # 4. Entrenar modelo
+    # 5. Entrenar modelo
     metrics = detector.train(X, test_size=0.2)
+    if n_jobs is not None:
+        detector.model.set_params(n_jobs=-1)
     
-    # 5. Guardar modelo
+    # 6. Guardar modelo
     model_path = MODELS_DIR / "trained" / "anomaly_detector.joblib"
     model_path.parent.mkdir(parents=True, exist_ok=True)
     detector.save(model_path)
+    detector.save_compact(compact_path(model_path))
     
-    # 6. Guardar metadata
+    # 7. Guardar metadata
     metadata = {
         'model_name': 'anomaly_detector',
         'model_type': 'IsolationForest',
         'version': '1.0.0',
         'trained_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         'n_samples': len(X),
+        'n_samples_train': len(X) - len(detector.X_holdout),
+        'n_samples_test': len(detector.X_holdout),
         'n_features': len(detector.feature_columns),
         'feature_names': detector.feature_columns,
         'contamination': detector.contamination,
+        'params': params,
+        'cv': None if busqueda is None else {
+            k: busqueda[k] for k in ('metric', 'best_score', 'base_score', 'folds')
+        },
         'test_anomalies': metrics['test_anomalies'],
         'test_anomaly_rate': metrics['test_anomaly_rate']
     }
@@ -89,7 +175,21 @@ def main():
     print(f"   • Tasa de anomalías en test: {metadata['test_anomaly_rate']:.2f}%")
     print(f"\n💾 Modelo guardado en: {model_path}")
     print(f"\n💡 Siguiente paso: Actualizar api/app.py para cargar este modelo")
+    
+    return metadata
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Entrenar el modelo de detección de anomalías')
+    parser.add_argument(
+        '--tune',
+        action='store_true',
+        help='Elegir hiperparámetros con validación cruzada por dispositivo y tiempo (MODEL_SEARCH_SPACE)'
+    )
+    parser.add_argument('--workers', type=int, default=None, help="Procesos de la búsqueda (default: TUNING_CONFIG['workers'])")
+    
+    args = parser.parse_args()
+    
+    main(tune=args.tune, workers=args.workers)
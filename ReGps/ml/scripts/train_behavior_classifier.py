@@ -5,45 +5,56 @@ Usa la clase BehaviorClassifier del módulo models
 
 import sys
 from pathlib import Path
-import pandas as pd
 from datetime import datetime
 
 # Agregar el directorio raíz al path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from models import behavior_classifier
 from models.behavior_classifier import BehaviorClassifier
-from config import RAW_DATA_DIR, MODELS_DIR
+from models.compact import compact_path
+from utils.dataset_store import load_dataset, dataset_fingerprint
+from utils.feature_cache import cached_features, code_version
+from utils.model_search import search_model, NotEnoughFolds
+from config import RAW_DATA_DIR, PROCESSED_DATA_DIR, MODELS_DIR, MODEL_PARAMS
 import joblib
 
 
-def load_latest_data():
-    """Carga los archivos CSV más recientes"""
+# Columnas leídas del almacenamiento (proyección: el resto no se carga)
+UBICACIONES_COLUMNS = ['DispositivoID', 'Latitud', 'Longitud', 'Velocidad', 'FechaHora']
+HISTORIAL_COLUMNS = ['DispositivoID', 'FechaHoraEvento', 'TipoZona']
+ALERTAS_COLUMNS = ['DispositivoID', 'FechaHora', 'Prioridad']
+
+
+def load_latest_data(historial_dir=None):
+    """
+    Carga ubicaciones, historial de zonas y alertas (solo las columnas que usa el modelo)
+    
+    Args:
+        historial_dir: Directorio del historial de zonas (default: data/raw,
+                       el extraído de Laravel)
+    """
     print("\n📂 Cargando datos de entrenamiento...")
     
     # Ubicaciones
-    ubicaciones_files = list(RAW_DATA_DIR.glob("ubicaciones_raw_*.csv"))
-    if not ubicaciones_files:
-        raise FileNotFoundError("No se encontraron archivos de ubicaciones")
-    
-    latest_ubicaciones = max(ubicaciones_files, key=lambda p: p.stat().st_mtime)
-    print(f"📄 Cargando ubicaciones: {latest_ubicaciones.name}")
-    df_ubicaciones = pd.read_csv(latest_ubicaciones)
+    df_ubicaciones = load_dataset(
+        'ubicaciones', RAW_DATA_DIR, columns=UBICACIONES_COLUMNS,
+        csv_pattern="ubicaciones_raw_*.csv"
+    )
+    if df_ubicaciones is None:
+        raise FileNotFoundError("No se encontraron datos de ubicaciones")
     
     # Historial de zonas (opcional)
-    historial_files = list(RAW_DATA_DIR.glob("historial_zonas_raw_*.csv"))
-    df_historial = None
-    if historial_files:
-        latest_historial = max(historial_files, key=lambda p: p.stat().st_mtime)
-        print(f"📄 Cargando historial zonas: {latest_historial.name}")
-        df_historial = pd.read_csv(latest_historial)
+    df_historial = load_dataset(
+        'historial_zonas', historial_dir or RAW_DATA_DIR, columns=HISTORIAL_COLUMNS,
+        csv_pattern="historial_zonas_raw_*.csv"
+    )
     
     # Alertas (opcional)
-    alertas_files = list(RAW_DATA_DIR.glob("alertas_raw_*.csv"))
-    df_alertas = None
-    if alertas_files:
-        latest_alertas = max(alertas_files, key=lambda p: p.stat().st_mtime)
-        print(f"📄 Cargando alertas: {latest_alertas.name}")
-        df_alertas = pd.read_csv(latest_alertas)
+    df_alertas = load_dataset(
+        'alertas', RAW_DATA_DIR, columns=ALERTAS_COLUMNS,
+        csv_pattern="alertas_raw_*.csv"
+    )
     
     print(f"✅ Datos cargados:")
     print(f"   • Ubicaciones: {len(df_ubicaciones):,}")
@@ -55,14 +66,67 @@ def load_latest_data():
     return df_ubicaciones, df_historial, df_alertas
 
 
-def main():
-    """Función principal"""
+def input_fingerprints(historial_dir=None):
+    """Huellas de los datos que lee load_latest_data (clave de la caché de features)"""
+    return {
+        'ubicaciones': dataset_fingerprint('ubicaciones', RAW_DATA_DIR, csv_pattern="ubicaciones_raw_*.csv"),
+        'historial_zonas': dataset_fingerprint(
+            'historial_zonas', historial_dir or RAW_DATA_DIR, csv_pattern="historial_zonas_raw_*.csv"
+        ),
+        'alertas': dataset_fingerprint('alertas', RAW_DATA_DIR, csv_pattern="alertas_raw_*.csv"),
+    }
+
+
+def build_daily_metrics(classifier, df_ubicaciones, df_historial, df_alertas, fingerprints=None):
+    """
+    Métricas diarias por dispositivo, de la caché de features si ya se
+    calcularon con los mismos datos y el mismo código
+    
+    Args:
+        classifier: BehaviorClassifier
+        df_ubicaciones, df_historial, df_alertas: Datos de load_latest_data
+        fingerprints: Huellas de los datos (input_fingerprints); None = sin caché
+    
+    Returns:
+        DataFrame con métricas agregadas y categorías
+    """
+    df_metrics, _ = cached_features(
+        'behavior_daily_metrics', fingerprints, code_version(behavior_classifier),
+        lambda: (classifier.create_daily_metrics(df_ubicaciones, df_historial, df_alertas), {}),
+        params={'columns': [UBICACIONES_COLUMNS, HISTORIAL_COLUMNS, ALERTAS_COLUMNS]}
+    )
+    
+    return df_metrics
+
+
+def main(historial_dir=None, tune=False, workers=None, n_jobs=None, data=None, fingerprints=None):
+    """
+    Función principal
+    
+    Args:
+        historial_dir: Directorio del historial de zonas (default: data/raw)
+        tune: Elegir los hiperparámetros con validación cruzada (utils/model_search.py)
+        workers: Procesos de la búsqueda (default: TUNING_CONFIG['workers'])
+        n_jobs: Hilos del ajuste final (default: -1, todos los núcleos).
+                scripts/train_pipeline.py reparte los núcleos entre los
+                modelos que entrena a la vez
+        data: Tupla (df_ubicaciones, df_historial, df_alertas) ya cargada
+              (default: se lee de data/raw y historial_dir)
+        fingerprints: Huellas de data (input_fingerprints) para usar la caché
+                      de features con datos ya cargados
+    
+    Returns:
+        dict con la metadata del modelo, o None si no hay datos suficientes
+    """
     print("=" * 70)
     print("🚀 ENTRENAMIENTO DE MODELO DE CLASIFICACIÓN DE COMPORTAMIENTO")
     print("=" * 70)
     
     # 1. Cargar datos
-    df_ubicaciones, df_historial, df_alertas = load_latest_data()
+    if data is None:
+        fingerprints = input_fingerprints(historial_dir)
+        data = load_latest_data(historial_dir)
+    df_ubicaciones, df_historial, df_alertas = data
     
     # 2. Crear instancia del modelo
     classifier = BehaviorClassifier(
@@ -72,7 +136,7 @@ def main():
     )
     
     # 3. Crear métricas diarias
-    df_metrics = classifier.create_daily_metrics(df_ubicaciones, df_historial, df_alertas)
+    df_metrics = build_daily_metrics(classifier, df_ubicaciones, df_historial, df_alertas, fingerprints)
     
     if len(df_metrics) < 10:
         print("⚠️ No hay suficientes observaciones para entrenar el modelo")
@@ -82,24 +146,51 @@ def main():
     # 4. Crear features
     X, y = classifier.create_features(df_metrics)
     
-    # 5. Entrenar modelo
+    # 5. Parámetros: MODEL_PARAMS o los mejores de la búsqueda
+    params = dict(MODEL_PARAMS['behavior'])
+    busqueda = None
+    if tune:
+        try:
+            busqueda = search_model(
+                'behavior', X, y, df_metrics['DispositivoID'], df_metrics['Fecha'], workers=workers,
+                report_path=MODELS_DIR / "metadata" / "behavior_classifier_search.json"
+            )
+            params = busqueda['best_params']
+        except NotEnoughFolds as e:
+            # Pocos datos para validar: se entrena igual, sin búsqueda
+            print(f"⚠️ Búsqueda omitida: {e}")
+            print("   Se entrena con MODEL_PARAMS")
+    classifier.model.set_params(**params)
+    if n_jobs is not None:
+        classifier.model.set_params(n_jobs=n_jobs)
+    
+    # 6. Entrenar modelo
     metrics = classifier.train(X, y, test_size=0.2)
+    if n_jobs is not None:
+        classifier.model.set_params(n_jobs=-1)
     
-    # 6. Guardar modelo
+    # 7. Guardar modelo
     model_path = MODELS_DIR / "trained" / "behavior_classifier.joblib"
     model_path.parent.mkdir(parents=True, exist_ok=True)
     classifier.save(model_path)
+    classifier.save_compact(compact_path(model_path))
     
-    # 7. Guardar metadata
+    # 8. Guardar metadata
     metadata = {
         'model_name': 'behavior_classifier',
         'model_type': 'RandomForestClassifier',
         'version': '1.0.0',
         'trained_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         'n_samples': len(df_metrics),
+        'n_samples_train': len(X) - len(classifier.X_holdout),
+        'n_samples_test': len(classifier.X_holdout),
         'n_features': len(classifier.feature_columns),
         'feature_names': classifier.feature_columns,
         'categories': classifier.categories,
+        'params': params,
+        'cv': None if busqueda is None else {
+            k: busqueda[k] for k in ('metric', 'best_score', 'base_score', 'folds')
+        },
         'metrics': metrics
     }
     
@@ -118,7 +209,29 @@ def main():
     print(f"   • Categorías: {', '.join(classifier.categories)}")
     print(f"\n💾 Modelo guardado en: {model_path}")
     print(f"\n💡 Siguiente paso: Actualizar api/app.py para cargar este modelo")
+    
+    return metadata
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Entrenar el clasificador de comportamiento')
+    parser.add_argument(
+        '--historial-generado',
+        action='store_true',
+        help='Usar el historial de zonas de scripts/generate_zone_events.py (data/processed)'
+    )
+    parser.add_argument(
+        '--tune',
+        action='store_true',
+        help='Elegir hiperparámetros con validación cruzada por dispositivo y tiempo (MODEL_SEARCH_SPACE)'
+    )
+    parser.add_argument('--workers', type=int, default=None, help="Procesos de la búsqueda (default: TUNING_CONFIG['workers'])")
+    
+    args = parser.parse_args()
+    
+    main(
+        historial_dir=PROCESSED_DATA_DIR if args.historial_generado else None,
+        tune=args.tune, workers=args.workers
+    )
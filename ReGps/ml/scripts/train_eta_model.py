@@ -11,36 +11,94 @@ from datetime import datetime
 # Agregar el directorio raíz al path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from models import eta_predictor
 from models.eta_predictor import ETAPredictor
-from config import RAW_DATA_DIR, MODELS_DIR
+from models.compact import compact_path
+from utils.dataset_store import load_dataset, dataset_fingerprint
+from utils.feature_cache import cached_features, code_version
+from utils.model_search import search_model, NotEnoughFolds
+from config import RAW_DATA_DIR, MODELS_DIR, MODEL_PARAMS
 import joblib
 
 
+# Columnas leídas del almacenamiento (proyección: el resto no se carga)
+UBICACIONES_COLUMNS = ['DispositivoID', 'Latitud', 'Longitud', 'Velocidad', 'FechaHora']
+
+
 def load_latest_data():
-    """Carga los archivos CSV más recientes"""
+    """Carga las ubicaciones (solo las columnas que usa el modelo)"""
     print("\n📂 Cargando datos de entrenamiento...")
     
-    ubicaciones_files = list(RAW_DATA_DIR.glob("ubicaciones_raw_*.csv"))
-    if not ubicaciones_files:
-        raise FileNotFoundError("No se encontraron archivos de ubicaciones")
-    
-    latest_ubicaciones = max(ubicaciones_files, key=lambda p: p.stat().st_mtime)
-    print(f"📄 Cargando: {latest_ubicaciones.name}")
-    df_ubicaciones = pd.read_csv(latest_ubicaciones)
+    df_ubicaciones = load_dataset(
+        'ubicaciones', RAW_DATA_DIR, columns=UBICACIONES_COLUMNS,
+        csv_pattern="ubicaciones_raw_*.csv"
+    )
+    if df_ubicaciones is None:
+        raise FileNotFoundError("No se encontraron datos de ubicaciones")
     
     print(f"✅ Cargadas {len(df_ubicaciones):,} ubicaciones")
     
     return df_ubicaciones
 
 
-def main():
-    """Función principal"""
+def input_fingerprints():
+    """Huella de los datos que lee load_latest_data (clave de la caché de features)"""
+    return {'ubicaciones': dataset_fingerprint('ubicaciones', RAW_DATA_DIR, csv_pattern="ubicaciones_raw_*.csv")}
+
+
+def build_features(predictor, df_ubicaciones, fingerprints=None):
+    """
+    Segmentos de ruta y sus features, de la caché de features si ya se
+    calcularon con los mismos datos y el mismo código
+    
+    Args:
+        predictor: ETAPredictor (queda con feature_columns)
+        df_ubicaciones: DataFrame con ubicaciones
+        fingerprints: Huellas de los datos (input_fingerprints); None = sin caché
+    
+    Returns:
+        X (features), y (target) y claves (DispositivoID, FechaHora) de cada segmento
+    """
+    def calcular():
+        df_segments = predictor.create_route_segments(df_ubicaciones)
+        X, y = predictor.create_features(df_segments, df_ubicaciones)
+        bloque = pd.concat([df_segments[['DispositivoID', 'FechaHora']], X, y], axis=1)
+        return bloque, {'feature_columns': predictor.feature_columns}
+    
+    bloque, meta = cached_features(
+        'eta_features', fingerprints, code_version(eta_predictor),
+        calcular, params={'columns': UBICACIONES_COLUMNS}
+    )
+    predictor.feature_columns = meta['feature_columns']
+    
+    return bloque[predictor.feature_columns], bloque['tiempo_viaje_min'], bloque[['DispositivoID', 'FechaHora']]
+
+
+def main(tune=False, workers=None, n_jobs=None, df_ubicaciones=None, fingerprints=None):
+    """
+    Función principal
+    
+    Args:
+        tune: Elegir los hiperparámetros con validación cruzada (utils/model_search.py)
+        workers: Procesos de la búsqueda (default: TUNING_CONFIG['workers'])
+        n_jobs: Hilos del ajuste final (default: -1, todos los núcleos).
+                scripts/train_pipeline.py reparte los núcleos entre los
+                modelos que entrena a la vez
+        df_ubicaciones: Ubicaciones ya cargadas (default: se leen de data/raw)
+        fingerprints: Huellas de df_ubicaciones (input_fingerprints) para usar
+                      la caché de features con datos ya cargados
+    
+    Returns:
+        dict con la metadata del modelo, o None si no hay datos suficientes
+    """
     print("=" * 70)
     print("🚀 ENTRENAMIENTO DE MODELO DE PREDICCIÓN DE ETA")
     print("=" * 70)
     
     # 1. Cargar datos
-    df_ubicaciones = load_latest_data()
+    if df_ubicaciones is None:
+        fingerprints = input_fingerprints()
+        df_ubicaciones = load_latest_data()
     
     # 2. Crear instancia del modelo
     predictor = ETAPredictor(
@@ -49,34 +107,58 @@ def main():
         random_state=42
     )
     
-    # 3. Crear segmentos de ruta
-    df_segments = predictor.create_route_segments(df_ubicaciones)
+    # 3. Crear segmentos de ruta y features
+    X, y, claves = build_features(predictor, df_ubicaciones, fingerprints)
     
-    if len(df_segments) < 10:
+    if len(X) < 10:
         print("⚠️ No hay suficientes segmentos de ruta para entrenar el modelo")
-        print(f"   Se necesitan al menos 10 segmentos, solo se encontraron {len(df_segments)}")
+        print(f"   Se necesitan al menos 10 segmentos, solo se encontraron {len(X)}")
         return
     
-    # 4. Crear features
-    X, y = predictor.create_features(df_segments, df_ubicaciones)
+    # 5. Parámetros: MODEL_PARAMS o los mejores de la búsqueda
+    params = dict(MODEL_PARAMS['eta'])
+    busqueda = None
+    if tune:
+        try:
+            busqueda = search_model(
+                'eta', X, y, claves['DispositivoID'], claves['FechaHora'], workers=workers,
+                report_path=MODELS_DIR / "metadata" / "eta_predictor_search.json"
+            )
+            params = busqueda['best_params']
+        except NotEnoughFolds as e:
+            # Pocos datos para validar: se entrena igual, sin búsqueda
+            print(f"⚠️ Búsqueda omitida: {e}")
+            print("   Se entrena con MODEL_PARAMS")
+    predictor.model.set_params(**params)
+    if n_jobs is not None:
+        predictor.model.set_params(n_jobs=n_jobs)
     
-    # 5. Entrenar modelo
+    # 6. Entrenar modelo
     metrics = predictor.train(X, y, test_size=0.2)
+    if n_jobs is not None:
+        predictor.model.set_params(n_jobs=-1)
     
-    # 6. Guardar modelo
+    # 7. Guardar modelo
     model_path = MODELS_DIR / "trained" / "eta_predictor.joblib"
     model_path.parent.mkdir(parents=True, exist_ok=True)
     predictor.save(model_path)
+    predictor.save_compact(compact_path(model_path))
     
-    # 7. Guardar metadata
+    # 8. Guardar metadata
     metadata = {
         'model_name': 'eta_predictor',
         'model_type': 'RandomForestRegressor',
         'version': '1.0.0',
         'trained_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'n_samples': len(df_segments),
+        'n_samples': len(X),
+        'n_samples_train': len(X) - len(predictor.X_holdout),
+        'n_samples_test': len(predictor.X_holdout),
         'n_features': len(predictor.feature_columns),
         'feature_names': predictor.feature_columns,
+        'params': params,
+        'cv': None if busqueda is None else {
+            k: busqueda[k] for k in ('metric', 'best_score', 'base_score', 'folds')
+        },
         'metrics': metrics
     }
     
@@ -96,7 +178,21 @@ def main():
     print(f"   • R² Score: {metrics['r2_score']:.4f}")
     print(f"\n💾 Modelo guardado en: {model_path}")
     print(f"\n💡 Siguiente paso: Actualizar api/app.py para cargar este modelo")
+    
+    return metadata
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Entrenar el modelo de predicción de ETA')
+    parser.add_argument(
+        '--tune',
+        action='store_true',
+        help='Elegir hiperparámetros con validación cruzada por dispositivo y tiempo (MODEL_SEARCH_SPACE)'
+    )
+    parser.add_argument('--workers', type=int, default=None, help="Procesos de la búsqueda (default: TUNING_CONFIG['workers'])")
+    
+    args = parser.parse_args()
+    
+    main(tune=args.tune, workers=args.workers)
@@ -0,0 +1,408 @@
+"""
+Pipeline de entrenamiento completo como DAG (utils/pipeline.py)
+
+    extract → preprocess → features
+    datos crudos → train_eta, train_anomaly, train_behavior → evaluate
+
+El entrenamiento de los modelos lee las ubicaciones crudas (no las
+procesadas), así que preprocess/features no son dependencias de train_*:
+un cambio en feature_engineering.py no reentrena los modelos.
+
+- Cada etapa tiene una clave calculada del código que ejecuta, sus
+  parámetros y la huella de los datasets que lee. Las etapas sin cambios
+  (misma clave y salidas intactas) se omiten.
+- Cada dataset crudo se lee una sola vez, con la unión de las columnas que
+  necesitan las etapas que se ejecutan, y se reparte en memoria.
+- Los tres entrenamientos corren a la vez y se reparten los núcleos
+  (n_jobs del ajuste final y procesos de la búsqueda con --tune).
+- evaluate usa la metadata que devuelven los entrenamientos (o la guardada
+  si un modelo no cambió), sin volver a leer datos.
+
+La extracción necesita la base de datos y es opcional (--extract): se hace
+antes de planificar, para que las claves vean los datos nuevos.
+
+Uso:
+    python scripts/train_pipeline.py                      # solo lo que cambió
+    python scripts/train_pipeline.py --extract --tune     # reentrenamiento nocturno
+    python scripts/train_pipeline.py --stages train_eta   # una etapa (y lo que necesite)
+    python scripts/train_pipeline.py --force              # todo de nuevo
+"""
+
+import sys
+import os
+import threading
+import time
+from pathlib import Path
+
+import sklearn
+
+# Agregar el directorio raíz al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import (
+    RAW_DATA_DIR, PROCESSED_DATA_DIR, CACHE_DIR, MODELS_DIR,
+    MODEL_PARAMS, MODEL_SEARCH_SPACE, TUNING_CONFIG, FEATURE_CONFIG,
+)
+from models.compact import compact_path
+from utils.dataset_store import load_dataset, dataset_fingerprint
+from utils.pipeline import Stage, run_dag, topological_order
+from scripts import preprocess, feature_engineering, evaluate_models
+from scripts import train_eta_model, train_anomaly_model, train_behavior_classifier
+
+
+ML_DIR = Path(__file__).parent.parent
+STATE_PATH = CACHE_DIR / "pipeline" / "state.json"
+
+# Datasets crudos: patrón CSV heredado de cada uno
+DATASETS = {
+    'ubicaciones': "ubicaciones_raw_*.csv",
+    'historial_zonas': "historial_zonas_raw_*.csv",
+    'alertas': "alertas_raw_*.csv",
+}
+
+# Etapas de entrenamiento: (clave en MODEL_PARAMS, archivo del modelo, script, módulo del wrapper)
+MODELOS = {
+    'train_eta': ('eta', 'eta_predictor', train_eta_model, 'models/eta_predictor.py'),
+    'train_anomaly': ('anomaly', 'anomaly_detector', train_anomaly_model, 'models/anomaly_detector.py'),
+    'train_behavior': ('behavior', 'behavior_classifier', train_behavior_classifier, 'models/behavior_classifier.py'),
+}
+
+
+class SharedData:
+    """
+    Datasets crudos leídos una vez y compartidos entre etapas
+    
+    Antes de ejecutar, plan() fija las columnas a leer de cada dataset (la
+    unión de lo que piden las etapas pendientes). get() lee el dataset la
+    primera vez (las demás etapas que lo piden a la vez esperan) y devuelve
+    una copia superficial: con copy-on-write las etapas no se pisan.
+    """
+    
+    def __init__(self, historial_dir=None):
+        """
+        Args:
+            historial_dir: Directorio del historial de zonas (default: data/raw)
+        """
+        self.dirs = {name: RAW_DATA_DIR for name in DATASETS}
+        self.dirs['historial_zonas'] = Path(historial_dir or RAW_DATA_DIR)
+        self.columns = {}
+        self.frames = {}
+        self.fingerprints = {}
+        self.locks = {name: threading.Lock() for name in DATASETS}
+    
+    def fingerprint(self, name):
+        """Huella del dataset (ver dataset_fingerprint)"""
+        return dataset_fingerprint(name, self.dirs[name], csv_pattern=DATASETS[name])
+    
+    def plan(self, pendientes):
+        """Columnas a leer según las etapas que se van a ejecutar"""
+        pedidas = {name: set() for name in DATASETS}
+        for stage in pendientes:
+            if stage == 'preprocess':
+                pedidas['ubicaciones'] = None  # todas las columnas
+            elif stage in MODELOS and pedidas['ubicaciones'] is not None:
+                pedidas['ubicaciones'].update(MODELOS[stage][2].UBICACIONES_COLUMNS)
+        if 'train_behavior' in pendientes:
+            pedidas['historial_zonas'].update(train_behavior_classifier.HISTORIAL_COLUMNS)
+            pedidas['alertas'].update(train_behavior_classifier.ALERTAS_COLUMNS)
+        
+        self.columns = {name: None if cols is None else sorted(cols) for name, cols in pedidas.items()}
+    
+    def get(self, name, columns=None):
+        """
+        Dataset en memoria (se lee la primera vez)
+        
+        Args:
+            name: Nombre del dataset
+            columns: Columnas a devolver, en este orden (default: todas las leídas)
+        
+        Returns:
+            DataFrame, o None si el dataset no existe
+        """
+        with self.locks[name]:
+            if name not in self.frames:
+                inicio = time.perf_counter()
+                # Huella de lo que se lee: clave de la caché de features de los entrenamientos
+                self.fingerprints[name] = self.fingerprint(name)
+                df = load_dataset(
+                    name, self.dirs[name], columns=self.columns.get(name),
+                    csv_pattern=DATASETS[name]
+                )
+                self.frames[name] = df
+                if df is not None:
+                    print(f"📂 {name}: {len(df):,} filas leídas una vez en {time.perf_counter() - inicio:.1f}s")
+        
+        df = self.frames[name]
+        if df is None:
+            return None
+        return df[columns] if columns else df.copy(deep=False)
+
+
+def run_preprocess(data):
+    """Etapa preprocess: limpia las ubicaciones crudas y las guarda en data/processed"""
+    df_raw = data.get('ubicaciones')
+    if df_raw is None:
+        raise FileNotFoundError("No se encontraron ubicaciones en data/raw/")
+    
+    df_processed = preprocess.add_basic_features(preprocess.clean_ubicaciones(df_raw))
+    preprocess.save_processed_data(df_processed)
+    preprocess.generate_summary_stats(df_processed)
+    
+    return df_processed
+
+
+def run_features(df_processed):
+    """
+    Etapa features: features de trayectoria sobre las ubicaciones procesadas
+    
+    Args:
+        df_processed: Salida de preprocess, o None si se omitió (se lee de data/processed)
+    """
+    # La caché de features se usa solo con lo leído de data/processed: el
+    # DataFrame en memoria de preprocess puede diferir en tipos de lo guardado
+    fingerprints = None
+    df = df_processed
+    if df is None:
+        fingerprints = feature_engineering.processed_fingerprints()
+        df = feature_engineering.load_processed_data()
+    if df is None:
+        raise FileNotFoundError("No se encontraron datos procesados en data/processed/")
+    
+    df = feature_engineering.compute_features(df, fingerprints)
+    feature_engineering.save_engineered_features(df)
+    
+    return len(df)
+
+
+def split_cores(n_modelos, workers=None):
+    """
+    Reparte los núcleos (o los procesos de búsqueda) entre los modelos que
+    se entrenan a la vez
+    
+    Returns:
+        Tupla (n_jobs, workers) por modelo
+    """
+    n = max(n_modelos, 1)
+    n_jobs = max(1, (os.cpu_count() or 1) // n)
+    return n_jobs, max(1, (workers or TUNING_CONFIG['workers']) // n)
+
+
+def build_stages(data, tune=False, workers=None):
+    """
+    Etapas del pipeline
+    
+    Args:
+        data: SharedData
+        tune: Buscar hiperparámetros en cada entrenamiento
+        workers: Procesos de búsqueda en total (se reparten entre modelos)
+    
+    Returns:
+        Tupla (lista de Stage, on_plan para run_dag)
+    """
+    code = lambda *paths: [ML_DIR / p for p in paths]
+    
+    stages = [
+        Stage(
+            'preprocess', lambda deps: run_preprocess(data),
+            code=code('scripts/preprocess.py', 'utils/dataset_store.py'),
+            params={'feature_config': FEATURE_CONFIG},
+            inputs=lambda: {'ubicaciones': data.fingerprint('ubicaciones')},
+            outputs=[PROCESSED_DATA_DIR / 'ubicaciones'],
+        ),
+        Stage(
+            'features', lambda deps: run_features(deps['preprocess']),
+            deps=['preprocess'],
+            code=code(
+                'scripts/feature_engineering.py', 'utils/trajectory_utils.py', 'utils/geo_arrays.py',
+                'utils/geo_utils.py', 'utils/dataset_store.py', 'utils/feature_cache.py'
+            ),
+            params={'stat_windows': feature_engineering.STAT_WINDOWS, 'feature_config': FEATURE_CONFIG},
+            outputs=[PROCESSED_DATA_DIR / 'features'],
+        ),
+    ]
+    
+    # Cuántos modelos se entrenan a la vez se conoce recién con el plan
+    reparto = {}
+    
+    def entrenar(stage_name):
+        script = MODELOS[stage_name][2]
+        n_jobs, tune_workers = reparto.get('cores', (None, workers))
+        kwargs = dict(tune=tune, workers=tune_workers, n_jobs=n_jobs)
+        
+        if stage_name == 'train_behavior':
+            datos = (
+                data.get('ubicaciones', script.UBICACIONES_COLUMNS),
+                data.get('historial_zonas', script.HISTORIAL_COLUMNS),
+                data.get('alertas', script.ALERTAS_COLUMNS),
+            )
+            return script.main(
+                historial_dir=data.dirs['historial_zonas'], data=datos,
+                fingerprints=dict(data.fingerprints), **kwargs
+            )
+        
+        df_ubicaciones = data.get('ubicaciones', script.UBICACIONES_COLUMNS)
+        if df_ubicaciones is None:
+            raise FileNotFoundError("No se encontraron datos de ubicaciones")
+        return script.main(
+            df_ubicaciones=df_ubicaciones, fingerprints={'ubicaciones': data.fingerprints['ubicaciones']}, **kwargs
+        )
+    
+    for stage_name, (clave, nombre, script, modulo) in MODELOS.items():
+        model_path = MODELS_DIR / "trained" / f"{nombre}.joblib"
+        outputs = [model_path, compact_path(model_path), MODELS_DIR / "metadata" / f"{nombre}_metadata.joblib"]
+        archivos = [f'scripts/{Path(script.__file__).name}', modulo, 'models/compact.py', 'models/tree_engine.py',
+                    'utils/geo_arrays.py', 'utils/geo_utils.py', 'utils/trajectory_utils.py', 'utils/metrics.py',
+                    'utils/dataset_store.py', 'utils/feature_cache.py']
+        params = {'model_params': MODEL_PARAMS[clave], 'sklearn': sklearn.__version__, 'tune': tune}
+        if tune:
+            archivos.append('utils/model_search.py')
+            params['search_space'] = MODEL_SEARCH_SPACE[clave]
+            params['max_candidates'] = TUNING_CONFIG['max_candidates']
+            outputs.append(MODELS_DIR / "metadata" / f"{nombre}_search.json")
+        
+        datasets = ['ubicaciones', 'historial_zonas', 'alertas'] if stage_name == 'train_behavior' else ['ubicaciones']
+        stages.append(Stage(
+            stage_name, lambda deps, s=stage_name: entrenar(s),
+            code=code(*archivos), params=params,
+            inputs=lambda ds=datasets: {name: data.fingerprint(name) for name in ds},
+            outputs=outputs,
+        ))
+    
+    def evaluar(deps):
+        metas = {}
+        for stage_name, (_, nombre, _, _) in MODELOS.items():
+            # Modelo omitido: su metadata guardada
+            meta = deps[stage_name]
+            metas[nombre] = meta if meta is not None else evaluate_models.load_model(nombre)[1]
+        
+        eta_meta = evaluate_models.evaluate_eta_predictor(metas['eta_predictor'])
+        anomaly_meta = evaluate_models.evaluate_anomaly_detector(metas['anomaly_detector'])
+        behavior_meta = evaluate_models.evaluate_behavior_classifier(metas['behavior_classifier'])
+        if not any([eta_meta, anomaly_meta, behavior_meta]):
+            raise FileNotFoundError("No hay modelos entrenados para evaluar")
+        
+        report = evaluate_models.generate_evaluation_report(eta_meta, anomaly_meta, behavior_meta)
+        evaluate_models.print_summary(report)
+        return report
+    
+    stages.append(Stage(
+        'evaluate', evaluar, deps=list(MODELOS),
+        code=code('scripts/evaluate_models.py'),
+        outputs=[MODELS_DIR / "metadata" / "evaluation_report.json"],
+    ))
+    
+    def on_plan(pendientes):
+        data.plan(pendientes)
+        reparto['cores'] = split_cores(len(pendientes & set(MODELOS)), workers)
+    
+    return stages, on_plan
+
+
+def select_stages(stages, nombres):
+    """Etapas pedidas y todas las que necesitan (sus ancestros)"""
+    por_nombre = {s.name: s for s in stages}
+    desconocidas = set(nombres) - set(por_nombre)
+    if desconocidas:
+        raise ValueError(f"Etapas desconocidas: {sorted(desconocidas)} (disponibles: {list(por_nombre)})")
+    
+    elegidas = set()
+    pendientes = list(nombres)
+    while pendientes:
+        nombre = pendientes.pop()
+        if nombre not in elegidas:
+            elegidas.add(nombre)
+            pendientes.extend(por_nombre[nombre].deps)
+    return [s for s in topological_order(stages) if s.name in elegidas]
+
+
+def print_report(resultados, segundos):
+    """Tabla final: estado y tiempo de cada etapa"""
+    print("\n" + "=" * 70)
+    print("📊 RESUMEN DEL PIPELINE")
+    print("=" * 70)
+    
+    iconos = {'ejecutada': '✅', 'omitida': '⏭️', 'fallida': '❌', 'cancelada': '🚫'}
+    for nombre, r in resultados.items():
+        print(f"   {iconos[r['estado']]} {nombre:<16} {r['estado']:<10} {r['segundos']:>8.1f}s")
+    
+    ejecutadas = sum(r['estado'] == 'ejecutada' for r in resultados.values())
+    omitidas = sum(r['estado'] == 'omitida' for r in resultados.values())
+    print(f"\n⏱️ Total: {segundos:.1f}s ({ejecutadas} ejecutadas, {omitidas} sin cambios)")
+
+
+def train_pipeline(stages=None, extract=False, tune=False, workers=None, force=False,
+                   historial_dir=None, state_path=None):
+    """
+    Ejecuta el pipeline de entrenamiento
+    
+    Args:
+        stages: Nombres de las etapas a ejecutar, con sus dependencias (default: todas)
+        extract: Extraer datos nuevos de la base antes de planificar
+        tune: Buscar hiperparámetros (utils/model_search.py) en cada entrenamiento
+        workers: Procesos de búsqueda en total, repartidos entre los modelos
+        force: Ejecutar todas las etapas aunque no hayan cambiado
+        historial_dir: Directorio del historial de zonas (default: data/raw)
+        state_path: JSON de estado (default: data/cache/pipeline/state.json)
+    
+    Returns:
+        dict nombre -> resultado de la etapa (ver run_dag), o None si falló la extracción
+    """
+    print("=" * 70)
+    print("🚀 PIPELINE DE ENTRENAMIENTO - ReGPS")
+    print("=" * 70)
+    inicio = time.perf_counter()
+    
+    if extract:
+        # Solo aquí hace falta el conector de la base (pymysql)
+        from scripts.extract_data import extract_all_data
+        if not extract_all_data():
+            print("❌ La extracción falló: no se entrena con datos incompletos")
+            return None
+    
+    data = SharedData(historial_dir)
+    todas, on_plan = build_stages(data, tune=tune, workers=workers)
+    elegidas = select_stages(todas, stages) if stages else todas
+    
+    resultados = run_dag(elegidas, state_path or STATE_PATH, force=force, on_plan=on_plan)
+    
+    print_report(resultados, time.perf_counter() - inicio)
+    return resultados
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Pipeline de entrenamiento de los modelos (solo etapas que cambiaron)')
+    parser.add_argument('--extract', action='store_true', help='Extraer datos nuevos de la base antes (incremental)')
+    parser.add_argument(
+        '--tune',
+        action='store_true',
+        help='Elegir hiperparámetros con validación cruzada por dispositivo y tiempo (MODEL_SEARCH_SPACE)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help="Procesos de búsqueda en total, repartidos entre modelos (default: TUNING_CONFIG['workers'])"
+    )
+    parser.add_argument('--force', action='store_true', help='Ejecutar todas las etapas aunque no hayan cambiado')
+    parser.add_argument(
+        '--stages',
+        nargs='+',
+        default=None,
+        help='Etapas a ejecutar, con sus dependencias (preprocess, features, train_eta, train_anomaly, train_behavior, evaluate)'
+    )
+    parser.add_argument(
+        '--historial-generado',
+        action='store_true',
+        help='Usar el historial de zonas de scripts/generate_zone_events.py (data/processed)'
+    )
+    
+    args = parser.parse_args()
+    
+    resultados = train_pipeline(
+        stages=args.stages, extract=args.extract, tune=args.tune, workers=args.workers,
+        force=args.force, historial_dir=PROCESSED_DATA_DIR if args.historial_generado else None
+    )
+    if resultados is None or any(r['estado'] in ('fallida', 'cancelada') for r in resultados.values()):
+        sys.exit(1)
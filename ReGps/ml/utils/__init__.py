@@ -3,21 +3,27 @@ Paquete de utilidades ML
 """
 
 from .db_connector import DatabaseConnector
+from . import geo_arrays
 from .geo_utils import (
     calculate_distance,
     calculate_bearing,
     calculate_speed,
     calculate_acceleration,
     is_point_in_circle,
-    haversine_distance_batch
+    haversine_distance_batch,
+    geodesic_distance_batch,
+    bearing_batch
 )
 
 __all__ = [
     'DatabaseConnector',
+    'geo_arrays',
     'calculate_distance',
     'calculate_bearing',
     'calculate_speed',
     'calculate_acceleration',
     'is_point_in_circle',
-    'haversine_distance_batch'
+    'haversine_distance_batch',
+    'geodesic_distance_batch',
+    'bearing_batch'
 ]
@@ -0,0 +1,701 @@
+"""
+Almacenamiento columnar de los datos del pipeline (Parquet + Arrow)
+
+Cada dataset vive en un directorio propio bajo data/raw o data/processed.
+Los datasets con fecha y dispositivo se particionan estilo Hive:
+
+    data/raw/ubicaciones/fecha=2025-01-15/bucket=3/part-<id>-0.parquet
+
+- fecha: día del timestamp (FechaHora / FechaHoraEvento)
+- bucket: DispositivoID % DATASET_CONFIG['device_buckets']
+
+Así una consulta por rango de fechas o por un subconjunto de dispositivos
+solo abre los directorios que le corresponden (poda de particiones), y el
+resto del filtro se resuelve con las estadísticas de cada row group.
+Las columnas se leen ya tipadas: no hay que volver a parsear fechas ni
+números desde texto en cada etapa.
+
+Uso:
+    from utils.dataset_store import write_dataset, read_dataset
+    write_dataset(df, 'ubicaciones')
+    df = read_dataset('ubicaciones', columns=['DispositivoID', 'FechaHora'],
+                      start='2025-01-01', dispositivos=[3, 7])
+"""
+
+import sys
+import json
+import hashlib
+import shutil
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import RAW_DATA_DIR, DATASET_CONFIG
+
+
+# Esquemas tipados de las tablas extraídas de Laravel.
+# Direccion es texto en la BD, pero el pipeline la usa como rumbo en
+# grados: se guarda como número (los valores no numéricos quedan nulos).
+SCHEMAS = {
+    'ubicaciones': pa.schema([
+        ('UbicacionID', pa.int64()),
+        ('DispositivoID', pa.int64()),
+        ('Latitud', pa.float64()),
+        ('Longitud', pa.float64()),
+        ('Velocidad', pa.float64()),
+        ('Direccion', pa.float64()),
+        ('FechaHora', pa.timestamp('us')),
+        ('IMEI', pa.string()),
+        ('Modelo', pa.string()),
+        ('EmpleadoNombre', pa.string()),
+    ]),
+    'dispositivos': pa.schema([
+        ('DispositivoID', pa.int64()),
+        ('IMEI', pa.string()),
+        ('Modelo', pa.string()),
+        ('Estado', pa.string()),
+        ('EmpleadoID', pa.int64()),
+        ('EmpleadoNombre', pa.string()),
+        ('EmpleadoApellido', pa.string()),
+    ]),
+    'zonas': pa.schema([
+        ('ZonaID', pa.int64()),
+        ('Nombre', pa.string()),
+        ('TipoZona', pa.string()),
+        ('TipoGeometria', pa.string()),
+        ('Latitud', pa.float64()),
+        ('Longitud', pa.float64()),
+        ('Radio', pa.float64()),  # metros
+        ('Coordenadas', pa.string()),  # JSON del polígono
+        ('HorarioInicio', pa.string()),  # HH:MM:SS
+        ('HorarioFin', pa.string()),
+        ('Estado', pa.string()),
+    ]),
+    'historial_zonas': pa.schema([
+        ('HistorialID', pa.int64()),
+        ('ZonaID', pa.int64()),
+        ('EmpleadoID', pa.int64()),
+        ('DispositivoID', pa.int64()),
+        ('TipoEvento', pa.string()),
+        ('FechaHoraEvento', pa.timestamp('us')),
+        ('Latitud', pa.float64()),
+        ('Longitud', pa.float64()),
+        ('TiempoPermanencia', pa.float64()),  # minutos
+        ('AlertaGenerada', pa.bool_()),
+        ('TipoZona', pa.string()),
+    ]),
+    'alertas': pa.schema([
+        ('AlertaID', pa.int64()),
+        ('DispositivoID', pa.int64()),
+        ('TipoAlerta', pa.string()),
+        ('Prioridad', pa.string()),
+        ('Descripcion', pa.string()),
+        ('FechaHora', pa.timestamp('us')),
+        ('Estado', pa.string()),
+    ]),
+}
+
+# Columna de tiempo por dataset (define la partición por fecha).
+# Los datasets derivados (procesados, features) usan FechaHora.
+TIME_COLUMNS = {
+    'ubicaciones': 'FechaHora',
+    'historial_zonas': 'FechaHoraEvento',
+    'alertas': 'FechaHora',
+}
+
+# Clave primaria por dataset (para eliminar duplicados al compactar)
+KEY_COLUMNS = {
+    'ubicaciones': 'UbicacionID',
+    'historial_zonas': 'HistorialID',
+    'alertas': 'AlertaID',
+}
+
+PARTITION_COLUMNS = ['fecha', 'bucket']
+
+PARTITIONING = ds.partitioning(
+    pa.schema([('fecha', pa.date32()), ('bucket', pa.int32())]),
+    flavor='hive'
+)
+
+WRITE_MODES = ('overwrite', 'replace_partitions', 'append')
+
+# Archivos auxiliares dentro del directorio del dataset. El prefijo "_"
+# hace que los lectores de pyarrow.dataset los ignoren.
+WATERMARK_FILE = '_watermark.json'
+
+
+def dataset_path(name, base_dir=None):
+    """Directorio de un dataset"""
+    return Path(base_dir or RAW_DATA_DIR) / name
+
+
+def dataset_exists(name, base_dir=None):
+    """True si el dataset tiene al menos un archivo Parquet"""
+    path = dataset_path(name, base_dir)
+    return path.is_dir() and any(path.rglob('*.parquet'))
+
+
+def device_bucket(dispositivos, n_buckets=None):
+    """
+    Bucket de partición de cada dispositivo
+    
+    Args:
+        dispositivos: DispositivoID (escalar o array)
+        n_buckets: Número de buckets (default: DATASET_CONFIG['device_buckets'])
+    
+    Returns:
+        numpy.ndarray[int32] (o int si la entrada es escalar)
+    """
+    n_buckets = n_buckets or DATASET_CONFIG['device_buckets']
+    buckets = np.asarray(dispositivos, dtype=np.int64) % n_buckets
+    return buckets.astype(np.int32) if buckets.ndim else int(buckets)
+
+
+def _time_column(name, columns):
+    """Columna de tiempo usada para particionar (None si no aplica)"""
+    col = TIME_COLUMNS.get(name, 'FechaHora')
+    if col in columns and 'DispositivoID' in columns:
+        return col
+    return None
+
+
+def _as_text(col):
+    """Texto nullable; los TIME de MySQL (timedelta) se formatean HH:MM:SS"""
+    if pd.api.types.is_timedelta64_dtype(col):
+        segundos = col.dt.total_seconds()
+        texto = (
+            (segundos // 3600).astype('Int64').astype('string').str.zfill(2) + ':' +
+            (segundos % 3600 // 60).astype('Int64').astype('string').str.zfill(2) + ':' +
+            (segundos % 60).astype('Int64').astype('string').str.zfill(2)
+        )
+        return texto
+    return col.astype('string')
+
+
+def to_arrow_table(df, name):
+    """
+    Convierte un DataFrame a tabla Arrow aplicando el esquema del dataset
+    
+    Las columnas del esquema se convierten a su tipo (los Decimal de
+    pymysql a float, textos a fechas, etc.). Las columnas que no están en
+    el esquema se conservan con el tipo inferido por Arrow.
+    
+    Args:
+        df: DataFrame a guardar
+        name: Nombre del dataset
+    
+    Returns:
+        pyarrow.Table
+    """
+    schema = SCHEMAS.get(name)
+    if schema is None:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    
+    data = {}
+    for col in df.columns:
+        if col not in schema.names:
+            data[col] = df[col]
+            continue
+        
+        tipo = schema.field(col).type
+        valores = df[col]
+        
+        if pa.types.is_timestamp(tipo):
+            valores = pd.to_datetime(valores).astype('datetime64[us]')
+        elif pa.types.is_floating(tipo):
+            valores = pd.to_numeric(valores, errors='coerce').astype(float)
+        elif pa.types.is_integer(tipo):
+            valores = pd.to_numeric(valores, errors='coerce').astype('Int64')
+        elif pa.types.is_boolean(tipo):
+            valores = valores.astype('boolean')
+        else:
+            valores = _as_text(valores)
+        
+        data[col] = valores
+    
+    df_tipado = pd.DataFrame(data, index=df.index)
+    fields = [
+        schema.field(col) if col in schema.names else None
+        for col in df_tipado.columns
+    ]
+    table = pa.Table.from_pandas(df_tipado, preserve_index=False)
+    
+    return table.cast(pa.schema([
+        f if f is not None else table.schema.field(i)
+        for i, f in enumerate(fields)
+    ]))
+
+
+def write_dataset(df, name, base_dir=None, mode='overwrite'):
+    """
+    Guarda un DataFrame como dataset Parquet
+    
+    Args:
+        df: DataFrame a guardar
+        name: Nombre del dataset ('ubicaciones', 'zonas', 'features', ...)
+        base_dir: Directorio base (default: data/raw)
+        mode: 'overwrite' (reemplaza el dataset completo),
+              'replace_partitions' (reemplaza solo las particiones escritas)
+              o 'append' (agrega archivos nuevos)
+    
+    Returns:
+        Path del dataset
+    """
+    if mode not in WRITE_MODES:
+        raise ValueError(f"Modo de escritura no soportado: {mode}. Opciones: {list(WRITE_MODES)}")
+    
+    path = dataset_path(name, base_dir)
+    if mode == 'overwrite' and path.exists():
+        shutil.rmtree(path)
+    path.mkdir(parents=True, exist_ok=True)
+    
+    table = to_arrow_table(df, name)
+    time_col = _time_column(name, table.column_names)
+    basename = f"part-{uuid.uuid4().hex[:12]}-{{i}}.parquet"
+    
+    if time_col is None:
+        # Tablas pequeñas sin fecha (zonas, dispositivos): un solo archivo
+        if mode != 'append':
+            for old in path.glob('*.parquet'):
+                old.unlink()
+        pq.write_table(table, path / basename.format(i=0), compression=DATASET_CONFIG['compression'])
+        return path
+    
+    fechas = table[time_col].cast(pa.date32())
+    buckets = pa.array(device_bucket(table['DispositivoID'].to_numpy(zero_copy_only=False)))
+    table = table.append_column('fecha', fechas).append_column('bucket', buckets)
+    
+    # Ordenar por partición, dispositivo y tiempo: cada archivo se escribe de
+    # una vez en row groups grandes, las series por dispositivo comprimen
+    # mejor y las estadísticas de DispositivoID permiten saltar row groups
+    table = table.sort_by([
+        ('fecha', 'ascending'), ('bucket', 'ascending'),
+        ('DispositivoID', 'ascending'), (time_col, 'ascending'),
+    ])
+    
+    ds.write_dataset(
+        table,
+        path,
+        format='parquet',
+        partitioning=PARTITIONING,
+        basename_template=basename,
+        existing_data_behavior='delete_matching' if mode == 'replace_partitions' else 'overwrite_or_ignore',
+        file_options=ds.ParquetFileFormat().make_write_options(compression=DATASET_CONFIG['compression']),
+        min_rows_per_group=DATASET_CONFIG['row_group_size'],
+        max_rows_per_group=DATASET_CONFIG['row_group_size'],
+    )
+    
+    return path
+
+
+def delete_partitions(name, start=None, end=None, base_dir=None):
+    """
+    Borra las particiones de fecha de un rango (ambos extremos incluidos)
+    
+    Se usa antes de reescribir un rango por bloques con mode='append': con
+    'replace_partitions' cada bloque borraría lo escrito por el anterior.
+    
+    Args:
+        name: Nombre del dataset
+        start: Primera fecha a borrar (None = desde el principio)
+        end: Última fecha a borrar (None = hasta el final)
+        base_dir: Directorio base (default: data/raw)
+    
+    Returns:
+        int: Número de días borrados
+    """
+    start = pd.Timestamp(start).date() if start is not None else None
+    end = pd.Timestamp(end).date() if end is not None else None
+    
+    borrados = 0
+    for directorio in dataset_path(name, base_dir).glob('fecha=*'):
+        fecha = pd.Timestamp(directorio.name.split('=', 1)[1]).date()
+        if (start is None or fecha >= start) and (end is None or fecha <= end):
+            shutil.rmtree(directorio)
+            borrados += 1
+    
+    return borrados
+
+
+def open_dataset(name, base_dir=None):
+    """
+    Abre un dataset Parquet sin leerlo
+    
+    Returns:
+        pyarrow.dataset.Dataset, o None si no existe
+    """
+    if not dataset_exists(name, base_dir):
+        return None
+    return ds.dataset(dataset_path(name, base_dir), format='parquet', partitioning=PARTITIONING)
+
+
+def build_filter(dataset, name, start=None, end=None, dispositivos=None, buckets=None):
+    """
+    Expresión de filtro para un rango [start, end), un conjunto de dispositivos
+    y/o un conjunto de buckets
+    
+    Combina filtros sobre las columnas de partición (descartan directorios
+    completos) con filtros sobre las columnas reales (descartan row groups
+    por sus estadísticas y filas sobrantes).
+    
+    Returns:
+        pyarrow.dataset.Expression, o None si no hay filtros
+    """
+    names = dataset.schema.names
+    time_col = _time_column(name, names)
+    particionado = 'fecha' in names
+    condiciones = []
+    
+    if start is not None and time_col:
+        start = pd.Timestamp(start)
+        condiciones.append(ds.field(time_col) >= start.to_pydatetime())
+        if particionado:
+            condiciones.append(ds.field('fecha') >= start.date())
+    
+    if end is not None and time_col:
+        end = pd.Timestamp(end)
+        condiciones.append(ds.field(time_col) < end.to_pydatetime())
+        if particionado:
+            condiciones.append(ds.field('fecha') <= end.date())
+    
+    if dispositivos is not None:
+        dispositivos = [int(d) for d in np.atleast_1d(dispositivos)]
+        condiciones.append(ds.field('DispositivoID').isin(dispositivos))
+        if particionado:
+            condiciones.append(ds.field('bucket').isin(sorted(set(device_bucket(dispositivos).tolist()))))
+    
+    if buckets is not None and particionado:
+        condiciones.append(ds.field('bucket').isin([int(b) for b in np.atleast_1d(buckets)]))
+    
+    if not condiciones:
+        return None
+    
+    filtro = condiciones[0]
+    for condicion in condiciones[1:]:
+        filtro = filtro & condicion
+    
+    return filtro
+
+
+def read_dataset(name, base_dir=None, columns=None, start=None, end=None, dispositivos=None,
+                 buckets=None):
+    """
+    Lee un dataset con proyección de columnas y filtros empujados al lector
+    
+    Args:
+        name: Nombre del dataset
+        base_dir: Directorio base (default: data/raw)
+        columns: Columnas a leer (None = todas menos las de partición)
+        start: Inicio del rango de fechas (incluido)
+        end: Fin del rango de fechas (excluido)
+        dispositivos: Lista de DispositivoID a leer
+        buckets: Buckets de dispositivo a leer (todos sus dispositivos)
+    
+    Returns:
+        DataFrame, o None si el dataset no existe
+    """
+    dataset = open_dataset(name, base_dir)
+    if dataset is None:
+        return None
+    
+    if columns is None:
+        columns = [c for c in dataset.schema.names if c not in PARTITION_COLUMNS]
+    
+    filtro = build_filter(dataset, name, start, end, dispositivos, buckets)
+    table = dataset.to_table(columns=list(columns), filter=filtro)
+    
+    return table.to_pandas()
+
+
+def read_watermark(name, base_dir=None):
+    """
+    Marca de agua (último registro extraído) de un dataset
+    
+    Returns:
+        dict guardado con write_watermark, o None si no hay
+    """
+    path = dataset_path(name, base_dir) / WATERMARK_FILE
+    if not path.exists():
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_watermark(name, watermark, base_dir=None):
+    """
+    Guarda la marca de agua de un dataset (escritura atómica)
+    
+    Args:
+        name: Nombre del dataset
+        watermark: dict serializable a JSON (p. ej. {'UbicacionID': 123, 'FechaHora': '...'})
+    """
+    path = dataset_path(name, base_dir)
+    path.mkdir(parents=True, exist_ok=True)
+    tmp = path / f"{WATERMARK_FILE}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(watermark, f, indent=2, default=str)
+    tmp.replace(path / WATERMARK_FILE)
+
+
+def write_partition(df, name, fecha, bucket, base_dir=None):
+    """
+    Reemplaza una partición (fecha, bucket) por un único archivo ordenado
+    
+    Las filas deben pertenecer a esa partición. El archivo nuevo se publica
+    antes de borrar los anteriores: una lectura concurrente puede ver
+    duplicados, pero nunca huecos. Un DataFrame vacío deja la partición vacía.
+    
+    Args:
+        df: Filas de la partición
+        name: Nombre del dataset
+        fecha: Día de la partición (date o 'YYYY-MM-DD')
+        bucket: Bucket de dispositivo
+        base_dir: Directorio base (default: data/raw)
+    
+    Returns:
+        Path del archivo escrito, o None si la partición quedó vacía
+    """
+    fecha = pd.Timestamp(fecha).date()
+    directorio = dataset_path(name, base_dir) / f"fecha={fecha.isoformat()}" / f"bucket={int(bucket)}"
+    directorio.mkdir(parents=True, exist_ok=True)
+    anteriores = list(directorio.glob('*.parquet'))
+    
+    destino = None
+    if len(df) > 0:
+        table = to_arrow_table(df, name)
+        time_col = _time_column(name, table.column_names)
+        if time_col is not None:
+            table = table.sort_by([('DispositivoID', 'ascending'), (time_col, 'ascending')])
+        
+        tmp = directorio / f"_tmp-{uuid.uuid4().hex[:12]}.parquet"
+        pq.write_table(
+            table, tmp,
+            compression=DATASET_CONFIG['compression'],
+            row_group_size=DATASET_CONFIG['row_group_size'],
+        )
+        destino = directorio / f"part-{uuid.uuid4().hex[:12]}-0.parquet"
+        tmp.replace(destino)
+    
+    for old in anteriores:
+        old.unlink()
+    
+    return destino
+
+
+def compact_dataset(name, base_dir=None, until=None):
+    """
+    Reescribe cada partición con varios archivos como un único archivo
+    
+    Las cargas incrementales agregan un archivo pequeño por partición en
+    cada ejecución; al compactar se unen, se eliminan registros repetidos
+    (misma clave primaria, se conserva el último) y se ordenan por
+    dispositivo y tiempo.
+    
+    Args:
+        name: Nombre del dataset
+        base_dir: Directorio base (default: data/raw)
+        until: Solo compactar particiones anteriores a esta fecha (las del
+               día en curso siguen recibiendo datos)
+    
+    Returns:
+        int: Número de particiones compactadas
+    """
+    dataset = open_dataset(name, base_dir)
+    if dataset is None:
+        return 0
+    
+    until = pd.Timestamp(until).date() if until is not None else None
+    key_col = KEY_COLUMNS.get(name)
+    
+    particiones = {}
+    for fragment in dataset.get_fragments():
+        keys = ds.get_partition_keys(fragment.partition_expression)
+        if 'fecha' not in keys:
+            continue
+        particiones.setdefault((keys['fecha'], keys['bucket']), []).append(fragment.path)
+    
+    compactadas = 0
+    for (fecha, bucket), paths in sorted(particiones.items()):
+        if len(paths) < 2 or (until is not None and fecha >= until):
+            continue
+        
+        df = ds.dataset(paths, format='parquet').to_table().to_pandas()
+        if key_col in df.columns:
+            df = df.drop_duplicates(subset=key_col, keep='last')
+        
+        write_partition(df, name, fecha, bucket, base_dir)
+        compactadas += 1
+    
+    return compactadas
+
+
+def list_partition_dates(name, base_dir=None):
+    """
+    Fechas con datos en un dataset particionado
+    
+    Returns:
+        Lista ordenada de datetime.date
+    """
+    dataset = open_dataset(name, base_dir)
+    if dataset is None:
+        return []
+    
+    fechas = set()
+    for fragment in dataset.get_fragments():
+        keys = ds.get_partition_keys(fragment.partition_expression)
+        if 'fecha' in keys:
+            fechas.add(keys['fecha'])
+    
+    return sorted(fechas)
+
+
+def dataset_fingerprint(name, base_dir=None, csv_pattern=None):
+    """
+    Huella del contenido de un dataset, sin leerlo
+    
+    Los archivos Parquet no se modifican después de escritos (cada
+    escritura, compactación o reemplazo de partición crea un archivo con
+    nombre nuevo), así que la lista de rutas relativas y tamaños identifica
+    el contenido. En el respaldo CSV se hashea el contenido del archivo más
+    reciente.
+    
+    Args:
+        name: Nombre del dataset
+        base_dir: Directorio base (default: data/raw)
+        csv_pattern: Patrón de los CSV heredados (como en load_dataset)
+    
+    Returns:
+        str (sha256 en hex), o None si no hay datos en ningún formato
+    """
+    base_dir = Path(base_dir or RAW_DATA_DIR)
+    huella = hashlib.sha256()
+    
+    if dataset_exists(name, base_dir):
+        path = dataset_path(name, base_dir)
+        for archivo in sorted(path.rglob('*.parquet')):
+            if archivo.name.startswith('_'):
+                continue
+            huella.update(f"{archivo.relative_to(path).as_posix()}:{archivo.stat().st_size}\n".encode())
+        return huella.hexdigest()
+    
+    csv_files = list(base_dir.glob(csv_pattern)) if csv_pattern else []
+    if not csv_files:
+        return None
+    
+    latest_file = max(csv_files, key=lambda x: x.stat().st_mtime)
+    with open(latest_file, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            huella.update(bloque)
+    return huella.hexdigest()
+
+
+def iter_dataset(name, chunk_size, base_dir=None, columns=None, start=None, end=None,
+                 dispositivos=None, buckets=None):
+    """
+    Recorre un dataset particionado día a día, en orden cronológico por dispositivo
+    
+    Cada partición (día, bucket) se lee por separado (poda por partición) y
+    sus filas salen ordenadas por dispositivo y tiempo. Los archivos ya se
+    escriben en ese orden, así que una partición de un solo archivo (todas
+    las compactadas) se lee por bloques de chunk_size sin cargarla entera:
+    la memoria depende de chunk_size y no del día más grande. Solo una
+    partición con varios archivos sin compactar (p. ej. el día en curso) se
+    lee completa para ordenarla.
+    
+    Args:
+        name: Nombre del dataset
+        chunk_size: Filas máximas por bloque
+        base_dir, columns, start, end, dispositivos, buckets: Igual que read_dataset
+    
+    Yields:
+        DataFrame con un bloque de filas
+    """
+    dataset = open_dataset(name, base_dir)
+    if dataset is None:
+        return
+    
+    if columns is None:
+        columns = [c for c in dataset.schema.names if c not in PARTITION_COLUMNS]
+    time_col = _time_column(name, dataset.schema.names)
+    filtro_base = build_filter(dataset, name, start, end, dispositivos, buckets)
+    
+    orden = [(c, 'ascending') for c in ('DispositivoID', time_col) if c in columns]
+    
+    for fecha in list_partition_dates(name, base_dir):
+        filtro_fecha = ds.field('fecha') == fecha
+        if filtro_base is not None:
+            filtro_fecha = filtro_fecha & filtro_base
+        
+        archivos = {}
+        for fragment in dataset.get_fragments(filter=filtro_fecha):
+            bucket = ds.get_partition_keys(fragment.partition_expression).get('bucket')
+            archivos[bucket] = archivos.get(bucket, 0) + 1
+        
+        for bucket, n_archivos in sorted(archivos.items()):
+            filtro = filtro_fecha & (ds.field('bucket') == bucket)
+            
+            if n_archivos == 1:
+                for batch in dataset.to_batches(columns=list(columns), filter=filtro,
+                                                batch_size=chunk_size):
+                    if batch.num_rows > 0:
+                        yield batch.to_pandas()
+                continue
+            
+            table = dataset.to_table(columns=list(columns), filter=filtro)
+            if orden:
+                table = table.sort_by(orden)
+            for inicio in range(0, table.num_rows, chunk_size):
+                yield table.slice(inicio, chunk_size).to_pandas()
+
+
+def load_dataset(name, base_dir=None, columns=None, csv_pattern=None, start=None, end=None,
+                 dispositivos=None):
+    """
+    Carga un dataset del almacenamiento Parquet, con respaldo al CSV más reciente
+    
+    El respaldo permite seguir usando exportaciones CSV anteriores a este
+    formato; los filtros se aplican igual, pero en memoria.
+    
+    Args:
+        name: Nombre del dataset
+        base_dir: Directorio base (default: data/raw)
+        columns: Columnas a leer (None = todas)
+        csv_pattern: Patrón de los CSV heredados (p. ej. 'ubicaciones_raw_*.csv')
+        start, end, dispositivos: Filtros (ver read_dataset)
+    
+    Returns:
+        DataFrame, o None si no hay datos en ningún formato
+    """
+    base_dir = Path(base_dir or RAW_DATA_DIR)
+    
+    df = read_dataset(name, base_dir, columns=columns, start=start, end=end, dispositivos=dispositivos)
+    if df is not None:
+        print(f"📂 Cargando dataset: {name} ({len(df):,} filas, Parquet)")
+        return df
+    
+    csv_files = list(base_dir.glob(csv_pattern)) if csv_pattern else []
+    if not csv_files:
+        return None
+    
+    latest_file = max(csv_files, key=lambda x: x.stat().st_mtime)
+    print(f"📂 Cargando: {latest_file.name} (CSV heredado)")
+    
+    time_col = TIME_COLUMNS.get(name, 'FechaHora')
+    df = pd.read_csv(latest_file, usecols=columns)
+    if time_col in df.columns:
+        df[time_col] = pd.to_datetime(df[time_col])
+        if start is not None:
+            df = df[df[time_col] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df[time_col] < pd.Timestamp(end)]
+    if dispositivos is not None:
+        df = df[df['DispositivoID'].isin(np.atleast_1d(dispositivos))]
+    
+    return df.reset_index(drop=True)
@@ -3,17 +3,22 @@ Utilidad para conectar a la base de datos de Laravel
 """
 
 import pymysql
-from pymysql.cursors import DictCursor
+from pymysql.cursors import DictCursor, SSCursor
 import pandas as pd
 import logging
 import os
 import sys
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
 # Agregar el directorio raíz al path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from config import DB_CONFIG
+from config import DB_CONFIG, EXTRACTION_CONFIG
+from utils.dataset_store import to_arrow_table
 
 logger = logging.getLogger(__name__)
 
@@ -56,10 +61,114 @@ class DatabaseConnector:
             logger.error(f"❌ Error al ejecutar query: {e}")
             raise
     
+    def iter_query(self, query, params=None, batch_size=None, dataset=None, as_arrow=False):
+        """
+        Ejecutar una consulta con cursor no bufferizado y devolverla por bloques
+        
+        El servidor envía las filas a medida que se leen (SSCursor), así que
+        la memoria máxima depende de batch_size y no del tamaño del resultado.
+        Mientras el generador no termine, la conexión no admite otras consultas.
+        
+        Args:
+            query: Consulta SQL (parámetros con el estilo %(nombre)s)
+            params: Parámetros de la consulta
+            batch_size: Filas por bloque (default: EXTRACTION_CONFIG['batch_size'])
+            dataset: Nombre del esquema de utils.dataset_store para tipar las
+                     columnas (Decimal → float, fechas, enteros nullables, ...)
+            as_arrow: Devolver pyarrow.Table en lugar de DataFrame
+        
+        Yields:
+            DataFrame (o pyarrow.Table) con hasta batch_size filas
+        """
+        if not self.connection:
+            self.connect()
+        
+        batch_size = batch_size or EXTRACTION_CONFIG['batch_size']
+        
+        try:
+            with self.connection.cursor(SSCursor) as cursor:
+                cursor.execute(query, params)
+                columns = [col[0] for col in cursor.description]
+                
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    
+                    df = pd.DataFrame.from_records(rows, columns=columns)
+                    if dataset is not None or as_arrow:
+                        table = to_arrow_table(df, dataset)
+                        yield table if as_arrow else table.to_pandas()
+                    else:
+                        yield df
+        except Exception as e:
+            logger.error(f"❌ Error al ejecutar query por bloques: {e}")
+            raise
+    
+    def iter_keyset(self, select, keys, where=None, params=None, page_size=None,
+                    dataset=None, as_arrow=False):
+        """
+        Recorrer un resultado grande por páginas con paginación por clave (keyset)
+        
+        Cada página es una consulta independiente que continúa después de la
+        última clave leída: k1 > v1 OR (k1 = v1 AND (k2 > v2 OR ...)) ORDER BY
+        k1, k2, ... LIMIT page_size. La condición se escribe expandida y no
+        como (k1, k2, ...) > (v1, v2, ...): MySQL muchas veces no usa el
+        índice para rangos con constructores de fila. A diferencia de OFFSET, el costo de cada página no
+        crece con la posición, y la extracción se puede reanudar desde la
+        última clave si se corta la conexión. Las claves deben ser únicas en
+        conjunto: para ubicaciones se usa (DispositivoID, FechaHora,
+        UbicacionID), que es el orden del índice idx_dispositivo_fecha
+        (InnoDB agrega la clave primaria a los índices secundarios).
+        
+        Args:
+            select: SELECT ... FROM ... (sin WHERE, ORDER BY ni LIMIT)
+            keys: dict ordenado {expresión SQL: columna del resultado},
+                  p. ej. {'u.DispositivoID': 'DispositivoID', 'u.FechaHora': 'FechaHora'}
+            where: Condición adicional (sin la palabra WHERE), opcional
+            params: Parámetros de la condición adicional
+            page_size: Filas por página (default: EXTRACTION_CONFIG['page_size'])
+            dataset, as_arrow: Igual que iter_query
+        
+        Yields:
+            DataFrame (o pyarrow.Table) con cada página
+        """
+        page_size = page_size or EXTRACTION_CONFIG['page_size']
+        expresiones = list(keys)
+        columnas = [keys[e] for e in expresiones]
+        despues = _keyset_condition(expresiones)
+        orden = ', '.join(expresiones)
+        
+        ultima_clave = None
+        while True:
+            condiciones = [f'({where})'] if where else []
+            page_params = dict(params or {})
+            
+            if ultima_clave is not None:
+                condiciones.append(f'({despues})')
+                page_params.update({f'_k{i}': v for i, v in enumerate(ultima_clave)})
+            
+            query = select
+            if condiciones:
+                query += '\nWHERE ' + ' AND '.join(condiciones)
+            query += f'\nORDER BY {orden}\nLIMIT {int(page_size)}'
+            
+            filas = 0
+            for bloque in self.iter_query(query, page_params, batch_size=page_size,
+                                          dataset=dataset, as_arrow=as_arrow):
+                filas += len(bloque)
+                ultimo = bloque.slice(len(bloque) - 1) if as_arrow else bloque.iloc[-1:]
+                ultima_clave = [_python_value(ultimo[c]) for c in columnas]
+                yield bloque
+            
+            if filas < page_size:
+                break
+    
     def close(self):
         """Cerrar conexión"""
         if self.connection:
             self.connection.close()
+            self.connection = None
             logger.info("🔒 Conexión cerrada")
     
     def __enter__(self):
@@ -72,6 +181,156 @@ class DatabaseConnector:
         self.close()
 
 
+class ConnectionPool:
+    """
+    Pool acotado de conexiones reutilizables, seguro entre hilos
+    
+    Como máximo `size` conexiones abiertas a la vez; quien pide una
+    conexión con el pool agotado espera hasta `timeout` segundos. Las
+    conexiones se crean bajo demanda, se verifican con ping al reutilizarse
+    (MySQL cierra las inactivas tras wait_timeout) y, si la tarea que la
+    usaba falla, se cierran en lugar de devolverse.
+    
+    Uso:
+        with ConnectionPool(size=4) as pool:
+            with pool.connection() as db:
+                df = db.execute_query("SELECT ...")
+    """
+    
+    def __init__(self, size=None, timeout=None):
+        """
+        Args:
+            size: Conexiones máximas (default: EXTRACTION_CONFIG['workers'])
+            timeout: Segundos máximos de espera por una conexión (None = sin límite)
+        """
+        self.size = size or EXTRACTION_CONFIG['workers']
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._stats = {
+            'adquiridas': 0,
+            'en_uso': 0,
+            'creadas': 0,
+            'descartadas': 0,
+            'timeouts': 0,
+            'espera_total_s': 0.0,
+            'espera_max_s': 0.0,
+        }
+    
+    def _count(self, **incrementos):
+        with self._lock:
+            for key, value in incrementos.items():
+                self._stats[key] += value
+    
+    @contextmanager
+    def connection(self):
+        """Obtener una conexión del pool (se devuelve al salir del bloque)"""
+        inicio = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout if self.timeout is not None else -1):
+            self._count(timeouts=1)
+            raise TimeoutError(f"No hay conexiones libres en el pool (size={self.size})")
+        
+        espera = time.perf_counter() - inicio
+        with self._lock:
+            self._stats['adquiridas'] += 1
+            self._stats['en_uso'] += 1
+            self._stats['espera_total_s'] += espera
+            self._stats['espera_max_s'] = max(self._stats['espera_max_s'], espera)
+        
+        connector = None
+        try:
+            try:
+                connector = self._idle.get_nowait()
+                connector.connection.ping(reconnect=True)
+            except queue.Empty:
+                connector = DatabaseConnector()
+                connector.connect()
+                self._count(creadas=1)
+            
+            yield connector
+        
+        except Exception:
+            if connector is not None:
+                try:
+                    connector.close()
+                except Exception:
+                    pass
+                connector = None
+                self._count(descartadas=1)
+            raise
+        
+        finally:
+            if connector is not None:
+                self._idle.put(connector)
+            self._count(en_uso=-1)
+            self._slots.release()
+    
+    def stats(self):
+        """
+        Métricas del pool
+        
+        Returns:
+            dict: tamaño, conexiones en uso/libres, adquisiciones, timeouts
+                  y tiempo de espera por una conexión (medio y máximo)
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        
+        stats['size'] = self.size
+        stats['libres'] = self._idle.qsize()
+        stats['espera_media_ms'] = round(
+            stats['espera_total_s'] / stats['adquiridas'] * 1000, 3
+        ) if stats['adquiridas'] else 0.0
+        stats['espera_max_ms'] = round(stats.pop('espera_max_s') * 1000, 3)
+        stats.pop('espera_total_s')
+        
+        return stats
+    
+    def close(self):
+        """Cerrar las conexiones libres del pool"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _keyset_condition(expresiones):
+    """
+    Condición "clave mayor que la última leída" expandida por columna
+    
+    Args:
+        expresiones: Expresiones SQL de la clave, en el orden del ORDER BY
+    
+    Returns:
+        str: k1 > %(_k0)s OR (k1 = %(_k0)s AND (k2 > %(_k1)s OR ...))
+    """
+    ultima = len(expresiones) - 1
+    condicion = f'{expresiones[ultima]} > %(_k{ultima})s'
+    for i in range(ultima - 1, -1, -1):
+        condicion = (
+            f'{expresiones[i]} > %(_k{i})s OR ({expresiones[i]} = %(_k{i})s AND ({condicion}))'
+        )
+    return condicion
+
+
+def _python_value(column):
+    """Primer valor de una columna (Series o Arrow) como tipo nativo para pymysql"""
+    if hasattr(column, 'to_pylist'):
+        return column.to_pylist()[0]
+    value = column.iloc[0]
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value.item() if hasattr(value, 'item') else value
+
+
 # Función helper para uso rápido
 def get_ubicaciones(limit=None):
     """Obtener ubicaciones de la base de datos"""
@@ -114,8 +373,8 @@ if __name__ == "__main__":
             df_ubicaciones = get_ubicaciones(limit=5)
             print(f"\n📍 Últimas 5 ubicaciones:")
             print(df_ubicaciones[['DispositivoID', 'Latitud', 'Longitud', 'FechaHora']])
-            
-        print("\n✅ Conexión exitosa!")
         
+        print("\n✅ Conexión exitosa!")
+    
     except Exception as e:
         print(f"\n❌ Error: {e}")
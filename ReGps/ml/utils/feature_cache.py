@@ -0,0 +1,254 @@
+"""
+Caché de features direccionada por contenido (data/cache/features)
+
+Cada bloque es una tabla de features guardada en Parquet y su clave es el
+sha256 de:
+
+- la huella de los datasets de entrada (dataset_fingerprint: los archivos
+  Parquet no se modifican después de escritos, así que datos nuevos,
+  compactados o reextraídos cambian la huella)
+- la versión del código que calcula las features (contenido de sus módulos
+  y de los módulos del proyecto que importan, code_version), más las
+  versiones de numpy y pandas
+- los parámetros (ventanas, umbrales, columnas leídas)
+
+Nada se invalida a mano: si cambia el código o los datos, la clave es otra
+y el bloque viejo deja de usarse hasta que la desalojan. El tamaño total se
+acota con FEATURE_CACHE_CONFIG['max_mb']: al guardar se borran los bloques
+usados hace más tiempo (cada lectura actualiza el mtime del archivo).
+
+Las features por dispositivo (diferencias, ventanas móviles, promedios
+históricos) cruzan los días, así que un bloque corresponde a todas las
+particiones que se leyeron, no a una partición suelta.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import types
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import CACHE_DIR, FEATURE_CACHE_CONFIG
+from utils.pipeline import file_hash, stable_hash
+
+
+# Clave de los metadatos del bloque en el esquema Parquet
+META_KEY = b'regps_feature_cache'
+
+ML_DIR = Path(__file__).resolve().parent.parent
+
+
+def _project_file(modulo):
+    """Archivo del módulo si es código del proyecto (no de una librería), o None"""
+    archivo = getattr(modulo, '__file__', None)
+    if archivo is None:
+        return None
+    path = Path(archivo).resolve()
+    if not path.is_relative_to(ML_DIR) or 'site-packages' in path.parts:
+        return None
+    return path
+
+
+def _collect_modules(modulo, archivos):
+    """Agrega a archivos el módulo y, recursivamente, los del proyecto que importa"""
+    path = _project_file(modulo)
+    if path is None or path in archivos:
+        return
+    # Por ruta y no por nombre: un script corrido directo se llama __main__
+    archivos[path] = modulo
+    
+    # Dependencias: módulos importados y módulos de las funciones/clases importadas
+    for valor in list(vars(modulo).values()):
+        if isinstance(valor, types.ModuleType):
+            _collect_modules(valor, archivos)
+        else:
+            origen = sys.modules.get(getattr(valor, '__module__', None) or '')
+            if origen is not None:
+                _collect_modules(origen, archivos)
+
+
+def code_version(*modulos):
+    """
+    Versión del código que calcula un bloque: sha256 del contenido de sus
+    módulos y de todos los módulos del proyecto que importan (directa o
+    indirectamente), así un cambio en un helper (p. ej. utils/geo_utils.py
+    detrás de geo_arrays) también invalida los bloques
+    
+    Args:
+        modulos: Módulos importados
+    
+    Returns:
+        str
+    """
+    archivos = {}
+    for modulo in modulos:
+        _collect_modules(modulo, archivos)
+    
+    huella = hashlib.sha256()
+    for path in sorted(archivos):
+        huella.update(f"{path.relative_to(ML_DIR).as_posix()}:{file_hash(path)}\n".encode())
+    return huella.hexdigest()
+
+
+class FeatureCache:
+    """
+    Bloques de features en Parquet con desalojo LRU por tamaño
+    """
+    
+    def __init__(self, base_dir=None, max_mb=None, enabled=None):
+        """
+        Args:
+            base_dir: Directorio de la caché (default: data/cache/features)
+            max_mb: Tamaño máximo en MB (default: FEATURE_CACHE_CONFIG['max_mb'])
+            enabled: Usar la caché (default: FEATURE_CACHE_CONFIG['enabled'])
+        """
+        self.base_dir = Path(base_dir or CACHE_DIR / "features")
+        self.max_bytes = int((max_mb or FEATURE_CACHE_CONFIG['max_mb']) * 1024 * 1024)
+        self.enabled = FEATURE_CACHE_CONFIG['enabled'] if enabled is None else enabled
+    
+    def key(self, name, inputs, version, params=None):
+        """
+        Clave de un bloque
+        
+        Args:
+            name: Nombre del bloque (p. ej. 'eta_features')
+            inputs: dict dataset -> huella (dataset_fingerprint)
+            version: Versión del código (code_version)
+            params: Parámetros (JSON) que cambian el resultado
+        
+        Returns:
+            str (sha256 en hex)
+        """
+        return stable_hash({
+            'name': name,
+            'inputs': inputs,
+            'version': version,
+            'params': params or {},
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+        })
+    
+    def _path(self, name, key):
+        return self.base_dir / name / f"{key}.parquet"
+    
+    def get(self, name, key):
+        """
+        Bloque guardado
+        
+        Returns:
+            Tupla (DataFrame, meta), o None si no existe
+        """
+        path = self._path(name, key)
+        try:
+            table = pq.read_table(path)
+            os.utime(path)  # Usado ahora: último en desalojarse
+        except FileNotFoundError:
+            return None
+        
+        meta = json.loads((table.schema.metadata or {}).get(META_KEY, b'{}'))
+        return table.to_pandas(), meta
+    
+    def put(self, name, key, df, meta=None):
+        """
+        Guarda un bloque (escritura atómica) y desaloja lo que sobre
+        
+        Args:
+            name: Nombre del bloque
+            key: Clave (ver key)
+            df: DataFrame de features
+            meta: dict JSON que se devuelve junto al bloque
+        
+        Returns:
+            Path del bloque
+        """
+        path = self._path(name, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # El índice se guarda (un RangeIndex solo como metadato) para devolver el mismo DataFrame
+        table = pa.Table.from_pandas(df)
+        schema_meta = dict(table.schema.metadata or {})
+        schema_meta[META_KEY] = json.dumps(meta or {}, default=str).encode()
+        table = table.replace_schema_metadata(schema_meta)
+        
+        tmp = path.with_name(f".{path.stem}-{uuid.uuid4().hex}.tmp")
+        pq.write_table(table, tmp, compression='zstd')
+        tmp.replace(path)
+        
+        self.evict(keep=path)
+        return path
+    
+    def evict(self, keep=None):
+        """
+        Borra los bloques usados hace más tiempo hasta quedar bajo max_bytes
+        
+        Args:
+            keep: Bloque que no se borra (el recién guardado)
+        
+        Returns:
+            Lista de Path borrados
+        """
+        bloques = []
+        for path in self.base_dir.glob('*/*.parquet'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # Otro proceso lo desalojó
+            bloques.append((stat.st_mtime, stat.st_size, path))
+        
+        total = sum(size for _, size, _ in bloques)
+        borrados = []
+        for _, size, path in sorted(bloques, key=lambda b: b[0]):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
+            borrados.append(path)
+        
+        return borrados
+    
+    def size(self):
+        """Bytes ocupados por los bloques"""
+        return sum(p.stat().st_size for p in self.base_dir.glob('*/*.parquet'))
+
+
+def cached_features(name, inputs, version, compute, params=None, cache=None):
+    """
+    Bloque de features de la caché, o calculado y guardado
+    
+    Args:
+        name: Nombre del bloque
+        inputs: dict dataset -> huella (None si el dataset no existe), o
+                None si no se conoce (datos pasados en memoria): sin caché
+        version: Versión del código (code_version)
+        compute: Función sin argumentos que devuelve (DataFrame, meta)
+        params: Parámetros que cambian el resultado
+        cache: FeatureCache (default: una con la configuración de config.py)
+    
+    Returns:
+        Tupla (DataFrame, meta)
+    """
+    cache = cache or FeatureCache()
+    if not cache.enabled or inputs is None:
+        return compute()
+    
+    key = cache.key(name, inputs, version, params)
+    guardado = cache.get(name, key)
+    if guardado is not None:
+        print(f"♻️ Features '{name}' desde la caché ({len(guardado[0]):,} filas, clave {key[:12]})")
+        return guardado
+    
+    df, meta = compute()
+    cache.put(name, key, df, meta)
+    print(f"💾 Features '{name}' guardadas en la caché (clave {key[:12]})")
+    return df, meta
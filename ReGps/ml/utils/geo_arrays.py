@@ -0,0 +1,209 @@
+"""
+Utilidades geoespaciales vectorizadas (API orientada a arrays)
+
+Mismos nombres que utils.geo_utils, pero cada función acepta arrays de
+numpy, Series de pandas o escalares, aplica broadcasting entre ellos y
+devuelve un numpy.ndarray. Pensado para reemplazar los bucles por fila:
+
+    from utils import geo_arrays
+    df['Distancia'] = geo_arrays.calculate_distance(lat_prev, lon_prev, df['Latitud'], df['Longitud'])
+
+Opciones comunes:
+    method: 'haversine' (rápido, esfera) o 'geodesic' (WGS-84, Vincenty
+            con respaldo Karney vía geopy; coincide con geo_utils)
+    dtype: np.float32 para reducir memoria a costa de precisión
+           (error del orden de 1 m); por defecto float64
+    chunk_size: Filas procesadas por bloque para acotar los temporales
+"""
+
+import numpy as np
+import pandas as pd
+
+from .geo_utils import haversine_distance_batch, geodesic_distance_batch, bearing_batch
+
+
+# Filas por bloque: acota los temporales a unas decenas de MB por array
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+DISTANCE_METHODS = {
+    'haversine': haversine_distance_batch,
+    'geodesic': geodesic_distance_batch,
+}
+
+
+def _as_array(values, dtype=None):
+    """Convierte Series/listas/escalares a numpy sin copiar si no es necesario"""
+    if isinstance(values, (pd.Series, pd.Index)):
+        values = values.to_numpy()
+    return np.asarray(values, dtype=dtype)
+
+
+def _as_time_array(values):
+    """
+    Convierte timestamps a un array numpy
+    Acepta datetime64 (o Series de fechas) y también segundos numéricos
+    """
+    if isinstance(getattr(values, 'dtype', None), pd.DatetimeTZDtype):
+        values = pd.DatetimeIndex(values).tz_convert(None)
+    values = _as_array(values)
+    if values.dtype.kind == 'M':
+        return values.astype('datetime64[ns]')
+    return values.astype(float)
+
+
+def _apply_chunked(kernel, arrays, dtype=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Aplica un kernel vectorizado por bloques sobre el primer eje
+    
+    Los arrays se combinan con broadcasting como vistas (sin copiar), de
+    modo que un centro escalar contra millones de puntos no se materializa.
+    
+    Args:
+        kernel: Función que recibe los arrays (ya alineados) y devuelve un array
+        arrays: Lista de arrays de entrada
+        dtype: Tipo del array de salida
+        chunk_size: Filas por bloque (None = todo de una vez)
+    
+    Returns:
+        numpy.ndarray con la forma del broadcasting de las entradas
+    """
+    arrays = np.broadcast_arrays(*arrays)
+    shape = arrays[0].shape
+    
+    if len(shape) == 0:
+        return np.asarray(kernel(*arrays), dtype=dtype)[()]
+    
+    out = None
+    step = chunk_size or shape[0] or 1
+    
+    for inicio in range(0, shape[0], step):
+        bloque = kernel(*(a[inicio:inicio + step] for a in arrays))
+        if out is None:
+            out = np.empty(shape, dtype=dtype or np.asarray(bloque).dtype)
+        out[inicio:inicio + step] = bloque
+    
+    if out is None:
+        out = np.empty(shape, dtype=dtype or np.float64)
+    
+    return out
+
+
+def calculate_distance(lat1, lon1, lat2, lon2, method='haversine', dtype=None,
+                       chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Calcular distancias entre pares de puntos GPS en kilómetros
+    
+    Args:
+        lat1, lon1: Coordenadas de los puntos de origen
+        lat2, lon2: Coordenadas de los puntos de destino
+        method: 'haversine' o 'geodesic'
+        dtype: Tipo de salida (np.float32 activa el modo de baja memoria)
+        chunk_size: Filas por bloque
+    
+    Returns:
+        numpy.ndarray: Distancias en kilómetros (NaN si falta alguna coordenada)
+    """
+    if method not in DISTANCE_METHODS:
+        raise ValueError(f"Método de distancia no soportado: {method}. Opciones: {list(DISTANCE_METHODS)}")
+    
+    kernel = DISTANCE_METHODS[method]
+    # Vincenty necesita float64 para converger; haversine puede operar en float32
+    input_dtype = dtype if method == 'haversine' and dtype is not None else float
+    arrays = [_as_array(x, dtype=input_dtype) for x in (lat1, lon1, lat2, lon2)]
+    
+    return _apply_chunked(kernel, arrays, dtype=dtype or np.float64, chunk_size=chunk_size)
+
+
+def calculate_bearing(lat1, lon1, lat2, lon2, dtype=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Calcular el rumbo (bearing) entre pares de puntos
+    
+    Returns:
+        numpy.ndarray: Ángulos en grados (0-360)
+    """
+    arrays = [_as_array(x, dtype=dtype or float) for x in (lat1, lon1, lat2, lon2)]
+    return _apply_chunked(bearing_batch, arrays, dtype=dtype or np.float64, chunk_size=chunk_size)
+
+
+def calculate_speed(lat1, lon1, time1, lat2, lon2, time2, method='haversine', dtype=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Calcular velocidades entre pares de puntos GPS
+    
+    Args:
+        lat1, lon1, time1: Coordenadas y timestamps de los puntos de origen
+        lat2, lon2, time2: Coordenadas y timestamps de los puntos de destino
+        method: 'haversine' o 'geodesic'
+        dtype: Tipo de salida
+        chunk_size: Filas por bloque
+    
+    Los timestamps pueden ser datetime64/Series de fechas o segundos numéricos.
+    
+    Returns:
+        numpy.ndarray: Velocidades en km/h (0 donde la diferencia de tiempo es 0)
+    """
+    if method not in DISTANCE_METHODS:
+        raise ValueError(f"Método de distancia no soportado: {method}. Opciones: {list(DISTANCE_METHODS)}")
+    
+    kernel = DISTANCE_METHODS[method]
+    
+    def speed_kernel(la1, lo1, t1, la2, lo2, t2):
+        dt = t2 - t1
+        horas = dt / np.timedelta64(3600, 's') if dt.dtype.kind == 'm' else dt / 3600
+        with np.errstate(invalid='ignore', divide='ignore'):
+            velocidad = kernel(la1, lo1, la2, lo2) / horas
+        return np.where(horas == 0, 0.0, velocidad)
+    
+    arrays = [
+        _as_array(lat1, dtype=float), _as_array(lon1, dtype=float), _as_time_array(time1),
+        _as_array(lat2, dtype=float), _as_array(lon2, dtype=float), _as_time_array(time2),
+    ]
+    
+    return _apply_chunked(speed_kernel, arrays, dtype=dtype or np.float64, chunk_size=chunk_size)
+
+
+def calculate_acceleration(speed1, speed2, time_diff_seconds, dtype=None,
+                           chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Calcular aceleraciones entre pares de velocidades
+    
+    Args:
+        speed1, speed2: Velocidades en km/h
+        time_diff_seconds: Diferencia de tiempo en segundos
+    
+    Returns:
+        numpy.ndarray: Aceleración en m/s² (0 donde la diferencia de tiempo es 0)
+    """
+    def acceleration_kernel(v1, v2, dt):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            aceleracion = (v2 * 1000 / 3600 - v1 * 1000 / 3600) / dt
+        return np.where(dt == 0, 0.0, aceleracion)
+    
+    arrays = [_as_array(x, dtype=dtype or float) for x in (speed1, speed2, time_diff_seconds)]
+    return _apply_chunked(acceleration_kernel, arrays, dtype=dtype or np.float64, chunk_size=chunk_size)
+
+
+def is_point_in_circle(point_lat, point_lon, center_lat, center_lon, radius_km,
+                       method='geodesic', chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Verificar si puntos están dentro de círculos (geocercas circulares)
+    
+    Args:
+        point_lat, point_lon: Coordenadas de los puntos a verificar
+        center_lat, center_lon: Centros de los círculos
+        radius_km: Radios en kilómetros
+        method: 'geodesic' (igual que geo_utils) o 'haversine'
+    
+    Returns:
+        numpy.ndarray[bool]: True si está dentro (False si falta alguna coordenada)
+    """
+    if method not in DISTANCE_METHODS:
+        raise ValueError(f"Método de distancia no soportado: {method}. Opciones: {list(DISTANCE_METHODS)}")
+    
+    kernel = DISTANCE_METHODS[method]
+    
+    def circle_kernel(plat, plon, clat, clon, radio):
+        return kernel(plat, plon, clat, clon) <= radio
+    
+    arrays = [_as_array(x, dtype=float) for x in (point_lat, point_lon, center_lat, center_lon, radius_km)]
+    return _apply_chunked(circle_kernel, arrays, dtype=bool, chunk_size=chunk_size)
@@ -7,6 +7,11 @@ import math
 import numpy as np
 
 
+# Elipsoide WGS-84 (el mismo que usa geopy.geodesic por defecto)
+WGS84_A = 6378137.0  # Semieje mayor en metros
+WGS84_F = 1 / 298.257223563  # Achatamiento
+
+
 def calculate_distance(lat1, lon1, lat2, lon2):
     """
     Calcular distancia entre dos puntos GPS en kilómetros
@@ -138,6 +143,120 @@ def haversine_distance_batch(lat1, lon1, lat2, lon2):
     return distance
 
 
+def bearing_batch(lat1, lon1, lat2, lon2):
+    """
+    Calcular el rumbo (bearing) para múltiples pares de coordenadas (vectorizado)
+    Misma fórmula que calculate_bearing
+    
+    Args:
+        lat1, lon1, lat2, lon2: Arrays de numpy o Series de pandas
+    
+    Returns:
+        numpy.ndarray: Ángulos en grados (0-360)
+    """
+    lat1_rad = np.radians(lat1)
+    lat2_rad = np.radians(lat2)
+    diff_lon_rad = np.radians(np.subtract(lon2, lon1))
+    
+    x = np.sin(diff_lon_rad) * np.cos(lat2_rad)
+    y = np.cos(lat1_rad) * np.sin(lat2_rad) - (
+        np.sin(lat1_rad) * np.cos(lat2_rad) * np.cos(diff_lon_rad)
+    )
+    
+    bearing_deg = np.degrees(np.arctan2(x, y))
+    
+    return (bearing_deg + 360) % 360
+
+
+def geodesic_distance_batch(lat1, lon1, lat2, lon2, max_iter=200, tol=1e-12):
+    """
+    Calcular distancias elipsoidales (WGS-84) para múltiples pares (vectorizado)
+    Usa la fórmula inversa de Vincenty, que coincide con calculate_distance
+    (geopy.geodesic) a nivel submilimétrico. Los pares casi antipodales que
+    no convergen se resuelven punto a punto con geopy.
+    
+    Args:
+        lat1, lon1, lat2, lon2: Arrays de numpy o Series de pandas
+        max_iter: Máximo de iteraciones de Vincenty
+        tol: Tolerancia de convergencia (radianes)
+    
+    Returns:
+        numpy.ndarray: Distancias en kilómetros (NaN si alguna coordenada es NaN)
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(
+        np.asarray(lat1, dtype=float), np.asarray(lon1, dtype=float),
+        np.asarray(lat2, dtype=float), np.asarray(lon2, dtype=float)
+    )
+    
+    a = WGS84_A
+    f = WGS84_F
+    b = a * (1 - f)
+    
+    L = np.radians(lon2 - lon1)
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sin_U1, cos_U1 = np.sin(U1), np.cos(U1)
+    sin_U2, cos_U2 = np.sin(U2), np.cos(U2)
+    
+    lam = L.copy()
+    delta = np.zeros_like(L)
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(max_iter):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.sqrt(
+                (cos_U2 * sin_lam) ** 2 +
+                (cos_U1 * sin_U2 - sin_U1 * cos_U2 * cos_lam) ** 2
+            )
+            cos_sigma = sin_U1 * sin_U2 + cos_U1 * cos_U2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            
+            # Puntos coincidentes: sin_sigma == 0
+            sin_alpha = np.where(sin_sigma > 0, cos_U1 * cos_U2 * sin_lam / sin_sigma, 0.0)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # Líneas ecuatoriales: cos2_alpha == 0
+            cos_2sigma_m = np.where(
+                cos2_alpha > 0, cos_sigma - 2 * sin_U1 * sin_U2 / cos2_alpha, 0.0
+            )
+            C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            
+            lam_prev = lam
+            lam = L + (1 - C) * f * sin_alpha * (
+                sigma + C * sin_sigma * (
+                    cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+                )
+            )
+            delta = np.abs(lam - lam_prev)
+            
+            if not np.any(delta > tol):
+                break
+        
+        u2 = cos2_alpha * (a ** 2 - b ** 2) / b ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (
+            cos_2sigma_m + B / 4 * (
+                cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+                B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+            )
+        )
+        
+        distance = b * A * (sigma - delta_sigma) / 1000
+    
+    # Casos que Vincenty no resuelve (casi antipodales): usar geopy
+    no_converge = np.flatnonzero(delta > tol)
+    if len(no_converge):
+        # Con escalares distance es un numpy.float64: se copia a array para asignar por índice
+        distance = np.array(distance, dtype=float)
+        for i in no_converge:
+            idx = np.unravel_index(i, distance.shape)
+            distance[idx] = calculate_distance(lat1[idx], lon1[idx], lat2[idx], lon2[idx])
+        if distance.ndim == 0:
+            distance = distance[()]
+    
+    return distance
+
+
 # Ejemplo de uso
 if __name__ == "__main__":
     # Ejemplo: Distancia entre dos puntos en Ciudad de México
@@ -0,0 +1,477 @@
+"""
+Motor de geocercas con índice espacial
+
+Reproduce Zona::contienePunto de Laravel (círculo por haversine con radio
+en metros; polígono por ray casting sobre las Coordenadas en JSON), pero sin
+recorrer todas las zonas por ping:
+
+- Un STRtree (shapely) indexa el rectángulo envolvente de cada zona activa.
+  Consultar un punto devuelve solo las zonas cuyo rectángulo lo contiene.
+- Sobre esos candidatos se hace la prueba exacta vectorizada: haversine
+  contra el radio para los círculos y shapely.contains_xy (polígonos
+  preparados) para los polígonos.
+- HorarioInicio/HorarioFin: una zona con horario solo aplica dentro de él
+  (si el fin es menor que el inicio, el horario cruza la medianoche).
+
+GeofenceIndex es inmutable: para reflejar zonas nuevas, modificadas o
+eliminadas se crea uno nuevo con with_changes(), que reutiliza las zonas
+ya parseadas y solo reconstruye el árbol. Los lectores que tengan una
+referencia al índice anterior siguen viendo un estado consistente.
+
+ZoneEventTracker usa el mismo índice para generar los eventos Entrada/Salida
+de historial_zonas sobre ubicaciones históricas.
+"""
+
+import json
+from datetime import datetime, time as dtime, timedelta
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+
+from .geo_utils import haversine_distance_batch
+
+
+# Metros por grado de latitud (esfera de 6371 km, igual que haversine)
+METERS_PER_DEGREE = 6371000.0 * np.pi / 180
+
+ZONE_TYPES = ('Checkpoint', 'Zona Permitida', 'Zona Restringida')
+
+SECONDS_PER_DAY = 24 * 3600
+
+
+def _seconds_of_day(valor):
+    """TIME de MySQL (timedelta, time o 'HH:MM:SS') a segundos del día; NaN si no hay"""
+    if valor is None or (isinstance(valor, float) and np.isnan(valor)) or valor is pd.NaT:
+        return np.nan
+    if isinstance(valor, (timedelta, pd.Timedelta)):
+        return valor.total_seconds() % SECONDS_PER_DAY
+    if isinstance(valor, dtime):
+        return valor.hour * 3600 + valor.minute * 60 + valor.second
+    if isinstance(valor, str):
+        partes = [int(p) for p in valor.split(':')]
+        partes += [0] * (3 - len(partes))
+        return (partes[0] * 3600 + partes[1] * 60 + partes[2]) % SECONDS_PER_DAY
+    raise ValueError(f"Horario no reconocido: {valor!r}")
+
+
+def _polygon_vertices(coordenadas):
+    """Coordenadas de Laravel ([{'lat', 'lng'}, ...] o [[lat, lng], ...]) a array (n, 2) lon/lat"""
+    if isinstance(coordenadas, (str, bytes)):
+        coordenadas = json.loads(coordenadas)
+    vertices = []
+    for v in coordenadas or []:
+        if isinstance(v, dict):
+            vertices.append((float(v['lng']), float(v['lat'])))
+        else:
+            vertices.append((float(v[1]), float(v[0])))
+    return np.asarray(vertices, dtype=float).reshape(-1, 2)
+
+
+def parse_zone(zona):
+    """
+    Normalizar una fila de la tabla zonas
+    
+    Args:
+        zona: dict o Series con las columnas de zonas (ZonaID, Nombre,
+              TipoZona, TipoGeometria, Latitud, Longitud, Radio, Coordenadas,
+              HorarioInicio, HorarioFin, Estado)
+    
+    Returns:
+        dict con la geometría lista para indexar, o None si la zona está
+        inactiva o su geometría no es utilizable (igual que Laravel, que
+        nunca la considera contenedora)
+    """
+    if zona.get('Estado', 'Activo') != 'Activo':
+        return None
+    
+    base = {
+        'zona_id': int(zona['ZonaID']),
+        'nombre': zona.get('Nombre'),
+        'tipo_zona': zona.get('TipoZona'),
+        'tipo_geometria': zona.get('TipoGeometria') or 'Circulo',
+        'inicio_s': _seconds_of_day(zona.get('HorarioInicio')),
+        'fin_s': _seconds_of_day(zona.get('HorarioFin')),
+    }
+    
+    if base['tipo_geometria'] == 'Circulo':
+        radio = zona.get('Radio')
+        if radio is None or pd.isna(radio) or float(radio) <= 0:
+            return None
+        lat, lon, radio = float(zona['Latitud']), float(zona['Longitud']), float(radio)
+        dlat = radio / METERS_PER_DEGREE
+        dlon = dlat / max(np.cos(np.radians(lat)), 1e-6)
+        return {
+            **base,
+            'lat': lat, 'lon': lon, 'radio_m': radio, 'geometria': None,
+            'caja': (lon - dlon, lat - dlat, lon + dlon, lat + dlat),
+        }
+    
+    vertices = _polygon_vertices(zona.get('Coordenadas'))
+    if len(vertices) < 3:
+        return None
+    poligono = shapely.Polygon(vertices)
+    if not poligono.is_valid:
+        poligono = shapely.make_valid(poligono)
+    shapely.prepare(poligono)
+    return {
+        **base,
+        'lat': np.nan, 'lon': np.nan, 'radio_m': np.nan, 'geometria': poligono,
+        'caja': tuple(poligono.bounds),
+    }
+
+
+class GeofenceIndex:
+    """Índice espacial inmutable de las zonas activas"""
+    
+    def __init__(self, zonas=None):
+        """
+        Args:
+            zonas: dict zona_id -> zona parseada (parse_zone)
+        """
+        self.zonas = dict(zonas or {})
+        orden = list(self.zonas.values())
+        
+        self.ids = np.array([z['zona_id'] for z in orden], dtype=np.int64)
+        self.nombres = np.array([z['nombre'] for z in orden], dtype=object)
+        self.tipos = np.array([z['tipo_zona'] for z in orden], dtype=object)
+        self.geometrias = np.array([z['tipo_geometria'] for z in orden], dtype=object)
+        self.es_circulo = self.geometrias == 'Circulo'
+        self.lat = np.array([z['lat'] for z in orden], dtype=float)
+        self.lon = np.array([z['lon'] for z in orden], dtype=float)
+        self.radio_m = np.array([z['radio_m'] for z in orden], dtype=float)
+        self.poligonos = np.array([z['geometria'] for z in orden], dtype=object)
+        self.inicio_s = np.array([z['inicio_s'] for z in orden], dtype=float)
+        self.fin_s = np.array([z['fin_s'] for z in orden], dtype=float)
+        self.con_horario = ~(np.isnan(self.inicio_s) & np.isnan(self.fin_s))
+        
+        cajas = np.array([z['caja'] for z in orden], dtype=float).reshape(-1, 4)
+        self._tree = STRtree(shapely.box(cajas[:, 0], cajas[:, 1], cajas[:, 2], cajas[:, 3]))
+    
+    @classmethod
+    def from_dataframe(cls, df_zonas):
+        """
+        Construir el índice desde la tabla zonas
+        
+        Args:
+            df_zonas: DataFrame con las columnas de zonas
+        
+        Returns:
+            GeofenceIndex
+        """
+        zonas = {}
+        for zona in df_zonas.to_dict('records'):
+            parseada = parse_zone(zona)
+            if parseada is not None:
+                zonas[parseada['zona_id']] = parseada
+        return cls(zonas)
+    
+    def with_changes(self, df_cambios=None, eliminadas=()):
+        """
+        Nuevo índice con zonas agregadas/modificadas y eliminadas
+        
+        Solo se parsean las filas que cambiaron; el resto se reutiliza.
+        
+        Args:
+            df_cambios: DataFrame con las filas nuevas o modificadas de zonas
+                        (una zona que pasó a Inactivo se quita del índice)
+            eliminadas: IDs de zonas borradas
+        
+        Returns:
+            GeofenceIndex
+        """
+        zonas = dict(self.zonas)
+        for zona_id in eliminadas:
+            zonas.pop(int(zona_id), None)
+        if df_cambios is not None:
+            for zona in df_cambios.to_dict('records'):
+                parseada = parse_zone(zona)
+                if parseada is None:
+                    zonas.pop(int(zona['ZonaID']), None)
+                else:
+                    zonas[parseada['zona_id']] = parseada
+        return GeofenceIndex(zonas)
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def query(self, lat, lon, segundos_dia=None):
+        """
+        Pares (punto, zona) con el punto dentro de la zona
+        
+        Args:
+            lat, lon: Arrays (o escalares) de coordenadas
+            segundos_dia: Segundos desde medianoche de cada punto para aplicar
+                          HorarioInicio/HorarioFin (None = ignorar horarios)
+        
+        Returns:
+            Tuple (idx_punto, idx_zona) de arrays int64, ordenados por punto;
+            idx_zona indexa ids/nombres/tipos del índice
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=float))
+        lon = np.atleast_1d(np.asarray(lon, dtype=float))
+        if len(self.ids) == 0 or len(lat) == 0:
+            vacio = np.zeros(0, dtype=np.int64)
+            return vacio, vacio
+        
+        # Candidatos: el punto cae en el rectángulo envolvente de la zona
+        idx_punto, idx_zona = self._tree.query(shapely.points(lon, lat))
+        
+        # Prueba exacta sobre los candidatos
+        dentro = np.zeros(len(idx_punto), dtype=bool)
+        circulo = self.es_circulo[idx_zona]
+        if circulo.any():
+            p, z = idx_punto[circulo], idx_zona[circulo]
+            distancia_m = haversine_distance_batch(self.lat[z], self.lon[z], lat[p], lon[p]) * 1000
+            dentro[circulo] = distancia_m <= self.radio_m[z]
+        poligono = ~circulo
+        if poligono.any():
+            p, z = idx_punto[poligono], idx_zona[poligono]
+            dentro[poligono] = shapely.contains_xy(self.poligonos[z], lon[p], lat[p])
+        
+        if segundos_dia is not None:
+            dentro &= self._in_schedule(idx_zona, np.broadcast_to(segundos_dia, lat.shape)[idx_punto])
+        
+        idx_punto, idx_zona = idx_punto[dentro], idx_zona[dentro]
+        orden = np.lexsort((idx_zona, idx_punto))
+        return idx_punto[orden].astype(np.int64), idx_zona[orden].astype(np.int64)
+    
+    def _in_schedule(self, idx_zona, segundos):
+        """Zonas sin horario siempre aplican; con horario, solo dentro de él"""
+        inicio = np.nan_to_num(self.inicio_s[idx_zona], nan=0.0)
+        fin = np.nan_to_num(self.fin_s[idx_zona], nan=SECONDS_PER_DAY)
+        normal = (segundos >= inicio) & (segundos <= fin)
+        nocturno = (segundos >= inicio) | (segundos <= fin)
+        return ~self.con_horario[idx_zona] | np.where(inicio <= fin, normal, nocturno)
+    
+    def zones_at(self, lat, lon, fecha_hora=None):
+        """
+        Zonas que contienen un punto
+        
+        Args:
+            lat, lon: Coordenadas del punto
+            fecha_hora: datetime del punto para los horarios (None = ignorar horarios)
+        
+        Returns:
+            Lista de dicts con zona_id, nombre, tipo_zona y tipo_geometria
+        """
+        segundos = None
+        if fecha_hora is not None:
+            segundos = fecha_hora.hour * 3600 + fecha_hora.minute * 60 + fecha_hora.second
+        _, idx_zona = self.query(lat, lon, segundos)
+        return [self.describe(z) for z in idx_zona]
+    
+    def describe(self, z):
+        """Datos públicos de la zona en la posición z del índice"""
+        return {
+            'zona_id': int(self.ids[z]),
+            'nombre': self.nombres[z],
+            'tipo_zona': self.tipos[z],
+            'tipo_geometria': self.geometrias[z],
+        }
+    
+    def stats(self):
+        """Zonas indexadas por tipo y geometría"""
+        return {
+            'zonas': len(self.ids),
+            'circulos': int(self.es_circulo.sum()),
+            'poligonos': int((~self.es_circulo).sum()),
+            'con_horario': int(self.con_horario.sum()),
+            'por_tipo': {tipo: int((self.tipos == tipo).sum()) for tipo in ZONE_TYPES},
+        }
+
+
+def seconds_of_day(fechas):
+    """
+    Segundos desde medianoche para un array de fechas
+    
+    Args:
+        fechas: datetime, lista/array datetime64 o Series de fechas
+    
+    Returns:
+        numpy.ndarray de floats
+    """
+    if isinstance(fechas, datetime):
+        fechas = [fechas]
+    fechas = np.asarray(pd.DatetimeIndex(pd.to_datetime(fechas)).tz_localize(None), dtype='datetime64[s]')
+    return (fechas - fechas.astype('datetime64[D]')).astype(np.int64).astype(float)
+
+
+class ZoneEventTracker:
+    """
+    Eventos Entrada/Salida de historial_zonas a partir de pings históricos
+    
+    Reproduce UbicacionController::verificarGeofencing sobre bloques de
+    ubicaciones en vez de ping por ping: por cada dispositivo y zona, el
+    primer ping dentro de la zona sin una entrada abierta genera una Entrada
+    y el primer ping fuera con la entrada abierta genera una Salida con
+    TiempoPermanencia (minutos completos desde la entrada).
+    
+    Todo el bloque se resuelve con arrays: una consulta al índice da los
+    pares (ping, zona) dentro, y las transiciones son los bordes de las
+    rachas de pings consecutivos (del mismo dispositivo) dentro de la misma
+    zona. Las estadías que siguen abiertas al final de un bloque se guardan y
+    continúan en el siguiente, así que los bloques deben llegar en orden
+    cronológico por dispositivo (p. ej. iter_dataset día a día).
+    """
+    
+    def __init__(self, index, horarios=False):
+        """
+        Args:
+            index: GeofenceIndex con las zonas activas
+            horarios: Aplicar HorarioInicio/HorarioFin (Laravel no los
+                      aplica al generar el historial)
+        """
+        self.index = index
+        self.horarios = horarios
+        self.puntos = 0
+        self._siguiente = 0
+        self._eventos = []
+        
+        # Estadías abiertas: dispositivo, zona (posición en el índice),
+        # fecha de entrada (ns) e ID del evento de entrada
+        vacio = np.zeros(0, dtype=np.int64)
+        self._abiertas = (vacio, vacio, vacio, vacio)
+    
+    def process(self, dispositivos, lat, lon, fechas):
+        """
+        Procesar un bloque de pings
+        
+        Args:
+            dispositivos: DispositivoID de cada ping
+            lat, lon: Coordenadas de cada ping
+            fechas: FechaHora de cada ping (sin zona horaria)
+        
+        Returns:
+            int: Número de eventos generados por el bloque
+        """
+        disp = np.asarray(dispositivos, dtype=np.int64)
+        t = np.asarray(pd.to_datetime(fechas), dtype='datetime64[ns]').view(np.int64)
+        orden = np.lexsort((t, disp))
+        disp, t = disp[orden], t[orden]
+        lat = np.asarray(lat, dtype=float)[orden]
+        lon = np.asarray(lon, dtype=float)[orden]
+        n = len(disp)
+        self.puntos += n
+        
+        segundos = (t // 10**9 % SECONDS_PER_DAY).astype(float) if self.horarios else None
+        idx_punto, idx_zona = self.index.query(lat, lon, segundos)
+        
+        # Las estadías abiertas de los dispositivos del bloque entran como una
+        # fila virtual antes de su primer ping: la racha que empieza en ella
+        # continúa una entrada de un bloque anterior
+        ab_disp, ab_zona, ab_entrada, ab_evento = self._abiertas
+        presentes = np.isin(ab_disp, disp)
+        virtuales, fila_virtual = np.unique(ab_disp[presentes], return_inverse=True)
+        m = len(virtuales)
+        
+        pos_real = np.arange(n) + np.searchsorted(virtuales, disp, side='right')
+        pos_virtual = np.searchsorted(disp, virtuales, side='left') + np.arange(m)
+        ext_disp = np.empty(n + m, dtype=np.int64)
+        ext_disp[pos_real] = disp
+        ext_disp[pos_virtual] = virtuales
+        ext_real = np.ones(n + m, dtype=bool)
+        ext_real[pos_virtual] = False
+        ext_fila = np.full(n + m, -1, dtype=np.int64)
+        ext_fila[pos_real] = np.arange(n)
+        
+        e = np.concatenate([pos_real[idx_punto], pos_virtual[fila_virtual]])
+        z = np.concatenate([idx_zona, ab_zona[presentes]])
+        entrada = np.concatenate([np.zeros(len(idx_punto), dtype=np.int64), ab_entrada[presentes]])
+        evento = np.concatenate([np.full(len(idx_punto), -1, dtype=np.int64), ab_evento[presentes]])
+        
+        orden = np.lexsort((e, z))
+        e, z, entrada, evento = e[orden], z[orden], entrada[orden], evento[orden]
+        
+        # Racha: pares de la misma zona en filas consecutivas del mismo dispositivo
+        sigue = np.zeros(len(e), dtype=bool)
+        sigue[1:] = (z[1:] == z[:-1]) & (e[1:] == e[:-1] + 1) & (ext_disp[e[1:]] == ext_disp[e[:-1]])
+        inicios = np.flatnonzero(~sigue)
+        finales = np.append(inicios[1:], len(e)) - 1
+        
+        # Entradas: rachas que empiezan en un ping real
+        nuevas = ext_real[e[inicios]]
+        fila_entrada = ext_fila[e[inicios[nuevas]]]
+        ids_entrada = self._siguiente + np.arange(nuevas.sum())
+        self._siguiente += len(ids_entrada)
+        racha_entrada = entrada[inicios]
+        racha_entrada[nuevas] = t[fila_entrada]
+        racha_evento = evento[inicios]
+        racha_evento[nuevas] = ids_entrada
+        
+        # Salidas: el ping siguiente al último de la racha, si es del mismo dispositivo
+        ultimo = e[finales]
+        siguiente = np.minimum(ultimo + 1, n + m - 1)
+        cierra = (ultimo + 1 < n + m) & (ext_disp[siguiente] == ext_disp[ultimo])
+        fila_salida = ext_fila[siguiente[cierra]]
+        ids_salida = self._siguiente + np.arange(len(fila_salida))
+        self._siguiente += len(ids_salida)
+        permanencia = (t[fila_salida] - racha_entrada[cierra]) // (60 * 10**9)
+        
+        # Estadías que siguen abiertas al final del bloque
+        queda = ~cierra
+        ab_fuera = ~presentes
+        self._abiertas = (
+            np.concatenate([ab_disp[ab_fuera], ext_disp[ultimo[queda]]]),
+            np.concatenate([ab_zona[ab_fuera], z[inicios[queda]]]),
+            np.concatenate([ab_entrada[ab_fuera], racha_entrada[queda]]),
+            np.concatenate([ab_evento[ab_fuera], racha_evento[queda]]),
+        )
+        
+        filas = np.concatenate([fila_entrada, fila_salida])
+        zonas = np.concatenate([z[inicios[nuevas]], z[inicios[cierra]]])
+        n_entradas = len(fila_entrada)
+        self._eventos.append(pd.DataFrame({
+            'EventoID': np.concatenate([ids_entrada, ids_salida]),
+            'EntradaID': np.concatenate([np.full(n_entradas, -1, dtype=np.int64), racha_evento[cierra]]),
+            'ZonaIdx': zonas,
+            'DispositivoID': disp[filas],
+            'TipoEvento': np.where(np.arange(len(filas)) < n_entradas, 'Entrada', 'Salida'),
+            'FechaHoraEvento': t[filas].view('datetime64[ns]'),
+            'Latitud': lat[filas],
+            'Longitud': lon[filas],
+            'TiempoPermanencia': np.concatenate([np.full(n_entradas, np.nan), permanencia.astype(float)]),
+        }))
+        
+        return len(filas)
+    
+    def open_stays(self):
+        """Número de estadías sin salida hasta ahora"""
+        return len(self._abiertas[0])
+    
+    def events(self):
+        """
+        Eventos generados hasta ahora, con las columnas de historial_zonas
+        
+        Igual que en Laravel, cada Entrada cerrada lleva el TiempoPermanencia
+        de su Salida; las que siguen abiertas quedan sin él.
+        
+        Returns:
+            DataFrame ordenado por dispositivo y fecha (ZonaID, DispositivoID,
+            TipoEvento, FechaHoraEvento, Latitud, Longitud, TiempoPermanencia,
+            AlertaGenerada, TipoZona)
+        """
+        if not self._eventos:
+            columnas = ['ZonaID', 'DispositivoID', 'TipoEvento', 'FechaHoraEvento', 'Latitud',
+                        'Longitud', 'TiempoPermanencia', 'AlertaGenerada', 'TipoZona']
+            return pd.DataFrame(columns=columnas)
+        
+        df = pd.concat(self._eventos, ignore_index=True)
+        
+        salidas = df['EntradaID'] >= 0
+        permanencia = pd.Series(
+            df.loc[salidas, 'TiempoPermanencia'].to_numpy(), index=df.loc[salidas, 'EntradaID'].to_numpy()
+        )
+        entradas = ~salidas
+        df.loc[entradas, 'TiempoPermanencia'] = df.loc[entradas, 'EventoID'].map(permanencia).to_numpy()
+        
+        tipo_zona = self.index.tipos[df['ZonaIdx'].to_numpy()]
+        df.insert(0, 'ZonaID', self.index.ids[df['ZonaIdx'].to_numpy()])
+        df['AlertaGenerada'] = np.where(
+            entradas, tipo_zona == 'Zona Restringida', tipo_zona == 'Zona Permitida'
+        )
+        df['TipoZona'] = tipo_zona
+        
+        df = df.sort_values(['DispositivoID', 'FechaHoraEvento', 'EventoID'], kind='stable')
+        return df.drop(columns=['EventoID', 'EntradaID', 'ZonaIdx']).reset_index(drop=True)
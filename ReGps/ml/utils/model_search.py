@@ -0,0 +1,348 @@
+"""
+Validación cruzada y búsqueda de hiperparámetros de los modelos
+
+Los scripts train_* (con --tune) eligen los parámetros del modelo final con
+search_model():
+
+- Folds agrupados por dispositivo y en el tiempo (grouped_time_folds): cada
+  fold entrena con el pasado de unos dispositivos y valida con el período
+  siguiente de otros, así que la métrica mide lo que pasa al servir (días
+  nuevos, dispositivos que el modelo no vio), no filas vecinas del mismo
+  recorrido.
+- Candidatos: MODEL_PARAMS con combinaciones de MODEL_SEARCH_SPACE
+  (config.py). La configuración actual es siempre el primer candidato.
+- Cada par (candidato, fold) es una tarea de un ProcessPoolExecutor. La
+  matriz de features, el target y los índices de los folds se guardan una
+  vez como .npy y los workers los abren con mmap: las páginas se comparten
+  entre procesos en vez de copiar la matriz a cada tarea.
+- Los estimadores se ajustan con n_jobs=1 y los workers limitan BLAS/OpenMP
+  a un hilo: el paralelismo es el del pool, sin procesos que a su vez
+  lancen un hilo por núcleo.
+
+El reporte (mejor configuración, métrica por fold de cada candidato y
+tiempos) se guarda como JSON junto a la metadata del modelo.
+"""
+
+import json
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest, RandomForestClassifier, RandomForestRegressor
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import ParameterGrid
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import MODEL_CONFIG, MODEL_PARAMS, MODEL_SEARCH_SPACE, TUNING_CONFIG
+from utils.metrics import mae, rmse
+
+
+ESTIMATORS = {
+    'eta': RandomForestRegressor,
+    'anomaly': IsolationForest,
+    'behavior': RandomForestClassifier,
+}
+
+# Métrica que decide el mejor candidato y si se minimiza o maximiza.
+# IsolationForest no tiene etiquetas: se usa la diferencia entre la tasa
+# de anomalías en validación y contamination (un umbral que se sostiene en
+# días y dispositivos nuevos)
+OBJECTIVES = {
+    'eta': ('rmse', 'min'),
+    'anomaly': ('error_calibracion', 'min'),
+    'behavior': ('f1_macro', 'max'),
+}
+
+
+class NotEnoughFolds(ValueError):
+    """Ningún fold alcanza TUNING_CONFIG['min_fold_rows'] filas de entrenamiento y de validación"""
+
+
+# ============================================================================
+# FOLDS
+# ============================================================================
+
+def grouped_time_folds(groups, times, n_folds=None, seed=None):
+    """
+    Folds de validación cruzada agrupados por dispositivo y hacia adelante en el tiempo
+    
+    El rango de tiempo se corta en n_folds + 1 bloques (por cuantiles) y los
+    dispositivos se reparten al azar en n_folds grupos. El fold k entrena
+    con los bloques 0..k de los dispositivos fuera del grupo k y valida con
+    el bloque k + 1 de los del grupo k. Con un solo dispositivo no se agrupa.
+    
+    Args:
+        groups: DispositivoID de cada fila
+        times: Fecha/hora de cada fila
+        n_folds: Número de folds (default: MODEL_CONFIG['cv_folds'])
+        seed: Semilla del reparto de dispositivos (default: MODEL_CONFIG['random_state'])
+    
+    Returns:
+        Lista de tuplas (train_idx, val_idx) con posiciones de fila
+    """
+    n_folds = n_folds or MODEL_CONFIG['cv_folds']
+    seed = MODEL_CONFIG['random_state'] if seed is None else seed
+    
+    tiempos = pd.to_datetime(pd.Series(np.asarray(times))).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    cortes = np.quantile(tiempos, np.linspace(0, 1, n_folds + 2)[1:-1])
+    bloque = np.searchsorted(cortes, tiempos, side='right')
+    
+    codigos, dispositivos = pd.factorize(np.asarray(groups))
+    agrupado = len(dispositivos) > 1
+    reparto = np.random.default_rng(seed).permutation(len(dispositivos)) % n_folds
+    grupo = reparto[codigos]
+    
+    folds = []
+    for k in range(n_folds):
+        en_grupo = grupo == k if agrupado else np.ones(len(grupo), dtype=bool)
+        fuera_grupo = ~en_grupo if agrupado else en_grupo
+        train_idx = np.flatnonzero((bloque <= k) & fuera_grupo)
+        val_idx = np.flatnonzero((bloque == k + 1) & en_grupo)
+        folds.append((train_idx, val_idx))
+    
+    return folds
+
+
+def candidate_params(name, max_candidates=None, seed=None):
+    """
+    Configuraciones a evaluar: MODEL_PARAMS con las combinaciones de MODEL_SEARCH_SPACE
+    
+    Args:
+        name: 'eta', 'anomaly' o 'behavior'
+        max_candidates: Máximo de candidatos; si la grilla es más grande se
+                        toma una muestra (default: TUNING_CONFIG, 0 = todos)
+        seed: Semilla de la muestra
+    
+    Returns:
+        Lista de dicts de parámetros; el primero es MODEL_PARAMS[name]
+    """
+    max_candidates = TUNING_CONFIG['max_candidates'] if max_candidates is None else max_candidates
+    seed = MODEL_CONFIG['random_state'] if seed is None else seed
+    
+    base = dict(MODEL_PARAMS[name])
+    candidatos = [base]
+    for combinacion in ParameterGrid(MODEL_SEARCH_SPACE.get(name, {})):
+        params = {**base, **combinacion}
+        if params not in candidatos:
+            candidatos.append(params)
+    
+    if max_candidates and len(candidatos) > max_candidates:
+        candidatos = [base] + random.Random(seed).sample(candidatos[1:], max_candidates - 1)
+    
+    return candidatos
+
+
+# ============================================================================
+# TAREAS DE LOS WORKERS
+# ============================================================================
+
+# Arrays del worker (abiertos con mmap en _init_worker)
+_DATOS = {}
+
+
+def _init_worker(directorio):
+    """Abre la matriz compartida y limita BLAS/OpenMP a un hilo por proceso"""
+    try:
+        from threadpoolctl import threadpool_limits
+        _DATOS['limites'] = threadpool_limits(limits=1)
+    except ImportError:
+        pass
+    
+    directorio = Path(directorio)
+    for archivo in directorio.glob('*.npy'):
+        _DATOS[archivo.stem] = np.load(archivo, mmap_mode='r')
+
+
+def build_estimator(name, params, n_jobs=1):
+    """Estimador de sklearn del modelo con los parámetros dados"""
+    return ESTIMATORS[name](**params, random_state=MODEL_CONFIG['random_state'], n_jobs=n_jobs)
+
+
+def _fold_metrics(name, model, params, X_val, y_val):
+    """Métricas de validación de un fold (incluye la de OBJECTIVES[name])"""
+    if name == 'eta':
+        predicciones = model.predict(X_val)
+        return {'rmse': float(rmse(y_val, predicciones)), 'mae': float(mae(y_val, predicciones))}
+    
+    if name == 'behavior':
+        predicciones = model.predict(X_val)
+        return {
+            'f1_macro': float(f1_score(y_val, predicciones, average='macro', zero_division=0)),
+            'accuracy': float(accuracy_score(y_val, predicciones)),
+        }
+    
+    tasa = float(np.mean(model.predict(X_val) == -1))
+    return {'tasa_anomalias': tasa, 'error_calibracion': abs(tasa - params.get('contamination', 0.1))}
+
+
+def _evaluate(name, candidato, params, fold):
+    """
+    Ajusta un candidato en un fold y lo evalúa (se ejecuta en un worker)
+    
+    Returns:
+        dict con candidato, fold, métricas y segundos de ajuste
+    """
+    X = _DATOS['X']
+    y = _DATOS.get('y')
+    train_idx = _DATOS[f'train_{fold}']
+    val_idx = _DATOS[f'val_{fold}']
+    
+    inicio = time.perf_counter()
+    # Igual que train(): el scaler se ajusta solo con las filas de entrenamiento
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(X[train_idx])
+    X_val = scaler.transform(X[val_idx])
+    
+    model = build_estimator(name, params)
+    if y is None:
+        model.fit(X_train)
+    else:
+        model.fit(X_train, y[train_idx])
+    segundos = time.perf_counter() - inicio
+    
+    return {
+        'candidato': candidato,
+        'fold': fold,
+        'metricas': _fold_metrics(name, model, params, X_val, None if y is None else y[val_idx]),
+        'segundos': segundos,
+    }
+
+
+# ============================================================================
+# BÚSQUEDA
+# ============================================================================
+
+def _share_arrays(directorio, X, y, folds):
+    """Guarda matriz, target e índices de los folds como .npy para abrirlos con mmap"""
+    np.save(directorio / 'X.npy', np.ascontiguousarray(X, dtype=np.float64))
+    if y is not None:
+        np.save(directorio / 'y.npy', y)
+    for k, (train_idx, val_idx) in enumerate(folds):
+        np.save(directorio / f'train_{k}.npy', train_idx)
+        np.save(directorio / f'val_{k}.npy', val_idx)
+
+
+def search_model(name, X, y, groups, times, n_folds=None, workers=None, max_candidates=None,
+                 report_path=None):
+    """
+    Busca los hiperparámetros de un modelo con validación cruzada en paralelo
+    
+    Args:
+        name: 'eta', 'anomaly' o 'behavior'
+        X: DataFrame de features (create_features del wrapper)
+        y: Target (None para anomalías)
+        groups: DispositivoID de cada fila de X
+        times: Fecha/hora de cada fila de X
+        n_folds: Folds (default: MODEL_CONFIG['cv_folds'])
+        workers: Procesos en paralelo (default: TUNING_CONFIG['workers'])
+        max_candidates: Ver candidate_params
+        report_path: Dónde guardar el reporte JSON (None = no se guarda)
+    
+    Returns:
+        dict con best_params, el score de cada candidato y los tiempos
+    
+    Raises:
+        NotEnoughFolds: Si ningún fold tiene filas suficientes (los scripts
+                        de entrenamiento siguen con MODEL_PARAMS)
+    """
+    workers = workers or TUNING_CONFIG['workers']
+    metrica, sentido = OBJECTIVES[name]
+    
+    print(f"\n🔎 Búsqueda de hiperparámetros ({name})...")
+    
+    X = np.asarray(X, dtype=np.float64)
+    clases = None
+    if y is not None:
+        y = np.asarray(y)
+        if name == 'behavior':
+            # Las categorías como códigos enteros: un .npy de objetos no se abre con mmap
+            y, clases = pd.factorize(y)
+        else:
+            y = y.astype(np.float64)
+    
+    minimo = TUNING_CONFIG['min_fold_rows']
+    folds = [
+        (train_idx, val_idx) for train_idx, val_idx in grouped_time_folds(groups, times, n_folds)
+        if len(train_idx) >= minimo and len(val_idx) >= minimo
+    ]
+    if not folds:
+        raise NotEnoughFolds(f"Ningún fold tiene al menos {minimo} filas de entrenamiento y de validación")
+    
+    candidatos = candidate_params(name, max_candidates)
+    print(f"   • Folds: {len(folds)} (validación: {', '.join(f'{len(v):,}' for _, v in folds)} filas)")
+    print(f"   • Candidatos: {len(candidatos)} | workers: {workers} | métrica: {metrica} ({sentido})")
+    
+    resultados = {}
+    inicio = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix='regps-cv-') as tmp:
+        _share_arrays(Path(tmp), X, y, folds)
+        
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(tmp,)) as executor:
+            futures = [
+                executor.submit(_evaluate, name, c, params, k)
+                for c, params in enumerate(candidatos)
+                for k in range(len(folds))
+            ]
+            for future in as_completed(futures):
+                r = future.result()
+                resultados[(r['candidato'], r['fold'])] = r
+    segundos = time.perf_counter() - inicio
+    
+    reporte_candidatos = []
+    for c, params in enumerate(candidatos):
+        por_fold = [resultados[(c, k)] for k in range(len(folds))]
+        valores = [r['metricas'][metrica] for r in por_fold]
+        reporte_candidatos.append({
+            'params': params,
+            'score': float(np.mean(valores)),
+            'score_std': float(np.std(valores)),
+            'folds': [r['metricas'] for r in por_fold],
+            'segundos_ajuste': float(sum(r['segundos'] for r in por_fold)),
+        })
+    
+    # Empates: gana el primero (la configuración actual antes que el resto)
+    scores = np.array([r['score'] for r in reporte_candidatos])
+    mejor = int(np.argmin(scores) if sentido == 'min' else np.argmax(scores))
+    t_ajuste = sum(r['segundos'] for r in resultados.values())
+    
+    reporte = {
+        'model': name,
+        'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'metric': metrica,
+        'direction': sentido,
+        'best_params': candidatos[mejor],
+        'best_score': reporte_candidatos[mejor]['score'],
+        'base_score': reporte_candidatos[0]['score'],
+        'classes': None if clases is None else [str(c) for c in clases],
+        'folds': [{'train': len(t), 'val': len(v)} for t, v in folds],
+        'candidates': reporte_candidatos,
+        'timing': {
+            'workers': workers,
+            'segundos': segundos,
+            'segundos_ajuste': t_ajuste,
+            'eficiencia': t_ajuste / max(workers * segundos, 1e-9),
+        },
+    }
+    
+    print(f"   • Mejor {metrica}: {reporte['best_score']:.4f} (actual {reporte['base_score']:.4f})")
+    cambios = {k: v for k, v in candidatos[mejor].items() if MODEL_PARAMS[name].get(k) != v}
+    print(f"   • Parámetros: {cambios if cambios else 'sin cambios respecto a MODEL_PARAMS'}")
+    print(f"   • Tiempo: {segundos:.1f}s ({len(futures)} ajustes, eficiencia del paralelismo "
+          f"{reporte['timing']['eficiencia'] * 100:.0f}%)")
+    
+    if report_path is not None:
+        report_path = Path(report_path)
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(report_path, 'w') as f:
+            json.dump(reporte, f, indent=2, default=str)
+        print(f"✅ Reporte de búsqueda guardado: {report_path}")
+    
+    return reporte
@@ -0,0 +1,293 @@
+"""
+Ejecución de etapas como DAG con artefactos identificados por hash
+
+Cada Stage declara de qué depende (otras etapas, archivos de código,
+parámetros y datasets de entrada) y qué produce. Su clave es el sha256 de
+todo eso más las claves de sus dependencias, así que se conoce antes de
+ejecutar nada:
+
+- Una etapa se omite si su clave es la de la última ejecución exitosa y
+  sus salidas siguen con el mismo hash (nadie las borró ni reemplazó).
+- Si una etapa se vuelve a ejecutar, también las que dependen de ella.
+- Las etapas listas corren a la vez en un pool de hilos; cada una escribe
+  su salida en un buffer propio que se imprime completo al terminar.
+
+El estado (clave, hash de las salidas y tiempos de cada etapa) se guarda en
+un JSON que se actualiza después de cada etapa: si el pipeline se
+interrumpe, lo ya terminado no se repite.
+"""
+
+import hashlib
+import io
+import json
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+
+
+def file_hash(path):
+    """sha256 del contenido de un archivo"""
+    huella = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            huella.update(bloque)
+    return huella.hexdigest()
+
+
+def path_fingerprint(path):
+    """
+    Huella de una salida: contenido de un archivo, o rutas relativas y
+    tamaños de un directorio (datasets Parquet, que no se modifican en el lugar)
+    
+    Returns:
+        str, o None si la ruta no existe
+    """
+    path = Path(path)
+    if path.is_file():
+        return file_hash(path)
+    if not path.is_dir():
+        return None
+    
+    huella = hashlib.sha256()
+    for archivo in sorted(p for p in path.rglob('*') if p.is_file()):
+        huella.update(f"{archivo.relative_to(path).as_posix()}:{archivo.stat().st_size}\n".encode())
+    return huella.hexdigest()
+
+
+def stable_hash(valor):
+    """sha256 de un valor JSON (claves ordenadas)"""
+    return hashlib.sha256(json.dumps(valor, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class Stage:
+    """
+    Etapa del pipeline
+    """
+    
+    def __init__(self, name, func, deps=(), code=(), params=None, inputs=None, outputs=()):
+        """
+        Args:
+            name: Nombre único de la etapa
+            func: Función que recibe un dict nombre -> valor devuelto por
+                  cada dependencia (None si se omitió) y devuelve el suyo
+            deps: Nombres de las etapas de las que depende
+            code: Archivos de código cuyo contenido entra en la clave
+            params: Parámetros (JSON) que cambian el resultado
+            inputs: Función sin argumentos que devuelve un dict con la huella
+                    de cada entrada externa (p. ej. dataset_fingerprint)
+            outputs: Archivos o directorios que produce
+        """
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.code = [Path(p) for p in code]
+        self.params = params or {}
+        self.inputs = inputs
+        self.outputs = [Path(p) for p in outputs]
+    
+    def key(self, dep_keys):
+        """Clave de la etapa dadas las claves de sus dependencias"""
+        return stable_hash({
+            'stage': self.name,
+            'code': {f'{p.parent.name}/{p.name}': file_hash(p) for p in self.code},
+            'params': self.params,
+            'inputs': self.inputs() if self.inputs else {},
+            'deps': {d: dep_keys[d] for d in self.deps},
+        })
+
+
+class _StageOutput(io.TextIOBase):
+    """sys.stdout que separa la salida de cada hilo de etapa en su propio buffer"""
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+    
+    def write(self, texto):
+        buffer = getattr(self.local, 'buffer', None)
+        return (buffer if buffer is not None else self.stream).write(texto)
+    
+    def flush(self):
+        self.stream.flush()
+
+
+def topological_order(stages):
+    """
+    Etapas ordenadas de modo que cada una va después de sus dependencias
+    
+    Raises:
+        ValueError: Si una dependencia no existe o hay un ciclo
+    """
+    por_nombre = {s.name: s for s in stages}
+    orden, visitando, listas = [], set(), set()
+    
+    def visitar(stage):
+        if stage.name in listas:
+            return
+        if stage.name in visitando:
+            raise ValueError(f"Ciclo de dependencias en la etapa '{stage.name}'")
+        visitando.add(stage.name)
+        for dep in stage.deps:
+            if dep not in por_nombre:
+                raise ValueError(f"La etapa '{stage.name}' depende de '{dep}', que no existe")
+            visitar(por_nombre[dep])
+        visitando.discard(stage.name)
+        listas.add(stage.name)
+        orden.append(stage)
+    
+    for stage in stages:
+        visitar(stage)
+    return orden
+
+
+def plan_dag(stages, state, force=False):
+    """
+    Claves de todas las etapas y cuáles hay que ejecutar
+    
+    Args:
+        stages: Lista de Stage
+        state: Estado de la última ejecución (ver run_dag)
+        force: Ejecutar todas aunque no hayan cambiado
+    
+    Returns:
+        Tupla (orden, claves, pendientes, motivos): motivos dice por qué se
+        ejecuta cada etapa pendiente
+    """
+    orden = topological_order(stages)
+    claves, motivos = {}, {}
+    
+    for stage in orden:
+        claves[stage.name] = stage.key(claves)
+        previo = state.get(stage.name)
+        
+        if force:
+            motivos[stage.name] = 'forzada'
+        elif previo is None:
+            motivos[stage.name] = 'sin ejecución previa'
+        elif any(d in motivos for d in stage.deps):
+            motivos[stage.name] = 'se ejecuta una dependencia'
+        elif previo['key'] != claves[stage.name]:
+            motivos[stage.name] = 'cambió el código, los parámetros o las entradas'
+        elif any(path_fingerprint(p) != previo['outputs'].get(str(p)) for p in stage.outputs):
+            motivos[stage.name] = 'sus salidas no existen o cambiaron'
+    
+    return orden, claves, set(motivos), motivos
+
+
+def load_state(state_path):
+    """Estado guardado por run_dag (dict vacío si no hay)"""
+    state_path = Path(state_path)
+    if not state_path.exists():
+        return {}
+    with open(state_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_state(state_path, state):
+    """Escribe el estado en un archivo temporal y lo reemplaza (nunca queda a medias)"""
+    state_path = Path(state_path)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = state_path.with_suffix('.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+    tmp.replace(state_path)
+
+
+def run_dag(stages, state_path, workers=None, force=False, on_plan=None):
+    """
+    Ejecuta las etapas que cambiaron, en paralelo donde el DAG lo permite
+    
+    Args:
+        stages: Lista de Stage
+        state_path: JSON con el estado de la última ejecución
+        workers: Etapas a la vez (default: todas las que estén listas)
+        force: Ejecutar todas aunque no hayan cambiado
+        on_plan: Función que recibe el conjunto de etapas a ejecutar antes
+                 de empezar (p. ej. para decidir qué datos cargar)
+    
+    Returns:
+        dict nombre -> {'estado': 'ejecutada' | 'omitida' | 'fallida' |
+        'cancelada', 'segundos', 'motivo', 'valor', 'error'}
+    """
+    state = load_state(state_path)
+    orden, claves, pendientes, motivos = plan_dag(stages, state, force)
+    if on_plan is not None:
+        on_plan(pendientes)
+    
+    resultados = {
+        s.name: {'estado': 'omitida', 'segundos': 0.0, 'motivo': None, 'valor': None, 'error': None}
+        for s in orden if s.name not in pendientes
+    }
+    por_ejecutar = [s for s in orden if s.name in pendientes]
+    
+    print(f"\n🧭 Plan: {len(por_ejecutar)} de {len(orden)} etapas")
+    for stage in orden:
+        if stage.name in pendientes:
+            print(f"   • {stage.name}: se ejecuta ({motivos[stage.name]})")
+        else:
+            print(f"   • {stage.name}: sin cambios, se omite")
+    
+    salida = _StageOutput(sys.stdout)
+    
+    def ejecutar(stage):
+        buffer = io.StringIO()
+        salida.local.buffer = buffer
+        inicio = time.perf_counter()
+        try:
+            valores = {d: resultados[d]['valor'] for d in stage.deps}
+            return stage.func(valores), None, time.perf_counter() - inicio, buffer.getvalue()
+        except Exception:
+            return None, traceback.format_exc(), time.perf_counter() - inicio, buffer.getvalue()
+        finally:
+            salida.local.buffer = None
+    
+    stdout_original = sys.stdout
+    sys.stdout = salida
+    try:
+        with ThreadPoolExecutor(max_workers=workers or max(len(por_ejecutar), 1)) as executor:
+            en_curso = {}
+            while por_ejecutar or en_curso:
+                for stage in list(por_ejecutar):
+                    estados = [resultados[d]['estado'] for d in stage.deps if d in resultados]
+                    if any(e in ('fallida', 'cancelada') for e in estados):
+                        resultados[stage.name] = {
+                            'estado': 'cancelada', 'segundos': 0.0, 'motivo': motivos[stage.name],
+                            'valor': None, 'error': 'falló una dependencia',
+                        }
+                        por_ejecutar.remove(stage)
+                    elif len(estados) == len(stage.deps):
+                        en_curso[executor.submit(ejecutar, stage)] = stage
+                        por_ejecutar.remove(stage)
+                
+                if not en_curso:
+                    continue
+                
+                hechos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for future in hechos:
+                    stage = en_curso.pop(future)
+                    valor, error, segundos, log = future.result()
+                    
+                    stdout_original.write(f"\n{'─' * 25} {stage.name} ({segundos:.1f}s) {'─' * 25}\n{log}")
+                    resultados[stage.name] = {
+                        'estado': 'fallida' if error else 'ejecutada', 'segundos': segundos,
+                        'motivo': motivos[stage.name], 'valor': valor, 'error': error,
+                    }
+                    if error:
+                        stdout_original.write(f"❌ {stage.name} falló:\n{error}")
+                        continue
+                    
+                    state[stage.name] = {
+                        'key': claves[stage.name],
+                        'outputs': {str(p): path_fingerprint(p) for p in stage.outputs},
+                        'seconds': segundos,
+                        'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    }
+                    _save_state(state_path, state)
+    finally:
+        sys.stdout = stdout_original
+    
+    return {s.name: resultados[s.name] for s in orden}
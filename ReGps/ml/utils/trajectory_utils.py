@@ -0,0 +1,187 @@
+"""
+Utilidades vectorizadas para trayectorias por dispositivo
+
+Todas las funciones asumen que los datos ya están ordenados por
+(DispositivoID, FechaHora), de modo que cada dispositivo ocupa un bloque
+contiguo. Así las operaciones "por dispositivo" (shift, diff, cumsum,
+ventanas móviles) se resuelven con pasadas sobre arrays de NumPy, sin
+máscaras por dispositivo ni bucles por fila.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def group_starts(*keys):
+    """
+    Marca la primera fila de cada bloque contiguo con la misma clave
+    
+    Args:
+        *keys: Uno o más arrays/Series ordenados por esas claves
+               (p. ej. DispositivoID, o DispositivoID y Fecha)
+    
+    Returns:
+        numpy.ndarray[bool]: True en la primera fila de cada bloque
+    """
+    keys = [np.asarray(k) for k in keys]
+    n = len(keys[0])
+    is_first = np.empty(n, dtype=bool)
+    
+    if n:
+        is_first[0] = True
+        is_first[1:] = False
+        for k in keys:
+            is_first[1:] |= k[1:] != k[:-1]
+    
+    return is_first
+
+
+def group_positions(is_first):
+    """
+    Posición de cada fila dentro de su dispositivo (0 para la primera)
+    
+    Args:
+        is_first: Resultado de group_starts
+    
+    Returns:
+        numpy.ndarray[int]: Posición dentro del bloque
+    """
+    idx = np.arange(len(is_first))
+    start = np.maximum.accumulate(np.where(is_first, idx, 0))
+    return idx - start
+
+
+def group_sizes(is_first):
+    """
+    Tamaño del bloque de cada fila (número de puntos de su dispositivo)
+    
+    Args:
+        is_first: Resultado de group_starts
+    
+    Returns:
+        numpy.ndarray[int]: Tamaño del grupo repetido por fila
+    """
+    starts = np.flatnonzero(is_first)
+    sizes = np.diff(np.append(starts, len(is_first)))
+    return np.repeat(sizes, sizes)
+
+
+def shift_within_group(values, is_first, fill_value=np.nan):
+    """
+    Valor de la fila anterior del mismo dispositivo
+    Equivale a groupby('DispositivoID').shift(1)
+    
+    Args:
+        values: Array o Series numérica
+        is_first: Resultado de group_starts
+        fill_value: Valor para la primera fila de cada dispositivo
+    
+    Returns:
+        numpy.ndarray[float]: Valores desplazados
+    """
+    values = np.asarray(values, dtype=float)
+    out = np.empty_like(values)
+    
+    if len(values):
+        out[1:] = values[:-1]
+        out[is_first] = fill_value
+    
+    return out
+
+
+def diff_within_group(values, is_first):
+    """
+    Diferencia con la fila anterior del mismo dispositivo
+    Equivale a groupby('DispositivoID').diff(). Para fechas (datetime64)
+    devuelve la diferencia en segundos, calculada en enteros para que la
+    resta sea exacta.
+    
+    Args:
+        values: Array o Series numérica o de fechas
+        is_first: Resultado de group_starts
+    
+    Returns:
+        numpy.ndarray[float]: Diferencias (NaN en la primera fila de cada dispositivo)
+    """
+    values = np.asarray(values)
+    out = np.empty(len(values), dtype=float)
+    
+    if len(values):
+        if values.dtype.kind == 'M':
+            out[1:] = (values[1:] - values[:-1]) / np.timedelta64(1, 's')
+        else:
+            out[1:] = values[1:] - values[:-1]
+        out[is_first] = np.nan
+    
+    return out
+
+
+def cumsum_within_group(values, is_first):
+    """
+    Suma acumulada por dispositivo
+    Equivale a groupby('DispositivoID').cumsum(): los NaN se ignoran en la
+    suma y se conservan en el resultado.
+    
+    Args:
+        values: Array o Series numérica
+        is_first: Resultado de group_starts
+    
+    Returns:
+        numpy.ndarray[float]: Suma acumulada
+    """
+    codes = np.cumsum(is_first)
+    values = pd.Series(np.asarray(values, dtype=float))
+    return values.groupby(codes).cumsum().to_numpy()
+
+
+def rolling_within_group(values, is_first, window, min_periods=1):
+    """
+    Media, desviación estándar (ddof=1) y máximo en ventana móvil por dispositivo
+    Equivale a groupby('DispositivoID').rolling(window, min_periods) pero
+    con `window` desplazamientos vectorizados en lugar de un bucle por grupo.
+    Los NaN no cuentan como observación, igual que en pandas.
+    
+    Args:
+        values: Array o Series numérica
+        is_first: Resultado de group_starts
+        window: Tamaño de la ventana (en puntos)
+        min_periods: Mínimo de observaciones para devolver un valor
+    
+    Returns:
+        dict: Arrays 'mean', 'std' y 'max' (NaN donde no hay suficientes puntos)
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    pos = group_positions(is_first)
+    valid = ~np.isnan(values)
+    
+    total = np.zeros(n)
+    count = np.zeros(n, dtype=np.int64)
+    maximum = np.full(n, -np.inf)
+    
+    # Primera pasada: suma, conteo y máximo
+    for k in range(min(window, n)):
+        src = values[:n - k]
+        ok = (pos[k:] >= k) & valid[:n - k]
+        total[k:] += np.where(ok, src, 0.0)
+        count[k:] += ok
+        maximum[k:] = np.where(ok, np.maximum(maximum[k:], src), maximum[k:])
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        enough = count >= max(min_periods, 1)
+        mean = np.where(enough, total / count, np.nan)
+        
+        # Segunda pasada: suma de cuadrados centrada (numéricamente estable)
+        sq = np.zeros(n)
+        for k in range(min(window, n)):
+            src = values[:n - k]
+            ok = (pos[k:] >= k) & valid[:n - k]
+            sq[k:] += np.where(ok, (src - mean[k:]) ** 2, 0.0)
+        
+        std = np.where(enough & (count > 1), np.sqrt(sq / (count - 1)), np.nan)
+    
+    return {
+        'mean': mean,
+        'std': std,
+        'max': np.where(enough, maximum, np.nan),
+    }